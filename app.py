@@ -1,18 +1,48 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory, jsonify, abort
+import time
+_import_started = time.perf_counter()  # profil de démarrage (voir init_logging)
+
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, send_from_directory, jsonify, abort, has_request_context
 import sqlite3
 import os
+import atexit
 import bcrypt
 import secrets
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
 import uuid
 import re
-from functools import wraps
+from functools import partial, wraps
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_wtf.csrf import CSRFProtect
 import logging
 from logging.handlers import RotatingFileHandler
+import jobs
+import tasks  # Enregistre les handlers des tâches d'arrière-plan
+from templating import init_templating
+from assets import init_assets
+from response_compression import init_response_compression
+from profiling import Profiler, ProfilingError, init_profiling
+import profiling
+import rows
+from sessions import create_sessions_table, init_sessions, revoke_user_sessions
+from storage import create_storage, ChecksumReader, StorageError, CHUNK_SIZE
+from packstore import PackStorage
+import chunked_upload
+import compression
+import content_index
+import image_hash
+import name_index
+import note_revisions
+import facets
+import changefeed
+from login_tracker import LoginTracker
+from query_log import QueryLog
+from backup import create_change_log
+from chunked_upload import UploadError
+from migrations import run_migrations
+import database
+import sharding
 
 # Configuration sécurisée
 app = Flask(__name__)
@@ -36,21 +66,85 @@ limiter = Limiter(
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+MAX_LOGIN_ATTEMPTS = 5
+ACCOUNT_LOCKOUT_SECONDS = 1800  # 30 minutes
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Stockage des fichiers : 'local' (UPLOAD_FOLDER), 's3' (AWS, MinIO...) ou
+# 'packed' (UPLOAD_FOLDER, fichiers d'au plus PACK_MAX_BLOB_SIZE octets regroupés en segments)
+app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'local')
+app.config['PACK_MAX_BLOB_SIZE'] = int(os.environ.get('PACK_MAX_BLOB_SIZE', 256 * 1024))
+app.config['PACK_SEGMENT_SIZE'] = int(os.environ.get('PACK_SEGMENT_SIZE', 256 * 1024 * 1024))
+app.config['S3_BUCKET'] = os.environ.get('S3_BUCKET', 'archive-uploads')
+app.config['S3_ENDPOINT_URL'] = os.environ.get('S3_ENDPOINT_URL')
+app.config['S3_REGION'] = os.environ.get('S3_REGION')
+app.config['S3_ACCESS_KEY_ID'] = os.environ.get('S3_ACCESS_KEY_ID')
+app.config['S3_SECRET_ACCESS_KEY'] = os.environ.get('S3_SECRET_ACCESS_KEY')
+app.config['PRESIGNED_URL_EXPIRES'] = 300  # secondes
+# Compression au repos des fichiers compressibles (texte, .doc...)
+app.config['AT_REST_COMPRESSION'] = os.environ.get('AT_REST_COMPRESSION', 'true').lower() == 'true'
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+# Uploads par morceaux (chaque requête reste sous MAX_CONTENT_LENGTH)
+app.config['CHUNKED_UPLOAD_MAX_SIZE'] = int(os.environ.get('CHUNKED_UPLOAD_MAX_SIZE', 4 * 1024 * 1024 * 1024))  # 4GB
+# Rétention de l'historique des notes
+app.config['NOTE_REVISIONS_KEEP'] = int(os.environ.get('NOTE_REVISIONS_KEEP', 100))
+app.config['NOTE_REVISIONS_MAX_AGE_DAYS'] = int(os.environ.get('NOTE_REVISIONS_MAX_AGE_DAYS', 365))
+# Flux /events : flux simultanés par worker (gunicorn.conf.py l'ajuste au modèle de worker)
+app.config['SSE_MAX_STREAMS'] = int(os.environ.get('SSE_MAX_STREAMS', 2))
+# Compteurs de connexion partagés par les workers (écritures différées)
+app.config['LOGIN_STATE_DB'] = os.environ.get('LOGIN_STATE_DB', 'login_state.db')
+# Statistiques des requêtes SQL partagées par les workers ('' : requêtes non mesurées)
+app.config['QUERY_STATS_DB'] = os.environ.get('QUERY_STATS_DB', 'query_stats.db')
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+# Administrateurs (noms d'utilisateur séparés par des virgules) : profilage à la demande
+app.config['ADMIN_USERS'] = {name.strip() for name in os.environ.get('ADMIN_USERS', '').split(',') if name.strip()}
+# Sessions de profilage partagées par les workers ('' : profilage désactivé) et résultats
+app.config['PROFILING_DB'] = os.environ.get('PROFILING_DB', 'profiling.db')
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+app.config['PROFILE_MAX_SHARE'] = float(os.environ.get('PROFILE_MAX_SHARE', profiling.DEFAULT_MAX_SHARE))
+# Base principale : sqlite:///chemin (défaut) ou postgresql://utilisateur:secret@hôte/base
+app.config['DATABASE_URL'] = os.environ.get('DATABASE_URL', database.DEFAULT_URL)
+# PostgreSQL : pool de connexions par processus et préparation des requêtes répétées
+app.config['DB_POOL_MIN_SIZE'] = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+app.config['DB_POOL_MAX_SIZE'] = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+app.config['DB_PREPARE_THRESHOLD'] = int(os.environ.get('DB_PREPARE_THRESHOLD', '2') or 0) or None
+# Données réparties : '' (base unique), 'bucket' (user_id % DB_SHARD_BUCKETS) ou 'user'
+app.config['DB_SHARD_MODE'] = os.environ.get('DB_SHARD_MODE', '')
+app.config['DB_SHARD_BUCKETS'] = int(os.environ.get('DB_SHARD_BUCKETS', sharding.DEFAULT_BUCKETS))
+# Répertoires des fichiers de données (un par volume), séparés par ':'
+app.config['DB_SHARD_DIRS'] = os.environ.get('DB_SHARD_DIRS', 'shards').split(os.pathsep)
 app.config['SESSION_COOKIE_SECURE'] = True  # HTTPS uniquement
 app.config['SESSION_COOKIE_HTTPONLY'] = True  # Protection XSS
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # Protection CSRF
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=2)  # Session timeout
+# 'cookie' (sessions signées Flask), 'sqlite' (côté serveur, révocables) ou 'memory'
+app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'cookie')
+
+# Cache de bytecode Jinja partagé par les workers + cache de fragments
+app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR', 'cache/jinja')
+init_templating(app)
+
+# Fichiers statiques empreintés (construits par `python assets.py`)
+init_assets(app)
+
+# Compression des réponses HTML / JSON (br, zstd, gzip selon Accept-Encoding)
+app.config['RESPONSE_COMPRESSION'] = os.environ.get('RESPONSE_COMPRESSION', 'true').lower() == 'true'
+app.config['RESPONSE_COMPRESSION_MIN_SIZE'] = int(os.environ.get('RESPONSE_COMPRESSION_MIN_SIZE', 1024))
+init_response_compression(app)
 
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# Le dossier d'upload est créé par le driver de stockage au premier usage,
+# le logging fichier à la première requête de chaque processus : importer
+# l'application (master gunicorn avec preload_app, scripts) reste sans effet
+# de bord sur le disque
+_logging_ready = False
 
-# Configuration du logging
-if not app.debug:
-    if not os.path.exists('logs'):
-        os.mkdir('logs')
+def init_logging():
+    """Configure le logging fichier (une fois par processus)"""
+    global _logging_ready
+    if _logging_ready or app.debug:
+        return
+    _logging_ready = True
+    os.makedirs('logs', exist_ok=True)
     file_handler = RotatingFileHandler('logs/app.log', maxBytes=10240, backupCount=10)
     file_handler.setFormatter(logging.Formatter(
         '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
@@ -58,17 +152,95 @@ if not app.debug:
     file_handler.setLevel(logging.INFO)
     app.logger.addHandler(file_handler)
     app.logger.setLevel(logging.INFO)
-    app.logger.info('Archive Platform startup')
+    app.logger.info(f'Archive Platform startup (pid {os.getpid()}, app import {_import_duration * 1000:.0f} ms)')
 
-def get_db_connection():
-    """Crée une connexion sécurisée à la base de données"""
-    conn = sqlite3.connect('database.db')
+@app.before_request
+def ensure_logging():
+    if not _logging_ready:
+        init_logging()
+
+# Latence de chaque requête, plan des requêtes lentes (python query_log.py report)
+query_log = QueryLog(
+    app.config['QUERY_STATS_DB'], app.config['SLOW_QUERY_MS'], logger=app.logger
+) if app.config['QUERY_STATS_DB'] else None
+main_database = database.Database(
+    app.config['DATABASE_URL'], app.config['DB_POOL_MIN_SIZE'], app.config['DB_POOL_MAX_SIZE'],
+    app.config['DB_PREPARE_THRESHOLD'], query_log
+)
+# Profilage CPU / mémoire d'un échantillon des requêtes d'une route (/admin/profiling)
+profiler = Profiler(
+    app.config['PROFILING_DB'], app.config['PROFILE_DIR'], logger=app.logger,
+    max_share=app.config['PROFILE_MAX_SHARE']
+) if app.config['PROFILING_DB'] else None
+init_profiling(app, profiler)
+# Chemin du fichier SQLite (ou URL PostgreSQL sans mot de passe)
+DATABASE = main_database.name
+# À incrémenter à chaque modification du schéma dans init_db()
+SCHEMA_VERSION = 11
+
+def connect_database(name):
+    """Crée une connexion sécurisée à la base principale (``DATABASE``) ou à un
+    fichier SQLite de données réparties"""
+    if name == DATABASE:
+        return main_database.connect()
+    conn = sqlite3.connect(name, factory=query_log.connection_class if query_log else sqlite3.Connection)
     conn.row_factory = sqlite3.Row  # Permet d'accéder aux colonnes par nom
     return conn
 
-def init_db():
+def get_catalog_connection():
+    """Base principale : utilisateurs, sessions, emplacement des données réparties"""
+    return main_database.connect()
+
+def get_db_connection(user_id=None):
+    """Connexion aux données de ``user_id`` (par défaut l'utilisateur de la session).
+
+    Sans répartition (DB_SHARD_MODE vide) ou sans utilisateur, c'est la base
+    principale.
+    """
+    if shard_router.enabled:
+        if user_id is None and has_request_context():
+            user_id = session.get('user_id')
+        if user_id is not None:
+            return shard_router.connect(user_id)
+    return get_catalog_connection()
+
+def data_databases():
+    """Fichiers contenant des données utilisateur (worker, scripts de maintenance)"""
+    if shard_router.enabled:
+        return shard_router.shard_paths()
+    return [DATABASE]
+
+# Sessions côté serveur (si SESSION_BACKEND != 'cookie')
+init_sessions(app, get_catalog_connection)
+
+# Suivi des connexions : last_login écrit par lots, échecs comptés hors de la base principale
+login_tracker = LoginTracker(
+    app.config['LOGIN_STATE_DB'], get_catalog_connection,
+    max_attempts=MAX_LOGIN_ATTEMPTS, lockout_seconds=ACCOUNT_LOCKOUT_SECONDS
+)
+atexit.register(login_tracker.flush)
+
+_storage = None
+
+def get_storage():
+    """Retourne le driver de stockage (créé au premier usage, partagé par le processus)"""
+    global _storage
+    if _storage is None:
+        _storage = create_storage(app.config)
+    return _storage
+
+def add_column_if_missing(cursor, table, column, definition):
+    """Migration idempotente : ajoute une colonne à une table existante"""
+    if database.is_postgres(cursor):
+        cursor.execute('ALTER TABLE ' + table + ' ADD COLUMN IF NOT EXISTS ' + column + ' ' + definition)
+        return
+    cursor.execute('PRAGMA table_info(' + table + ')')
+    if column not in [row['name'] for row in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE ' + table + ' ADD COLUMN ' + column + ' ' + definition)
+
+def init_db(db_path=DATABASE):
     """Initialise la base de données SQLite avec des contraintes de sécurité"""
-    conn = get_db_connection()
+    conn = connect_database(db_path)
     cursor = conn.cursor()
     
     # Table des utilisateurs avec contraintes renforcées
@@ -152,9 +324,81 @@ def init_db():
         )
     ''')
     
+    # Codec de compression au repos (NULL : fichier stocké tel quel)
+    add_column_if_missing(cursor, 'files', 'codec', 'TEXT')
+    # Empreinte SHA-256 des octets stockés (NULL : calculée par scrubber.py)
+    add_column_if_missing(cursor, 'files', 'checksum', 'TEXT')
+    # Empreintes perceptuelles des images (NULL : pas une image ou pas encore calculées)
+    for column in ('ahash', 'dhash', 'phash'):
+        add_column_if_missing(cursor, 'files', column, 'INTEGER')
+    
+    # Journal des ajouts / suppressions de fichiers (sauvegardes incrémentales)
+    create_change_log(cursor)
+    
+    # File des tâches d'arrière-plan (et tâches en cours de tous les fichiers de données)
+    jobs.create_jobs_table(cursor)
+    jobs.create_job_leases_table(cursor)
+    
+    # Sessions côté serveur
+    create_sessions_table(cursor)
+    
+    # Uploads reprenables par morceaux (réservation des finalisations en cours)
+    chunked_upload.create_upload_tables(cursor)
+    add_column_if_missing(cursor, 'upload_sessions', 'completing_until', 'TIMESTAMP')
+    
+    # Index plein texte du contenu des fichiers
+    content_index.create_content_index(cursor)
+    
+    # Recherche par sous-chaîne dans les noms de fichiers (trigrammes)
+    name_index.create_name_index(cursor)
+    
+    # Images similaires : hachage multi-index des empreintes perceptuelles
+    image_hash.create_image_hash_index(cursor)
+    
+    # Historique des notes (deltas compressés)
+    note_revisions.create_revisions_table(cursor)
+    
+    # Contenu d'un dossier (tableau de bord, filtrage par étiquettes)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_folders_parent ON folders (user_id, parent_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_folder ON files (user_id, folder_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notes_folder ON notes (user_id, folder_id)')
+    # Téléchargement par clé, parcours ordonné du vérificateur de stockage
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_filename ON files (filename)')
+    
+    # Filtrage par étiquettes : index inverse et compteurs
+    facets.create_facet_index(cursor)
+    
+    # Journal des modifications (flux /events) ; après toutes les tables suivies
+    changefeed.create_change_feed(cursor)
+    
+    # Emplacement des fichiers de données (DB_SHARD_MODE)
+    sharding.create_placement_table(cursor)
+    
     conn.commit()
     conn.close()
 
+def migrate_database(db_path):
+    if db_path == DATABASE:
+        return main_database.run_migrations(init_db, SCHEMA_VERSION)
+    return run_migrations(db_path, lambda: init_db(db_path), SCHEMA_VERSION)
+
+def migrate():
+    """Met le schéma à jour une seule fois (verrou inter-processus) ; retourne True si exécuté"""
+    migrated = migrate_database(DATABASE)
+    # Données réparties : chaque fichier a le schéma complet et sa propre version
+    for path in shard_router.shard_paths():
+        migrated = migrate_database(path) or migrated
+    return migrated
+
+# Routage des connexions par utilisateur (inactif si DB_SHARD_MODE est vide)
+if app.config['DB_SHARD_MODE'] and main_database.backend != 'sqlite':
+    raise ValueError('DB_SHARD_MODE répartit des fichiers SQLite : incompatible avec ' + main_database.backend)
+shard_router = sharding.ShardRouter(
+    DATABASE, app.config['DB_SHARD_MODE'], app.config['DB_SHARD_BUCKETS'],
+    app.config['DB_SHARD_DIRS'], initialize=migrate_database,
+    factory=query_log.connection_class if query_log else sqlite3.Connection
+)
+
 def login_required(f):
     """Décorateur pour protéger les routes nécessitant une authentification"""
     @wraps(f)
@@ -165,6 +409,18 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def admin_required(f):
+    """Décorateur des routes d'administration (utilisateurs de ADMIN_USERS)"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            flash('Veuillez vous connecter pour accéder à cette page.', 'error')
+            return redirect(url_for('login'))
+        if session.get('username') not in app.config['ADMIN_USERS']:
+            abort(403)
+        return f(*args, **kwargs)
+    return decorated_function
+
 def validate_email(email):
     """Valide le format d'une adresse email"""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -204,7 +460,7 @@ def sanitize_filename(filename):
 
 def check_resource_ownership(user_id, resource_type, resource_id):
     """Vérifie que l'utilisateur est propriétaire de la ressource (protection IDOR)"""
-    conn = get_db_connection()
+    conn = get_db_connection(user_id)
     cursor = conn.cursor()
     
     if resource_type == 'file':
@@ -254,9 +510,10 @@ def register():
             return render_template('register.html')
         
         # Hachage sécurisé avec bcrypt
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        # (stocké en texte : colonne TEXT sous SQLite comme sous PostgreSQL)
+        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
         
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -269,7 +526,7 @@ def register():
             app.logger.info(f'New user registered: {username}')
             flash('Inscription réussie ! Vous pouvez maintenant vous connecter.', 'success')
             return redirect(url_for('login'))
-        except sqlite3.IntegrityError:
+        except database.IntegrityError:
             flash('Ce nom d\'utilisateur ou email existe déjà.', 'error')
         finally:
             conn.close()
@@ -288,7 +545,7 @@ def login():
             flash('Veuillez remplir tous les champs.', 'error')
             return render_template('login.html')
         
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         # Requête paramétrée (protection SQL injection)
@@ -308,13 +565,14 @@ def login():
                     return render_template('login.html')
             
             # Vérification du mot de passe avec bcrypt
-            if bcrypt.checkpw(password.encode('utf-8'), user['password']):
-                # Réinitialiser les tentatives échouées
-                cursor.execute(
-                    'UPDATE users SET failed_login_attempts = 0, account_locked_until = NULL, last_login = ? WHERE id = ?',
-                    (datetime.now(), user['id'])
-                )
-                conn.commit()
+            # Les anciens comptes SQLite ont un hachage stocké en octets
+            stored_hash = user['password']
+            if isinstance(stored_hash, str):
+                stored_hash = stored_hash.encode('utf-8')
+            if bcrypt.checkpw(password.encode('utf-8'), stored_hash):
+                # Réinitialiser les tentatives échouées (seulement s'il y en a) ;
+                # last_login est écrit par lots
+                login_tracker.record_success(conn, user)
                 
                 # Créer la session
                 session.clear()
@@ -326,25 +584,14 @@ def login():
                 conn.close()
                 return redirect(url_for('dashboard'))
             else:
-                # Incrémenter les tentatives échouées
-                failed_attempts = user['failed_login_attempts'] + 1
-                
-                if failed_attempts >= 5:
-                    # Verrouiller le compte pour 30 minutes
-                    locked_until = datetime.now() + timedelta(minutes=30)
-                    cursor.execute(
-                        'UPDATE users SET failed_login_attempts = ?, account_locked_until = ? WHERE id = ?',
-                        (failed_attempts, locked_until, user['id'])
-                    )
+                # Incrémenter les tentatives échouées (stockage partagé ; la base
+                # n'est écrite qu'au verrouillage du compte)
+                _, locked_until = login_tracker.record_failure(user)
+                if locked_until:
+                    app.logger.warning(f'Account locked after failed logins: {username}')
                     flash('Trop de tentatives échouées. Compte verrouillé pour 30 minutes.', 'error')
                 else:
-                    cursor.execute(
-                        'UPDATE users SET failed_login_attempts = ? WHERE id = ?',
-                        (failed_attempts, user['id'])
-                    )
                     flash('Nom d\'utilisateur ou mot de passe incorrect.', 'error')
-                
-                conn.commit()
         else:
             flash('Nom d\'utilisateur ou mot de passe incorrect.', 'error')
         
@@ -361,6 +608,23 @@ def logout():
     flash('Vous avez été déconnecté avec succès.', 'success')
     return redirect(url_for('index'))
 
+@app.route('/logout_all', methods=['POST'])
+@login_required
+def logout_all():
+    user_id = session['user_id']
+    username = session.get('username', 'Unknown')
+    
+    # Révocation de toutes les sessions de l'utilisateur (tous appareils)
+    revoked = revoke_user_sessions(app, user_id)
+    session.clear()
+    
+    if revoked is None:
+        flash('Vous avez été déconnecté. Les autres appareils restent connectés jusqu\'à expiration de leur session.', 'success')
+    else:
+        app.logger.info(f'User revoked all sessions: {username} ({revoked} sessions)')
+        flash('Vous avez été déconnecté de tous vos appareils.', 'success')
+    return redirect(url_for('index'))
+
 @app.route('/dashboard')
 @login_required
 def dashboard():
@@ -384,40 +648,42 @@ def dashboard():
         if folder_info:
             current_folder_name = folder_info['name']
     
+    # Projections explicites et lignes compactes (namedtuples) : seules les
+    # colonnes affichées par le template sont lues
+    rows.use_namedtuples(cursor)
+    
     # Récupérer les dossiers (requêtes paramétrées)
     if folder_id:
-        cursor.execute('SELECT * FROM folders WHERE user_id = ? AND parent_id = ?', (user_id, folder_id))
+        cursor.execute('SELECT id, name, created_at FROM folders WHERE user_id = ? AND parent_id = ?', (user_id, folder_id))
     else:
-        cursor.execute('SELECT * FROM folders WHERE user_id = ? AND parent_id IS NULL', (user_id,))
+        cursor.execute('SELECT id, name, created_at FROM folders WHERE user_id = ? AND parent_id IS NULL', (user_id,))
     folders = cursor.fetchall()
     
     # Récupérer les fichiers
     if folder_id:
-        cursor.execute('SELECT * FROM files WHERE user_id = ? AND folder_id = ?', (user_id, folder_id))
+        cursor.execute('SELECT id, filename, original_name, file_size FROM files WHERE user_id = ? AND folder_id = ?', (user_id, folder_id))
     else:
-        cursor.execute('SELECT * FROM files WHERE user_id = ? AND folder_id IS NULL', (user_id,))
+        cursor.execute('SELECT id, filename, original_name, file_size FROM files WHERE user_id = ? AND folder_id IS NULL', (user_id,))
     files = cursor.fetchall()
     
     # Récupérer les notes
     if folder_id:
-        cursor.execute('SELECT * FROM notes WHERE user_id = ? AND folder_id = ?', (user_id, folder_id))
+        cursor.execute('SELECT id, title, content, created_at FROM notes WHERE user_id = ? AND folder_id = ?', (user_id, folder_id))
     else:
-        cursor.execute('SELECT * FROM notes WHERE user_id = ? AND folder_id IS NULL', (user_id,))
+        cursor.execute('SELECT id, title, content, created_at FROM notes WHERE user_id = ? AND folder_id IS NULL', (user_id,))
     notes = cursor.fetchall()
     
     # Récupérer toutes les étiquettes de l'utilisateur
-    cursor.execute('SELECT * FROM labels WHERE user_id = ?', (user_id,))
+    cursor.execute('SELECT id, name, color FROM labels WHERE user_id = ?', (user_id,))
     user_labels = cursor.fetchall()
+    # Version des étiquettes : clé des fragments mis en cache dans le template
+    labels_version = hash(tuple(user_labels))
+    
+    # Récupérer les étiquettes des dossiers (une seule requête pour le niveau)
+    folder_labels = facets.labels_by_folder(conn, user_id, folder_id, user_labels)
     
-    # Récupérer les étiquettes des dossiers
-    folder_labels = {}
-    for folder in folders:
-        cursor.execute('''
-            SELECT l.* FROM labels l 
-            JOIN folder_labels fl ON l.id = fl.label_id 
-            WHERE fl.folder_id = ? AND l.user_id = ?
-        ''', (folder['id'], user_id))
-        folder_labels[folder['id']] = cursor.fetchall()
+    # Dernière modification déjà reflétée par la page : point de départ du flux /events
+    change_cursor = changefeed.latest_change_id(conn, user_id)
     
     conn.close()
     
@@ -426,7 +692,9 @@ def dashboard():
                          files=files, 
                          notes=notes,
                          user_labels=user_labels,
+                         labels_version=labels_version,
                          folder_labels=folder_labels,
+                         change_cursor=change_cursor,
                          current_folder=folder_id,
                          current_folder_name=current_folder_name)
 
@@ -459,7 +727,7 @@ def create_folder():
         )
         conn.commit()
         flash('Dossier créé avec succès!', 'success')
-    except sqlite3.IntegrityError as e:
+    except database.IntegrityError as e:
         flash('Erreur lors de la création du dossier.', 'error')
         app.logger.error(f'Error creating folder: {e}')
     finally:
@@ -498,8 +766,9 @@ def upload_file():
     original_filename = sanitize_filename(file.filename)
     unique_filename = str(uuid.uuid4()) + '_' + original_filename
     
-    # Construction sécurisée du chemin
+    # Construction sécurisée du chemin (conservé pour le stockage local)
     file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+    storage = get_storage()
     
     # Vérification de la taille
     file.seek(0, os.SEEK_END)
@@ -511,31 +780,201 @@ def upload_file():
     
     file.seek(0)
     
+    # Compression au repos si un échantillon du fichier s'y prête
+    codec = None
+    if app.config['AT_REST_COMPRESSION']:
+        codec = compression.choose_codec(file.stream, original_filename.rsplit('.', 1)[-1])
+    
     try:
-        # Sauvegarde sécurisée du fichier
-        file.save(file_path)
+        # Sauvegarde sécurisée du fichier (empreinte des octets stockés)
+        if codec:
+            reader = ChecksumReader(compression.compressing_reader(file.stream, codec))
+        else:
+            reader = ChecksumReader(file.stream)
+        storage.put(unique_filename, reader)
         
         conn = get_db_connection()
         cursor = conn.cursor()
         
         # Requête paramétrée
         cursor.execute(
-            'INSERT INTO files (user_id, filename, original_name, file_path, file_size, folder_id) VALUES (?, ?, ?, ?, ?, ?)',
-            (user_id, unique_filename, original_filename, file_path, file_size, folder_id)
+            'INSERT INTO files (user_id, filename, original_name, file_path, file_size, folder_id, codec, checksum) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (user_id, unique_filename, original_filename, file_path, file_size, folder_id, codec, reader.hexdigest())
         )
+        # Extraction du texte en arrière-plan (index plein texte)
+        if content_index.is_indexable(original_filename):
+            jobs.enqueue(conn, 'index_file', {'file_id': cursor.lastrowid}, user_id=user_id)
+        # Empreintes perceptuelles (images similaires)
+        if image_hash.is_hashable(original_filename):
+            jobs.enqueue(conn, 'hash_images', {'file_ids': [cursor.lastrowid]}, user_id=user_id)
         conn.commit()
         conn.close()
         
         flash('Fichier uploadé avec succès!', 'success')
     except Exception as e:
         # Nettoyage en cas d'erreur
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        try:
+            storage.delete(unique_filename)
+        except Exception as cleanup_error:
+            app.logger.error(f'Error cleaning up failed upload: {cleanup_error}')
         flash('Erreur lors de l\'upload du fichier.', 'error')
         app.logger.error(f'Error uploading file: {e}')
     
     return redirect(url_for('dashboard', folder_id=folder_id))
 
+@app.route('/uploads', methods=['POST'])
+@login_required
+@limiter.limit("20 per hour")
+def init_chunked_upload():
+    """Ouvre un upload par morceaux et retourne son identifiant"""
+    data = request.get_json(silent=True) or {}
+    user_id = session['user_id']
+    filename = data.get('filename') or ''
+    total_size = data.get('size')
+    folder_id = data.get('folder_id')
+    
+    if not isinstance(total_size, int) or total_size <= 0:
+        return jsonify({'error': 'Taille de fichier invalide'}), 400
+    if total_size > app.config['CHUNKED_UPLOAD_MAX_SIZE']:
+        return jsonify({'error': 'Fichier trop volumineux'}), 413
+    if not allowed_file(filename):
+        return jsonify({'error': 'Type de fichier non autorisé'}), 400
+    if folder_id is not None and (not isinstance(folder_id, int) or not check_resource_ownership(user_id, 'folder', folder_id)):
+        return jsonify({'error': 'Accès non autorisé à ce dossier'}), 403
+    
+    original_filename = sanitize_filename(filename)
+    unique_filename = str(uuid.uuid4()) + '_' + original_filename
+    chunk_size = data.get('chunk_size')
+    if not isinstance(chunk_size, int):
+        chunk_size = chunked_upload.DEFAULT_CHUNK_SIZE
+    
+    conn = get_db_connection()
+    try:
+        upload = chunked_upload.init_upload(
+            conn, app.config['UPLOAD_FOLDER'], user_id, original_filename, unique_filename,
+            total_size, folder_id, chunk_size
+        )
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    finally:
+        conn.close()
+    
+    return jsonify({
+        'upload_id': upload['id'],
+        'chunk_size': upload['chunk_size'],
+        'chunk_count': upload['chunk_count'],
+    }), 201
+
+@app.route('/uploads/<upload_id>')
+@login_required
+def chunked_upload_status(upload_id):
+    """État d'un upload : morceaux déjà reçus (pour la reprise)"""
+    conn = get_db_connection()
+    try:
+        upload = chunked_upload.get_upload(conn, upload_id, session['user_id'])
+        if not upload:
+            return jsonify({'error': 'Upload introuvable'}), 404
+        received = chunked_upload.received_chunks(conn, upload_id)
+    finally:
+        conn.close()
+    
+    return jsonify({
+        'upload_id': upload_id,
+        'chunk_size': upload['chunk_size'],
+        'chunk_count': upload['chunk_count'],
+        'received': received,
+        'completing': bool(upload['completing']),
+    })
+
+@app.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@login_required
+@limiter.limit("2000 per hour")  # un fichier de 4GB = 512 morceaux de 8MB
+def put_chunk(upload_id, index):
+    """Reçoit un morceau ; le client peut en envoyer plusieurs en parallèle"""
+    conn = get_db_connection()
+    try:
+        upload = chunked_upload.get_upload(conn, upload_id, session['user_id'])
+        if not upload:
+            return jsonify({'error': 'Upload introuvable'}), 404
+        chunked_upload.write_chunk(
+            conn, app.config['UPLOAD_FOLDER'], upload, index,
+            request.stream, request.headers.get('X-Chunk-SHA256')
+        )
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    finally:
+        conn.close()
+    
+    return '', 204
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_chunked_upload(upload_id):
+    """Finalise l'upload : le fichier assemblé est déplacé dans le stockage"""
+    user_id = session['user_id']
+    upload_folder = app.config['UPLOAD_FOLDER']
+    storage = get_storage()
+    
+    conn = get_db_connection()
+    upload = None
+    try:
+        # Session réservée avant toute vérification : une seconde finalisation
+        # simultanée échoue au lieu de déplacer le fichier une seconde fois
+        upload = chunked_upload.claim_upload(conn, upload_id, user_id)
+        if not upload:
+            if chunked_upload.get_upload(conn, upload_id, user_id):
+                return jsonify({'error': 'Finalisation déjà en cours'}), 409
+            return jsonify({'error': 'Upload introuvable'}), 404
+        assembled_path = chunked_upload.complete_upload(conn, upload_folder, upload)
+        
+        unique_filename = upload['stored_name']
+        file_path = os.path.join(upload_folder, unique_filename)
+        file_size = storage.put_file(unique_filename, assembled_path)
+        
+        cursor = conn.cursor()
+        # Fichier déplacé tel quel dans le stockage : pas de compression au
+        # repos, empreinte (checksum NULL) enregistrée par le scrubber
+        cursor.execute(
+            'INSERT INTO files (user_id, filename, original_name, file_path, file_size, folder_id, codec, checksum) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (user_id, unique_filename, upload['original_name'], file_path, file_size, upload['folder_id'], None, None)
+        )
+        file_id = cursor.lastrowid
+        if content_index.is_indexable(upload['original_name']):
+            jobs.enqueue(conn, 'index_file', {'file_id': file_id}, user_id=user_id)
+        if image_hash.is_hashable(upload['original_name']):
+            jobs.enqueue(conn, 'hash_images', {'file_ids': [file_id]}, user_id=user_id)
+        conn.commit()
+        chunked_upload.discard_upload(conn, upload_folder, upload_id)
+    except UploadError as e:
+        chunked_upload.release_upload(conn, upload_id)
+        return jsonify({'error': str(e)}), e.status
+    except (OSError, StorageError) + database.Error as e:
+        app.logger.error(f'Error completing chunked upload {upload_id}: {e}')
+        if upload:
+            conn.rollback()
+            chunked_upload.release_upload(conn, upload_id)
+        return jsonify({'error': 'Erreur lors de la finalisation de l\'upload'}), 500
+    finally:
+        conn.close()
+    
+    return jsonify({'file_id': file_id, 'filename': unique_filename}), 201
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_chunked_upload(upload_id):
+    """Abandonne un upload et libère son fichier partiel"""
+    conn = get_db_connection()
+    try:
+        if not chunked_upload.get_upload(conn, upload_id, session['user_id']):
+            return jsonify({'error': 'Upload introuvable'}), 404
+        chunked_upload.discard_upload(conn, app.config['UPLOAD_FOLDER'], upload_id)
+    finally:
+        conn.close()
+    
+    return '', 204
+
 @app.route('/download/<filename>')
 @login_required
 def download_file(filename):
@@ -546,7 +985,7 @@ def download_file(filename):
     cursor = conn.cursor()
     
     cursor.execute(
-        'SELECT file_path FROM files WHERE filename = ? AND user_id = ?',
+        'SELECT file_path, original_name, file_size, codec FROM files WHERE filename = ? AND user_id = ?',
         (filename, user_id)
     )
     result = cursor.fetchone()
@@ -564,7 +1003,64 @@ def download_file(filename):
         flash('Accès non autorisé.', 'error')
         abort(403)
     
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
+    storage = get_storage()
+    codec = result['codec']
+    if codec:
+        return send_compressed_file(storage, filename, result['original_name'], result['file_size'], codec)
+    
+    # Stockage objet : redirection vers une URL présignée, les octets ne
+    # transitent pas par les workers
+    presigned_url = storage.presigned_url(filename, result['original_name'], app.config['PRESIGNED_URL_EXPIRES'])
+    if presigned_url:
+        return redirect(presigned_url)
+    
+    # Fichier regroupé dans un segment : envoyé depuis le segment (sendfile sous gunicorn)
+    if isinstance(storage, PackStorage):
+        blob_file = storage.packs.open(filename)
+        if blob_file is not None:
+            response = send_file(blob_file, as_attachment=True, download_name=filename)
+            response.content_length = blob_file.size
+            return response
+    
+    return send_from_directory(storage.root, filename, as_attachment=True)
+
+def send_compressed_file(storage, key, original_name, original_size, codec):
+    """Envoie un fichier compressé au repos, décompressé seulement si nécessaire"""
+    client_accepts = request.accept_encodings[codec] > 0
+    
+    if client_accepts:
+        presigned_url = storage.presigned_url(
+            key, original_name, app.config['PRESIGNED_URL_EXPIRES'], content_encoding=codec
+        )
+        if presigned_url:
+            return redirect(presigned_url)
+    
+    # Blob ouvert avant l'envoi des en-têtes : un objet absent donne une 404
+    # (une erreur du stockage une 503) plutôt qu'une réponse interrompue
+    try:
+        blob_file = storage.open(key)
+    except FileNotFoundError:
+        abort(404)
+    chunks = iter(partial(blob_file.read, CHUNK_SIZE), b'')
+    
+    if client_accepts:
+        # Octets compressés transmis tels quels : le client décompresse
+        response = app.response_class(chunks, mimetype='application/octet-stream')
+        response.headers['Content-Encoding'] = codec
+        blob = storage.stat(key)
+        if blob:
+            response.content_length = blob.size
+    else:
+        response = app.response_class(
+            compression.decompress_stream(chunks, codec),
+            mimetype='application/octet-stream'
+        )
+        response.content_length = original_size
+    response.call_on_close(blob_file.close)
+    
+    response.headers.set('Content-Disposition', 'attachment', filename=original_name)
+    response.vary.add('Accept-Encoding')
+    return response
 
 @app.route('/search')
 @login_required
@@ -577,17 +1073,57 @@ def search():
     
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.row_factory = None  # tuples bruts : sérialisés directement en JSON
     
-    # Requête paramétrée avec LIKE sécurisé
-    search_pattern = f'%{query}%'
-    cursor.execute(
-        'SELECT * FROM files WHERE user_id = ? AND original_name LIKE ?',
-        (user_id, search_pattern)
+    # Sous-chaîne de original_name (jokers % et _ échappés), index trigramme
+    name_index.search(cursor, user_id, query)
+    
+    # Réponse JSON produite par lots (fetchmany) ; la connexion est fermée en fin de flux
+    return app.response_class(
+        rows.stream_json_list(cursor, 'files', on_close=conn.close),
+        mimetype='application/json'
     )
-    files = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+
+@app.route('/search/content')
+@login_required
+def search_content():
+    """Recherche dans le contenu des fichiers (extraits surlignés)"""
+    query = request.args.get('q', '').strip()
+    
+    if not query or len(query) > 100:
+        return jsonify({'files': []})
+    
+    conn = get_db_connection()
+    try:
+        results = content_index.search(conn, session['user_id'], query)
+    finally:
+        conn.close()
     
-    return jsonify({'files': files})
+    # Les extraits sont déjà échappés ; seul <mark> y est du HTML
+    return jsonify({'files': results})
+
+@app.route('/similar/<int:file_id>')
+@login_required
+def similar_files(file_id):
+    """Images proches d'un fichier (distance de Hamming des empreintes perceptuelles)"""
+    user_id = session['user_id']
+    distance = request.args.get('distance', image_hash.DEFAULT_DISTANCE, type=int)
+    
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT phash FROM files WHERE id = ? AND user_id = ?', (file_id, user_id))
+        row = cursor.fetchone()
+        if row is None:
+            return jsonify({'error': 'Fichier introuvable'}), 404
+        if row['phash'] is None:
+            # Pas une image, ou empreinte pas encore calculée par le worker
+            return jsonify({'files': [], 'hashed': False})
+        results = image_hash.find_similar(conn, user_id, row['phash'], distance, exclude_id=file_id)
+    finally:
+        conn.close()
+    
+    return jsonify({'files': results, 'hashed': True})
 
 @app.route('/delete_file/<int:file_id>', methods=['POST'])
 @login_required
@@ -602,27 +1138,20 @@ def delete_file(file_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Récupérer le chemin du fichier
-    cursor.execute('SELECT file_path FROM files WHERE id = ?', (file_id,))
+    # Récupérer la clé de stockage du fichier
+    cursor.execute('SELECT filename FROM files WHERE id = ?', (file_id,))
     file_info = cursor.fetchone()
     
     if file_info:
-        file_path = file_info['file_path']
-        
-        # Suppression physique sécurisée
+        # Suppression physique sécurisée (la clé est validée par le driver)
         try:
-            if os.path.exists(file_path):
-                # Vérification du chemin avant suppression
-                safe_path = os.path.normpath(file_path)
-                upload_dir = os.path.normpath(app.config['UPLOAD_FOLDER'])
-                
-                if safe_path.startswith(upload_dir):
-                    os.remove(file_path)
-        except Exception as e:
+            get_storage().delete(file_info['filename'])
+        except (OSError, StorageError) as e:
             app.logger.error(f'Error deleting file: {e}')
         
         # Suppression de la base de données (requête paramétrée)
         cursor.execute('DELETE FROM files WHERE id = ?', (file_id,))
+        content_index.remove_documents(conn, [file_id])
         conn.commit()
         flash('Fichier supprimé avec succès!', 'success')
     else:
@@ -644,22 +1173,35 @@ def delete_folder(folder_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Supprimer les fichiers physiques du dossier
-    cursor.execute('SELECT file_path FROM files WHERE folder_id = ?', (folder_id,))
-    files = cursor.fetchall()
-    
-    for file in files:
-        try:
-            if os.path.exists(file['file_path']):
-                safe_path = os.path.normpath(file['file_path'])
-                upload_dir = os.path.normpath(app.config['UPLOAD_FOLDER'])
-                if safe_path.startswith(upload_dir):
-                    os.remove(file['file_path'])
-        except Exception as e:
-            app.logger.error(f'Error deleting file: {e}')
-    
-    # Les suppressions en cascade sont gérées par les contraintes FK
-    cursor.execute('DELETE FROM folders WHERE id = ?', (folder_id,))
+    # Le dossier et tous ses sous-dossiers : les clés étrangères ne sont pas
+    # appliquées (ni SQLite sans PRAGMA foreign_keys, ni PostgreSQL), rien
+    # n'est supprimé en cascade
+    cursor.execute('''
+        WITH RECURSIVE subtree (id) AS (
+            SELECT id FROM folders WHERE id = ? AND user_id = ?
+            UNION ALL
+            SELECT f.id FROM folders f JOIN subtree s ON f.parent_id = s.id WHERE f.user_id = ?
+        )
+        SELECT id FROM subtree
+    ''', (folder_id, user_id, user_id))
+    folder_ids = [row['id'] for row in cursor.fetchall()]
+    placeholders = ', '.join('?' * len(folder_ids))
+    
+    # Les fichiers physiques sont supprimés en arrière-plan par le worker
+    cursor.execute('SELECT id, filename FROM files WHERE folder_id IN (' + placeholders + ')', folder_ids)
+    folder_files = cursor.fetchall()
+    keys = [file['filename'] for file in folder_files]
+    cursor.execute('SELECT id FROM notes WHERE folder_id IN (' + placeholders + ')', folder_ids)
+    note_ids = [row['id'] for row in cursor.fetchall()]
+    
+    cursor.execute('DELETE FROM files WHERE folder_id IN (' + placeholders + ')', folder_ids)
+    cursor.execute('DELETE FROM notes WHERE folder_id IN (' + placeholders + ')', folder_ids)
+    for note_id in note_ids:
+        note_revisions.delete_revisions(conn, note_id)
+    cursor.execute('DELETE FROM folders WHERE id IN (' + placeholders + ')', folder_ids)
+    content_index.remove_documents(conn, [file['id'] for file in folder_files])
+    if keys:
+        jobs.enqueue(conn, 'delete_blobs', {'keys': keys}, user_id=user_id)
     conn.commit()
     conn.close()
     
@@ -698,6 +1240,7 @@ def create_note():
             'INSERT INTO notes (title, content, folder_id, user_id) VALUES (?, ?, ?, ?)',
             (title, content, folder_id, user_id)
         )
+        note_revisions.record_revision(conn, cursor.lastrowid, user_id, title, content)
         conn.commit()
         flash('Note créée avec succès!', 'success')
     except Exception as e:
@@ -731,17 +1274,77 @@ def edit_note(note_id):
         return redirect(url_for('dashboard'))
     
     conn = get_db_connection()
+    save_note(conn, user_id, note_id, title, content)
+    conn.close()
+    
+    flash('Note modifiée avec succès!', 'success')
+    return redirect(url_for('dashboard'))
+
+def save_note(conn, user_id, note_id, title, content):
+    """Met à jour une note et ajoute une révision à son historique"""
     cursor = conn.cursor()
+    cursor.execute('SELECT title, content FROM notes WHERE id = ?', (note_id,))
+    previous = cursor.fetchone()
     
     # Requête paramétrée
     cursor.execute(
         'UPDATE notes SET title = ?, content = ?, updated_at = ? WHERE id = ?',
         (title, content, datetime.now(), note_id)
     )
+    note_revisions.record_revision(
+        conn, note_id, user_id, title, content,
+        previous=tuple(previous), keep=app.config['NOTE_REVISIONS_KEEP']
+    )
     conn.commit()
+
+@app.route('/notes/<int:note_id>/revisions')
+@login_required
+def note_revision_list(note_id):
+    if not check_resource_ownership(session['user_id'], 'note', note_id):
+        return jsonify({'error': 'Note introuvable'}), 404
+    
+    conn = get_db_connection()
+    revisions = note_revisions.list_revisions(conn, note_id)
     conn.close()
     
-    flash('Note modifiée avec succès!', 'success')
+    return jsonify({'note_id': note_id, 'revisions': revisions})
+
+@app.route('/notes/<int:note_id>/revisions/<int:revision>')
+@login_required
+def note_revision(note_id, revision):
+    if not check_resource_ownership(session['user_id'], 'note', note_id):
+        return jsonify({'error': 'Note introuvable'}), 404
+    
+    conn = get_db_connection()
+    found = note_revisions.get_revision(conn, note_id, revision)
+    conn.close()
+    
+    if not found:
+        return jsonify({'error': 'Révision introuvable'}), 404
+    return jsonify(found)
+
+@app.route('/notes/<int:note_id>/revisions/<int:revision>/restore', methods=['POST'])
+@login_required
+@limiter.limit("50 per hour")
+def restore_note_revision(note_id, revision):
+    user_id = session['user_id']
+    
+    # Vérification de propriété (protection IDOR)
+    if not check_resource_ownership(user_id, 'note', note_id):
+        flash('Accès non autorisé.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    conn = get_db_connection()
+    found = note_revisions.get_revision(conn, note_id, revision)
+    if found:
+        # La restauration est une nouvelle révision : l'historique reste intact
+        save_note(conn, user_id, note_id, found['title'], found['content'])
+    conn.close()
+    
+    if not found:
+        flash('Révision introuvable.', 'error')
+    else:
+        flash(f'Note restaurée à la révision {revision}.', 'success')
     return redirect(url_for('dashboard'))
 
 @app.route('/delete_note/<int:note_id>', methods=['POST'])
@@ -758,6 +1361,7 @@ def delete_note(note_id):
     cursor = conn.cursor()
     
     cursor.execute('DELETE FROM notes WHERE id = ?', (note_id,))
+    note_revisions.delete_revisions(conn, note_id)
     conn.commit()
     conn.close()
     
@@ -824,7 +1428,7 @@ def add_label_to_folder():
     
     try:
         cursor.execute(
-            'INSERT OR IGNORE INTO folder_labels (folder_id, label_id) VALUES (?, ?)',
+            'INSERT INTO folder_labels (folder_id, label_id) VALUES (?, ?) ON CONFLICT DO NOTHING',
             (folder_id, label_id)
         )
         conn.commit()
@@ -873,12 +1477,184 @@ def get_labels():
     
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.row_factory = None
+    
+    cursor.execute('SELECT id, name, color, created_at FROM labels WHERE user_id = ?', (user_id,))
+    
+    return app.response_class(
+        rows.stream_json_list(cursor, 'labels', on_close=conn.close),
+        mimetype='application/json'
+    )
+
+@app.route('/filter')
+@login_required
+def filter_by_labels():
+    """Dossiers, fichiers et notes par étiquettes (?label=1&label=2&mode=and|or) avec facettes"""
+    user_id = session['user_id']
+    label_ids = request.args.getlist('label', type=int)[:facets.MAX_FILTER_LABELS]
+    mode = request.args.get('mode', 'and').lower()
+    limit = min(request.args.get('limit', facets.DEFAULT_LIMIT, type=int), facets.MAX_LIMIT)
+    
+    if mode not in facets.MODES:
+        return jsonify({'error': 'Mode invalide (and ou or)'}), 400
+    
+    conn = get_db_connection()
+    try:
+        if not label_ids:
+            return jsonify({'mode': mode, 'labels': [], 'facets': facets.label_facets(conn, user_id)})
+        
+        # Seules les étiquettes de l'utilisateur sont utilisables (protection IDOR)
+        owned = facets.owned_labels(conn, user_id, label_ids)
+        if len(owned) != len(set(label_ids)):
+            return jsonify({'error': 'Étiquette introuvable'}), 404
+        
+        result = facets.filter_by_labels(conn, user_id, owned, mode, max(1, limit))
+    finally:
+        conn.close()
     
-    cursor.execute('SELECT * FROM labels WHERE user_id = ?', (user_id,))
-    labels = [dict(row) for row in cursor.fetchall()]
+    return jsonify(result)
+
+# Places de flux SSE de ce worker
+event_stream_slots = changefeed.StreamSlots(app.config['SSE_MAX_STREAMS'])
+
+@app.route('/events')
+@login_required
+@limiter.limit("120 per hour")  # reconnexion toutes les 5 minutes par onglet
+def events():
+    """Flux Server-Sent Events des modifications de l'utilisateur"""
+    user_id = session['user_id']
+    # Reconnexion : Last-Event-ID ; première connexion : curseur rendu dans la page
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('since', type=int)
+    if last_id is None:
+        conn = get_db_connection()
+        last_id = changefeed.latest_change_id(conn, user_id)
+        conn.close()
+    
+    if not event_stream_slots.acquire():
+        response = jsonify({'error': 'Trop de flux ouverts, réessayez plus tard'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    
+    stream = changefeed.EventStream(lambda: get_db_connection(user_id), user_id, max(0, last_id), event_stream_slots)
+    response = app.response_class(stream, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx : pas de mise en tampon
+    return response
+
+@app.route('/jobs')
+@login_required
+def list_jobs():
+    user_id = session['user_id']
+    
+    conn = get_db_connection()
+    user_jobs = jobs.list_jobs(conn, user_id)
     conn.close()
     
-    return jsonify({'labels': labels})
+    return jsonify({'jobs': user_jobs})
+
+@app.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    user_id = session['user_id']
+    
+    # Seules les tâches de l'utilisateur sont visibles (protection IDOR)
+    conn = get_db_connection()
+    job = jobs.get_job(conn, job_id, user_id)
+    conn.close()
+    
+    if not job:
+        return jsonify({'error': 'Tâche introuvable'}), 404
+    
+    return jsonify({'job': job})
+
+# Endpoints jamais profilés : la session serait visible dans ses propres résultats
+PROFILING_ENDPOINTS = {
+    'profiling_sessions', 'profiling_session', 'stop_profiling',
+    'download_profile', 'download_stacks', 'download_allocations',
+}
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+@admin_required
+def profiling_sessions():
+    """Liste les sessions de profilage, ou en ouvre une (JSON)"""
+    if profiler is None:
+        return jsonify({'error': 'Profilage désactivé (PROFILING_DB)'}), 404
+    if request.method == 'GET':
+        return jsonify({'sessions': profiler.sessions()})
+    
+    data = request.get_json(silent=True) or {}
+    endpoint = data.get('endpoint')
+    if endpoint not in app.view_functions or endpoint in PROFILING_ENDPOINTS:
+        return jsonify({'error': 'Endpoint inconnu', 'endpoints': sorted(set(app.view_functions) - PROFILING_ENDPOINTS)}), 400
+    try:
+        options = {
+            'allocations': bool(data.get('allocations')),
+            'sample_rate': float(data.get('sample_rate', profiling.DEFAULT_SAMPLE_RATE)),
+            'max_requests': int(data.get('max_requests', profiling.DEFAULT_MAX_REQUESTS)),
+            'duration': int(data.get('duration', profiling.DEFAULT_DURATION)),
+            'max_slowdown': float(data.get('max_slowdown', profiling.DEFAULT_MAX_SLOWDOWN)),
+        }
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Paramètres invalides'}), 400
+    try:
+        session_id = profiler.start(
+            endpoint, mode=data.get('mode', profiling.CPROFILE), created_by=session['username'], **options
+        )
+    except ProfilingError as e:
+        return jsonify({'error': str(e)}), e.status
+    app.logger.info(f'Profiling session {session_id} started on {endpoint} by {session["username"]}')
+    return jsonify({'session': profiler.get(session_id)}), 201
+
+def _profiling_session_or_404(session_id):
+    if profiler is None:
+        abort(404)
+    profile_session = profiler.get(session_id)
+    if profile_session is None:
+        abort(404)
+    return profile_session
+
+@app.route('/admin/profiling/<int:session_id>')
+@admin_required
+def profiling_session(session_id):
+    profile_session = _profiling_session_or_404(session_id)
+    return jsonify({'session': profile_session, 'requests': profiler.requests(session_id)})
+
+@app.route('/admin/profiling/<int:session_id>/stop', methods=['POST'])
+@admin_required
+def stop_profiling(session_id):
+    _profiling_session_or_404(session_id)
+    profiler.stop(session_id, reason='arrêtée par ' + session['username'])
+    return jsonify({'session': profiler.get(session_id)})
+
+def _profile_download(data, filename, mimetype):
+    if data is None:
+        return jsonify({'error': 'Aucun résultat de ce type pour cette session'}), 404
+    response = app.response_class(data, mimetype=mimetype)
+    response.headers.set('Content-Disposition', 'attachment', filename=filename)
+    return response
+
+@app.route('/admin/profiling/<int:session_id>/profile.pstats')
+@admin_required
+def download_profile(session_id):
+    """Profils cProfile fusionnés (python -m pstats, snakeviz)"""
+    _profiling_session_or_404(session_id)
+    return _profile_download(profiler.export_pstats(session_id), f'profile-{session_id}.pstats', 'application/octet-stream')
+
+@app.route('/admin/profiling/<int:session_id>/stacks.folded')
+@admin_required
+def download_stacks(session_id):
+    """Piles échantillonnées repliées (flamegraph.pl, speedscope)"""
+    _profiling_session_or_404(session_id)
+    return _profile_download(profiler.export_folded(session_id), f'stacks-{session_id}.folded', 'text/plain')
+
+@app.route('/admin/profiling/<int:session_id>/allocations.txt')
+@admin_required
+def download_allocations(session_id):
+    _profiling_session_or_404(session_id)
+    return _profile_download(profiler.export_allocations(session_id), f'allocations-{session_id}.txt', 'text/plain')
 
 @app.route('/vulnerabilities')
 def vulnerabilities():
@@ -893,13 +1669,34 @@ def not_found(e):
 def forbidden(e):
     return render_template('403.html'), 403
 
+@app.errorhandler(StorageError)
+def storage_error(e):
+    # Service de stockage injoignable ou en erreur (S3...) : erreur temporaire
+    app.logger.error(f'Storage error: {e}')
+    return render_template('500.html'), 503, {'Retry-After': '30'}
+
+def integrity_error(e):
+    # Écriture sur un fichier de données déplacé pendant la requête
+    if sharding.is_moved_error(e):
+        shard_router.invalidate()
+        response = jsonify({'error': 'Données en cours de déplacement, réessayez'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    return internal_error(e)
+
+for _integrity_error in database.IntegrityError:
+    app.register_error_handler(_integrity_error, integrity_error)
+
 @app.errorhandler(500)
 def internal_error(e):
     app.logger.error(f'Internal error: {e}')
     return render_template('500.html'), 500
 
+_import_duration = time.perf_counter() - _import_started
+
 if __name__ == '__main__':
-    init_db()
+    migrate()
     # Mode debug DÉSACTIVÉ en production
     # Utiliser un serveur WSGI comme Gunicorn en production
     app.run(debug=False, host='127.0.0.1', port=5000)
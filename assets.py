@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""Pipeline des fichiers statiques
+
+Le build (``python assets.py``) :
+- minifie et regroupe les fichiers JS/CSS de ``static/`` selon ``BUNDLES`` ;
+- déduplique les contenus identiques (``app.js`` / ``app-enhanced.js``) ;
+- nomme chaque fichier d'après l'empreinte de son contenu
+  (``dist/js/dashboard.3f2a1b4c.js``) ;
+- précalcule les variantes ``.gz`` et ``.br`` servies directement par nginx ;
+- écrit ``static/dist/manifest.json``.
+
+À l'exécution, ``init_assets(app)`` fait émettre les noms empreintés par
+``url_for('static', filename=...)`` : les templates ne changent pas et le
+cache ``immutable`` devient sûr. ``bundle_urls(nom)`` (global Jinja) donne
+l'URL d'un bundle, ou celles de ses sources tant que le build n'a pas été
+exécuté (développement).
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+
+from flask import url_for
+
+try:
+    import brotli
+except ImportError:  # dépendance optionnelle : seules les variantes .gz sont produites
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIRNAME = 'dist'
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 8
+# Les petits fichiers ne gagnent rien à être compressés
+MIN_PRECOMPRESS_SIZE = 512
+
+# Bundles : nom logique -> fichiers sources (dans l'ordre), inclus dans les
+# templates avec ``bundle_urls()``. Tout fichier JS/CSS de static/ est en
+# outre publié seul sous son propre nom.
+BUNDLES = {
+    # Tableau de bord : script commun (base.html) et script de la page
+    'js/dashboard.bundle.js': ['js/app-tailwind.js', 'js/dashboard.js'],
+}
+
+
+def minify_css(source):
+    """Minification CSS conservatrice (commentaires et espaces superflus)"""
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.DOTALL)
+    source = re.sub(r'\s+', ' ', source)
+    # Pas de suppression autour de + et - : ils sont significatifs dans calc()
+    source = re.sub(r'\s*([{};:,>])\s*', r'\1', source)
+    source = source.replace(';}', '}')
+    return source.strip()
+
+
+def minify_js(source):
+    """Minification JS conservatrice.
+
+    Supprime l'indentation, les lignes vides et les commentaires ``//`` en
+    début de ligne, mais conserve les retours à la ligne (insertion
+    automatique des points-virgules) et le contenu des template literals.
+    """
+    lines = []
+    in_template = False
+    for line in source.splitlines():
+        if in_template:
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if not stripped or stripped.startswith('//'):
+                continue
+            lines.append(stripped)
+        # Un nombre impair de backticks non échappés ouvre ou ferme un template literal
+        if len(re.findall(r'(?<!\\)`', line)) % 2:
+            in_template = not in_template
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def discover_sources(static_dir=STATIC_DIR):
+    """Retourne les fichiers JS/CSS de static/ (chemins relatifs, hors dist/)"""
+    sources = []
+    for subdir in ('js', 'css'):
+        directory = os.path.join(static_dir, subdir)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if os.path.splitext(name)[1] in MINIFIERS:
+                sources.append(f'{subdir}/{name}')
+    return sources
+
+
+def build_bundle(static_dir, sources):
+    """Concatène et minifie les sources d'un bundle"""
+    ext = os.path.splitext(sources[0])[1]
+    parts = []
+    for source in sources:
+        with open(os.path.join(static_dir, source), 'r', encoding='utf-8') as f:
+            parts.append(MINIFIERS[ext](f.read()))
+    # Le séparateur ';' évite qu'un fichier JS sans point-virgule final ne
+    # fusionne avec le suivant
+    separator = '\n;\n' if ext == '.js' else '\n'
+    return separator.join(parts).encode('utf-8')
+
+
+def write_precompressed(path, data):
+    """Écrit les variantes .gz et .br à côté du fichier"""
+    if len(data) < MIN_PRECOMPRESS_SIZE:
+        return
+    with open(path + '.gz', 'wb') as f:
+        # mtime=0 : build reproductible
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def build(static_dir=STATIC_DIR):
+    """Construit static/dist/ et retourne le manifeste {nom logique: nom empreinté}"""
+    dist_dir = os.path.join(static_dir, DIST_DIRNAME)
+    os.makedirs(dist_dir, exist_ok=True)
+
+    bundles = {source: [source] for source in discover_sources(static_dir)}
+    bundles.update(BUNDLES)
+
+    manifest = {}
+    written = {}  # empreinte -> nom publié (déduplication)
+    for logical_name, sources in sorted(bundles.items()):
+        data = build_bundle(static_dir, sources)
+        digest = hashlib.sha256(data).hexdigest()
+
+        if digest in written:
+            manifest[logical_name] = written[digest]
+            continue
+
+        stem, ext = os.path.splitext(logical_name)
+        hashed_name = f'{DIST_DIRNAME}/{stem}.{digest[:HASH_LENGTH]}{ext}'
+        path = os.path.join(static_dir, hashed_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        write_precompressed(path, data)
+
+        written[digest] = hashed_name
+        manifest[logical_name] = hashed_name
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_dir):
+    """Charge le manifeste s'il existe (sinon les fichiers sources sont servis)"""
+    try:
+        with open(os.path.join(static_dir, DIST_DIRNAME, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def init_assets(app):
+    """Fait pointer url_for('static', ...) vers les fichiers empreintés"""
+    manifest = load_manifest(app.static_folder)
+    app.extensions['asset_manifest'] = manifest
+
+    def bundle_urls(name):
+        if name in manifest:
+            return [url_for('static', filename=name)]
+        return [url_for('static', filename=source) for source in BUNDLES.get(name, [name])]
+
+    app.jinja_env.globals['bundle_urls'] = bundle_urls
+    if not manifest:
+        return
+
+    @app.url_defaults
+    def hashed_static_url(endpoint, values):
+        if endpoint == 'static':
+            filename = values.get('filename')
+            if filename in manifest:
+                values['filename'] = manifest[filename]
+
+    # Les fichiers empreintés ne changent jamais : cache d'un an
+    default_max_age = app.get_send_file_max_age
+
+    def get_send_file_max_age(filename):
+        if filename and filename.startswith(DIST_DIRNAME + '/'):
+            return 365 * 24 * 3600
+        return default_max_age(filename)
+
+    app.get_send_file_max_age = get_send_file_max_age
+
+
+if __name__ == '__main__':
+    static_dir = sys.argv[1] if len(sys.argv) > 1 else STATIC_DIR
+    print("Construction des fichiers statiques...")
+    manifest = build(static_dir)
+    for logical_name, hashed_name in sorted(manifest.items()):
+        print(f"  {logical_name:30} -> {hashed_name}")
+    if brotli is None:
+        print("⚠ Module brotli absent : seules les variantes .gz ont été générées")
+    print(f"✓ {len(set(manifest.values()))} fichiers publiés pour {len(manifest)} entrées")
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""Sauvegarde et restauration de la base de données et des fichiers uploadés
+
+- La base est copiée à chaud avec l'API de backup en ligne de SQLite, par
+  pas de ``--pages`` pages : le verrou de lecture est relâché entre deux
+  pas et les écritures de l'application continuent (``--method vacuum``
+  utilise ``VACUUM INTO``, une seule transaction de lecture compacte).
+- Les fichiers sont copiés de façon incrémentale : les triggers de la
+  table ``files`` alimentent le journal ``file_changes`` et seuls les
+  fichiers ajoutés depuis la dernière sauvegarde sont copiés.
+- La restauration vérifie l'instantané (``PRAGMA integrity_check``,
+  empreinte SHA-256, présence des fichiers) avant de remplacer quoi que ce
+  soit. Les fichiers supprimés entre l'instantané et leur copie sont listés
+  dans le manifeste (``missing``) : vérification et restauration les
+  ignorent.
+
+Usage :
+    python backup.py snapshot [--keep 7]       # nouvelle sauvegarde
+    python backup.py list                      # sauvegardes disponibles
+    python backup.py verify <nom> [--deep]     # vérification seule
+    python backup.py restore <nom>             # restauration (application arrêtée)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database
+from storage import validate_key
+
+BACKUP_DIR = os.environ.get('BACKUP_DIR', 'backups')
+DEFAULT_PAGES = 256  # pages copiées par pas (1MB avec des pages de 4KB)
+DEFAULT_SLEEP = 0.005  # secondes entre deux pas : laisse passer les écritures
+MAX_RESTARTS = 5  # redémarrages tolérés avant une copie en un seul pas
+COPY_BUFFER = 1024 * 1024
+
+
+class BackupError(Exception):
+    """Sauvegarde invalide ou incomplète"""
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def create_change_log(cursor):
+    """Crée le journal des modifications de ``files`` et ses triggers"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS file_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            op TEXT NOT NULL CHECK(op IN ('I', 'D')),
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    database.create_trigger(cursor, 'files_log_insert', 'INSERT', 'files', '''
+        INSERT INTO file_changes (file_id, filename, op) VALUES (NEW.id, NEW.filename, 'I')
+    ''')
+    database.create_trigger(cursor, 'files_log_delete', 'DELETE', 'files', '''
+        INSERT INTO file_changes (file_id, filename, op) VALUES (OLD.id, OLD.filename, 'D')
+    ''')
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BUFFER), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_database(src_path, dest_path, pages=DEFAULT_PAGES, sleep=DEFAULT_SLEEP):
+    """Copie la base à chaud par pas de ``pages`` pages ; retourne des statistiques.
+
+    Une écriture d'une autre connexion pendant la copie la fait repartir du
+    début : après ``MAX_RESTARTS`` redémarrages la base est copiée en un
+    seul pas pour garantir la terminaison sous forte charge d'écriture.
+    """
+    state = {'steps': 0, 'restarts': 0, 'remaining': None, 'total': 0}
+
+    def progress(status, remaining, total):
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > MAX_RESTARTS:
+                # Une exception dans le callback interrompt le backup en cours
+                raise _TooManyRestarts()
+        state['remaining'] = remaining
+        state['total'] = total
+        state['steps'] += 1
+
+    started = time.perf_counter()
+    src = sqlite3.connect(src_path, timeout=30)
+    dest = sqlite3.connect(dest_path)
+    try:
+        try:
+            src.backup(dest, pages=pages, progress=progress, sleep=sleep)
+        except _TooManyRestarts:
+            src.backup(dest, pages=-1)
+    finally:
+        dest.close()
+        src.close()
+
+    return {
+        'method': 'backup',
+        'pages': state['total'],
+        'steps': state['steps'],
+        'restarts': state['restarts'],
+        'seconds': round(time.perf_counter() - started, 3),
+        'bytes': os.path.getsize(dest_path),
+    }
+
+
+def vacuum_into(src_path, dest_path):
+    """Copie compactée de la base en une transaction de lecture"""
+    started = time.perf_counter()
+    conn = sqlite3.connect(src_path, timeout=30)
+    try:
+        conn.execute('VACUUM INTO ?', (dest_path,))
+    finally:
+        conn.close()
+    return {
+        'method': 'vacuum',
+        'seconds': round(time.perf_counter() - started, 3),
+        'bytes': os.path.getsize(dest_path),
+    }
+
+
+class BlobCatalog:
+    """Catalogue des fichiers déjà sauvegardés (``backups/catalog.db``)"""
+
+    def __init__(self, backup_dir):
+        self.blob_dir = os.path.join(backup_dir, 'blobs')
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(backup_dir, 'catalog.db'))
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                copied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value INTEGER)')
+        self.conn.commit()
+
+    def path(self, key):
+        return os.path.join(self.blob_dir, validate_key(key))
+
+    def get(self, key):
+        """Retourne ``(size, sha256)`` d'un fichier sauvegardé, ou None"""
+        return self.conn.execute('SELECT size, sha256 FROM blobs WHERE key = ?', (key,)).fetchone()
+
+    def last_seq(self):
+        row = self.conn.execute("SELECT value FROM state WHERE name = 'last_seq'").fetchone()
+        return row[0] if row else None
+
+    def set_last_seq(self, seq):
+        self.conn.execute("INSERT OR REPLACE INTO state (name, value) VALUES ('last_seq', ?)", (seq,))
+        self.conn.commit()
+
+    def copy_from(self, storage, key):
+        """Copie un fichier du stockage dans la sauvegarde ; retourne sa taille"""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as out, storage.open(key) as src:
+                for block in iter(lambda: src.read(COPY_BUFFER), b''):
+                    digest.update(block)
+                    out.write(block)
+                    size += len(block)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.conn.execute(
+            'INSERT OR REPLACE INTO blobs (key, size, sha256) VALUES (?, ?, ?)',
+            (key, size, digest.hexdigest())
+        )
+        self.conn.commit()
+        return size
+
+    def prune(self, keep_keys):
+        """Supprime les fichiers qu'aucune sauvegarde conservée ne référence"""
+        removed = 0
+        for (key,) in self.conn.execute('SELECT key FROM blobs').fetchall():
+            if key not in keep_keys:
+                try:
+                    os.remove(self.path(key))
+                except FileNotFoundError:
+                    pass
+                self.conn.execute('DELETE FROM blobs WHERE key = ?', (key,))
+                removed += 1
+        self.conn.commit()
+        return removed
+
+    def close(self):
+        self.conn.close()
+
+
+def _snapshot_keys(snapshot_path):
+    conn = sqlite3.connect('file:' + snapshot_path + '?mode=ro', uri=True)
+    try:
+        return {row[0] for row in conn.execute('SELECT filename FROM files')}
+    finally:
+        conn.close()
+
+
+def backup_blobs(snapshot_path, storage, catalog):
+    """Copie les fichiers ajoutés depuis la dernière sauvegarde.
+
+    Le journal est lu dans l'instantané : les fichiers copiés sont
+    exactement ceux que l'instantané référence. La première sauvegarde
+    copie tous les fichiers de la table ``files``.
+    """
+    conn = sqlite3.connect('file:' + snapshot_path + '?mode=ro', uri=True)
+    try:
+        max_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM file_changes').fetchone()[0]
+        last_seq = catalog.last_seq()
+        if last_seq is None:
+            keys = [row[0] for row in conn.execute('SELECT filename FROM files')]
+        else:
+            # Ajouts du journal encore présents dans l'instantané
+            keys = [row[0] for row in conn.execute(
+                'SELECT DISTINCT c.filename FROM file_changes c JOIN files f ON f.filename = c.filename '
+                "WHERE c.seq > ? AND c.op = 'I'",
+                (last_seq,)
+            )]
+    finally:
+        conn.close()
+
+    copied, total_bytes, missing = 0, 0, []
+    for key in keys:
+        if catalog.get(key) is not None:
+            continue
+        if storage.stat(key) is None:
+            # Supprimé depuis l'instantané : il manquera à cette sauvegarde
+            missing.append(key)
+            continue
+        total_bytes += catalog.copy_from(storage, key)
+        copied += 1
+    catalog.set_last_seq(max_seq)
+    return {'blobs_copied': copied, 'blob_bytes': total_bytes, 'missing': missing, 'last_seq': max_seq}
+
+
+def list_snapshots(backup_dir=BACKUP_DIR):
+    db_dir = os.path.join(backup_dir, 'db')
+    if not os.path.isdir(db_dir):
+        return []
+    return sorted(name[:-3] for name in os.listdir(db_dir) if name.endswith('.db'))
+
+
+def run_backup(db_path, storage, backup_dir=BACKUP_DIR, method='backup',
+               pages=DEFAULT_PAGES, sleep=DEFAULT_SLEEP, keep=None):
+    """Sauvegarde complète : instantané de la base puis fichiers incrémentaux"""
+    db_dir = os.path.join(backup_dir, 'db')
+    os.makedirs(db_dir, exist_ok=True)
+    # Microsecondes : deux sauvegardes de la même seconde ne s'écrasent pas
+    name = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    snapshot_path = os.path.join(db_dir, name + '.db')
+    tmp_path = snapshot_path + '.part'
+    if os.path.exists(snapshot_path) or os.path.exists(tmp_path):
+        raise BackupError(f'Sauvegarde {name} déjà existante')
+
+    if method == 'vacuum':
+        stats = vacuum_into(db_path, tmp_path)
+    else:
+        stats = snapshot_database(db_path, tmp_path, pages=pages, sleep=sleep)
+    os.replace(tmp_path, snapshot_path)
+
+    catalog = BlobCatalog(backup_dir)
+    try:
+        stats.update(backup_blobs(snapshot_path, storage, catalog))
+        stats['sha256'] = _sha256_file(snapshot_path)
+        stats['created_at'] = datetime.now().isoformat()
+        with open(os.path.join(db_dir, name + '.json'), 'w') as f:
+            json.dump(stats, f, indent=2)
+
+        # Le journal déjà sauvegardé n'est plus utile dans la base vivante
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            conn.execute('DELETE FROM file_changes WHERE seq <= ?', (stats['last_seq'],))
+            conn.commit()
+        finally:
+            conn.close()
+
+        if keep:
+            for old in list_snapshots(backup_dir)[:-keep]:
+                for ext in ('.db', '.json'):
+                    try:
+                        os.remove(os.path.join(db_dir, old + ext))
+                    except FileNotFoundError:
+                        pass
+            kept = set()
+            for remaining in list_snapshots(backup_dir):
+                kept |= _snapshot_keys(os.path.join(db_dir, remaining + '.db'))
+            stats['blobs_pruned'] = catalog.prune(kept)
+    finally:
+        catalog.close()
+    return name, stats
+
+
+def _load_manifest(backup_dir, name):
+    try:
+        with open(os.path.join(backup_dir, 'db', name + '.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _unavailable_keys(manifest):
+    """Fichiers supprimés entre l'instantané et leur copie (``missing`` du
+    manifeste) : référencés par l'instantané, absents de la sauvegarde par
+    construction"""
+    return set(manifest.get('missing', [])) if manifest else set()
+
+
+def verify_snapshot(name, backup_dir=BACKUP_DIR, deep=False):
+    """Vérifie une sauvegarde ; retourne la liste des problèmes détectés"""
+    db_dir = os.path.join(backup_dir, 'db')
+    snapshot_path = os.path.join(db_dir, name + '.db')
+    if not os.path.exists(snapshot_path):
+        return [f'Sauvegarde introuvable : {name}']
+
+    problems = []
+    manifest = _load_manifest(backup_dir, name)
+    if manifest is not None:
+        if manifest.get('sha256') != _sha256_file(snapshot_path):
+            problems.append('Empreinte SHA-256 de la base différente du manifeste')
+    else:
+        problems.append('Manifeste absent')
+    unavailable = _unavailable_keys(manifest)
+
+    conn = sqlite3.connect('file:' + snapshot_path + '?mode=ro', uri=True)
+    try:
+        result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        if result != 'ok':
+            problems.append(f'integrity_check : {result}')
+        keys = [row[0] for row in conn.execute('SELECT filename FROM files')]
+    finally:
+        conn.close()
+
+    catalog = BlobCatalog(backup_dir)
+    try:
+        for key in keys:
+            if key in unavailable:
+                continue
+            entry = catalog.get(key)
+            path = catalog.path(key)
+            if entry is None or not os.path.exists(path):
+                problems.append(f'Fichier absent de la sauvegarde : {key}')
+            elif os.path.getsize(path) != entry[0]:
+                problems.append(f'Taille incorrecte : {key}')
+            elif deep and _sha256_file(path) != entry[1]:
+                problems.append(f'Empreinte incorrecte : {key}')
+    finally:
+        catalog.close()
+    return problems
+
+
+def restore(name, db_path, storage, backup_dir=BACKUP_DIR):
+    """Restaure une sauvegarde vérifiée (base puis fichiers manquants ou différents)"""
+    problems = verify_snapshot(name, backup_dir)
+    if problems:
+        raise BackupError('Sauvegarde invalide : ' + '; '.join(problems[:5]))
+
+    snapshot_path = os.path.join(backup_dir, 'db', name + '.db')
+    unavailable = _unavailable_keys(_load_manifest(backup_dir, name))
+    # Copie à côté de la base puis renommage atomique
+    tmp_path = db_path + '.restore'
+    src = sqlite3.connect('file:' + snapshot_path + '?mode=ro', uri=True)
+    dest = sqlite3.connect(tmp_path)
+    try:
+        src.backup(dest)
+        keys = [row[0] for row in src.execute('SELECT filename FROM files')]
+    finally:
+        dest.close()
+        src.close()
+
+    catalog = BlobCatalog(backup_dir)
+    restored = 0
+    try:
+        for key in keys:
+            if key in unavailable:
+                continue
+            size = catalog.get(key)[0]
+            current = storage.stat(key)
+            if current is None or current.size != size:
+                with open(catalog.path(key), 'rb') as f:
+                    storage.put(key, f)
+                restored += 1
+    finally:
+        catalog.close()
+
+    os.replace(tmp_path, db_path)
+    return {'files': len(keys), 'blobs_restored': restored, 'blobs_unavailable': len(unavailable & set(keys))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sauvegarde de la base et des fichiers uploadés')
+    parser.add_argument('--backup-dir', default=BACKUP_DIR)
+    parser.add_argument('--db', help='Fichier SQLite (par défaut celui de DATABASE_URL)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    snapshot = commands.add_parser('snapshot', help='Nouvelle sauvegarde')
+    snapshot.add_argument('--method', choices=['backup', 'vacuum'], default='backup')
+    snapshot.add_argument('--pages', type=int, default=DEFAULT_PAGES, help='Pages copiées par pas')
+    snapshot.add_argument('--sleep', type=float, default=DEFAULT_SLEEP, help='Pause entre deux pas (s)')
+    snapshot.add_argument('--keep', type=int, help='Nombre de sauvegardes conservées')
+
+    commands.add_parser('list', help='Sauvegardes disponibles')
+
+    verify = commands.add_parser('verify', help='Vérifier une sauvegarde')
+    verify.add_argument('name')
+    verify.add_argument('--deep', action='store_true', help='Recalculer les empreintes des fichiers')
+
+    restore_cmd = commands.add_parser('restore', help='Restaurer une sauvegarde (application arrêtée)')
+    restore_cmd.add_argument('name')
+
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for name in list_snapshots(args.backup_dir):
+            print(name)
+        return 0
+
+    if args.command == 'verify':
+        problems = verify_snapshot(args.name, args.backup_dir, deep=args.deep)
+        for problem in problems:
+            print(f'✗ {problem}')
+        if not problems:
+            print(f'✓ Sauvegarde {args.name} valide')
+        return 1 if problems else 0
+
+    from app import get_storage, main_database, shard_router
+
+    if main_database.backend != 'sqlite':
+        # Instantané par l'API backup de SQLite : une base PostgreSQL se sauvegarde avec pg_dump
+        print(f'✗ DATABASE_URL désigne une base {main_database.backend} : utiliser pg_dump / pg_restore')
+        return 1
+    if shard_router.enabled:
+        # La base principale n'est plus que le catalogue : l'instantané ne
+        # contiendrait aucun fichier, note ni dossier
+        print(f'✗ DB_SHARD_MODE={shard_router.mode} : données réparties sur plusieurs fichiers, '
+              f'non prises en charge par backup.py')
+        return 1
+
+    db_path = args.db or main_database.path
+    if args.command == 'snapshot':
+        try:
+            name, stats = run_backup(db_path, get_storage(), args.backup_dir, method=args.method,
+                                     pages=args.pages, sleep=args.sleep, keep=args.keep)
+        except BackupError as e:
+            print(f'✗ {e}')
+            return 1
+        print(f"✓ Sauvegarde {name} : base {stats['bytes'] / 1e6:.1f} Mo en {stats['seconds']}s, "
+              f"{stats['blobs_copied']} fichier(s) copié(s) ({stats['blob_bytes'] / 1e6:.1f} Mo)")
+        for key in stats['missing']:
+            print(f'  ⚠ fichier supprimé pendant la sauvegarde : {key}')
+        return 0
+
+    try:
+        stats = restore(args.name, db_path, get_storage(), args.backup_dir)
+    except BackupError as e:
+        print(f'✗ {e}')
+        return 1
+    print(f"✓ Sauvegarde {args.name} restaurée : {stats['files']} fichier(s), "
+          f"{stats['blobs_restored']} recopié(s)")
+    if stats['blobs_unavailable']:
+        print(f"  ⚠ {stats['blobs_unavailable']} fichier(s) supprimé(s) pendant la sauvegarde, non restauré(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
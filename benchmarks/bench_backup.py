@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Benchmark des sauvegardes à chaud (backup.py)
+
+Mesure, sur une base d'environ ``--size-mb`` Mo :
+- le débit de l'instantané selon le nombre de pages par pas (API de backup
+  en ligne) et avec ``VACUUM INTO`` ;
+- l'impact sur un écrivain concurrent (latence p50 / p99 / max d'un
+  INSERT + COMMIT, à ``--write-rate`` écritures par seconde) ;
+- la copie complète puis incrémentale des fichiers.
+
+Usage :
+    python benchmarks/bench_backup.py [--size-mb 100] [--write-rate 50] [--blobs 2000]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+# Ajouter le répertoire racine au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup
+from storage import LocalStorage
+
+ROW_SIZE = 4096
+
+
+def create_database(path, size_mb):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            original_name TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_size INTEGER
+        )
+    ''')
+    conn.execute('CREATE TABLE notes (id INTEGER PRIMARY KEY AUTOINCREMENT, content TEXT)')
+    backup.create_change_log(conn.cursor())
+    rows = size_mb * 1024 * 1024 // ROW_SIZE
+    conn.executemany('INSERT INTO notes (content) VALUES (?)', (('x' * ROW_SIZE,) for _ in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+class Writer(threading.Thread):
+    """Écrivain concurrent : mesure la latence de chaque transaction"""
+
+    def __init__(self, path, rate):
+        super().__init__(daemon=True)
+        self.path = path
+        self.interval = 1.0 / rate
+        self.latencies = []
+        self.stopping = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        while not self.stopping.is_set():
+            start = time.perf_counter()
+            conn.execute('INSERT INTO notes (content) VALUES (?)', ('écriture concurrente',))
+            conn.commit()
+            self.latencies.append(time.perf_counter() - start)
+            self.stopping.wait(self.interval)
+        conn.close()
+
+
+def percentiles(values):
+    if not values:
+        return 0, 0, 0
+    values = sorted(values)
+    return values[len(values) // 2], values[int(len(values) * 0.99)], values[-1]
+
+
+def measure(db_path, dest_dir, label, func, rate):
+    writer = Writer(db_path, rate) if rate else None
+    if writer:
+        writer.start()
+        time.sleep(0.2)
+    dest = os.path.join(dest_dir, label.replace(' ', '_') + '.db')
+    stats = func(db_path, dest)
+    if writer:
+        writer.stopping.set()
+        writer.join()
+    os.remove(dest)
+    latencies = writer.latencies if writer else []
+    return stats, percentiles(latencies), len(latencies)
+
+
+def bench_snapshots(db_path, tmpdir, rate):
+    variants = [
+        ('pages=64', lambda s, d: backup.snapshot_database(s, d, pages=64)),
+        ('pages=1024', lambda s, d: backup.snapshot_database(s, d, pages=1024)),
+        ('pages=-1', lambda s, d: backup.snapshot_database(s, d, pages=-1, sleep=0)),
+        ('vacuum into', backup.vacuum_into),
+    ]
+
+    # Référence : latence de l'écrivain sans sauvegarde
+    writer = Writer(db_path, rate)
+    writer.start()
+    time.sleep(2)
+    writer.stopping.set()
+    writer.join()
+    p50, p99, worst = percentiles(writer.latencies)
+    print(f"{'variante':>12} | {'durée (s)':>9} | {'Mo/s':>6} | {'redém.':>6} | "
+          f"{'écr. p50 (ms)':>13} | {'p99 (ms)':>8} | {'max (ms)':>8}")
+    print('-' * 84)
+    print(f"{'sans backup':>12} | {'-':>9} | {'-':>6} | {'-':>6} | "
+          f'{p50 * 1000:>13.2f} | {p99 * 1000:>8.2f} | {worst * 1000:>8.2f}')
+
+    for label, func in variants:
+        stats, (p50, p99, worst), _ = measure(db_path, tmpdir, label, func, rate)
+        throughput = stats['bytes'] / 1e6 / stats['seconds'] if stats['seconds'] else 0
+        print(f"{label:>12} | {stats['seconds']:>9.2f} | {throughput:>6.0f} | {stats.get('restarts', 0):>6} | "
+              f'{p50 * 1000:>13.2f} | {p99 * 1000:>8.2f} | {worst * 1000:>8.2f}')
+
+
+def bench_blobs(tmpdir, count):
+    storage = LocalStorage(os.path.join(tmpdir, 'uploads'))
+    db_path = os.path.join(tmpdir, 'blobs.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE files (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT NOT NULL)')
+    backup.create_change_log(conn.cursor())
+    payload = os.urandom(64 * 1024)
+
+    def add_files(start, n):
+        for i in range(start, start + n):
+            key = f'{i:08d}_doc.pdf'
+            with open(storage.path(key), 'wb') as f:
+                f.write(payload)
+            conn.execute('INSERT INTO files (filename) VALUES (?)', (key,))
+        conn.commit()
+
+    catalog = backup.BlobCatalog(os.path.join(tmpdir, 'backups'))
+    snapshot = os.path.join(tmpdir, 'snapshot.db')
+    print(f'\nFichiers ({count} x 64 Ko)')
+    for label, start, n in (('complète', 0, count), ('incrémentale', count, count // 20)):
+        add_files(start, n)
+        backup.snapshot_database(db_path, snapshot)
+        started = time.perf_counter()
+        stats = backup.backup_blobs(snapshot, storage, catalog)
+        elapsed = time.perf_counter() - started
+        print(f"  {label:>12} : {stats['blobs_copied']:>6} fichier(s) en {elapsed:.2f}s "
+              f"({stats['blob_bytes'] / 1e6 / elapsed:.0f} Mo/s)")
+    catalog.close()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=100)
+    parser.add_argument('--write-rate', type=int, default=50, help='Écritures concurrentes par seconde')
+    parser.add_argument('--blobs', type=int, default=2000)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench_backup_')
+    db_path = os.path.join(tmpdir, 'database.db')
+    create_database(db_path, args.size_mb)
+    print(f'Base de {os.path.getsize(db_path) / 1e6:.0f} Mo, {args.write_rate} écritures/s concurrentes\n')
+
+    bench_snapshots(db_path, tmpdir, args.write_rate)
+    bench_blobs(tmpdir, args.blobs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Benchmark de l'index plein texte du contenu des fichiers
+
+Mesure, sur des documents texte synthétiques :
+- l'extraction (fichiers .txt) en série puis dans le pool de processus ;
+- le débit d'indexation FTS5 (documents/s, Mo/s) ;
+- la latence des recherches (p50 / p95) avec filtre utilisateur et extraits.
+
+Usage :
+    python benchmarks/bench_content_index.py [--docs 100000] [--users 100]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Ajouter le répertoire racine au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import content_index
+
+WORDS_PER_DOC = 300
+BATCH_SIZE = 1000
+QUERIES = ['facture', 'contrat bail', 'électricité', 'archiv', 'mot4999', 'inexistant']
+
+
+def vocabulary(size=5000):
+    base = ['facture', 'contrat', 'bail', 'électricité', 'archive', 'rapport', 'réunion',
+            'paiement', 'client', 'fournisseur', 'avenant', 'signature', 'Lomé', 'projet']
+    return base + [f'mot{i}' for i in range(size - len(base))]
+
+
+def make_document(rng, words):
+    # Distribution de Zipf approximative : quelques mots très fréquents
+    return ' '.join(words[min(int(rng.paretovariate(1.1)) - 1, len(words) - 1)] for _ in range(WORDS_PER_DOC))
+
+
+def create_database(path):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            original_name TEXT NOT NULL,
+            folder_id INTEGER
+        )
+    ''')
+    content_index.create_content_index(conn.cursor())
+    conn.commit()
+    return conn
+
+
+def bench_extraction(tmpdir, rng, words, count):
+    paths = []
+    for i in range(count):
+        path = os.path.join(tmpdir, f'doc{i}.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(make_document(rng, words))
+        paths.append(path)
+
+    start = time.perf_counter()
+    for path in paths:
+        content_index.extract_text(path, 'txt')
+    serial = time.perf_counter() - start
+
+    pool = content_index.get_pool()
+    list(pool.map(content_index.extract_text, paths[:10], ['txt'] * 10))  # démarrage des processus
+    start = time.perf_counter()
+    list(pool.map(content_index.extract_text, paths, ['txt'] * count, chunksize=32))
+    pooled = time.perf_counter() - start
+    return serial, pooled
+
+
+def bench_indexing(conn, rng, words, docs, users):
+    total_bytes = 0
+    start = time.perf_counter()
+    for batch_start in range(0, docs, BATCH_SIZE):
+        for i in range(batch_start, min(batch_start + BATCH_SIZE, docs)):
+            user_id = i % users + 1
+            cursor = conn.execute(
+                'INSERT INTO files (user_id, filename, original_name, folder_id) VALUES (?, ?, ?, ?)',
+                (user_id, f'{i:036d}_doc{i}.txt', f'doc{i}.txt', None)
+            )
+            text = make_document(rng, words)
+            total_bytes += len(text)
+            content_index.index_document(conn, cursor.lastrowid, user_id, text)
+        conn.commit()
+    return time.perf_counter() - start, total_bytes
+
+
+def bench_queries(conn, users, repeat=50):
+    results = {}
+    for query in QUERIES:
+        timings = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            found = content_index.search(conn, i % users + 1, query)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        results[query] = (timings[len(timings) // 2], timings[int(len(timings) * 0.95)], len(found))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--extract', type=int, default=2000, help='Fichiers pour la mesure d\'extraction')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    words = vocabulary()
+    tmpdir = tempfile.mkdtemp(prefix='bench_content_index_')
+
+    serial, pooled = bench_extraction(tmpdir, rng, words, args.extract)
+    print(f'Extraction de {args.extract} fichiers .txt')
+    print(f'  série : {args.extract / serial:>8.0f} fichiers/s')
+    print(f'  pool  : {args.extract / pooled:>8.0f} fichiers/s')
+
+    conn = create_database(os.path.join(tmpdir, 'bench.db'))
+    elapsed, total_bytes = bench_indexing(conn, rng, words, args.docs, args.users)
+    print(f'\nIndexation de {args.docs} documents ({total_bytes / 1e6:.0f} Mo de texte)')
+    print(f'  {args.docs / elapsed:.0f} documents/s, {total_bytes / 1e6 / elapsed:.1f} Mo/s')
+    print(f'  taille de la base : {os.path.getsize(os.path.join(tmpdir, "bench.db")) / 1e6:.0f} Mo')
+
+    print(f"\n{'requête':>14} | {'p50 (ms)':>9} | {'p95 (ms)':>9} | {'résultats':>9}")
+    print('-' * 50)
+    for query, (p50, p95, count) in bench_queries(conn, args.users).items():
+        print(f'{query:>14} | {p50 * 1000:>9.2f} | {p95 * 1000:>9.2f} | {count:>9}')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Benchmark SQLite contre PostgreSQL (pool de connexions, requêtes préparées)
+
+Trois mesures, chacune sur une base créée par init_db() :
+- une « requête » typique : emprunt d'une connexion, lecture des notes d'un
+  utilisateur, restitution ; SQLite, PostgreSQL avec une connexion ouverte
+  par requête, PostgreSQL avec le pool ;
+- la même lecture répétée sur une connexion, avec et sans préparation
+  (``prepare_threshold``) ;
+- des écrivains simultanés (un processus par worker gunicorn) : SQLite
+  n'accepte qu'un écrivain à la fois, PostgreSQL verrouille par ligne.
+
+La base PostgreSQL doit être vide et dédiée au benchmark (ses tables sont
+supprimées au début) :
+
+Usage :
+    python benchmarks/bench_database.py --url postgresql://postgres@localhost/bench
+        [--requests 2000] [--seconds 3] [--writers 1 4 8]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Ajouter le répertoire racine au path pour les imports
+sys.path.insert(0, ROOT)
+
+USERS = 50
+NOTES_PER_USER = 40
+NOTES_QUERY = 'SELECT id, title, content, created_at FROM notes WHERE user_id = ? ORDER BY created_at DESC LIMIT 20'
+
+
+def load_app(url):
+    """Importe l'application avec DATABASE_URL (à faire dans chaque processus)"""
+    os.environ['DATABASE_URL'] = url
+    import app
+
+    return app
+
+
+def reset_postgres(url):
+    import psycopg
+
+    with psycopg.connect(url, autocommit=True) as conn:
+        conn.execute('DROP SCHEMA public CASCADE')
+        conn.execute('CREATE SCHEMA public')
+
+
+def populate(app):
+    app.migrate()
+    conn = app.get_db_connection()
+    conn.executemany(
+        'INSERT INTO notes (title, content, user_id) VALUES (?, ?, ?)',
+        [('note ' + str(i), 'contenu ' * 30, user_id)
+         for user_id in range(1, USERS + 1) for i in range(NOTES_PER_USER)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def timed(iterations, func):
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_requests(app, url, iterations):
+    def pooled(i):
+        conn = app.get_db_connection()
+        conn.execute(NOTES_QUERY, (i % USERS + 1,)).fetchall()
+        conn.close()
+
+    if app.main_database.backend == 'sqlite':
+        return {'connexion par requête': timed(iterations, pooled)}
+
+    import psycopg
+
+    def unpooled(i):
+        with psycopg.connect(url, autocommit=True) as conn:
+            conn.execute(
+                NOTES_QUERY.replace('?', '%s'), (i % USERS + 1,)
+            ).fetchall()
+
+    pooled(0)  # ouverture du pool hors mesure
+    return {
+        'connexion par requête': timed(iterations, unpooled),
+        'pool': timed(iterations, pooled),
+    }
+
+
+def bench_prepared(app, iterations):
+    import database
+
+    results = {}
+    for label, threshold in (('sans préparation', None), ('préparée', 2)):
+        db = database.Database(app.app.config['DATABASE_URL'], 1, 1, threshold)
+        conn = db.connect()
+
+        def query(i):
+            conn.execute(NOTES_QUERY, (i % USERS + 1,)).fetchall()
+
+        query(0)
+        results[label] = timed(iterations, query)
+        conn.close()
+        db.dispose()
+    return results
+
+
+def writer(url, user_id, seconds, barrier, results):
+    app = load_app(url)
+    barrier.wait()
+    writes = errors = 0
+    worst = 0.0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        started = time.perf_counter()
+        conn = app.get_db_connection()
+        try:
+            conn.execute(
+                'INSERT INTO notes (title, content, user_id) VALUES (?, ?, ?)',
+                ('note ' + str(writes), 'contenu ' * 20, user_id)
+            )
+            conn.commit()
+            writes += 1
+        except app.database.Error:
+            errors += 1  # database is locked
+        finally:
+            conn.close()
+        worst = max(worst, time.perf_counter() - started)
+    results.put((writes, errors, worst))
+
+
+def bench_writers(url, writers, seconds):
+    barrier = multiprocessing.Barrier(writers)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=writer, args=(url, user_id, seconds, barrier, results))
+        for user_id in range(1, writers + 1)
+    ]
+    for process in processes:
+        process.start()
+    totals = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return (sum(t[0] for t in totals) / seconds, sum(t[1] for t in totals),
+            max(t[2] for t in totals) * 1000)
+
+
+def run_backend(url, args, results):
+    app = load_app(url)
+    populate(app)
+    requests = bench_requests(app, url, args.requests)
+    prepared = bench_prepared(app, args.requests) if app.main_database.backend == 'postgresql' else {}
+    app.main_database.dispose()
+    writers = {count: bench_writers(url, count, args.seconds) for count in args.writers}
+    results.put((requests, prepared, writers))
+
+
+def in_process(url, args):
+    """Mesures d'un backend dans un processus neuf : app lit DATABASE_URL à l'import"""
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_backend, args=(url, args, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', required=True, help='URL PostgreSQL d\'une base dédiée au benchmark')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--writers', type=int, nargs='*', default=[1, 4, 8])
+    args = parser.parse_args()
+
+    multiprocessing.set_start_method('spawn')
+    os.chdir(tempfile.mkdtemp(prefix='bench_database_'))
+    reset_postgres(args.url)
+    sqlite = in_process('sqlite:///' + os.path.abspath('database.db'), args)
+    postgres = in_process(args.url, args)
+
+    print(f'{os.cpu_count()} cœur(s), {args.requests} requêtes par mesure\n')
+    rows = [('SQLite, connexion par requête', sqlite[0]['connexion par requête'])]
+    rows += [('PostgreSQL, ' + label, value) for label, value in postgres[0].items()]
+    rows += [('PostgreSQL, même connexion, ' + label, value) for label, value in postgres[1].items()]
+    print('Requête de lecture (µs) :')
+    for label, value in rows:
+        print(f'  {label:<46}{value:>8.0f}')
+    print(f'\n{"écrivains":>10} | {"SQLite":>26} | {"PostgreSQL":>26}')
+    print(f'{"":>10} | {"écritures/s":>11} {"erreurs":>7} {"max ms":>6} | {"écritures/s":>11} {"erreurs":>7} {"max ms":>6}')
+    for count in args.writers:
+        s, p = sqlite[2][count], postgres[2][count]
+        print(f'{count:>10} | {s[0]:>11.0f} {s[1]:>7} {s[2]:>6.0f} | {p[0]:>11.0f} {p[1]:>7} {p[2]:>6.0f}')
+
+
+if __name__ == '__main__':
+    main()
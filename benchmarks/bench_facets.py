@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Benchmark du filtrage par étiquettes (facets.py)
+
+Crée un utilisateur avec ``--folders`` dossiers, ``--labels`` étiquettes
+(réparties selon une loi de Zipf, 0 à 5 par dossier), des fichiers et des
+notes, puis mesure :
+- les requêtes ET / OU avec facettes, avec et sans l'index
+  ``(label_id, folder_id)`` ;
+- les facettes sans filtre (compteurs précalculés vs comptage) ;
+- les étiquettes des dossiers du tableau de bord (une requête par dossier
+  vs une requête pour le niveau).
+
+Usage :
+    python benchmarks/bench_facets.py [--folders 5000] [--labels 40]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Ajouter le répertoire racine au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REPEAT = 20
+
+
+def populate(conn, folders, labels, rng):
+    conn.execute("INSERT INTO users (username, email, password) VALUES ('bench', 'bench@example.com', 'x')")
+    conn.executemany(
+        'INSERT INTO labels (name, color, user_id) VALUES (?, ?, 1)',
+        ((f'label{i}', '#3b82f6') for i in range(labels))
+    )
+    conn.executemany(
+        'INSERT INTO folders (user_id, name, parent_id) VALUES (1, ?, ?)',
+        ((f'dossier{i}', None if i < folders // 5 else rng.randint(1, folders // 5)) for i in range(folders))
+    )
+    weights = [1 / (rank + 1) for rank in range(labels)]
+    pairs = set()
+    for folder_id in range(1, folders + 1):
+        for label_id in rng.choices(range(1, labels + 1), weights, k=rng.randint(0, 5)):
+            pairs.add((folder_id, label_id))
+    conn.executemany('INSERT INTO folder_labels (folder_id, label_id) VALUES (?, ?)', sorted(pairs))
+    conn.executemany(
+        "INSERT INTO files (user_id, filename, original_name, file_path, file_size, folder_id) "
+        "VALUES (1, ?, ?, '', 1024, ?)",
+        ((f'f{i}', f'fichier{i}.pdf', rng.randint(1, folders)) for i in range(folders * 4))
+    )
+    conn.executemany(
+        "INSERT INTO notes (title, content, folder_id, user_id) VALUES (?, 'contenu', ?, 1)",
+        ((f'note{i}', rng.randint(1, folders)) for i in range(folders))
+    )
+    conn.commit()
+    return len(pairs)
+
+
+def timed(func):
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2] * 1000
+
+
+def bench_filters(conn, facets, labels):
+    # Étiquettes fréquente, moyenne et rare (loi de Zipf : id 1 la plus fréquente)
+    queries = [
+        ('ET fréquente+moyenne', [1, labels // 4], 'and'),
+        ('ET moyenne+rare', [labels // 4, labels], 'and'),
+        ('ET 3 étiquettes', [1, 2, 3], 'and'),
+        ('OU 3 étiquettes', [1, labels // 4, labels], 'or'),
+    ]
+    print(f"{'requête':>22} | {'dossiers':>8} | {'avec index (ms)':>15} | {'sans index (ms)':>15}")
+    print('-' * 70)
+    measures = []
+    for label, ids, mode in queries:
+        owned = facets.owned_labels(conn, 1, ids)
+        count = facets.filter_by_labels(conn, 1, owned, mode)['folder_count']
+        measures.append((label, owned, mode, count, timed(lambda: facets.filter_by_labels(conn, 1, owned, mode))))
+
+    conn.execute('DROP INDEX idx_folder_labels_label')
+    for label, owned, mode, count, indexed in measures:
+        scan = timed(lambda: facets.filter_by_labels(conn, 1, owned, mode))
+        print(f'{label:>22} | {count:>8} | {indexed:>15.2f} | {scan:>15.2f}')
+    conn.execute('CREATE INDEX idx_folder_labels_label ON folder_labels (label_id, folder_id)')
+
+    def counted_facets():
+        conn.execute('''
+            SELECT l.id, l.name, l.color, COUNT(fl.folder_id) FROM labels l
+            LEFT JOIN folder_labels fl ON fl.label_id = l.id
+            WHERE l.user_id = 1 GROUP BY l.id ORDER BY l.name
+        ''').fetchall()
+
+    print(f'\nFacettes sans filtre : label_counts {timed(lambda: facets.label_facets(conn, 1)):.2f} ms, '
+          f'comptage {timed(counted_facets):.2f} ms')
+
+
+def bench_dashboard(conn, facets, rows):
+    cursor = rows.use_namedtuples(conn.cursor())
+    cursor.execute('SELECT id, name, color FROM labels WHERE user_id = 1')
+    user_labels = cursor.fetchall()
+    cursor.execute('SELECT id FROM folders WHERE user_id = 1 AND parent_id IS NULL')
+    folders = cursor.fetchall()
+
+    def per_folder():
+        result = {}
+        for folder in folders:
+            cursor.execute('''
+                SELECT l.id, l.name, l.color FROM labels l
+                JOIN folder_labels fl ON l.id = fl.label_id
+                WHERE fl.folder_id = ? AND l.user_id = ?
+            ''', (folder.id, 1))
+            result[folder.id] = cursor.fetchall()
+        return result
+
+    print(f'\nTableau de bord ({len(folders)} dossiers à la racine) : '
+          f'une requête par dossier {timed(per_folder):.2f} ms, '
+          f'une requête {timed(lambda: facets.labels_by_folder(conn, 1, None, user_labels)):.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--folders', type=int, default=5000)
+    parser.add_argument('--labels', type=int, default=40)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix='bench_facets_'))
+    import app
+    import facets
+    import rows
+
+    app.init_db()
+    conn = app.get_db_connection()
+    pairs = populate(conn, args.folders, args.labels, random.Random(42))
+    print(f'{args.folders} dossiers, {args.labels} étiquettes, {pairs} associations\n')
+
+    bench_filters(conn, facets, args.labels)
+    bench_dashboard(conn, facets, rows)
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
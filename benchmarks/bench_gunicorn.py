@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Benchmark justifiant le dimensionnement de gunicorn.conf.py
+
+- bcrypt relâche-t-il le GIL ? (progression d'un thread Python pendant
+  les hachages) : détermine si des threads suffisent pour la connexion ;
+- débit d'un worker selon le nombre de threads, pour une charge CPU
+  (bcrypt) et une charge E/S (attente simulée d'un upload / téléchargement) ;
+- croissance de la mémoire (RSS) d'un worker au fil des requêtes, qui
+  motive le recyclage ``max_requests``.
+
+Usage :
+    python benchmarks/bench_gunicorn.py [--requests 3000]
+"""
+
+import argparse
+import io
+import os
+import runpy
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Ajouter le répertoire racine au path pour les imports
+sys.path.insert(0, ROOT)
+
+BCRYPT_ROUNDS = 12  # valeur par défaut de bcrypt.gensalt(), utilisée par l'application
+IO_WAIT = 0.02  # secondes d'attente par requête E/S simulée
+THREAD_COUNTS = (1, 2, 4, 8, 16)
+
+
+def gil_release_ratio(hashes=4):
+    """Part de la progression normale d'un thread Python pendant les hachages"""
+    def spin(duration):
+        count = 0
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            count += 1
+        return count
+
+    salt = bcrypt.gensalt(BCRYPT_ROUNDS)
+    start = time.perf_counter()
+    for _ in range(hashes):
+        bcrypt.hashpw(b'benchmark', salt)
+    duration = time.perf_counter() - start
+
+    baseline = spin(duration)
+    hasher = threading.Thread(target=lambda: [bcrypt.hashpw(b'benchmark', salt) for _ in range(hashes)])
+    hasher.start()
+    concurrent = spin(duration)
+    hasher.join()
+    return concurrent / baseline
+
+
+def throughput(task, threads, total):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: task(), range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def memory_growth(requests, step):
+    os.chdir(tempfile.mkdtemp(prefix='bench_gunicorn_'))
+    from app import app, init_logging, migrate
+
+    migrate()
+    init_logging()
+    app.logger.setLevel('ERROR')
+    app.config['SESSION_COOKIE_SECURE'] = False
+    client = app.test_client()
+    client.post('/register', data={'username': 'bench', 'email': 'bench@example.com',
+                                   'password': 'Passw0rdX', 'confirm_password': 'Passw0rdX'})
+    client.post('/login', data={'username': 'bench', 'password': 'Passw0rdX'})
+    client.post('/upload', data={'file': (io.BytesIO(b'contenu ' * 512), 'note.txt')},
+                content_type='multipart/form-data')
+
+    routes = ['/dashboard', '/search?q=note', '/get_labels', '/jobs']
+    samples = [(0, rss_mb())]
+    for i in range(1, requests + 1):
+        client.get(routes[i % len(routes)])
+        if i % step == 0:
+            samples.append((i, rss_mb()))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--hashes', type=int, default=16, help='Hachages bcrypt par mesure')
+    args = parser.parse_args()
+
+    # Valeurs calculées par gunicorn.conf.py pour le profil production sur cette machine
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ['FLASK_ENV'] = 'production'
+    conf = runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+    print(f"gunicorn.conf.py (production, {conf['cores']} cœur(s)) : {conf['workers']} worker(s) "
+          f"{conf['worker_class']} x {conf.get('threads', '-')} threads, "
+          f"max_requests={conf['max_requests']}+{conf['max_requests_jitter']}, "
+          f"keepalive={conf['keepalive']}s, timeout={conf['timeout']}s")
+
+    ratio = gil_release_ratio()
+    print(f'\nThread Python pendant bcrypt : {ratio * 100:.0f} % de sa progression seule '
+          f"({'GIL relâché' if ratio > 0.2 else 'GIL conservé'})")
+
+    salt = bcrypt.gensalt(BCRYPT_ROUNDS)
+    print(f"\n{'threads':>7} | {'bcrypt (hash/s)':>15} | {'E/S (req/s)':>11}")
+    print('-' * 40)
+    for threads in THREAD_COUNTS:
+        cpu = throughput(lambda: bcrypt.hashpw(b'benchmark', salt), threads, args.hashes)
+        io_bound = throughput(lambda: time.sleep(IO_WAIT), threads, 200)
+        print(f'{threads:>7} | {cpu:>15.1f} | {io_bound:>11.0f}')
+
+    print(f'\nMémoire d\'un worker (RSS) sur {args.requests} requêtes')
+    samples = memory_growth(args.requests, max(1, args.requests // 6))
+    for count, rss in samples:
+        print(f'  {count:>6} requêtes : {rss:6.1f} Mo')
+    growth = (samples[-1][1] - samples[1][1]) / max(1, samples[-1][0] - samples[1][0]) * 1000
+    print(f'  croissance après échauffement : {growth:.2f} Mo / 1000 requêtes')
+
+
+if __name__ == '__main__':
+    main()
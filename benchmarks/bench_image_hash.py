@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""Benchmark des images similaires : empreintes perceptuelles et hachage multi-index
+
+- coût du calcul des empreintes (JPEG réduit au décodage, PNG décodé en entier) ;
+- construction des index de blocs sur ``--images`` empreintes (1 million par
+  défaut, un seul utilisateur : pire cas) dont des groupes de quasi-doublons ;
+- latence (p50 / p95) de ``image_hash.find_similar`` contre le parcours de
+  toutes les empreintes de l'utilisateur, par distance maximale, avec
+  vérification que les deux renvoient les mêmes fichiers.
+
+Les empreintes de remplissage sont tirées uniformément : les bits du phash
+(sans composante continue, comparés à la médiane) sont équilibrés sur des
+images réelles, mais des collections très homogènes (scans de documents)
+donnent plus de candidats par bloc.
+
+Usage :
+    python benchmarks/bench_image_hash.py [--images 1000000] [--queries 50]
+"""
+
+import argparse
+import io
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+# Ajouter le répertoire racine au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_hash
+
+BATCH_SIZE = 10000
+GROUP_SIZE = 5  # quasi-doublons par image d'origine
+DISTANCES = (4, 8, 10, 11)
+
+
+def create_database(path):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            original_name TEXT NOT NULL,
+            folder_id INTEGER,
+            ahash INTEGER,
+            dhash INTEGER,
+            phash INTEGER
+        )
+    ''')
+    return conn
+
+
+def flip(value, rng, count):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def fill(conn, rng, count):
+    """Empreintes aléatoires, dont un dixième en groupes de quasi-doublons ;
+    retourne les empreintes d'origine des groupes"""
+    originals = [rng.getrandbits(64) for _ in range(count // 10 // GROUP_SIZE)]
+    hashes = [flip(original, rng, rng.randint(0, 8)) for original in originals for _ in range(GROUP_SIZE)]
+    hashes += [rng.getrandbits(64) for _ in range(count - len(hashes))]
+    rng.shuffle(hashes)
+    for offset in range(0, count, BATCH_SIZE):
+        conn.executemany(
+            'INSERT INTO files (user_id, filename, original_name, phash) VALUES (1, ?, ?, ?)',
+            [(f'{i:x}.jpg', f'photo_{i}.jpg', image_hash._to_signed(hashes[i]))
+             for i in range(offset, min(offset + BATCH_SIZE, count))]
+        )
+    conn.commit()
+    return originals
+
+
+def hashing_cost(repeat=5):
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(48)
+    image = Image.new('RGB', (4000, 3000), (200, 200, 190))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(4000), rng.randrange(3000)
+        draw.ellipse([x, y, x + rng.randrange(100, 1500), y + rng.randrange(100, 1000)],
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    print('Calcul des trois empreintes (ms, médiane) :')
+    for label, format, size in (('JPEG 12 Mpx', 'JPEG', None), ('PNG 12 Mpx', 'PNG', None),
+                                ('JPEG 1 Mpx', 'JPEG', (1200, 900))):
+        data = io.BytesIO()
+        (image.resize(size) if size else image).save(data, format, quality=85)
+        timings = []
+        for _ in range(repeat):
+            data.seek(0)
+            start = time.perf_counter()
+            image_hash.compute_hashes(data)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f'  {label:<12} {statistics.median(timings):>8.1f}')
+    print()
+
+
+def timed(func, inputs):
+    samples, results = [], []
+    for args in inputs:
+        start = time.perf_counter()
+        results.append(func(*args))
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1], results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    try:
+        hashing_cost()
+    except ImportError:
+        print('Pillow non installé : coût du calcul non mesuré\n')
+
+    rng = random.Random(48)
+    tmpdir = tempfile.mkdtemp(prefix='bench_image_hash_')
+    path = os.path.join(tmpdir, 'images.db')
+    conn = create_database(path)
+    originals = fill(conn, rng, args.images)
+    table_size = os.path.getsize(path)
+
+    start = time.perf_counter()
+    image_hash.create_image_hash_index(conn.cursor())
+    conn.commit()
+    build = time.perf_counter() - start
+    index_size = os.path.getsize(path) - table_size
+    print(f'{args.images} empreintes, un utilisateur ; index de blocs : {build:.1f} s, '
+          f'{index_size / 1e6:.0f} Mo (table {table_size / 1e6:.0f} Mo)\n')
+
+    def scan(phash, distance):
+        rows = conn.execute('SELECT id, phash FROM files WHERE user_id = 1 AND phash IS NOT NULL')
+        return sorted(file_id for file_id, value in rows if image_hash.hamming(phash, value) <= distance)
+
+    def indexed(phash, distance):
+        return sorted(r['id'] for r in image_hash.find_similar(conn, 1, phash, distance, limit=args.images))
+
+    print(f'{"distance":>8} {"sondes":>7} {"résultats":>9} | {"parcours p50":>12} {"p95 ms":>7} | '
+          f'{"index p50":>9} {"p95 ms":>7} | {"gain":>6}')
+    for distance in DISTANCES:
+        inputs = [(flip(rng.choice(originals), rng, rng.randint(0, 3)), distance) for _ in range(args.queries)]
+        probes = sum(len(values) for values in image_hash.probes(0, distance))
+        scan_p50, scan_p95, expected = timed(scan, inputs[:max(args.queries // 10, 3)])
+        index_p50, index_p95, found = timed(indexed, inputs)
+        if found[:len(expected)] != expected:
+            sys.exit(f'Résultats différents à la distance {distance}')
+        hits = statistics.mean(len(r) for r in found)
+        print(f'{distance:>8} {probes:>7} {hits:>9.1f} | {scan_p50:>12.1f} {scan_p95:>7.1f} | '
+              f'{index_p50:>9.2f} {index_p95:>7.2f} | {scan_p50 / index_p50:>5.0f}x')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Benchmark de la recherche par nom : parcours LIKE contre index trigramme
+
+Sur des noms de fichiers synthétiques (1 million par défaut) :
+- construction de l'index (remplissage initial) et taille sur disque ;
+- coût des triggers à l'insertion (fichiers/s avec et sans index) ;
+- latence (p50 / p95) de ``name_index.search`` contre le parcours
+  ``LIKE '%...%' ESCAPE`` des fichiers de l'utilisateur, par type de saisie,
+  avec vérification que les deux renvoient les mêmes fichiers.
+
+Usage :
+    python benchmarks/bench_name_search.py [--names 1000000] [--users 10] [--queries 50]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+# Ajouter le répertoire racine au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import name_index
+
+BATCH_SIZE = 10000
+WORDS = ['facture', 'contrat', 'bail', 'releve', 'rapport', 'reunion', 'scan', 'photo',
+         'Lomé', 'avenant', 'devis', 'CV', 'attestation', 'bulletin', 'impots']
+EXTENSIONS = ['.pdf', '.docx', '.xlsx', '.jpg', '.png', '.txt', '.zip']
+SCAN_SQL = ("SELECT f.id FROM files f WHERE f.user_id = ? AND f.original_name LIKE ? ESCAPE '\\'")
+
+
+def make_name(rng, i):
+    parts = [rng.choice(WORDS), str(rng.randint(2000, 2025)), f'{rng.randint(1, 12):02d}']
+    if rng.random() < 0.5:
+        parts.append(f'{i:07d}')
+    return rng.choice(['_', '-', ' ']).join(parts) + rng.choice(EXTENSIONS)
+
+
+def create_database(path):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            original_name TEXT NOT NULL,
+            file_size INTEGER,
+            folder_id INTEGER,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_files_folder ON files (user_id, folder_id)')
+    return conn
+
+
+def insert(conn, rng, start, count, users):
+    for offset in range(start, start + count, BATCH_SIZE):
+        conn.executemany(
+            'INSERT INTO files (user_id, filename, original_name, file_size) VALUES (?, ?, ?, 0)',
+            [(rng.randint(1, users), f'{i:x}.bin', make_name(rng, i))
+             for i in range(offset, min(offset + BATCH_SIZE, start + count))]
+        )
+    conn.commit()
+
+
+def queries(rng, count):
+    """Saisies typiques par catégorie (la longueur change le chemin suivi)"""
+    return {
+        'mot fréquent': [rng.choice(WORDS) for _ in range(count)],
+        'année + mois': [f'{rng.randint(2000, 2025)}_{rng.randint(1, 12):02d}' for _ in range(count)],
+        'numéro rare': [f'{rng.randint(0, 999999):07d}' for _ in range(count)],
+        'absent': [f'zq{rng.randint(0, 9999)}' for _ in range(count)],
+        'joker littéral': ['50%' for _ in range(count)],
+        'court (< 3)': [rng.choice(['CV', '_0', 'pd']) for _ in range(count)],
+    }
+
+
+def timed(func, user_ids, inputs):
+    samples, results = [], []
+    for user_id, query in zip(user_ids, inputs):
+        start = time.perf_counter()
+        results.append(sorted(func(user_id, query)))
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1], results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--names', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(45)
+    tmpdir = tempfile.mkdtemp(prefix='bench_name_search_')
+    path = os.path.join(tmpdir, 'names.db')
+    conn = create_database(path)
+
+    start = time.perf_counter()
+    insert(conn, rng, 0, args.names, args.users)
+    load = time.perf_counter() - start
+    table_size = os.path.getsize(path)
+
+    start = time.perf_counter()
+    name_index.create_name_index(conn.cursor())
+    conn.commit()
+    build = time.perf_counter() - start
+    index_size = os.path.getsize(path) - table_size
+
+    extra = max(args.names // 100, 1000)
+    start = time.perf_counter()
+    insert(conn, rng, args.names, extra, args.users)
+    indexed_insert = time.perf_counter() - start
+
+    print(f'{args.names} noms, {args.users} utilisateurs ({args.names // args.users} noms chacun)')
+    print(f'Insertion sans index : {args.names / load:,.0f} fichiers/s')
+    print(f'Insertion avec index : {extra / indexed_insert:,.0f} fichiers/s (triggers)')
+    print(f'Remplissage initial  : {build:.1f} s')
+    print(f'Table files          : {table_size / 1e6:.0f} Mo, index trigramme : {index_size / 1e6:.0f} Mo\n')
+
+    def scan(user_id, query):
+        return [row[0] for row in conn.execute(SCAN_SQL, (user_id, '%' + name_index.escape_like(query) + '%'))]
+
+    def indexed(user_id, query):
+        return [row[0] for row in name_index.search(conn.cursor(), user_id, query)]
+
+    print(f'{"saisie":<16} {"résultats":>9} | {"LIKE p50":>9} {"p95 ms":>7} | {"index p50":>9} {"p95 ms":>7} | {"gain":>6}')
+    for label, inputs in queries(rng, args.queries).items():
+        user_ids = [rng.randint(1, args.users) for _ in inputs]
+        scan_p50, scan_p95, expected = timed(scan, user_ids, inputs)
+        index_p50, index_p95, found = timed(indexed, user_ids, inputs)
+        if found != expected:
+            sys.exit(f'Résultats différents pour « {label} »')
+        hits = statistics.mean(len(r) for r in expected)
+        print(f'{label:<16} {hits:>9.0f} | {scan_p50:>9.2f} {scan_p95:>7.2f} | '
+              f'{index_p50:>9.2f} {index_p95:>7.2f} | {scan_p50 / index_p50:>5.1f}x')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Benchmark de l'historique des notes (note_revisions.py)
+
+Simule ``--edits`` modifications (phrases ajoutées, supprimées ou
+réécrites) d'une note d'environ 10000 caractères et compare, selon
+l'intervalle entre instantanés :
+- la taille stockée, face à une copie complète par révision ;
+- le temps d'enregistrement d'une révision ;
+- le temps de reconstruction d'une révision (p50 / max).
+
+Usage :
+    python benchmarks/bench_note_revisions.py [--edits 1000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+# Ajouter le répertoire racine au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import note_revisions
+
+WORDS = ('archive document dossier sécurité fichier note étiquette sauvegarde '
+         'utilisateur révision contenu plateforme recherche téléchargement').split()
+INTERVALS = (1, 4, 16, 64)  # 1 : un instantané par révision (copie complète compressée)
+
+
+def sentence(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 16))).capitalize() + '. '
+
+
+def edit_history(edits, seed=42):
+    """Versions successives d'une note de ~10000 caractères"""
+    rng = random.Random(seed)
+    sentences = []
+    while sum(map(len, sentences)) < 9000:
+        sentences.append(sentence(rng))
+    versions = [''.join(sentences)]
+    for _ in range(edits):
+        position = rng.randrange(len(sentences))
+        action = rng.random()
+        if action < 0.4:
+            sentences.insert(position, sentence(rng))
+        elif action < 0.6 and len(sentences) > 10:
+            del sentences[position]
+        else:
+            sentences[position] = sentence(rng)
+        while sum(map(len, sentences)) > 10000:
+            sentences.pop()
+        versions.append(''.join(sentences))
+    return versions
+
+
+def run(versions, interval):
+    note_revisions.SNAPSHOT_INTERVAL = interval
+    conn = sqlite3.connect(':memory:')
+    note_revisions.create_revisions_table(conn.cursor())
+
+    save_times = []
+    for content in versions:
+        start = time.perf_counter()
+        note_revisions.record_revision(conn, 1, 1, 'Note', content)
+        save_times.append(time.perf_counter() - start)
+    stored = conn.execute('SELECT SUM(length(payload)) FROM note_revisions').fetchone()[0]
+
+    read_times = []
+    for revision in range(1, len(versions) + 1, max(1, len(versions) // 200)):
+        start = time.perf_counter()
+        found = note_revisions.get_revision(conn, 1, revision)
+        read_times.append(time.perf_counter() - start)
+        assert found['content'] == versions[revision - 1]
+    conn.close()
+    return stored, sorted(save_times), sorted(read_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--edits', type=int, default=1000)
+    args = parser.parse_args()
+
+    versions = edit_history(args.edits)
+    raw = sum(len(v.encode('utf-8')) for v in versions)
+    print(f'{len(versions)} révisions, note de {len(versions[-1])} caractères, '
+          f'copies complètes non compressées : {raw / 1e6:.1f} Mo\n')
+    print(f"{'intervalle':>10} | {'stocké (Ko)':>11} | {'vs copies':>9} | "
+          f"{'écriture p50 (ms)':>17} | {'lecture p50 (ms)':>16} | {'lecture max (ms)':>16}")
+    print('-' * 94)
+    for interval in INTERVALS:
+        stored, saves, reads = run(versions, interval)
+        print(f'{interval:>10} | {stored / 1024:>11.0f} | {stored / raw * 100:>8.1f}% | '
+              f'{saves[len(saves) // 2] * 1000:>17.2f} | {reads[len(reads) // 2] * 1000:>16.2f} | '
+              f'{reads[-1] * 1000:>16.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""Benchmark du stockage en segments (packstore.py) contre un fichier par upload
+
+Sur ``--files`` petits fichiers (70 % de .txt de 1 à 8 Ko, 30 % de .png de 16
+à 96 Ko), pour ``LocalStorage`` et ``PackStorage`` :
+- latence d'écriture (``put``, p50 / p99) et place occupée sur le disque ;
+- latence de lecture aléatoire (``get``), cache chaud puis, avec
+  ``--drop-caches`` (root), cache de pages vidé ;
+- durée de la liste complète des clés, puis de la lecture de tous les
+  fichiers dans l'ordre des clés (côté source d'une sauvegarde ou d'une
+  vérification) ;
+- durée d'une sauvegarde complète des fichiers (``backup.backup_blobs``) :
+  dominée par la destination (un fichier et un commit du catalogue par
+  fichier copié), identique pour les deux dispositions ;
+- compactage après suppression d'un tiers des fichiers.
+
+Usage :
+    python benchmarks/bench_packstore.py [--files 20000] [--reads 5000] [--drop-caches]
+"""
+
+import argparse
+import io
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Ajouter le répertoire racine au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup
+from packstore import PackStorage
+from storage import LocalStorage
+
+
+def percentiles(values):
+    values = sorted(values)
+    return values[len(values) // 2], values[int(len(values) * 0.99)]
+
+
+def make_blobs(rng, count):
+    blobs = []
+    for i in range(count):
+        if rng.random() < 0.7:
+            key, size = f'{rng.getrandbits(64):016x}_notes_{i}.txt', rng.randint(1024, 8192)
+        else:
+            key, size = f'{rng.getrandbits(64):016x}_scan_{i}.png', rng.randint(16 * 1024, 96 * 1024)
+        blobs.append((key, size))
+    return blobs
+
+
+def disk_usage(path):
+    total = 0
+    for directory, _, names in os.walk(path):
+        for name in names:
+            total += os.lstat(os.path.join(directory, name)).st_blocks * 512
+    return total
+
+
+def drop_caches():
+    os.sync()
+    with open('/proc/sys/vm/drop_caches', 'w') as f:
+        f.write('3\n')
+
+
+def timed(func, items):
+    samples = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def bench_layout(label, storage, root, blobs, payload, reads, rng, cold):
+    print(f'{label}')
+    started = time.perf_counter()
+    samples = timed(lambda blob: storage.put(blob[0], io.BytesIO(payload[:blob[1]])), blobs)
+    elapsed = time.perf_counter() - started
+    p50, p99 = percentiles(samples)
+    data_bytes = sum(size for _, size in blobs)
+    print(f'  écriture   : {len(blobs) / elapsed:>8.0f} fichiers/s  p50 {p50:.3f} ms  p99 {p99:.3f} ms')
+    print(f'  disque     : {disk_usage(root) / 1e6:>8.1f} Mo pour {data_bytes / 1e6:.1f} Mo de données')
+    # Écriture différée terminée avant les mesures suivantes (sinon elle
+    # retombe sur les fsync du catalogue de la sauvegarde)
+    os.sync()
+
+    sample = rng.sample([key for key, _ in blobs], min(reads, len(blobs)))
+    p50, p99 = percentiles(timed(storage.get, sample))
+    print(f'  lecture    : p50 {p50:.3f} ms  p99 {p99:.3f} ms (cache chaud)')
+    if cold:
+        drop_caches()
+        p50, p99 = percentiles(timed(storage.get, sample))
+        print(f'  lecture    : p50 {p50:.3f} ms  p99 {p99:.3f} ms (cache vidé)')
+
+    if cold:
+        drop_caches()
+    started = time.perf_counter()
+    listed = sum(1 for _ in storage.list())
+    print(f'  liste      : {(time.perf_counter() - started) * 1000:>8.0f} ms ({listed} clés)')
+
+    if cold:
+        drop_caches()
+    started = time.perf_counter()
+    total = 0
+    for blob in storage.list():
+        with storage.open(blob.key) as f:
+            total += len(f.read())
+    elapsed = time.perf_counter() - started
+    print(f'  parcours   : {elapsed:>8.2f} s ({total / 1e6 / elapsed:.0f} Mo/s)')
+
+
+def bench_backup(label, storage, blobs, tmpdir, cold):
+    db_path = os.path.join(tmpdir, label + '.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE files (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT NOT NULL)')
+    backup.create_change_log(conn.cursor())
+    conn.executemany('INSERT INTO files (filename) VALUES (?)', [(key,) for key, _ in blobs])
+    conn.commit()
+    conn.close()
+    snapshot = os.path.join(tmpdir, label + '-snapshot.db')
+    backup.snapshot_database(db_path, snapshot)
+    catalog = backup.BlobCatalog(os.path.join(tmpdir, 'backup-' + label))
+    if cold:
+        drop_caches()
+    started = time.perf_counter()
+    stats = backup.backup_blobs(snapshot, storage, catalog)
+    elapsed = time.perf_counter() - started
+    catalog.close()
+    shutil.rmtree(os.path.join(tmpdir, 'backup-' + label))
+    print(f"  sauvegarde : {elapsed:>8.2f} s ({stats['blobs_copied']} fichiers, "
+          f"{stats['blob_bytes'] / 1e6 / elapsed:.0f} Mo/s)")
+
+
+def bench_compaction(storage, blobs, rng, reads):
+    deleted = rng.sample([key for key, _ in blobs], len(blobs) // 3)
+    for key in deleted:
+        storage.delete(key)
+    before = storage.packs.stats()
+    started = time.perf_counter()
+    stats = storage.packs.compact(min_garbage=0.2)
+    elapsed = time.perf_counter() - started
+    after = storage.packs.stats()
+    print(f"  compactage : {elapsed:>8.2f} s, {stats['segments']} segment(s), {stats['moved']} blobs recopiés, "
+          f"{(before['bytes'] - after['bytes']) / 1e6:.1f} Mo libérés "
+          f"(reste {(after['bytes'] - after['live_bytes']) / 1e6:.1f} Mo inutiles)")
+    remaining = sorted(set(key for key, _ in blobs) - set(deleted))
+    p50, p99 = percentiles(timed(storage.get, rng.sample(remaining, min(reads, len(remaining)))))
+    print(f'  lecture    : p50 {p50:.3f} ms  p99 {p99:.3f} ms (après compactage)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=20000)
+    parser.add_argument('--reads', type=int, default=5000)
+    parser.add_argument('--segment-mb', type=int, default=64)
+    parser.add_argument('--drop-caches', action='store_true', help='Vider le cache de pages (root)')
+    parser.add_argument('--dir', help='Répertoire de travail (par défaut un répertoire temporaire)')
+    args = parser.parse_args()
+
+    rng = random.Random(50)
+    blobs = make_blobs(rng, args.files)
+    payload = os.urandom(96 * 1024)
+    tmpdir = tempfile.mkdtemp(prefix='bench_packstore_', dir=args.dir)
+    print(f'{args.files} fichiers, {sum(size for _, size in blobs) / 1e6:.0f} Mo, dans {tmpdir}\n')
+    try:
+        layouts = [
+            ('un fichier par upload', LocalStorage(os.path.join(tmpdir, 'files'))),
+            ('segments', PackStorage(os.path.join(tmpdir, 'packed'), segment_size=args.segment_mb * 1024 * 1024)),
+        ]
+        for label, storage in layouts:
+            bench_layout(label, storage, storage.root, blobs, payload, args.reads, random.Random(7), args.drop_caches)
+            bench_backup(label.replace(' ', '_'), storage, blobs, tmpdir, args.drop_caches)
+            if isinstance(storage, PackStorage):
+                bench_compaction(storage, blobs, random.Random(7), args.reads)
+            print()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Benchmark de la compression des réponses : temps CPU contre octets gagnés
+
+Pour chaque encodage (gzip, brotli, zstd) et plusieurs niveaux, sur :
+- le HTML de dashboard.html pour 10, 1 000 et 10 000 éléments ;
+- des listes JSON au format de ``/search`` (produites par
+  ``rows.stream_json_list``) de 100, 1 000 et 10 000 fichiers ;
+
+mesure la taille compressée, le ratio et le temps de compression, en une
+fois (réponse en mémoire) et morceau par morceau avec flush (réponse en
+flux, comme ``response_compression._compress_stream``).
+
+Usage :
+    python benchmarks/bench_response_compression.py [--repeat 5]
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+# Ajouter le répertoire racine au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_templates import app, make_context, render_template, session  # chdir temporaire inclus
+import response_compression
+import rows
+
+app.logger.setLevel("ERROR")
+
+LEVELS = {
+    response_compression.GZIP: (1, 6, 9),
+    response_compression.BROTLI: (1, 4, 5, 6, 11),
+    response_compression.ZSTD: (1, 3, 9, 19),
+}
+HTML_SIZES = (10, 1000, 10000)
+JSON_SIZES = (100, 1000, 10000)
+
+
+def html_payload(size):
+    with app.test_request_context('/dashboard'):
+        session['user_id'] = 1
+        session['username'] = 'bench'
+        html = render_template('dashboard.html', **make_context(size))
+    return [html.encode('utf-8')]
+
+
+def json_payload(size):
+    """Morceaux produits par stream_json_list pour un résultat de /search"""
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE files (id INTEGER PRIMARY KEY, filename TEXT, original_name TEXT, '
+                 'file_size INTEGER, folder_id INTEGER, uploaded_at TIMESTAMP)')
+    conn.executemany(
+        'INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)',
+        [(i, f'{i:032x}_facture_{i}.pdf', f'facture_{i}.pdf', 1024 * (i % 500 + 1), i % 40 or None,
+          f'2025-{i % 12 + 1:02d}-{i % 28 + 1:02d} 10:{i % 60:02d}:00') for i in range(1, size + 1)]
+    )
+    cursor = conn.execute('SELECT id, filename, original_name, file_size, folder_id, uploaded_at FROM files')
+    chunks = [chunk.encode('utf-8') for chunk in rows.stream_json_list(cursor, 'files')]
+    conn.close()
+    return chunks
+
+
+def one_shot(chunks, encoding, level):
+    return response_compression.compress(b''.join(chunks), encoding, level)
+
+
+def streamed(chunks, encoding, level):
+    enc = response_compression.encoder(encoding, level)
+    parts = [enc.compress(chunk) + enc.flush() for chunk in chunks]
+    parts.append(enc.finish())
+    return b''.join(parts)
+
+
+def measure(func, chunks, encoding, level, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.process_time()
+        output = func(chunks, encoding, level)
+        timings.append(time.process_time() - start)
+    return len(output), statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    encodings = response_compression.available_encodings()
+    payloads = [(f'HTML {size}', html_payload(size)) for size in HTML_SIZES]
+    payloads += [(f'JSON {size}', json_payload(size)) for size in JSON_SIZES]
+
+    print(f'Encodages disponibles : {", ".join(encodings)} '
+          f'(niveaux par défaut : {response_compression.LEVELS})\n')
+    print(f'{"contenu":<11} {"brut":>9} {"enc":>5} {"niv":>4} | {"1 fois":>9} {"ratio":>6} {"CPU ms":>8} '
+          f'{"Mo/s":>7} | {"flux":>9} {"ratio":>6} {"CPU ms":>8}')
+    print('-' * 96)
+    for label, chunks in payloads:
+        raw = sum(len(chunk) for chunk in chunks)
+        for encoding in encodings:
+            for level in LEVELS[encoding]:
+                repeat = args.repeat if level < 11 and raw < 2_000_000 else max(args.repeat // 3, 1)
+                size, cpu = measure(one_shot, chunks, encoding, level, repeat)
+                stream_size, stream_cpu = measure(streamed, chunks, encoding, level, repeat)
+                default = '*' if response_compression.LEVELS[encoding] == level else ' '
+                print(f'{label:<11} {raw:>9} {encoding:>5} {level:>3}{default} | {size:>9} {raw / size:>6.1f} '
+                      f'{cpu:>8.2f} {raw / 1e6 / max(cpu / 1000, 1e-9):>7.0f} | '
+                      f'{stream_size:>9} {raw / stream_size:>6.1f} {stream_cpu:>8.2f}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
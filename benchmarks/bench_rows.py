@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Benchmark mémoire des endpoints de liste (/search, /get_labels)
+
+Compare, sur une base de N fichiers pour un même utilisateur :
+- avant : SELECT * + [dict(row) for row in fetchall()] + json.dumps ;
+- après : projection explicite + flux JSON par lots (fetchmany).
+
+Usage :
+    python benchmarks/bench_rows.py [--rows 50000]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Ajouter le répertoire racine au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rows
+
+SEARCH_COLUMNS = 'id, filename, original_name, file_size, folder_id, uploaded_at'
+
+
+def create_database(path, count):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            original_name TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_size INTEGER,
+            folder_id INTEGER,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.executemany(
+        'INSERT INTO files (user_id, filename, original_name, file_path, file_size, folder_id) VALUES (?, ?, ?, ?, ?, ?)',
+        (
+            (1, f'{i:036d}_facture_{i}.pdf', f'facture_{i}.pdf',
+             f'uploads/{i:036d}_facture_{i}.pdf', 1024 + i, i % 100 or None)
+            for i in range(count)
+        )
+    )
+    conn.commit()
+    conn.close()
+
+
+def before(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM files WHERE user_id = ? AND original_name LIKE ?', (1, '%facture%'))
+    files = [dict(row) for row in cursor.fetchall()]
+    body = json.dumps({'files': files})
+    conn.close()
+    return len(body)
+
+
+def after(path):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT ' + SEARCH_COLUMNS + ' FROM files WHERE user_id = ? AND original_name LIKE ?',
+        (1, '%facture%')
+    )
+    # Le serveur WSGI consomme le flux morceau par morceau
+    size = 0
+    for chunk in rows.stream_json_list(cursor, 'files', on_close=conn.close):
+        size += len(chunk)
+    return size
+
+
+def measure(func, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = func(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='bench_rows_'), 'bench.db')
+    create_database(path, args.rows)
+
+    print(f'{args.rows} lignes')
+    print(f"{'variante':>8} | {'pic mémoire (Mo)':>16} | {'durée (ms)':>10} | {'réponse (Ko)':>12}")
+    print('-' * 58)
+    for name, func in (('avant', before), ('après', after)):
+        peak, elapsed, size = measure(func, path)
+        print(f'{name:>8} | {peak / 1e6:>16.2f} | {elapsed * 1000:>10.1f} | {size / 1024:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
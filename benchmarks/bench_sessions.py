@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Benchmark des backends de session
+
+Compare le coût par requête authentifiée (ouverture + sauvegarde de la
+session) entre les cookies signés Flask et les sessions côté serveur
+(SQLite avec cache en mémoire, mémoire seule).
+
+Usage :
+    python benchmarks/bench_sessions.py [--requests 5000]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Ajouter le répertoire racine au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, session
+from sessions import (MemorySessionStore, ServerSideSessionInterface, SessionCache,
+                      SQLiteSessionStore, create_sessions_table)
+
+
+def make_app(interface):
+    app = Flask(__name__)
+    app.secret_key = 'benchmark'
+    if interface is not None:
+        app.session_interface = interface
+
+    @app.route('/login')
+    def login():
+        session.clear()
+        session['user_id'] = 1
+        session['username'] = 'bench'
+        session.permanent = True
+        return ''
+
+    @app.route('/page')
+    def page():
+        return str(session.get('user_id'))
+
+    return app
+
+
+def sqlite_interface(cache_ttl):
+    path = os.path.join(tempfile.mkdtemp(prefix='bench_sessions_'), 'sessions.db')
+
+    def connect():
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    conn = connect()
+    create_sessions_table(conn.cursor())
+    conn.commit()
+    conn.close()
+    return ServerSideSessionInterface(SQLiteSessionStore(connect), SessionCache(ttl=cache_ttl))
+
+
+def run(app, count):
+    client = app.test_client()
+    client.get('/login')
+    start = time.perf_counter()
+    for _ in range(count):
+        client.get('/page')
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    variants = (
+        ('cookie signé (Flask)', None),
+        ('sqlite, cache 5 s', sqlite_interface(cache_ttl=5)),
+        ('sqlite, sans cache', sqlite_interface(cache_ttl=0)),
+        ('mémoire', ServerSideSessionInterface(MemorySessionStore())),
+    )
+    baseline = None
+    print(f"{'backend':>22} | {'µs / requête':>12} | {'vs cookie':>9}")
+    print('-' * 50)
+    for name, interface in variants:
+        per_request = run(make_app(interface), args.requests)
+        baseline = baseline or per_request
+        print(f'{name:>22} | {per_request:>12.1f} | {per_request / baseline:>8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Benchmark du débit d'écriture selon le nombre d'utilisateurs simultanés
+
+Chaque utilisateur est un processus (un worker gunicorn) qui enchaîne des
+requêtes d'écriture : connexion, création d'une note (avec les triggers
+du journal des modifications), commit, fermeture. Comparaison entre la base
+unique (un seul écrivain à la fois pour tout le monde) et les données
+réparties (``DB_SHARD_MODE=bucket``, un fichier par utilisateur ici), plus
+le coût du routage par connexion et la durée d'un déplacement à chaud.
+
+Usage :
+    python benchmarks/bench_sharding.py [--seconds 3] [--tenants 1 2 4 8 16]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Ajouter le répertoire racine au path pour les imports
+sys.path.insert(0, ROOT)
+
+
+def make_router(mode, buckets):
+    import app
+    import sharding
+
+    return sharding.ShardRouter(
+        app.DATABASE, mode, buckets, ['shards'],
+        initialize=lambda path: app.init_db(path)
+    )
+
+
+def tenant(user_id, mode, buckets, seconds, barrier, results):
+    router = make_router(mode, buckets)
+    barrier.wait()
+    writes = errors = 0
+    worst = 0.0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        started = time.perf_counter()
+        try:
+            # Même délai d'attente du verrou que get_db_connection() (5 s)
+            conn = router.connect(user_id) if router.enabled else router.connect_catalog()
+            try:
+                conn.execute(
+                    'INSERT INTO notes (title, content, user_id) VALUES (?, ?, ?)',
+                    ('note ' + str(writes), 'contenu ' * 20, user_id)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+            writes += 1
+        except sqlite3.OperationalError:
+            errors += 1  # database is locked
+        worst = max(worst, time.perf_counter() - started)
+    results.put((writes, errors, worst))
+
+
+def run(mode, tenants, seconds):
+    directory = tempfile.mkdtemp(prefix='bench_sharding_')
+    os.chdir(directory)
+    import app
+
+    app.init_db()
+    router = make_router(mode, tenants)
+    if router.enabled:
+        for user_id in range(1, tenants + 1):
+            router.path_for(router.bucket_for(user_id))  # fichiers créés avant la mesure
+
+    barrier = multiprocessing.Barrier(tenants)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=tenant, args=(user_id, mode, tenants, seconds, barrier, results))
+        for user_id in range(1, tenants + 1)
+    ]
+    for process in processes:
+        process.start()
+    totals = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    writes = sum(t[0] for t in totals)
+    errors = sum(t[1] for t in totals)
+    worst = max(t[2] for t in totals)
+    return writes / seconds, errors, worst * 1000
+
+
+def bench_routing(iterations=2000):
+    """Coût d'ouverture d'une connexion : base unique contre routage (cache chaud)"""
+    os.chdir(tempfile.mkdtemp(prefix='bench_sharding_'))
+    import app
+
+    app.init_db()
+    router = make_router('bucket', 16)
+    router.path_for(router.bucket_for(1))
+
+    def timed(connect):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            connect().close()
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    print(f'\nOuverture d\'une connexion : base unique {timed(router.connect_catalog):.0f} µs, '
+          f'données réparties {timed(lambda: router.connect(1)):.0f} µs')
+
+
+def bench_move(notes):
+    """Durée d'un déplacement (pause des écritures du bucket déplacé)"""
+    os.chdir(tempfile.mkdtemp(prefix='bench_sharding_'))
+    import app
+
+    app.init_db()
+    router = make_router('bucket', 16)
+    conn = router.connect(1)
+    conn.executemany(
+        'INSERT INTO notes (title, content, user_id) VALUES (?, ?, ?)',
+        [('note ' + str(i), 'contenu ' * 100, 1) for i in range(notes)]
+    )
+    conn.commit()
+    conn.close()
+    size = os.path.getsize(router.path_for(router.bucket_for(1))) / 1024 / 1024
+    start = time.perf_counter()
+    router.move(router.bucket_for(1), 'volume2')
+    print(f'Déplacement d\'un fichier de {size:.1f} Mo ({notes} notes) : '
+          f'{(time.perf_counter() - start) * 1000:.0f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--tenants', type=int, nargs='*', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--move-notes', type=int, default=50000)
+    args = parser.parse_args()
+
+    print(f'{os.cpu_count()} cœur(s), {args.seconds:.0f} s par mesure\n')
+    print(f'{"utilisateurs":>12} | {"base unique":>26} | {"données réparties":>26}')
+    print(f'{"":>12} | {"écritures/s":>11} {"verrous":>7} {"max ms":>6} | {"écritures/s":>11} {"verrous":>7} {"max ms":>6}')
+    for tenants in args.tenants:
+        single = run('', tenants, args.seconds)
+        sharded = run('bucket', tenants, args.seconds)
+        print(f'{tenants:>12} | {single[0]:>11.0f} {single[1]:>7} {single[2]:>6.0f}'
+              f' | {sharded[0]:>11.0f} {sharded[1]:>7} {sharded[2]:>6.0f}')
+    print('(verrous : écritures abandonnées après 5 s d\'attente ; max ms : pire latence d\'une écriture)')
+
+    bench_routing()
+    bench_move(args.move_notes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Benchmark du démarrage de l'application
+
+- profil d'import (``python -X importtime``) : durée totale et modules les
+  plus coûteux ;
+- démarrage de ``--workers`` workers façon gunicorn, avec et sans
+  préchargement dans le master (``--preload``) : temps entre le fork et la
+  première réponse, mémoire propre (USS) et proportionnelle (PSS) de chaque
+  worker, lue dans ``/proc/<pid>/smaps_rollup`` (Linux).
+
+Usage :
+    python benchmarks/bench_startup.py [--workers 4] [--imports 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile(cwd, top=12):
+    """Durée d'import de l'application et modules directement importés les plus lents"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=cwd, capture_output=True, text=True, env=dict(os.environ, PYTHONPATH=ROOT)
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        # Deux espaces d'indentation par niveau d'import imbriqué
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative_us)))
+    total = next((cumulative for depth, name, cumulative in entries if name == 'app'), 0)
+    direct = [(name, cumulative) for depth, name, cumulative in entries if depth == 1]
+    return total, sorted(direct, key=lambda entry: -entry[1])[:top]
+
+
+def import_wall_time(cwd, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import app'], cwd=cwd, check=True,
+                       env=dict(os.environ, PYTHONPATH=ROOT), capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def memory(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1])
+    return {
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'uss': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+    }
+
+
+def boot_workers(preload, workers):
+    """Exécuté dans un processus dédié : simule le master gunicorn"""
+    sys.path.insert(0, ROOT)
+    if preload:
+        import wsgi  # noqa: F401  (migrations, templates, gc.freeze)
+
+    children = []
+    for _ in range(workers):
+        ready_r, ready_w = os.pipe()
+        go_r, go_w = os.pipe()
+        forked_at = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            os.close(go_w)
+            import wsgi  # déjà chargé avec preload
+            wsgi.app.config['SESSION_COOKIE_SECURE'] = False
+            wsgi.app.test_client().get('/login')
+            os.write(ready_w, str(time.perf_counter() - forked_at).encode())
+            os.close(ready_w)
+            os.read(go_r, 1)  # attendre la mesure mémoire du parent
+            os._exit(0)
+        os.close(ready_w)
+        os.close(go_r)
+        children.append((pid, ready_r, go_w))
+
+    results = []
+    for pid, ready_r, go_w in children:
+        boot = float(os.read(ready_r, 64).decode())
+        results.append({'boot': boot})
+    for (pid, ready_r, go_w), result in zip(children, results):
+        result.update(memory(pid))
+        os.write(go_w, b'x')
+        os.waitpid(pid, 0)
+    print(json.dumps(results))
+
+
+def run_mode(cwd, preload, workers):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--boot', 'preload' if preload else 'lazy',
+         '--workers', str(workers)],
+        cwd=cwd, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--imports', type=int, default=5, help='Imports à froid mesurés')
+    parser.add_argument('--boot', choices=['preload', 'lazy'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.boot:
+        boot_workers(args.boot == 'preload', args.workers)
+        return
+
+    cwd = tempfile.mkdtemp(prefix='bench_startup_')
+    subprocess.run([sys.executable, '-c', 'import app; app.migrate()'], cwd=cwd, check=True,
+                   env=dict(os.environ, PYTHONPATH=ROOT), capture_output=True)
+
+    total, direct = import_profile(cwd)
+    print(f'Import de app : {total / 1000:.0f} ms (importtime), '
+          f'{import_wall_time(cwd, args.imports) * 1000:.0f} ms avec le démarrage de Python\n')
+    print(f"{'module':>28} | {'cumulé (ms)':>11}")
+    print('-' * 42)
+    for name, cumulative in direct:
+        print(f'{name:>28} | {cumulative / 1000:>11.1f}')
+
+    print(f"\n{args.workers} workers")
+    print(f"{'mode':>8} | {'boot moyen (ms)':>15} | {'USS / worker (Mo)':>17} | {'PSS / worker (Mo)':>17}")
+    print('-' * 68)
+    for label, preload in (('lazy', False), ('preload', True)):
+        results = run_mode(cwd, preload, args.workers)
+        boot = statistics.mean(r['boot'] for r in results)
+        uss = statistics.mean(r['uss'] for r in results) / 1024
+        pss = statistics.mean(r['pss'] for r in results) / 1024
+        print(f'{label:>8} | {boot * 1000:>15.1f} | {uss:>17.1f} | {pss:>17.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Benchmark du rendu de dashboard.html
+
+Mesure le temps de rendu pour un dossier de 10, 1 000 et 10 000 éléments,
+avec et sans cache de fragments.
+
+Usage :
+    python benchmarks/bench_templates.py [--repeat 20]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Ajouter le répertoire racine au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Travailler dans un répertoire temporaire (uploads/, logs/, cache/)
+os.chdir(tempfile.mkdtemp(prefix='bench_templates_'))
+
+from flask import render_template, session
+from app import app
+from templating import fragment_cache
+
+# Les avertissements de rendu lent fausseraient les mesures
+app.logger.setLevel("ERROR")
+
+SIZES = (10, 1000, 10000)
+
+
+def make_context(size):
+    """Construit un contexte de rendu avec ``size`` éléments répartis"""
+    third = max(size // 3, 1)
+    labels = [{'id': i, 'name': f'Label {i}', 'color': '#3b82f6'} for i in range(1, 25)]
+    folders = [{'id': i, 'name': f'Dossier {i}', 'created_at': '2025-01-01 10:00:00'} for i in range(third)]
+    files = [
+        {'id': i, 'filename': f'{i:08d}_facture_{i}.pdf', 'original_name': f'facture_{i}.pdf',
+         'file_size': 1024 * (i % 500 + 1)}
+        for i in range(size - 2 * third)
+    ]
+    notes = [
+        {'id': i, 'title': f'Note {i}', 'content': 'Contenu de la note ' * 10,
+         'created_at': '2025-01-01 10:00:00'}
+        for i in range(third)
+    ]
+    folder_labels = {folder['id']: labels[:2] for folder in folders}
+    return {
+        'folders': folders,
+        'files': files,
+        'notes': notes,
+        'user_labels': labels,
+        'labels_version': hash(tuple(l['id'] for l in labels)),
+        'folder_labels': folder_labels,
+        'current_folder': 1,
+        'current_folder_name': 'Benchmark',
+    }
+
+
+def measure(context, repeat, use_fragment_cache):
+    timings = []
+    with app.test_request_context('/dashboard'):
+        session['user_id'] = 1
+        session['username'] = 'bench'
+        render_template('dashboard.html', **context)  # échauffement
+        for _ in range(repeat):
+            if not use_fragment_cache:
+                fragment_cache.clear()
+            start = time.perf_counter()
+            render_template('dashboard.html', **context)
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, max(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'éléments':>10} | {'sans cache (ms)':>16} | {'avec cache (ms)':>16} | {'max (ms)':>9}")
+    print('-' * 62)
+    for size in SIZES:
+        context = make_context(size)
+        repeat = args.repeat if size < 10000 else max(args.repeat // 4, 3)
+        cold, _ = measure(context, repeat, use_fragment_cache=False)
+        warm, worst = measure(context, repeat, use_fragment_cache=True)
+        print(f'{size:>10} | {cold:>16.2f} | {warm:>16.2f} | {worst:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+# Flux de modifications - Archive Platform
+"""Journal des modifications par utilisateur et flux Server-Sent Events.
+
+Des triggers écrivent une ligne dans ``change_log`` pour chaque ajout,
+modification ou suppression de fichier, dossier, note, étiquette
+(et association dossier-étiquette), ainsi qu'à la fin de chaque tâche
+d'arrière-plan : tous les écrivains (routes, worker, restauration de
+révision) sont couverts, dans la même transaction que la modification.
+
+``/events`` interroge ce journal à intervalle régulier (la base est le
+seul point commun entre les workers gunicorn) et transmet les nouvelles
+lignes au navigateur (``id > dernier transmis``). Sous PostgreSQL, les
+identifiants sont attribués avant le commit : une transaction plus lente
+rendrait visible un identifiant inférieur au dernier transmis, jamais
+relu. Les triggers y prennent donc le verrou consultatif d'écriture
+(celui de ``BEGIN IMMEDIATE``) avant d'écrire dans le journal : les lignes
+deviennent visibles dans l'ordre de leurs identifiants. Chaque flux :
+- ne garde en mémoire qu'un lot de ``BATCH_SIZE`` lignes et n'ouvre une
+  connexion SQLite que le temps d'une interrogation ;
+- envoie un commentaire de maintien toutes les ``HEARTBEAT_INTERVAL``
+  secondes et se termine après ``MAX_STREAM_DURATION`` secondes ;
+  EventSource se reconnecte alors avec ``Last-Event-ID`` ;
+- occupe une place d'un sémaphore par worker (``SSE_MAX_STREAMS``).
+
+En production, nginx envoie ``/events`` au service ``events`` (workers
+gevent, voir docker-compose.yml) : un flux n'y coûte qu'une greenlet. Servi
+par les workers gthread de l'application (développement), un flux mobilise
+un thread et la limite préserve les autres requêtes.
+"""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import database
+
+BATCH_SIZE = 100
+POLL_INTERVAL = 1.0  # secondes
+HEARTBEAT_INTERVAL = 15.0
+MAX_STREAM_DURATION = 300.0
+RETRY_MS = 2000  # délai de reconnexion conseillé au navigateur
+RETENTION = timedelta(hours=24)
+
+# {json} : json_object (SQLite) ou json_build_object (PostgreSQL) ; les
+# dates sont converties en texte pour garder le même format sur les deux bases
+_FILE_DATA = ("{json}('id', {r}.id, 'filename', {r}.filename, 'original_name', {r}.original_name, "
+              "'file_size', {r}.file_size, 'folder_id', {r}.folder_id)")
+_NOTE_DATA = ("{json}('id', {r}.id, 'title', {r}.title, 'content', {r}.content, "
+              "'folder_id', {r}.folder_id, 'created_at', CAST({r}.created_at AS TEXT))")
+_FOLDER_DATA = ("{json}('id', {r}.id, 'name', {r}.name, 'parent_id', {r}.parent_id, "
+                "'created_at', CAST({r}.created_at AS TEXT))")
+_LABEL_DATA = "{json}('id', {r}.id, 'name', {r}.name, 'color', {r}.color)"
+
+# (table, type d'objet, colonne dossier, données JSON, colonnes suivies en modification)
+_TRACKED = (
+    ('files', 'file', 'folder_id', _FILE_DATA, 'original_name, folder_id'),
+    ('notes', 'note', 'folder_id', _NOTE_DATA, 'title, content, folder_id'),
+    ('folders', 'folder', 'parent_id', _FOLDER_DATA, 'name, parent_id'),
+    ('labels', 'label', None, _LABEL_DATA, 'name, color'),
+)
+
+
+def create_change_feed(cursor):
+    """Table du journal et triggers (appelée par init_db)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            action TEXT NOT NULL,
+            object_id INTEGER NOT NULL,
+            folder_id INTEGER,
+            data TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_user ON change_log (user_id, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_created ON change_log (created_at)')
+
+    # Les triggers sont construits à partir de constantes du module uniquement
+    postgres = database.is_postgres(cursor)
+    json_object = 'json_build_object' if postgres else 'json_object'
+    # PostgreSQL : écritures du journal sérialisées jusqu'au commit (voir plus haut)
+    lock = 'PERFORM pg_advisory_xact_lock(' + str(database.WRITE_LOCK_KEY) + '); ' if postgres else ''
+    for table, kind, folder_column, data, columns in _TRACKED:
+        folder_new = 'NEW.' + folder_column if folder_column else 'NULL'
+        folder_old = 'OLD.' + folder_column if folder_column else 'NULL'
+        database.create_trigger(
+            cursor, table + '_change_insert', 'INSERT', table,
+            lock + 'INSERT INTO change_log (user_id, kind, action, object_id, folder_id, data) '
+            "VALUES (NEW.user_id, '" + kind + "', 'created', NEW.id, " + folder_new + ', '
+            + data.format(r='NEW', json=json_object) + ')'
+        )
+        database.create_trigger(
+            cursor, table + '_change_update', 'UPDATE OF ' + columns, table,
+            lock + 'INSERT INTO change_log (user_id, kind, action, object_id, folder_id, data) '
+            "VALUES (NEW.user_id, '" + kind + "', 'updated', NEW.id, " + folder_new + ', '
+            + data.format(r='NEW', json=json_object) + ')'
+        )
+        database.create_trigger(
+            cursor, table + '_change_delete', 'DELETE', table,
+            lock + 'INSERT INTO change_log (user_id, kind, action, object_id, folder_id, data) '
+            "VALUES (OLD.user_id, '" + kind + "', 'deleted', OLD.id, " + folder_old + ', '
+            + json_object + "('id', OLD.id))"
+        )
+
+    # Étiquettes d'un dossier : l'utilisateur est celui de l'étiquette (une
+    # étiquette supprimée n'émet que son propre événement)
+    for action, row in (('labeled', 'NEW'), ('unlabeled', 'OLD')):
+        database.create_trigger(
+            cursor, 'folder_labels_change_' + action, 'INSERT' if row == 'NEW' else 'DELETE', 'folder_labels',
+            lock + 'INSERT INTO change_log (user_id, kind, action, object_id, folder_id, data) '
+            "SELECT l.user_id, 'folder', '" + action + "', " + row + '.folder_id, ' + row + '.folder_id, '
+            + json_object + "('folder_id', " + row + ".folder_id, 'label_id', l.id, 'name', l.name, 'color', l.color) "
+            'FROM labels l WHERE l.id = ' + row + '.label_id'
+        )
+
+    database.create_trigger(
+        cursor, 'jobs_change_finished', 'UPDATE OF status', 'jobs',
+        lock + """INSERT INTO change_log (user_id, kind, action, object_id, data)
+        VALUES (NEW.user_id, 'job', NEW.status, NEW.id, """ + json_object + """('id', NEW.id, 'job_type', NEW.job_type))""",
+        when="NEW.user_id IS NOT NULL AND NEW.status IN ('done', 'failed') AND OLD.status != NEW.status"
+    )
+
+
+def latest_change_id(conn, user_id):
+    """Curseur initial du tableau de bord (dernière modification déjà affichée)"""
+    cursor = conn.cursor()
+    cursor.execute('SELECT MAX(id) FROM change_log WHERE user_id = ?', (user_id,))
+    return cursor.fetchone()[0] or 0
+
+
+def changes_since(conn, user_id, last_id, limit=BATCH_SIZE):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, kind, action, object_id, folder_id, data FROM change_log
+        WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?
+    ''', (user_id, last_id, limit))
+    return cursor.fetchall()
+
+
+def history_truncated(conn, user_id, last_id):
+    """True si des modifications de l'utilisateur postérieures à ``last_id``
+    ont pu être purgées.
+
+    ``last_id`` est la dernière modification de l'utilisateur reçue par le
+    client ; la purge supprimant les plus anciennes, les suivantes sont
+    encore là tant qu'elle y est. Les identifiants étant communs à tous les
+    utilisateurs, un écart avec sa plus ancienne ligne ne prouve rien.
+    """
+    if not last_id:
+        return False  # le client n'a encore rien reçu
+    cursor = conn.cursor()
+    cursor.execute('SELECT 1 FROM change_log WHERE user_id = ? AND id = ?', (user_id, last_id))
+    return cursor.fetchone() is None
+
+
+def prune_changes(conn, retention=RETENTION):
+    """Supprime les modifications plus anciennes que ``retention`` (worker)"""
+    cursor = conn.cursor()
+    # created_at est en UTC (CURRENT_TIMESTAMP), au format de SQLite
+    cutoff = datetime.now(timezone.utc) - retention
+    cursor.execute('DELETE FROM change_log WHERE created_at < ?', (cutoff.strftime('%Y-%m-%d %H:%M:%S'),))
+    conn.commit()
+    return cursor.rowcount
+
+
+def format_event(change):
+    change_id, kind, action, object_id, folder_id, data = change
+    payload = {
+        'kind': kind,
+        'action': action,
+        'id': object_id,
+        'folder_id': folder_id,
+        'data': json.loads(data) if data else None,
+    }
+    return ('id: ' + str(change_id) + '\nevent: change\ndata: '
+            + json.dumps(payload, ensure_ascii=False, separators=(',', ':')) + '\n\n')
+
+
+class StreamSlots:
+    """Nombre maximal de flux simultanés dans ce worker"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    def acquire(self):
+        return self._semaphore.acquire(blocking=False)
+
+    def release(self):
+        self._semaphore.release()
+
+
+class EventStream:
+    """Itérable WSGI d'un flux SSE ; ``close()`` (appelé par le serveur,
+    y compris à la déconnexion du client) libère la place du sémaphore."""
+
+    def __init__(self, connect, user_id, last_id, slots,
+                 poll_interval=POLL_INTERVAL, heartbeat=HEARTBEAT_INTERVAL, max_duration=MAX_STREAM_DURATION):
+        self.connect = connect
+        self.user_id = user_id
+        self.last_id = last_id
+        self.slots = slots
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.max_duration = max_duration
+        self._closed = False
+
+    def __iter__(self):
+        yield 'retry: ' + str(RETRY_MS) + '\n\n'
+        started = last_sent = time.monotonic()
+        while not self._closed and time.monotonic() - started < self.max_duration:
+            conn = self.connect()
+            try:
+                if history_truncated(conn, self.user_id, self.last_id):
+                    # Le client a manqué des modifications purgées : rechargement complet
+                    yield 'event: reset\ndata: {}\n\n'
+                    return
+                changes = changes_since(conn, self.user_id, self.last_id)
+            finally:
+                conn.close()
+
+            if changes:
+                self.last_id = changes[-1][0]
+                yield ''.join(format_event(change) for change in changes)
+                last_sent = time.monotonic()
+                if len(changes) == BATCH_SIZE:
+                    continue  # lot plein : la suite immédiatement
+            elif time.monotonic() - last_sent >= self.heartbeat:
+                yield ': keep-alive\n\n'
+                last_sent = time.monotonic()
+            time.sleep(self.poll_interval)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.slots.release()
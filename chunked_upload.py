@@ -0,0 +1,243 @@
+# Uploads reprenables par morceaux - Archive Platform
+"""Protocole d'upload par morceaux (init / envoi d'un morceau / finalisation).
+
+Chaque morceau est vérifié (SHA-256 fourni par le client) puis écrit
+directement à sa position dans un fichier partiel unique avec
+``os.pwrite`` : la finalisation n'a qu'à le renommer, sans le relire ;
+l'empreinte du fichier entier (``files.checksum``) est enregistrée plus
+tard par le scrubber. Les morceaux reçus sont enregistrés dans ``upload_chunks``,
+ce qui permet au client de reprendre un upload interrompu en ne renvoyant
+que les morceaux manquants, éventuellement en parallèle.
+
+La finalisation réserve d'abord la session (``completing_until``) : deux
+requêtes ``complete`` simultanées (double clic, reprise du client) ne
+déplacent pas deux fois le même fichier et ne créent pas deux lignes
+``files``.
+"""
+
+import hashlib
+import os
+import uuid
+from datetime import datetime, timedelta
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB, sous MAX_CONTENT_LENGTH
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_ACTIVE_UPLOADS = 3  # uploads ouverts simultanément par utilisateur
+UPLOAD_EXPIRATION = timedelta(hours=24)
+COMPLETION_TIMEOUT = timedelta(minutes=30)  # réservation d'une finalisation interrompue (worker tué)
+READ_SIZE = 1024 * 1024
+PARTS_DIRNAME = '.chunks'
+
+
+class UploadError(Exception):
+    """Erreur du protocole d'upload ; ``status`` est le code HTTP à retourner"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def create_upload_tables(cursor):
+    """Crée les tables des uploads par morceaux"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            folder_id INTEGER,
+            original_name TEXT NOT NULL,
+            stored_name TEXT NOT NULL,
+            total_size INTEGER NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            chunk_count INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            completing_until TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_upload_sessions_user ON upload_sessions (user_id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_chunks (
+            upload_id TEXT NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            PRIMARY KEY (upload_id, chunk_index),
+            FOREIGN KEY (upload_id) REFERENCES upload_sessions (id) ON DELETE CASCADE
+        )
+    ''')
+
+
+def parts_dir(upload_folder):
+    return os.path.join(upload_folder, PARTS_DIRNAME)
+
+
+def part_path(upload_folder, upload_id):
+    # upload_id est un uuid hexadécimal généré par le serveur
+    return os.path.join(parts_dir(upload_folder), f'{upload_id}.part')
+
+
+def init_upload(conn, upload_folder, user_id, original_name, stored_name, total_size,
+                folder_id=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Ouvre un upload et crée son fichier partiel ; retourne la session"""
+    chunk_size = min(max(chunk_size, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT COUNT(*) FROM upload_sessions WHERE user_id = ? AND expires_at > ?',
+        (user_id, datetime.now())
+    )
+    if cursor.fetchone()[0] >= MAX_ACTIVE_UPLOADS:
+        raise UploadError('Trop d\'uploads en cours.', 429)
+
+    upload_id = uuid.uuid4().hex
+    chunk_count = max(1, -(-total_size // chunk_size))
+    os.makedirs(parts_dir(upload_folder), exist_ok=True)
+    # Fichier creux de la taille finale : chaque morceau est écrit à sa place
+    with open(part_path(upload_folder, upload_id), 'wb') as f:
+        f.truncate(total_size)
+
+    cursor.execute(
+        'INSERT INTO upload_sessions (id, user_id, folder_id, original_name, stored_name, total_size, chunk_size, chunk_count, expires_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (upload_id, user_id, folder_id, original_name, stored_name, total_size, chunk_size,
+         chunk_count, datetime.now() + UPLOAD_EXPIRATION)
+    )
+    conn.commit()
+    return get_upload(conn, upload_id, user_id)
+
+
+def get_upload(conn, upload_id, user_id):
+    """Retourne la session d'upload de l'utilisateur (ou None) ; ``completing``
+    est vrai pendant sa finalisation"""
+    now = datetime.now()
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT *, (completing_until IS NOT NULL AND completing_until > ?) AS completing '
+        'FROM upload_sessions WHERE id = ? AND user_id = ? AND expires_at > ?',
+        (now, upload_id, user_id, now)
+    )
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+
+def claim_upload(conn, upload_id, user_id):
+    """Réserve la session pour sa finalisation ; retourne la session, ou None
+    si elle est introuvable ou déjà réservée par une autre requête"""
+    now = datetime.now()
+    cursor = conn.execute(
+        'UPDATE upload_sessions SET completing_until = ? '
+        'WHERE id = ? AND user_id = ? AND expires_at > ? AND (completing_until IS NULL OR completing_until <= ?)',
+        (now + COMPLETION_TIMEOUT, upload_id, user_id, now, now)
+    )
+    conn.commit()
+    if cursor.rowcount != 1:
+        return None
+    return get_upload(conn, upload_id, user_id)
+
+
+def release_upload(conn, upload_id):
+    """Annule la réservation après un échec : la finalisation peut être relancée"""
+    conn.execute('UPDATE upload_sessions SET completing_until = NULL WHERE id = ?', (upload_id,))
+    conn.commit()
+
+
+def received_chunks(conn, upload_id):
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT chunk_index FROM upload_chunks WHERE upload_id = ? ORDER BY chunk_index',
+        (upload_id,)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def expected_chunk_size(upload, index):
+    if index == upload['chunk_count'] - 1:
+        return upload['total_size'] - index * upload['chunk_size']
+    return upload['chunk_size']
+
+
+def write_chunk(conn, upload_folder, upload, index, stream, expected_sha256):
+    """Vérifie un morceau et l'écrit à sa position dans le fichier partiel"""
+    if upload['completing']:
+        raise UploadError('Upload en cours de finalisation.', 409)
+    if not 0 <= index < upload['chunk_count']:
+        raise UploadError('Index de morceau invalide.')
+    if not expected_sha256 or len(expected_sha256) != 64:
+        raise UploadError('En-tête X-Chunk-SHA256 manquant ou invalide.')
+
+    expected_size = expected_chunk_size(upload, index)
+    digest = hashlib.sha256()
+
+    # Morceau vérifié en mémoire (au plus MAX_CHUNK_SIZE) avant toute
+    # écriture : un renvoi tronqué ou corrompu d'un morceau déjà accepté
+    # (réponse perdue, nouvelle tentative du client) n'écrase pas ses octets
+    data = bytearray()
+    while len(data) < expected_size:
+        block = stream.read(min(READ_SIZE, expected_size - len(data)))
+        if not block:
+            break
+        digest.update(block)
+        data += block
+    if stream.read(1):
+        raise UploadError('Morceau plus grand que prévu.')
+    if len(data) != expected_size:
+        raise UploadError('Morceau incomplet.')
+    if digest.hexdigest() != expected_sha256.lower():
+        # Le morceau sera simplement renvoyé : rien n'est enregistré
+        raise UploadError('Somme de contrôle du morceau invalide.', 422)
+
+    fd = os.open(part_path(upload_folder, upload['id']), os.O_WRONLY)
+    try:
+        os.pwrite(fd, data, index * upload['chunk_size'])
+    finally:
+        os.close(fd)
+
+    conn.execute(
+        'INSERT INTO upload_chunks (upload_id, chunk_index, size, sha256) VALUES (?, ?, ?, ?) '
+        'ON CONFLICT (upload_id, chunk_index) DO UPDATE SET size = excluded.size, sha256 = excluded.sha256',
+        (upload['id'], index, len(data), digest.hexdigest())
+    )
+    conn.commit()
+
+
+def complete_upload(conn, upload_folder, upload):
+    """Vérifie que tous les morceaux sont présents ; retourne le fichier
+    assemblé.
+
+    Le fichier partiel est déjà dans son état final et n'est pas relu :
+    chaque morceau a été vérifié à sa réception, l'empreinte du fichier
+    entier est laissée au scrubber. L'appelant le transfère dans le stockage
+    puis appelle ``discard_upload``.
+    """
+    missing = upload['chunk_count'] - len(received_chunks(conn, upload['id']))
+    if missing:
+        raise UploadError(f'{missing} morceau(x) manquant(s).', 409)
+    path = part_path(upload_folder, upload['id'])
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return path
+
+
+def discard_upload(conn, upload_folder, upload_id):
+    """Supprime la session d'upload, ses morceaux et le fichier partiel restant"""
+    conn.execute('DELETE FROM upload_chunks WHERE upload_id = ?', (upload_id,))
+    conn.execute('DELETE FROM upload_sessions WHERE id = ?', (upload_id,))
+    conn.commit()
+    try:
+        os.remove(part_path(upload_folder, upload_id))
+    except FileNotFoundError:
+        pass
+
+
+def purge_expired_uploads(conn, upload_folder):
+    """Supprime les uploads abandonnés"""
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM upload_sessions WHERE expires_at <= ?', (datetime.now(),))
+    expired = [row[0] for row in cursor.fetchall()]
+    for upload_id in expired:
+        discard_upload(conn, upload_folder, upload_id)
+    return len(expired)
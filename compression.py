@@ -0,0 +1,105 @@
+# Compression des fichiers au repos - Archive Platform
+"""Compression transparente des fichiers stockés.
+
+À l'upload, un échantillon du fichier est compressé rapidement : si le gain
+est suffisant, le fichier est stocké compressé (zstd si le paquet
+``zstandard`` est installé, gzip sinon) et le codec est enregistré dans la
+colonne ``files.codec``. Au téléchargement, les octets compressés sont
+transmis tels quels si le client accepte l'encodage, et décompressés au fil
+de l'eau sinon.
+"""
+
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd optionnel : gzip (zlib) est toujours disponible
+    zstandard = None
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+
+SAMPLE_SIZE = 128 * 1024
+MIN_SIZE = 4 * 1024  # en dessous, le gain ne vaut pas l'en-tête du codec
+MAX_RATIO = 0.85  # compressé seulement si l'échantillon gagne au moins 15 %
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+CHUNK_SIZE = 64 * 1024
+
+# Formats déjà compressés : inutile d'échantillonner
+INCOMPRESSIBLE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'docx'}
+
+
+def preferred_codec():
+    return ZSTD if zstandard is not None else GZIP
+
+
+def choose_codec(fileobj, extension=None):
+    """Retourne le codec à utiliser pour ``fileobj`` (ou None) et rembobine le flux"""
+    if extension and extension.lower() in INCOMPRESSIBLE_EXTENSIONS:
+        return None
+    start = fileobj.tell()
+    sample = fileobj.read(SAMPLE_SIZE)
+    fileobj.seek(start)
+    if len(sample) < MIN_SIZE:
+        return None
+    # Niveau 1 : estimation rapide, suffisante pour écarter les données aléatoires
+    ratio = len(zlib.compress(sample, 1)) / len(sample)
+    return preferred_codec() if ratio <= MAX_RATIO else None
+
+
+class _GzipReader:
+    """Flux en lecture qui produit la version gzip d'un autre flux"""
+
+    def __init__(self, fileobj, level=GZIP_LEVEL):
+        self.fileobj = fileobj
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        self.buffer = b''
+        self.eof = False
+
+    def read(self, size=-1):
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            data = self.fileobj.read(CHUNK_SIZE)
+            if data:
+                self.buffer += self.compressor.compress(data)
+            else:
+                self.buffer += self.compressor.flush()
+                self.eof = True
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def compressing_reader(fileobj, codec):
+    """Enveloppe ``fileobj`` : la lecture retourne les octets compressés"""
+    if codec == GZIP:
+        return _GzipReader(fileobj)
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError('Le codec zstd nécessite le paquet zstandard')
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_reader(fileobj)
+    raise ValueError(f'Codec inconnu : {codec}')
+
+
+def decompressor(codec):
+    if codec == GZIP:
+        return zlib.decompressobj(31)
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError('Le codec zstd nécessite le paquet zstandard')
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f'Codec inconnu : {codec}')
+
+
+def decompress_stream(chunks, codec):
+    """Décompresse au fil de l'eau une suite de blocs compressés"""
+    dobj = decompressor(codec)
+    for chunk in chunks:
+        data = dobj.decompress(chunk)
+        if data:
+            yield data
+    if codec == GZIP:
+        tail = dobj.flush()
+        if tail:
+            yield tail
@@ -43,6 +43,21 @@ class Config:
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     LOG_FILE = 'logs/app.log'
     
+    # Serveur Gunicorn (lu par gunicorn.conf.py)
+    # Workers / threads : None = dimensionnés selon les cœurs disponibles
+    GUNICORN_BIND = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+    GUNICORN_WORKER_CLASS = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')  # gthread ou gevent
+    GUNICORN_WORKERS = int(os.environ['GUNICORN_WORKERS']) if os.environ.get('GUNICORN_WORKERS') else None
+    GUNICORN_THREADS = int(os.environ['GUNICORN_THREADS']) if os.environ.get('GUNICORN_THREADS') else None
+    GUNICORN_WORKER_CONNECTIONS = 1000  # gevent : connexions simultanées par worker
+    GUNICORN_PRELOAD = True
+    GUNICORN_RELOAD = False
+    GUNICORN_TIMEOUT = 60  # secondes sans signe de vie avant redémarrage du worker
+    GUNICORN_GRACEFUL_TIMEOUT = 30
+    GUNICORN_KEEPALIVE = 5  # secondes ; nginx réutilise ses connexions vers l'application
+    GUNICORN_MAX_REQUESTS = 2000  # recyclage des workers : borne la croissance mémoire
+    GUNICORN_MAX_REQUESTS_JITTER = 200  # évite que tous les workers redémarrent ensemble
+    
 
 class DevelopmentConfig(Config):
     """Configuration pour le développement"""
@@ -50,15 +65,25 @@ class DevelopmentConfig(Config):
     TESTING = False
     SESSION_COOKIE_SECURE = False  # HTTP autorisé en développement
     
+    # Un seul worker rechargé à chaque modification du code
+    GUNICORN_BIND = os.environ.get('GUNICORN_BIND', '127.0.0.1:5000')
+    GUNICORN_WORKERS = 1
+    GUNICORN_THREADS = 4
+    GUNICORN_PRELOAD = False  # incompatible avec le rechargement automatique
+    GUNICORN_RELOAD = True
+    GUNICORN_TIMEOUT = 300  # sessions de débogage
+    GUNICORN_MAX_REQUESTS = 0
+    GUNICORN_MAX_REQUESTS_JITTER = 0
+    
 
 class ProductionConfig(Config):
     """Configuration pour la production"""
     DEBUG = False
     TESTING = False
     
-    # Variables obligatoires en production
-    if not os.environ.get('SECRET_KEY'):
-        raise ValueError("SECRET_KEY doit être défini en production")
+    # Variables obligatoires en production : vérifiées par get_config(), pour
+    # que l'import de ce module (gunicorn.conf.py, scripts) ne lève pas
+    REQUIRED_ENV = ('SECRET_KEY',)
     
 
 class TestingConfig(Config):
@@ -81,4 +106,8 @@ def get_config(env=None):
     """Récupère la configuration appropriée"""
     if env is None:
         env = os.environ.get('FLASK_ENV', 'development')
-    return config.get(env, config['default'])
+    selected = config.get(env, config['default'])
+    for name in getattr(selected, 'REQUIRED_ENV', ()):
+        if not os.environ.get(name):
+            raise ValueError(f"{name} doit être défini en production")
+    return selected
@@ -0,0 +1,293 @@
+# Index plein texte du contenu des fichiers - Archive Platform
+"""Extraction du texte des documents (txt, docx, pdf) et index FTS5.
+
+L'extraction est faite par le worker (tâche ``index_file``) dans un pool de
+processus : le parsing des PDF est coûteux en CPU et ne doit bloquer ni les
+requêtes web ni les autres tâches. Le texte extrait est tronqué à
+``MAX_INDEXED_CHARS`` puis stocké dans la table virtuelle
+``file_contents`` dont le rowid est l'identifiant du fichier. La colonne
+``owner`` (jeton ``u<user_id>``) fait partie de la requête MATCH : FTS5
+croise directement les listes de documents au lieu de classer tous les
+documents de tous les utilisateurs avant de filtrer.
+
+Sous PostgreSQL, ``file_contents`` est une table ordinaire avec une colonne
+``tsvector`` générée et un index GIN ; la recherche utilise ``to_tsquery``,
+``ts_headline`` et ``ts_rank`` (même syntaxe côté utilisateur : mots
+entiers, dernier mot en préfixe).
+
+Usage :
+    python content_index.py --backfill   # indexe les fichiers existants
+"""
+
+import argparse
+import codecs
+import os
+import re
+import sys
+
+from markupsafe import escape
+
+import database
+
+INDEXABLE_EXTENSIONS = {'txt', 'pdf', 'docx'}
+MAX_SOURCE_BYTES = 64 * 1024 * 1024  # fichiers plus gros : non indexés
+MAX_INDEXED_CHARS = 200000  # texte conservé par document
+MAX_PDF_PAGES = 500
+EXTRACTION_TIMEOUT = 120  # secondes
+SNIPPET_TOKENS = 16
+SEARCH_LIMIT = 50
+
+# Délimiteurs du surlignage renvoyés par snippet() : caractères de contrôle
+# absents du texte indexé, remplacés par <mark> après échappement HTML
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+_DOCX_TEXT = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t'
+_DOCX_PARAGRAPH = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p'
+_CONTROL_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_pool = None
+
+
+def create_content_index(cursor):
+    """Crée la table FTS5 du contenu des fichiers (ou son équivalent PostgreSQL)"""
+    if database.is_postgres(cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS file_contents (
+                rowid BIGINT PRIMARY KEY,
+                content TEXT,
+                owner TEXT,
+                document tsvector GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_file_contents_document ON file_contents USING GIN (document)')
+        return
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS file_contents USING fts5(
+            content,
+            owner,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+
+
+def is_indexable(filename):
+    return filename.rsplit('.', 1)[-1].lower() in INDEXABLE_EXTENSIONS
+
+
+def _extract_txt(path):
+    with open(path, 'rb') as f:
+        # 4 octets par caractère au plus en UTF-8
+        data = f.read(MAX_INDEXED_CHARS * 4)
+    try:
+        # Décodage non final : un caractère multi-octets coupé par la limite
+        # de lecture est ignoré au lieu de faire basculer tout le document
+        # en latin-1
+        return codecs.getincrementaldecoder('utf-8')().decode(data, final=False)
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+
+def _extract_docx(path):
+    import zipfile
+    from xml.etree import ElementTree
+
+    parts = []
+    size = 0
+    with zipfile.ZipFile(path) as archive:
+        with archive.open('word/document.xml') as document:
+            # Analyse incrémentale : le XML n'est jamais chargé en entier
+            for event, element in ElementTree.iterparse(document, events=('end',)):
+                if element.tag == _DOCX_TEXT and element.text:
+                    parts.append(element.text)
+                    size += len(element.text)
+                elif element.tag == _DOCX_PARAGRAPH:
+                    parts.append('\n')
+                    element.clear()
+                if size >= MAX_INDEXED_CHARS:
+                    break
+    return ''.join(parts)
+
+
+def _extract_pdf(path):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return ''
+    parts = []
+    size = 0
+    reader = PdfReader(path)
+    for page in reader.pages[:MAX_PDF_PAGES]:
+        text = page.extract_text() or ''
+        parts.append(text)
+        size += len(text)
+        if size >= MAX_INDEXED_CHARS:
+            break
+    return '\n'.join(parts)
+
+
+_EXTRACTORS = {'txt': _extract_txt, 'docx': _extract_docx, 'pdf': _extract_pdf}
+
+
+def extract_text(path, extension):
+    """Extrait le texte d'un fichier local (exécuté dans le pool de processus)"""
+    extractor = _EXTRACTORS.get(extension.lower())
+    if extractor is None:
+        return ''
+    text = extractor(path)
+    return _CONTROL_CHARS.sub(' ', text[:MAX_INDEXED_CHARS])
+
+
+def get_pool():
+    """Pool de processus d'extraction, créé au premier usage"""
+    global _pool
+    if _pool is None:
+        # Importé au premier usage : seul le worker des tâches en a besoin
+        from concurrent.futures import ProcessPoolExecutor
+
+        workers = int(os.environ.get('CONTENT_INDEX_PROCESSES', '2'))
+        _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool
+
+
+def extract_in_pool(path, extension):
+    return get_pool().submit(extract_text, path, extension).result(timeout=EXTRACTION_TIMEOUT)
+
+
+def _owner_token(user_id):
+    return 'u' + str(int(user_id))
+
+
+def index_document(conn, file_id, user_id, text):
+    """Remplace le texte indexé d'un fichier (ne commit pas)"""
+    conn.execute('DELETE FROM file_contents WHERE rowid = ?', (file_id,))
+    # Rien n'est indexé si le fichier a été supprimé pendant l'extraction
+    conn.execute(
+        'INSERT INTO file_contents (rowid, content, owner) SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM files WHERE id = ?)',
+        (file_id, text, _owner_token(user_id), file_id)
+    )
+
+
+def remove_documents(conn, file_ids):
+    """Retire des fichiers de l'index (ne commit pas)"""
+    conn.executemany('DELETE FROM file_contents WHERE rowid = ?', [(file_id,) for file_id in file_ids])
+
+
+def build_match_query(query, user_id):
+    """Transforme la saisie utilisateur en requête FTS5 sûre.
+
+    Chaque mot devient une phrase entre guillemets (la syntaxe FTS5 de
+    l'utilisateur n'est pas interprétée) ; le dernier mot est un préfixe.
+    """
+    terms = [term.replace('"', '""') for term in query.split()]
+    if not terms:
+        return None
+    phrases = ['"' + term + '"' for term in terms]
+    phrases[-1] += '*'
+    return 'owner:' + _owner_token(user_id) + ' AND content:(' + ' '.join(phrases) + ')'
+
+
+def build_tsquery(query):
+    """Équivalent PostgreSQL de build_match_query (``to_tsquery('simple', ...)``).
+
+    Chaque mot est un lexème entre apostrophes, le dernier est un préfixe.
+    """
+    terms = [term.replace("'", "''").replace('\\', '\\\\') for term in query.lower().split()]
+    if not terms:
+        return None
+    lexemes = ["'" + term + "'" for term in terms]
+    lexemes[-1] += ':*'
+    return ' & '.join(lexemes)
+
+
+def highlight(snippet):
+    """Échappe un extrait puis remplace les délimiteurs par <mark>"""
+    return str(escape(snippet)).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def search(conn, user_id, query, limit=SEARCH_LIMIT):
+    """Recherche plein texte dans les fichiers d'un utilisateur"""
+    if database.is_postgres(conn):
+        return _search_postgres(conn, user_id, query, limit)
+    match = build_match_query(query, user_id)
+    if match is None:
+        return []
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT f.id, f.filename, f.original_name, f.folder_id, '
+        'snippet(file_contents, 0, ?, ?, ?, ?) AS snippet '
+        'FROM file_contents JOIN files f ON f.id = file_contents.rowid '
+        'WHERE file_contents MATCH ? AND f.user_id = ? '
+        'ORDER BY bm25(file_contents, 1.0, 0.0) LIMIT ?',
+        (_MARK_START, _MARK_END, '…', SNIPPET_TOKENS, match, user_id, limit)
+    )
+    return _results(cursor)
+
+
+def _search_postgres(conn, user_id, query, limit):
+    tsquery = build_tsquery(query)
+    if tsquery is None:
+        return []
+    options = ('StartSel=' + _MARK_START + ', StopSel=' + _MARK_END + ', MaxWords=' + str(SNIPPET_TOKENS)
+               + ', MinWords=' + str(SNIPPET_TOKENS // 2) + ', FragmentDelimiter=…, MaxFragments=1')
+    cursor = conn.cursor()
+    # Filtre par propriétaire avant le classement, comme la colonne owner de FTS5
+    cursor.execute(
+        'SELECT f.id, f.filename, f.original_name, f.folder_id, '
+        "ts_headline('simple', c.content, q, ?) AS snippet "
+        "FROM file_contents c JOIN files f ON f.id = c.rowid, to_tsquery('simple', ?) q "
+        'WHERE c.document @@ q AND c.owner = ? AND f.user_id = ? '
+        'ORDER BY ts_rank(c.document, q) DESC LIMIT ?',
+        (options, tsquery, _owner_token(user_id), user_id, limit)
+    )
+    return _results(cursor)
+
+
+def _results(cursor):
+    return [
+        {
+            'id': row[0],
+            'filename': row[1],
+            'original_name': row[2],
+            'folder_id': row[3],
+            'snippet': highlight(row[4]),
+        }
+        for row in cursor.fetchall()
+    ]
+
+
+def backfill(conn):
+    """Dépose une tâche d'indexation pour chaque fichier non encore indexé"""
+    import jobs
+
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT id, user_id, original_name FROM files '
+        'WHERE id NOT IN (SELECT rowid FROM file_contents)'
+    )
+    count = 0
+    for file_id, user_id, original_name in cursor.fetchall():
+        if is_indexable(original_name):
+            jobs.enqueue(conn, 'index_file', {'file_id': file_id}, user_id=user_id, priority=-1)
+            count += 1
+    conn.commit()
+    return count
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description='Index plein texte du contenu des fichiers')
+    parser.add_argument('--backfill', action='store_true', help='Indexer les fichiers existants')
+    args = parser.parse_args()
+
+    if args.backfill:
+        from app import connect_database, data_databases, migrate
+
+        migrate()
+        for db_path in data_databases():
+            conn = connect_database(db_path)
+            conn.row_factory = None
+            print(f'{db_path} : {backfill(conn)} fichier(s) à indexer')
+            conn.close()
+    else:
+        parser.print_help()
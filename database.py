@@ -0,0 +1,527 @@
+# Accès à la base de données - Archive Platform
+"""Connexions à la base principale selon ``DATABASE_URL``.
+
+- ``sqlite:///database.db`` (défaut) : sqlite3, une connexion par requête ;
+  ``sqlite:///:memory:`` : base en mémoire partagée par les connexions du
+  processus (tests).
+- ``postgresql://utilisateur:secret@hôte:5432/base`` : psycopg 3 et un pool
+  de connexions par processus (``close()`` rend la connexion au pool). Une
+  requête exécutée ``prepare_threshold`` fois sur une connexion y est
+  préparée : PostgreSQL réutilise son plan (``DB_PREPARE_THRESHOLD``, vide
+  pour désactiver, par exemple derrière pgbouncer en mode transaction).
+
+Les connexions PostgreSQL imitent l'interface sqlite3 utilisée par
+l'application (``execute``, ``cursor``, ``lastrowid``, lignes accessibles
+par index ou par nom, ``row_factory``) et ses transactions implicites :
+une transaction ne commence qu'à la première écriture, une requête en
+lecture seule ne coûte aucun BEGIN / ROLLBACK.
+
+Le SQL de l'application reste celui de SQLite, écrit avec des idiomes
+communs aux deux bases (``ON CONFLICT``, ``COALESCE``...). ``translate()``
+convertit le reste pour PostgreSQL (résultat mis en cache) :
+
+- paramètres ``?`` en ``%s`` ;
+- ``CURRENT_TIMESTAMP`` en heure UTC tronquée à la seconde, comme SQLite ;
+- ``BEGIN IMMEDIATE`` en transaction + verrou consultatif (sérialise les
+  mêmes sections critiques, ex. réclamation des tâches) ;
+- ``temp.`` en ``pg_temp.`` et ``CROSS JOIN ... ON`` (indication d'ordre de
+  jointure pour SQLite) en ``JOIN`` ;
+- définitions de tables : ``INTEGER`` en ``BIGINT``, ``AUTOINCREMENT`` en
+  colonne d'identité, ``BLOB`` en ``BYTEA``, ``GLOB`` en ``SIMILAR TO`` ;
+  ``TIMESTAMP`` garde ses microsecondes (comme les dates passées en
+  paramètre sous SQLite : ``TIMESTAMP(0)`` arrondirait) ; les clés
+  étrangères sont retirées : SQLite ne les applique pas (``foreign_keys``
+  désactivé), l'intégrité est assurée par l'application et les triggers, le
+  comportement reste le même sur les deux bases.
+
+``LIKE`` reste sensible à la casse sous PostgreSQL (il ne l'est pas sous
+SQLite) : une requête qui veut ignorer la casse choisit ``ILIKE``
+explicitement (``is_postgres()``), une réécriture globale changerait aussi
+les motifs qui comptent sur la casse. Triggers et recherche plein texte ont
+une version par base dans leur module.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from decimal import Decimal
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit
+
+import migrations
+
+DEFAULT_URL = 'sqlite:///database.db'
+POOL_TIMEOUT = 30  # secondes d'attente d'une connexion libre
+WRITE_LOCK_KEY = 0x41524348  # verrou consultatif de BEGIN IMMEDIATE
+MIGRATION_LOCK_KEY = 0x4D494752
+
+# Exceptions des deux pilotes (complétées au chargement de psycopg) ;
+# à utiliser dans les ``except`` à la place de celles de sqlite3
+IntegrityError = (sqlite3.IntegrityError,)
+Error = (sqlite3.Error,)
+
+_psycopg = None
+
+
+def _load_psycopg():
+    global _psycopg, IntegrityError, Error
+    if _psycopg is None:
+        try:
+            import psycopg
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            raise RuntimeError('DATABASE_URL=postgresql:// nécessite les paquets psycopg et psycopg_pool')
+        _psycopg = psycopg
+        IntegrityError = (sqlite3.IntegrityError, psycopg.IntegrityError)
+        Error = (sqlite3.Error, psycopg.Error)
+    return _psycopg
+
+
+def parse_url(url):
+    """Retourne (backend, cible) : chemin SQLite ou URL PostgreSQL"""
+    scheme = url.split(':', 1)[0].lower()
+    if scheme == 'sqlite':
+        if not url.startswith('sqlite:///'):
+            raise ValueError('URL SQLite attendue sous la forme sqlite:///chemin')
+        return 'sqlite', url[len('sqlite:///'):] or ':memory:'
+    if scheme in ('postgresql', 'postgres'):
+        return 'postgresql', url
+    raise ValueError('DATABASE_URL non prise en charge : ' + scheme)
+
+
+def redact_url(url):
+    """URL sans mot de passe (journaux, identifiant de base du worker)"""
+    parts = urlsplit(url)
+    if parts.password is None:
+        return url
+    netloc = parts.netloc.rsplit('@', 1)
+    return urlunsplit(parts._replace(netloc=netloc[0].split(':', 1)[0] + ':***@' + netloc[1]))
+
+
+def is_postgres(conn_or_cursor):
+    return isinstance(conn_or_cursor, (PostgresConnection, PostgresCursor))
+
+
+def create_trigger(cursor, name, event, table, body, when=None):
+    """Trigger ``AFTER <event> ON <table> FOR EACH ROW`` sur les deux bases.
+
+    ``body`` : instructions séparées par ``;`` utilisant ``NEW`` / ``OLD``,
+    écrites dans le SQL commun aux deux bases. Sous PostgreSQL, elles forment
+    le corps d'une fonction PL/pgSQL du même nom, remplacée à chaque
+    migration comme le trigger (``IF NOT EXISTS`` sous SQLite).
+    """
+    body = body.strip().rstrip(';')
+    if not is_postgres(cursor):
+        cursor.execute(
+            'CREATE TRIGGER IF NOT EXISTS ' + name + ' AFTER ' + event + ' ON ' + table
+            + (' WHEN ' + when if when else '') + ' BEGIN ' + body + '; END'
+        )
+        return
+    cursor.execute(
+        'CREATE OR REPLACE FUNCTION ' + name + '() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+        + body + '; RETURN NULL; END $$'
+    )
+    cursor.execute(
+        'CREATE OR REPLACE TRIGGER ' + name + ' AFTER ' + event + ' ON ' + table + ' FOR EACH ROW'
+        + (' WHEN (' + when + ')' if when else '') + ' EXECUTE FUNCTION ' + name + '()'
+    )
+
+
+class Database:
+    """Base principale désignée par ``DATABASE_URL``"""
+
+    def __init__(self, url=DEFAULT_URL, pool_min_size=1, pool_max_size=10, prepare_threshold=2, query_log=None):
+        self.url = url
+        self.backend, self.target = parse_url(url)
+        self.pool_min_size = pool_min_size
+        self.pool_max_size = pool_max_size
+        self.prepare_threshold = prepare_threshold
+        self.query_log = query_log  # query_log.QueryLog : requêtes mesurées
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._memory_keeper = None
+        # Tables à colonne d'identité -> colonne (lastrowid par RETURNING)
+        self.identity_columns = {}
+        if self.backend == 'postgresql':
+            _load_psycopg()
+
+    @property
+    def name(self):
+        """Chemin du fichier SQLite, ou URL PostgreSQL sans mot de passe"""
+        return self.target if self.backend == 'sqlite' else redact_url(self.url)
+
+    @property
+    def path(self):
+        return self.target if self.backend == 'sqlite' else None
+
+    def connect(self):
+        if self.backend == 'postgresql':
+            return PostgresConnection(self, self._get_pool())
+        factory = self.query_log.connection_class if self.query_log is not None else sqlite3.Connection
+        if self.target == ':memory:':
+            # Base nommée partagée, conservée tant que le processus vit
+            uri = 'file:archive-' + str(os.getpid()) + '?mode=memory&cache=shared'
+            if self._memory_keeper is None:
+                self._memory_keeper = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            conn = sqlite3.connect(uri, uri=True, factory=factory)
+        else:
+            conn = sqlite3.connect(self.target, factory=factory)
+        conn.row_factory = sqlite3.Row  # Permet d'accéder aux colonnes par nom
+        return conn
+
+    def run_migrations(self, init_fn, version):
+        """Exécute ``init_fn`` une seule fois par version du schéma ; retourne True si exécuté"""
+        if self.backend == 'postgresql':
+            try:
+                return migrations.run_migrations_postgres(self.connect, init_fn, version, MIGRATION_LOCK_KEY)
+            finally:
+                # Le master gunicorn migre puis forke : pas de pool hérité
+                self.dispose()
+        if self.target == ':memory:':
+            init_fn()
+            return True
+        return migrations.run_migrations(self.target, init_fn, version)
+
+    def _get_pool(self):
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            with self._lock:
+                if self._pool is None or self._pool_pid != pid:
+                    # Après un fork, le pool du parent (threads, sockets) est inutilisable
+                    from psycopg_pool import ConnectionPool
+
+                    self._pool = ConnectionPool(
+                        self.url, min_size=self.pool_min_size, max_size=self.pool_max_size,
+                        kwargs={'autocommit': True, 'prepare_threshold': self.prepare_threshold},
+                        configure=_configure_connection, timeout=POOL_TIMEOUT,
+                        name='archive', open=True
+                    )
+                    self._pool_pid = pid
+                    self._load_identity_columns()
+        return self._pool
+
+    def _load_identity_columns(self):
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT table_name, column_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND is_identity = 'YES'"
+            ).fetchall()
+        self.identity_columns.update(rows)
+
+    def dispose(self):
+        """Ferme le pool de ce processus (recréé au prochain usage)"""
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.close()
+            self._pool = None
+
+
+def _configure_connection(conn):
+    """Nouvelle connexion du pool : mêmes types en sortie que sqlite3"""
+    psycopg = _load_psycopg()
+    from psycopg.types.string import TextLoader
+
+    # Dates en texte (SQLite les stocke en texte ISO ; l'application les
+    # relit avec datetime.fromisoformat ou les affiche telles quelles)
+    for type_name in ('timestamp', 'timestamptz', 'date'):
+        conn.adapters.register_loader(type_name, TextLoader)
+    conn.adapters.register_loader('numeric', _numeric_loader())
+    # CURRENT_TIMESTAMP en UTC, comme SQLite
+    conn.execute("SET TIME ZONE 'UTC'")
+    if conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+        conn.commit()
+
+
+_numeric_loader_class = None
+
+
+def _numeric_loader():
+    global _numeric_loader_class
+    if _numeric_loader_class is None:
+        from psycopg.adapt import Loader
+
+        class NumericLoader(Loader):
+            """SUM() d'une colonne BIGINT : int (sérialisable en JSON) plutôt que Decimal"""
+
+            def load(self, data):
+                value = Decimal(bytes(data).decode())
+                return int(value) if value == value.to_integral_value() else float(value)
+
+        _numeric_loader_class = NumericLoader
+    return _numeric_loader_class
+
+
+# -- Traduction SQL ------------------------------------------------------
+
+_LITERAL_RE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\$\$.*?\$\$)", re.S)
+_TEMP_RE = re.compile(r'\btemp\.', re.I)
+_CROSS_JOIN_RE = re.compile(r'\bCROSS JOIN\b', re.I)
+_INSERT_RE = re.compile(r'^\s*INSERT\s+INTO\s+(\w+)', re.I)
+_DML_RE = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.I)
+_BEGIN_IMMEDIATE_RE = re.compile(r'^\s*BEGIN\s+IMMEDIATE\s*$', re.I)
+_DDL_RE = re.compile(r'^\s*(CREATE\s+(TEMP\s+|TEMPORARY\s+)?TABLE|ALTER\s+TABLE)\b', re.I)
+_IDENTITY_RE = re.compile(r'\b(\w+)\s+INTEGER\s+PRIMARY\s+KEY\s+AUTOINCREMENT\b', re.I)
+_CREATE_TABLE_RE = re.compile(r'CREATE\s+(?:TEMP\s+|TEMPORARY\s+)?TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.I)
+_FOREIGN_KEY_RE = re.compile(
+    r',\s*FOREIGN\s+KEY\s*\([^)]*\)\s*REFERENCES\s+\w+\s*\([^)]*\)(\s+ON\s+(DELETE|UPDATE)\s+(CASCADE|SET\s+NULL|RESTRICT|NO\s+ACTION))*',
+    re.I
+)
+_INTEGER_RE = re.compile(r'\bINTEGER\b', re.I)
+_BLOB_RE = re.compile(r'\bBLOB\b', re.I)
+_GLOB_RE = re.compile(r'\bGLOB\b', re.I)
+_CURRENT_TIMESTAMP_RE = re.compile(r'\bCURRENT_TIMESTAMP\b', re.I)
+# Session en UTC (_configure_connection) ; SQLite tronque aussi à la seconde
+CURRENT_TIMESTAMP_SQL = "date_trunc('second', LOCALTIMESTAMP)"
+
+
+class Statement:
+    __slots__ = ('sql', 'kind', 'insert_table', 'identity')
+
+    def __init__(self, sql, kind, insert_table=None, identity=None):
+        self.sql = sql
+        self.kind = kind  # 'write', 'begin_immediate' ou 'other'
+        self.insert_table = insert_table
+        self.identity = identity  # (table, colonne) créée par ce CREATE TABLE
+
+
+def _rewrite_code(segment, ddl):
+    """Réécritures hors littéraux"""
+    segment = _CURRENT_TIMESTAMP_RE.sub(CURRENT_TIMESTAMP_SQL, segment)
+    segment = _TEMP_RE.sub('pg_temp.', segment)
+    segment = _CROSS_JOIN_RE.sub('JOIN', segment)
+    if ddl:
+        segment = _IDENTITY_RE.sub(r'\1 BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY', segment)
+        segment = _INTEGER_RE.sub('BIGINT', segment)
+        segment = _BLOB_RE.sub('BYTEA', segment)
+        segment = _GLOB_RE.sub('SIMILAR TO', segment)
+    return segment
+
+
+@lru_cache(maxsize=1024)
+def translate(sql, with_params=True):
+    """Convertit une requête SQLite pour PostgreSQL (voir le docstring du module)"""
+    if _BEGIN_IMMEDIATE_RE.match(sql):
+        return Statement('SELECT pg_advisory_xact_lock(' + str(WRITE_LOCK_KEY) + ')', 'begin_immediate')
+
+    ddl = bool(_DDL_RE.match(sql))
+    identity = None
+    if ddl:
+        table = _CREATE_TABLE_RE.search(sql)
+        column = _IDENTITY_RE.search(sql)
+        if table and column:
+            identity = (table.group(1), column.group(1))
+        sql = _FOREIGN_KEY_RE.sub('', sql)
+
+    parts = []
+    for index, segment in enumerate(_LITERAL_RE.split(sql)):
+        if index % 2:  # littéral : seuls les % sont à doubler
+            parts.append(segment.replace('%', '%%') if with_params else segment)
+            continue
+        segment = _rewrite_code(segment, ddl)
+        if with_params:
+            segment = segment.replace('%', '%%').replace('?', '%s')
+        parts.append(segment)
+    translated = ''.join(parts)
+
+    insert = _INSERT_RE.match(sql)
+    kind = 'write' if _DML_RE.match(sql) else 'other'
+    return Statement(translated, kind, insert.group(1).lower() if insert else None, identity)
+
+
+# -- Connexions PostgreSQL -----------------------------------------------
+
+class Row(tuple):
+    """Ligne compatible avec sqlite3.Row : accès par index ou par nom de colonne"""
+    __slots__ = ()
+    _index = {}
+    _names = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise IndexError('No item with that key')
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return list(self._names)
+
+
+_row_classes = {}
+
+
+def _row_class(names):
+    cls = _row_classes.get(names)
+    if cls is None:
+        index = {}
+        for position, name in enumerate(names):
+            index.setdefault(name, position)
+        cls = _row_classes.setdefault(names, type('Row', (Row,), {'__slots__': (), '_index': index, '_names': names}))
+    return cls
+
+
+class PostgresCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._conn.cursor()
+        self.row_factory = connection.row_factory
+        self.lastrowid = None
+        self.arraysize = 1
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, sql, params=()):
+        query_log = self.connection.database.query_log
+        if query_log is None:
+            return self._execute(sql, params)
+        start = time.perf_counter()
+        self._execute(sql, params)
+        query_log.record(sql, params, time.perf_counter() - start, _explain, self.connection)
+        return self
+
+    def _execute(self, sql, params=()):
+        statement = translate(sql, bool(params))
+        query = statement.sql
+        self.lastrowid = None
+        if statement.kind == 'begin_immediate':
+            self.connection._begin()
+        elif statement.kind == 'write':
+            self.connection._begin()
+
+        database = self.connection.database
+        returning = None
+        if statement.insert_table is not None and 'RETURNING' not in query.upper():
+            returning = database.identity_columns.get(statement.insert_table)
+            if returning:
+                query += ' RETURNING ' + returning
+
+        self._cursor.execute(query, tuple(params) if params else None)
+        if statement.identity is not None:
+            database.identity_columns[statement.identity[0].lower()] = statement.identity[1]
+        if returning:
+            row = self._cursor.fetchone()
+            self.lastrowid = row[0] if row else None
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        statement = translate(sql, True)
+        if statement.kind == 'write':
+            self.connection._begin()
+        seq_of_params = [tuple(params) for params in seq_of_params]
+        start = time.perf_counter()
+        self._cursor.executemany(statement.sql, seq_of_params)
+        query_log = self.connection.database.query_log
+        if query_log is not None:
+            query_log.record(
+                sql, seq_of_params[0] if seq_of_params else (), time.perf_counter() - start,
+                _explain, self.connection
+            )
+        return self
+
+    def _make(self, row):
+        if row is None:
+            return None
+        factory = self.row_factory
+        if factory is None:
+            return row
+        if factory is Row or factory is sqlite3.Row:
+            return _row_class(tuple(column.name for column in self._cursor.description))(row)
+        return factory(self, row)
+
+    def fetchone(self):
+        return self._make(self._cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        return [self._make(row) for row in self._cursor.fetchmany(size or self.arraysize)]
+
+    def fetchall(self):
+        return [self._make(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def close(self):
+        self._cursor.close()
+
+
+def _explain(connection, sql, params):
+    """Plan d'une requête lente (``query_log``), sans mesurer l'EXPLAIN"""
+    import query_log
+
+    cursor = connection.cursor()
+    cursor._execute('EXPLAIN ' + sql, params)
+    return query_log.postgres_plan([row[0] for row in cursor.fetchall()])
+
+
+class PostgresConnection:
+    """Connexion empruntée au pool, avec l'interface sqlite3 de l'application"""
+
+    def __init__(self, database, pool):
+        self.database = database
+        self._pool = pool
+        self._conn = pool.getconn()
+        self.row_factory = Row
+
+    def _in_transaction(self):
+        return self._conn.info.transaction_status != _psycopg.pq.TransactionStatus.IDLE
+
+    def _begin(self):
+        # Transaction implicite à la première écriture, comme sqlite3
+        if not self._in_transaction():
+            self._conn.execute('BEGIN')
+
+    @property
+    def in_transaction(self):
+        return self._in_transaction()
+
+    def cursor(self):
+        return PostgresCursor(self)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def commit(self):
+        if self._conn is not None and self._in_transaction():
+            self._conn.execute('COMMIT')
+
+    def rollback(self):
+        if self._conn is not None and self._in_transaction():
+            self._conn.execute('ROLLBACK')
+
+    def close(self):
+        """Rend la connexion au pool (transaction non validée annulée, comme sqlite3)"""
+        if self._conn is None:
+            return
+        try:
+            if not self._conn.closed:
+                self.rollback()
+        finally:
+            self._pool.putconn(self._conn)
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
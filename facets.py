@@ -0,0 +1,203 @@
+# Filtrage par étiquettes - Archive Platform
+"""Filtrage à facettes des dossiers (et de leur contenu) par étiquettes.
+
+- ``idx_folder_labels_label (label_id, folder_id)`` : l'index inverse
+  étiquette → dossiers ; la clé primaire (folder_id, label_id) sert le sens
+  dossier → étiquettes (calcul des facettes). Les deux sont couvrants.
+- ``label_counts`` : nombre de dossiers par étiquette, maintenu par
+  triggers ; donne les facettes sans filtre sans rien compter et ordonne
+  les étiquettes d'une requête ET de la plus sélective à la moins sélective.
+- Les clés étrangères n'étant pas activées, des triggers suppriment les
+  associations d'un dossier ou d'une étiquette supprimés (sinon les
+  compteurs dériveraient).
+
+Un fichier ou une note correspond au filtre si son dossier y correspond
+(les étiquettes ne s'attachent qu'aux dossiers).
+"""
+
+import database
+
+MODES = ('and', 'or')
+MAX_FILTER_LABELS = 20
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 1000
+
+
+def create_facet_index(cursor):
+    """Index, table de compteurs et triggers (appelée par init_db)"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_folder_labels_label ON folder_labels (label_id, folder_id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS label_counts (
+            label_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            folder_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    database.create_trigger(cursor, 'folder_labels_count_insert', 'INSERT', 'folder_labels', '''
+        INSERT INTO label_counts (label_id, user_id, folder_count)
+        SELECT NEW.label_id, user_id, 1 FROM labels WHERE id = NEW.label_id
+        ON CONFLICT (label_id) DO UPDATE SET folder_count = label_counts.folder_count + 1
+    ''')
+    database.create_trigger(cursor, 'folder_labels_count_delete', 'DELETE', 'folder_labels', '''
+        UPDATE label_counts SET folder_count = folder_count - 1 WHERE label_id = OLD.label_id
+    ''')
+    database.create_trigger(cursor, 'folders_delete_labels', 'DELETE', 'folders', '''
+        DELETE FROM folder_labels WHERE folder_id = OLD.id
+    ''')
+    database.create_trigger(cursor, 'labels_delete_folder_labels', 'DELETE', 'labels', '''
+        DELETE FROM folder_labels WHERE label_id = OLD.id;
+        DELETE FROM label_counts WHERE label_id = OLD.id
+    ''')
+
+    # Associations orphelines (dossiers supprimés avant les triggers) puis
+    # recalcul des compteurs : idempotent, exécuté à chaque migration
+    cursor.execute('DELETE FROM folder_labels WHERE folder_id NOT IN (SELECT id FROM folders)')
+    cursor.execute('DELETE FROM folder_labels WHERE label_id NOT IN (SELECT id FROM labels)')
+    cursor.execute('DELETE FROM label_counts')
+    cursor.execute('''
+        INSERT INTO label_counts (label_id, user_id, folder_count)
+        SELECT l.id, l.user_id, COUNT(fl.folder_id) FROM labels l
+        LEFT JOIN folder_labels fl ON fl.label_id = l.id
+        GROUP BY l.id
+    ''')
+
+
+def _placeholders(count):
+    return ','.join('?' * count)
+
+
+def label_facets(conn, user_id):
+    """Facettes sans filtre : compteurs précalculés"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT l.id, l.name, l.color, COALESCE(c.folder_count, 0) FROM labels l
+        LEFT JOIN label_counts c ON c.label_id = l.id
+        WHERE l.user_id = ? ORDER BY l.name
+    ''', (user_id,))
+    return [{'id': r[0], 'name': r[1], 'color': r[2], 'count': r[3]} for r in cursor.fetchall()]
+
+
+def owned_labels(conn, user_id, label_ids):
+    """Étiquettes de l'utilisateur parmi ``label_ids``, de la plus rare à la plus fréquente"""
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT l.id FROM labels l LEFT JOIN label_counts c ON c.label_id = l.id '
+        'WHERE l.user_id = ? AND l.id IN (' + _placeholders(len(label_ids)) + ') '
+        'ORDER BY COALESCE(c.folder_count, 0)',
+        (user_id, *label_ids)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _matching_folders_sql(label_ids, mode):
+    """Sous-requête des dossiers correspondants et ses paramètres"""
+    if mode == 'or':
+        return (
+            'SELECT DISTINCT folder_id FROM folder_labels WHERE label_id IN ('
+            + _placeholders(len(label_ids)) + ')'
+        ), list(label_ids)
+    # ET : dossiers de l'étiquette la plus rare (label_ids trié), puis une
+    # recherche dans la clé primaire par étiquette restante
+    sql = 'SELECT fl.folder_id FROM folder_labels fl WHERE fl.label_id = ?'
+    for _ in label_ids[1:]:
+        sql += ' AND EXISTS (SELECT 1 FROM folder_labels WHERE folder_id = fl.folder_id AND label_id = ?)'
+    return sql, list(label_ids)
+
+
+def filter_by_labels(conn, user_id, label_ids, mode='and', limit=DEFAULT_LIMIT):
+    """Dossiers, fichiers et notes étiquetés ; facettes restreintes au résultat.
+
+    ``label_ids`` doit provenir de ``owned_labels`` (étiquettes de
+    l'utilisateur, triées par sélectivité). Les listes sont limitées à
+    ``limit`` éléments, les totaux sont exacts.
+    """
+    matched_sql, params = _matching_folders_sql(label_ids, mode)
+    cursor = conn.cursor()
+    # Ensemble matérialisé une fois, réutilisé par les listes et les facettes
+    cursor.execute('DROP TABLE IF EXISTS temp.matched_folders')
+    cursor.execute('CREATE TEMP TABLE matched_folders (id INTEGER PRIMARY KEY)')
+    # CROSS JOIN : le planificateur part des associations (sélectives) et
+    # non des dossiers de l'utilisateur
+    cursor.execute(
+        'INSERT INTO temp.matched_folders (id) SELECT f.id FROM ('
+        + matched_sql + ') m CROSS JOIN folders f ON f.id = m.folder_id WHERE f.user_id = ? ON CONFLICT DO NOTHING',
+        (*params, user_id)
+    )
+    try:
+        result = {'mode': mode, 'labels': list(label_ids)}
+
+        cursor.execute('SELECT COUNT(*) FROM temp.matched_folders')
+        result['folder_count'] = cursor.fetchone()[0]
+        cursor.execute('''
+            SELECT f.id, f.name, f.parent_id FROM temp.matched_folders m
+            JOIN folders f ON f.id = m.id ORDER BY f.name LIMIT ?
+        ''', (limit,))
+        result['folders'] = [{'id': r[0], 'name': r[1], 'parent_id': r[2]} for r in cursor.fetchall()]
+
+        cursor.execute('''
+            SELECT COUNT(*) FROM files WHERE user_id = ? AND folder_id IN (SELECT id FROM temp.matched_folders)
+        ''', (user_id,))
+        result['file_count'] = cursor.fetchone()[0]
+        cursor.execute('''
+            SELECT id, original_name, file_size, folder_id FROM files
+            WHERE user_id = ? AND folder_id IN (SELECT id FROM temp.matched_folders)
+            ORDER BY original_name LIMIT ?
+        ''', (user_id, limit))
+        result['files'] = [
+            {'id': r[0], 'original_name': r[1], 'file_size': r[2], 'folder_id': r[3]} for r in cursor.fetchall()
+        ]
+
+        cursor.execute('''
+            SELECT COUNT(*) FROM notes WHERE user_id = ? AND folder_id IN (SELECT id FROM temp.matched_folders)
+        ''', (user_id,))
+        result['note_count'] = cursor.fetchone()[0]
+        cursor.execute('''
+            SELECT id, title, folder_id FROM notes
+            WHERE user_id = ? AND folder_id IN (SELECT id FROM temp.matched_folders)
+            ORDER BY title LIMIT ?
+        ''', (user_id, limit))
+        result['notes'] = [{'id': r[0], 'title': r[1], 'folder_id': r[2]} for r in cursor.fetchall()]
+
+        # Facettes : nombre de dossiers du résultat portant chaque étiquette
+        # (parcours de la clé primaire folder_id, label_id)
+        cursor.execute('''
+            SELECT fl.label_id, COUNT(*) FROM temp.matched_folders m
+            JOIN folder_labels fl ON fl.folder_id = m.id
+            GROUP BY fl.label_id
+        ''')
+        counts = dict(cursor.fetchall())
+        result['facets'] = [
+            {'id': r[0], 'name': r[1], 'color': r[2], 'count': counts.get(r[0], 0)}
+            for r in cursor.execute('SELECT id, name, color FROM labels WHERE user_id = ? ORDER BY name', (user_id,))
+        ]
+        return result
+    finally:
+        cursor.execute('DROP TABLE IF EXISTS temp.matched_folders')
+
+
+def labels_by_folder(conn, user_id, parent_id, user_labels):
+    """Étiquettes des dossiers d'un niveau en une requête (au lieu d'une par dossier).
+
+    ``user_labels`` : lignes (id, name, color) déjà chargées par le tableau
+    de bord, réutilisées telles quelles.
+    """
+    by_id = {label.id: label for label in user_labels}
+    cursor = conn.cursor()
+    if parent_id:
+        cursor.execute('''
+            SELECT fl.folder_id, fl.label_id FROM folders f
+            JOIN folder_labels fl ON fl.folder_id = f.id
+            WHERE f.user_id = ? AND f.parent_id = ?
+        ''', (user_id, parent_id))
+    else:
+        cursor.execute('''
+            SELECT fl.folder_id, fl.label_id FROM folders f
+            JOIN folder_labels fl ON fl.folder_id = f.id
+            WHERE f.user_id = ? AND f.parent_id IS NULL
+        ''', (user_id,))
+    folder_labels = {}
+    for folder_id, label_id in cursor.fetchall():
+        label = by_id.get(label_id)
+        if label is not None:
+            folder_labels.setdefault(folder_id, []).append(label)
+    return folder_labels
@@ -0,0 +1,110 @@
+# Bases de données des tests - Archive Platform
+"""Bases de test au schéma réel de l'application.
+
+Le schéma est construit une fois par processus dans une base modèle par
+``init_db`` et ses migrations (``app.migrate_database``), puis copié pour
+chaque test avec l'API backup de SQLite : une colonne, un index ou un
+trigger ajouté à l'application est aussitôt présent dans les tests.
+
+Usage :
+    conn = fixtures.create_database()              # base en mémoire
+    fixtures.create_database('/tmp/a.db').close()  # fichier (plusieurs connexions)
+    file_id = fixtures.add_file(conn, 1, 'rapport.pdf')
+    client, user_id = fixtures.create_app_client(upload_folder)  # routes de app.py
+"""
+
+import atexit
+import os
+import shutil
+import sqlite3
+import tempfile
+
+# Fichiers d'état ouverts à l'import de app.py : hors du répertoire courant
+_STATE_FILES = (
+    ('JINJA_CACHE_DIR', 'jinja'),
+    ('LOGIN_STATE_DB', 'login_state.db'),
+    ('QUERY_STATS_DB', 'query_stats.db'),
+    ('PROFILING_DB', 'profiling.db'),
+)
+
+_template = None
+
+
+def _template_path():
+    global _template
+    if _template is None:
+        directory = tempfile.mkdtemp(prefix='archive_schema_')
+        atexit.register(shutil.rmtree, directory, True)
+        for variable, name in _STATE_FILES:
+            os.environ.setdefault(variable, os.path.join(directory, name))
+        os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(directory, 'database.db'))
+        from app import migrate_database
+
+        path = os.path.join(directory, 'schema.db')
+        migrate_database(path)
+        _template = path
+    return _template
+
+
+def create_database(path=':memory:'):
+    """Nouvelle base au schéma de l'application ; retourne une connexion (lignes sqlite3.Row)"""
+    source = sqlite3.connect(_template_path())
+    conn = sqlite3.connect(path)
+    try:
+        source.backup(conn)
+    finally:
+        source.close()
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def add_user(conn, username):
+    """Insère un utilisateur (colonnes obligatoires remplies) ; retourne son id"""
+    return conn.execute(
+        'INSERT INTO users (username, email, password) VALUES (?, ?, ?)',
+        (username, username + '@example.com', 'hash')
+    ).lastrowid
+
+
+def add_file(conn, user_id, original_name, filename=None, **columns):
+    """Insère une ligne ``files`` (colonnes obligatoires remplies) ; retourne son id"""
+    values = {
+        'user_id': user_id,
+        'filename': filename or 'stored_' + original_name,
+        'original_name': original_name,
+        'file_size': 0,
+    }
+    values.update(columns)
+    values.setdefault('file_path', os.path.join('uploads', values['filename']))
+    return conn.execute(
+        'INSERT INTO files (' + ', '.join(values) + ') VALUES (' + ', '.join('?' * len(values)) + ')',
+        tuple(values.values())
+    ).lastrowid
+
+
+def create_app_client(upload_folder, username='alice'):
+    """Client de test de l'application : base principale remise au schéma
+    vide, stockage local dans ``upload_folder``, session ouverte pour
+    ``username`` ; retourne ``(client, user_id)``"""
+    directory = os.path.dirname(_template_path())
+    import app
+
+    # Jamais la base d'une installation (app importé sans passer par ce module)
+    if os.path.dirname(os.path.abspath(app.DATABASE)) != directory:
+        raise RuntimeError('app importé avant fixtures : base principale ' + app.DATABASE)
+    conn = create_database(app.DATABASE)
+    try:
+        user_id = add_user(conn, username)
+        conn.commit()
+    finally:
+        conn.close()
+
+    app.app.config.update(UPLOAD_FOLDER=upload_folder, SESSION_COOKIE_SECURE=False)
+    app.limiter.enabled = False
+    app._storage = None  # driver recréé pour UPLOAD_FOLDER
+    app._logging_ready = True  # pas de logs/ dans le répertoire courant
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['username'] = username
+    return client, user_id
@@ -0,0 +1,110 @@
+# Configuration Gunicorn - Archive Platform
+"""Configuration de Gunicorn, pilotée par ``config.py`` (profil ``FLASK_ENV``).
+
+Dimensionnement par défaut (``benchmarks/bench_gunicorn.py``) :
+- un worker par cœur : bcrypt (connexion, inscription) est limité par le
+  CPU, plus de processus que de cœurs n'augmente pas son débit ;
+- ``gthread`` avec 4 threads par worker : bcrypt relâche le GIL et les
+  uploads / téléchargements attendent surtout les E/S, les threads
+  recouvrent ces attentes sans multiplier la mémoire ;
+- ``gevent`` (si installé) pour un grand nombre de connexions lentes : le
+  service ``events`` de docker-compose sert ainsi les flux ``/events``, qui
+  occuperaient chacun un thread en gthread ;
+- recyclage des workers après ``max_requests`` requêtes (+ gigue).
+
+Usage :
+    gunicorn -c gunicorn.conf.py
+    FLASK_ENV=development gunicorn -c gunicorn.conf.py   # rechargement auto
+"""
+
+import os
+import sys
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import get_config
+
+settings = get_config()
+
+THREADS_PER_CORE = 4
+
+
+def available_cores():
+    """Cœurs utilisables, en tenant compte du quota CPU du conteneur (cgroup v2)"""
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cores = min(cores, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def select_worker_class(requested):
+    """gthread par défaut ; gevent seulement si le paquet est installé"""
+    if requested == 'gevent':
+        try:
+            import gevent  # noqa: F401
+        except ImportError:
+            print('gunicorn.conf: gevent non installé, utilisation de gthread', file=sys.stderr)
+            return 'gthread'
+        return 'gevent'
+    return 'gthread'
+
+
+cores = available_cores()
+
+wsgi_app = 'wsgi:app'
+bind = settings.GUNICORN_BIND
+worker_class = select_worker_class(settings.GUNICORN_WORKER_CLASS)
+if worker_class == 'gevent':
+    # Bibliothèque standard patchée avant tout import de l'application (migrations
+    # dans on_starting, préchargement) : verrous et sockets coopératifs
+    from gevent import monkey
+    monkey.patch_all()
+workers = settings.GUNICORN_WORKERS or cores
+if worker_class == 'gthread':
+    threads = settings.GUNICORN_THREADS or THREADS_PER_CORE
+    # Un flux /events occupe un thread : la moitié au plus
+    os.environ.setdefault('SSE_MAX_STREAMS', str(max(1, threads // 2)))
+else:
+    worker_connections = settings.GUNICORN_WORKER_CONNECTIONS
+    os.environ.setdefault('SSE_MAX_STREAMS', str(worker_connections // 2))
+
+preload_app = settings.GUNICORN_PRELOAD
+reload = settings.GUNICORN_RELOAD
+timeout = settings.GUNICORN_TIMEOUT
+graceful_timeout = settings.GUNICORN_GRACEFUL_TIMEOUT
+keepalive = settings.GUNICORN_KEEPALIVE
+max_requests = settings.GUNICORN_MAX_REQUESTS
+max_requests_jitter = settings.GUNICORN_MAX_REQUESTS_JITTER
+
+# Battement de cœur des workers en mémoire (pas sur le système de fichiers
+# overlay du conteneur, dont les écritures peuvent bloquer)
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# nginx est le seul client direct : en-têtes X-Forwarded-* acceptés
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+accesslog = '-'
+errorlog = '-'
+loglevel = settings.LOG_LEVEL.lower()
+
+
+def on_starting(server):
+    """Migrations exécutées une fois dans le master, avant le chargement de l'application"""
+    from app import migrate
+
+    if migrate():
+        server.log.info('Database schema migrated')
+
+
+def when_ready(server):
+    server.log.info(
+        f'Archive Platform: {workers} worker(s) {worker_class}'
+        + (f' x {threads} threads' if worker_class == 'gthread' else '')
+        + f', {cores} core(s), max_requests={max_requests}+{max_requests_jitter}'
+    )
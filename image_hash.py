@@ -0,0 +1,279 @@
+# Empreintes perceptuelles des images - Archive Platform
+"""Détection des images quasi identiques (rescans, ré-exports, recadrages légers).
+
+Trois empreintes de 64 bits sont calculées par le worker (tâche
+``hash_images``) pour les images de ``HASHABLE_EXTENSIONS`` et stockées dans
+``files`` :
+
+- ``ahash`` : pixels 8x8 comparés à la moyenne ;
+- ``dhash`` : gradient horizontal sur 9x8 pixels ;
+- ``phash`` : DCT de l'image réduite à 32x32, coefficients basse fréquence
+  (lignes et colonnes 1 à 8, sans la composante continue) comparés à leur
+  médiane. C'est l'empreinte utilisée pour la recherche.
+
+Deux images sont proches si la distance de Hamming de leurs ``phash`` est
+faible. La recherche utilise le hachage multi-index : ``phash`` est découpé
+en ``CHUNKS`` blocs de 16 bits, chacun couvert par un index partiel
+``(user_id, bloc, phash)``. Si deux empreintes diffèrent d'au plus ``d`` bits,
+l'un des blocs diffère d'au plus ``d // CHUNKS`` bits (principe des tiroirs) :
+on interroge chaque index avec toutes les valeurs à cette distance du bloc
+cherché, puis on vérifie la distance exacte des candidats. Aucun état en
+mémoire : les index suivent les insertions et suppressions de ``files``.
+
+Les empreintes sont des entiers signés en base (INTEGER SQLite, BIGINT
+PostgreSQL) ; les blocs extraits par décalage puis masque sont identiques
+à ceux de l'entier non signé.
+
+Usage :
+    python image_hash.py --backfill   # calcule les empreintes des images existantes
+"""
+
+import argparse
+import math
+import os
+import statistics
+import sys
+from itertools import combinations
+from operator import mul
+
+HASHABLE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+MAX_SOURCE_BYTES = 64 * 1024 * 1024  # images plus grosses : pas d'empreinte
+DEFAULT_DISTANCE = 10  # bits sur 64 : rescans et ré-exports restent en dessous
+MAX_DISTANCE = 11  # au-delà, 3 bits par bloc : trop de valeurs à sonder
+SIMILAR_LIMIT = 50
+BACKFILL_BATCH_SIZE = 200  # fichiers par tâche de remplissage
+
+CHUNKS = 4
+CHUNK_BITS = 16
+_CHUNK_MASK = (1 << CHUNK_BITS) - 1
+# Expressions des index partiels (reprises telles quelles dans les requêtes)
+_CHUNK_SQL = [
+    '((phash >> ' + str(CHUNK_BITS * (CHUNKS - 1 - i)) + ') & ' + str(_CHUNK_MASK) + ')'
+    for i in range(CHUNKS)
+]
+
+_DCT_SIZE = 32
+_DRAFT_SIZE = 256  # décodage JPEG réduit (draft) : inutile de décoder plus grand
+_DCT_COS = [
+    [math.cos(math.pi * u * (2 * x + 1) / (2 * _DCT_SIZE)) for x in range(_DCT_SIZE)]
+    for u in range(1, 9)
+]
+
+_flip_masks = {}
+
+
+def is_hashable(filename):
+    return filename.rsplit('.', 1)[-1].lower() in HASHABLE_EXTENSIONS
+
+
+def create_image_hash_index(cursor):
+    """Index partiels du hachage multi-index (colonnes ajoutées par init_db).
+
+    ``phash`` est inclus dans chaque index : les candidats sont filtrés sans
+    lire la table, seuls les fichiers retenus sont lus ensuite.
+    """
+    for i, expression in enumerate(_CHUNK_SQL):
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_files_phash_' + str(i) + ' ON files (user_id, ' + expression + ', phash) '
+            'WHERE phash IS NOT NULL'
+        )
+
+
+# -- Calcul des empreintes ----------------------------------------------------
+
+def _bits(values):
+    result = 0
+    for value in values:
+        result = (result << 1) | bool(value)
+    return result
+
+
+def _pixels(gray, width, height):
+    from PIL import Image
+
+    return gray.resize((width, height), Image.Resampling.LANCZOS).tobytes()
+
+
+def average_hash(gray):
+    pixels = _pixels(gray, 8, 8)
+    mean = sum(pixels) / len(pixels)
+    return _bits(p > mean for p in pixels)
+
+
+def difference_hash(gray):
+    pixels = _pixels(gray, 9, 8)
+    return _bits(pixels[y * 9 + x + 1] > pixels[y * 9 + x] for y in range(8) for x in range(8))
+
+
+def perceptual_hash(gray):
+    pixels = _pixels(gray, _DCT_SIZE, _DCT_SIZE)
+    # DCT séparable limitée aux fréquences 1 à 8 : lignes puis colonnes
+    rows = [
+        [sum(map(mul, cos, pixels[y * _DCT_SIZE:(y + 1) * _DCT_SIZE])) for cos in _DCT_COS]
+        for y in range(_DCT_SIZE)
+    ]
+    columns = list(zip(*rows))
+    coefficients = [sum(map(mul, cos, column)) for cos in _DCT_COS for column in columns]
+    median = statistics.median(coefficients)
+    return _bits(c > median for c in coefficients)
+
+
+def compute_hashes(source):
+    """Empreintes ``{'ahash', 'dhash', 'phash'}`` (entiers non signés) d'une
+    image (chemin ou fichier binaire), ou None si elle n'est pas lisible"""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    try:
+        with Image.open(source) as image:
+            image.draft('L', (_DRAFT_SIZE, _DRAFT_SIZE))
+            # Même orientation qu'à l'affichage (photos pivotées par EXIF)
+            gray = ImageOps.exif_transpose(image).convert('L')
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+        return None
+    if gray.width > _DRAFT_SIZE or gray.height > _DRAFT_SIZE:
+        gray = gray.resize((_DRAFT_SIZE, _DRAFT_SIZE), Image.Resampling.BOX)
+    return {
+        'ahash': average_hash(gray),
+        'dhash': difference_hash(gray),
+        'phash': perceptual_hash(gray),
+    }
+
+
+def _to_signed(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value):
+    return value & ((1 << 64) - 1)
+
+
+def hamming(a, b):
+    return (_to_unsigned(a) ^ _to_unsigned(b)).bit_count()
+
+
+def store_hashes(conn, file_id, hashes):
+    """Enregistre les empreintes d'un fichier (ne commit pas)"""
+    conn.execute(
+        'UPDATE files SET ahash = ?, dhash = ?, phash = ? WHERE id = ?',
+        (_to_signed(hashes['ahash']), _to_signed(hashes['dhash']), _to_signed(hashes['phash']), file_id)
+    )
+
+
+# -- Recherche ----------------------------------------------------------------
+
+def _masks(radius):
+    """Masques de 16 bits ayant au plus ``radius`` bits à 1"""
+    masks = _flip_masks.get(radius)
+    if masks is None:
+        masks = [
+            sum(1 << bit for bit in bits)
+            for count in range(radius + 1)
+            for bits in combinations(range(CHUNK_BITS), count)
+        ]
+        _flip_masks[radius] = masks
+    return masks
+
+
+def probes(phash, max_distance):
+    """Valeurs à sonder dans chaque index de bloc pour une distance ``max_distance``"""
+    phash = _to_unsigned(phash)
+    masks = _masks(max_distance // CHUNKS)
+    result = []
+    for i in range(CHUNKS):
+        chunk = (phash >> (CHUNK_BITS * (CHUNKS - 1 - i))) & _CHUNK_MASK
+        result.append([chunk ^ mask for mask in masks])
+    return result
+
+
+def find_similar(conn, user_id, phash, max_distance=DEFAULT_DISTANCE, exclude_id=None, limit=SIMILAR_LIMIT):
+    """Fichiers de ``user_id`` dont le ``phash`` est à au plus ``max_distance``
+    bits de ``phash``, du plus proche au plus lointain"""
+    max_distance = max(0, min(max_distance, MAX_DISTANCE))
+    cursor = conn.cursor()
+    distances = {}
+    for expression, values in zip(_CHUNK_SQL, probes(phash, max_distance)):
+        cursor.execute(
+            'SELECT id, phash FROM files WHERE user_id = ? AND phash IS NOT NULL AND ' + expression + ' IN ('
+            + ', '.join('?' * len(values)) + ')',
+            [user_id] + values
+        )
+        for file_id, candidate in cursor.fetchall():
+            if file_id not in distances:
+                distances[file_id] = hamming(phash, candidate)
+    distances.pop(exclude_id, None)
+    matches = sorted((distance, file_id) for file_id, distance in distances.items() if distance <= max_distance)
+    matches = matches[:limit]
+    if not matches:
+        return []
+
+    cursor.execute(
+        'SELECT id, filename, original_name, folder_id FROM files WHERE id IN ('
+        + ', '.join('?' * len(matches)) + ')',
+        [file_id for _, file_id in matches]
+    )
+    rows = {row[0]: row for row in cursor.fetchall()}
+    return [
+        {
+            'id': file_id,
+            'filename': rows[file_id][1],
+            'original_name': rows[file_id][2],
+            'folder_id': rows[file_id][3],
+            'distance': distance,
+        }
+        for distance, file_id in matches if file_id in rows
+    ]
+
+
+# -- Remplissage des fichiers existants ---------------------------------------
+
+def backfill(conn, batch_size=BACKFILL_BATCH_SIZE):
+    """Dépose des tâches ``hash_images`` (lots d'un même utilisateur) pour les
+    images sans empreinte ; retourne le nombre d'images concernées"""
+    import jobs
+
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, user_id, original_name FROM files WHERE phash IS NULL ORDER BY user_id, id')
+    count = 0
+    batch, batch_user = [], None
+
+    def flush():
+        if batch:
+            jobs.enqueue(conn, 'hash_images', {'file_ids': list(batch)}, user_id=batch_user, priority=-1)
+            batch.clear()
+
+    while True:
+        rows = cursor.fetchmany(1000)
+        if not rows:
+            break
+        for file_id, user_id, original_name in rows:
+            if not is_hashable(original_name):
+                continue
+            if user_id != batch_user or len(batch) >= batch_size:
+                flush()
+                batch_user = user_id
+            batch.append(file_id)
+            count += 1
+    flush()
+    conn.commit()
+    return count
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description='Empreintes perceptuelles des images')
+    parser.add_argument('--backfill', action='store_true', help='Calculer les empreintes des images existantes')
+    args = parser.parse_args()
+
+    if args.backfill:
+        from app import connect_database, data_databases, migrate
+
+        migrate()
+        for db_path in data_databases():
+            conn = connect_database(db_path)
+            conn.row_factory = None
+            print(f'{db_path} : {backfill(conn)} image(s) à traiter')
+            conn.close()
+    else:
+        parser.print_help()
@@ -0,0 +1,324 @@
+# File de tâches persistante - Archive Platform
+"""File de tâches adossée à une table SQLite (aucun Redis requis).
+
+Les routes déposent des tâches avec ``enqueue()`` ; le processus ``worker.py``
+les réclame avec ``claim()`` puis les exécute via les handlers enregistrés
+avec le décorateur ``job_handler``.
+"""
+
+import json
+import os
+import random
+import socket
+from datetime import datetime, timedelta
+
+# Statuts possibles d'une tâche
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Paramètres par défaut (surchargeables par type de tâche)
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_VISIBILITY_TIMEOUT = 300  # secondes avant qu'une tâche bloquée soit reprise
+DEFAULT_CONCURRENCY = 2
+BACKOFF_BASE = 5  # secondes
+BACKOFF_MAX = 3600  # 1 heure
+
+# Registre des handlers : job_type -> JobType
+HANDLERS = {}
+
+
+class JobType:
+    """Description d'un type de tâche et de ses limites d'exécution"""
+
+    def __init__(self, name, func, concurrency, visibility_timeout, max_attempts):
+        self.name = name
+        self.func = func
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+
+def job_handler(name, concurrency=DEFAULT_CONCURRENCY,
+                visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT,
+                max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Décorateur enregistrant une fonction ``func(payload, job)`` comme handler"""
+    def decorator(func):
+        HANDLERS[name] = JobType(name, func, concurrency, visibility_timeout, max_attempts)
+        return func
+    return decorator
+
+
+def create_jobs_table(cursor):
+    """Crée la table des tâches et ses index"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_type TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            user_id INTEGER,
+            priority INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            run_after TIMESTAMP NOT NULL,
+            locked_until TIMESTAMP,
+            locked_by TEXT,
+            last_error TEXT,
+            result TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    ''')
+    # Index couvrant la sélection de la prochaine tâche à exécuter
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_ready
+        ON jobs (status, priority DESC, run_after, id)
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs (user_id, id)')
+
+
+def create_job_leases_table(cursor):
+    """Tâches en cours de tous les fichiers de données (DB_SHARD_MODE).
+
+    Tenue dans le catalogue : les limites de concurrence par type sont
+    comptées sur l'ensemble des fichiers et non fichier par fichier.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_leases (
+            source TEXT NOT NULL,
+            job_id INTEGER NOT NULL,
+            job_type TEXT NOT NULL,
+            locked_until TIMESTAMP NOT NULL,
+            PRIMARY KEY (source, job_id)
+        )
+    ''')
+
+
+def _now():
+    return datetime.now()
+
+
+def enqueue(conn, job_type, payload=None, user_id=None, priority=0, delay=0, max_attempts=None):
+    """Ajoute une tâche à la file et retourne son identifiant.
+
+    N'effectue pas de commit : la tâche est ainsi déposée dans la même
+    transaction que la modification qui l'a rendue nécessaire.
+    """
+    if max_attempts is None:
+        job = HANDLERS.get(job_type)
+        max_attempts = job.max_attempts if job else DEFAULT_MAX_ATTEMPTS
+    cursor = conn.cursor()
+    cursor.execute(
+        'INSERT INTO jobs (job_type, payload, user_id, priority, max_attempts, run_after) VALUES (?, ?, ?, ?, ?, ?)',
+        (job_type, json.dumps(payload or {}), user_id, priority, max_attempts,
+         _now() + timedelta(seconds=delay))
+    )
+    return cursor.lastrowid
+
+
+def _claimable_types(job_types):
+    return {name: HANDLERS[name] for name in (job_types or HANDLERS) if name in HANDLERS}
+
+
+def has_ready(conn, job_types=None):
+    """True si une tâche est exécutable (lecture seule, aucun verrou d'écriture)"""
+    names = list(_claimable_types(job_types))
+    if not names:
+        return False
+    now = _now()
+    placeholders = ','.join('?' * len(names))
+    row = conn.execute(
+        'SELECT 1 FROM jobs WHERE job_type IN (' + placeholders + ') '
+        'AND ((status = ? AND run_after <= ?) OR (status = ? AND locked_until <= ?)) LIMIT 1',
+        (*names, QUEUED, now, RUNNING, now)
+    ).fetchone()
+    return row is not None
+
+
+def claim(conn, worker_id, job_types=None, running=None):
+    """Réclame atomiquement la prochaine tâche exécutable, ou retourne None.
+
+    Une tâche est exécutable si elle est en attente et que son ``run_after``
+    est passé, ou si elle est en cours mais que son délai de visibilité a
+    expiré (worker mort). Les limites de concurrence par type sont
+    respectées en comptant les tâches en cours non expirées, ou selon
+    ``running`` (type -> tâches en cours) fourni par l'appelant (voir
+    ``claim_leased``).
+    """
+    handlers = _claimable_types(job_types)
+    # Lecture préalable : une file vide ne prend pas le verrou d'écriture
+    if not has_ready(conn, job_types):
+        return None
+
+    now = _now()
+    cursor = conn.cursor()
+    # BEGIN IMMEDIATE : prend le verrou d'écriture avant la lecture pour
+    # qu'aucun autre worker ne réclame la même tâche
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        # Les tâches dont le worker a disparu après la dernière tentative
+        # autorisée sont abandonnées plutôt que relancées indéfiniment
+        cursor.execute(
+            'UPDATE jobs SET status = ?, last_error = ?, locked_until = NULL, updated_at = ? '
+            'WHERE status = ? AND locked_until <= ? AND attempts >= max_attempts',
+            (FAILED, 'visibility timeout expired', now, RUNNING, now)
+        )
+        if running is None:
+            cursor.execute(
+                'SELECT job_type, COUNT(*) AS running FROM jobs WHERE status = ? AND locked_until > ? GROUP BY job_type',
+                (RUNNING, now)
+            )
+            running = {row['job_type']: row['running'] for row in cursor.fetchall()}
+        available = [name for name, job in handlers.items() if running.get(name, 0) < job.concurrency]
+        if not available:
+            conn.rollback()
+            return None
+
+        placeholders = ','.join('?' * len(available))
+        cursor.execute(
+            'SELECT * FROM jobs WHERE job_type IN (' + placeholders + ') '
+            'AND ((status = ? AND run_after <= ?) OR (status = ? AND locked_until <= ?)) '
+            'ORDER BY priority DESC, run_after, id LIMIT 1',
+            (*available, QUEUED, now, RUNNING, now)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+
+        locked_until = now + timedelta(seconds=handlers[row['job_type']].visibility_timeout)
+        cursor.execute(
+            'UPDATE jobs SET status = ?, attempts = attempts + 1, locked_until = ?, locked_by = ?, updated_at = ? WHERE id = ?',
+            (RUNNING, locked_until, worker_id, now, row['id'])
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    job = dict(row)
+    job['attempts'] += 1
+    job['locked_until'] = locked_until
+    job['payload'] = json.loads(job['payload'])
+    return job
+
+
+def claim_leased(catalog, conn, source, worker_id, job_types=None):
+    """``claim()`` dans un fichier de données réparti (``source``).
+
+    Les tâches en cours sont comptées dans la table ``job_leases`` du
+    catalogue, dont le verrou d'écriture sérialise les réclamations : deux
+    workers ne dépassent pas ensemble la limite d'un type.
+    """
+    now = _now()
+    cursor = catalog.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute(
+            'SELECT job_type, COUNT(*) AS running FROM job_leases WHERE locked_until > ? GROUP BY job_type',
+            (now,)
+        )
+        running = {row['job_type']: row['running'] for row in cursor.fetchall()}
+        job = claim(conn, worker_id, job_types, running=running)
+        if job is not None:
+            cursor.execute(
+                'INSERT OR REPLACE INTO job_leases (source, job_id, job_type, locked_until) VALUES (?, ?, ?, ?)',
+                (source, job['id'], job['job_type'], job['locked_until'])
+            )
+        catalog.commit()
+    except Exception:
+        catalog.rollback()
+        raise
+    return job
+
+
+def release_lease(catalog, source, job_id):
+    """Retire une tâche terminée ou replanifiée des tâches en cours"""
+    catalog.execute('DELETE FROM job_leases WHERE source = ? AND job_id = ?', (source, job_id))
+    catalog.commit()
+
+
+def purge_expired_leases(catalog):
+    """Supprime les tâches en cours dont le délai de visibilité a expiré (worker mort)"""
+    cursor = catalog.cursor()
+    cursor.execute('DELETE FROM job_leases WHERE locked_until <= ?', (_now(),))
+    catalog.commit()
+    return cursor.rowcount
+
+
+def complete(conn, job_id, worker_id, result=None):
+    """Marque une tâche comme terminée (si ce worker la détient toujours)"""
+    cursor = conn.cursor()
+    cursor.execute(
+        'UPDATE jobs SET status = ?, result = ?, locked_until = NULL, updated_at = ? WHERE id = ? AND locked_by = ?',
+        (DONE, json.dumps(result) if result is not None else None, _now(), job_id, worker_id)
+    )
+    conn.commit()
+
+
+def fail(conn, job, worker_id, error):
+    """Enregistre un échec : replanifie avec backoff exponentiel ou abandonne"""
+    now = _now()
+    cursor = conn.cursor()
+    if job['attempts'] >= job['max_attempts']:
+        cursor.execute(
+            'UPDATE jobs SET status = ?, last_error = ?, locked_until = NULL, updated_at = ? WHERE id = ? AND locked_by = ?',
+            (FAILED, str(error)[:1000], now, job['id'], worker_id)
+        )
+    else:
+        delay = min(BACKOFF_BASE * 2 ** (job['attempts'] - 1), BACKOFF_MAX)
+        delay += random.uniform(0, delay / 2)  # jitter pour étaler les reprises
+        cursor.execute(
+            'UPDATE jobs SET status = ?, last_error = ?, run_after = ?, locked_until = NULL, updated_at = ? WHERE id = ? AND locked_by = ?',
+            (QUEUED, str(error)[:1000], now + timedelta(seconds=delay), now, job['id'], worker_id)
+        )
+    conn.commit()
+
+
+def get_job(conn, job_id, user_id):
+    """Retourne l'état public d'une tâche appartenant à l'utilisateur"""
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT id, job_type, status, attempts, max_attempts, last_error, result, created_at, updated_at '
+        'FROM jobs WHERE id = ? AND user_id = ?',
+        (job_id, user_id)
+    )
+    row = cursor.fetchone()
+    return _public_job(row) if row else None
+
+
+def list_jobs(conn, user_id, limit=20):
+    """Retourne les dernières tâches de l'utilisateur"""
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT id, job_type, status, attempts, max_attempts, last_error, result, created_at, updated_at '
+        'FROM jobs WHERE user_id = ? ORDER BY id DESC LIMIT ?',
+        (user_id, limit)
+    )
+    return [_public_job(row) for row in cursor.fetchall()]
+
+
+def purge_finished(conn, older_than=7 * 24 * 3600):
+    """Supprime les tâches terminées ou abandonnées depuis plus de ``older_than`` secondes"""
+    cursor = conn.cursor()
+    cursor.execute(
+        'DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+        (DONE, FAILED, _now() - timedelta(seconds=older_than))
+    )
+    conn.commit()
+    return cursor.rowcount
+
+
+def _public_job(row):
+    job = dict(row)
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+def default_worker_id():
+    """Identifiant unique du worker courant (hôte + pid)"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
@@ -0,0 +1,154 @@
+# Suivi des connexions - Archive Platform
+"""Écritures différées du suivi des connexions (``users.last_login``,
+tentatives échouées, verrouillage).
+
+La base principale n'a qu'un écrivain à la fois : une écriture par
+connexion réussie ou échouée entre en concurrence avec les uploads lors
+des pics de connexions. Ici :
+
+- une connexion réussie n'écrit dans ``users`` que s'il y a réellement
+  des tentatives échouées ou un verrou à effacer ; ``last_login`` est mis
+  en attente puis écrit par lots (``flush``) au plus toutes les
+  ``flush_interval`` secondes, une seule valeur par utilisateur ;
+- les tentatives échouées sont comptées dans une petite base SQLite
+  partagée par les workers (WAL, ``synchronous=OFF``), par incrément
+  atomique ; la base principale n'est écrite qu'au franchissement du seuil
+  de verrouillage (le verrou y est persisté et lu par ``login()``).
+
+Une panne du système (pas d'un processus) peut perdre les derniers
+compteurs et ``last_login`` en attente ; le verrouillage d'un compte,
+lui, est toujours écrit de façon durable dans la base principale.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+FLUSH_INTERVAL = 30.0  # secondes
+FLUSH_BATCH_SIZE = 500
+
+
+class LoginTracker:
+    def __init__(self, path, connect, max_attempts=5, lockout_seconds=1800, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.connect = connect  # connexion à la base principale
+        self.max_attempts = max_attempts
+        self.lockout = timedelta(seconds=lockout_seconds)
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._last_flush = time.monotonic()
+        self._flush_lock = threading.Lock()
+        self._ready = False
+
+    def _store(self):
+        """Connexion au stockage partagé, une par thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+            if not self._ready:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS login_failures (
+                        user_id INTEGER PRIMARY KEY,
+                        attempts INTEGER NOT NULL,
+                        updated_at REAL NOT NULL
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS pending_logins (
+                        user_id INTEGER PRIMARY KEY,
+                        last_login TEXT NOT NULL
+                    )
+                ''')
+                self._ready = True
+            self._local.conn = conn
+        return conn
+
+    def record_failure(self, user):
+        """Compte un échec ; retourne (tentatives, verrouillé_jusqu'à ou None).
+
+        ``user`` : ligne ``users`` lue par ``login()``. Les tentatives déjà
+        persistées (seuil franchi précédemment) servent de point de départ.
+        """
+        attempts = self._store().execute('''
+            INSERT INTO login_failures (user_id, attempts, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET attempts = attempts + 1, updated_at = excluded.updated_at
+            RETURNING attempts
+        ''', (user['id'], (user['failed_login_attempts'] or 0) + 1, time.time())).fetchall()[0][0]
+
+        if attempts < self.max_attempts:
+            return attempts, None
+
+        # Seuil franchi : verrou durable dans la base principale
+        locked_until = datetime.now() + self.lockout
+        conn = self.connect()
+        try:
+            conn.execute(
+                'UPDATE users SET failed_login_attempts = ?, account_locked_until = ? WHERE id = ?',
+                (attempts, locked_until, user['id'])
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        return attempts, locked_until
+
+    def record_success(self, conn, user):
+        """Réinitialise les échecs (si nécessaire) et met ``last_login`` en attente"""
+        store = self._store()
+        store.execute('DELETE FROM login_failures WHERE user_id = ?', (user['id'],))
+        if user['failed_login_attempts'] or user['account_locked_until']:
+            conn.execute(
+                'UPDATE users SET failed_login_attempts = 0, account_locked_until = NULL WHERE id = ?',
+                (user['id'],)
+            )
+            conn.commit()
+        store.execute(
+            'INSERT OR REPLACE INTO pending_logins (user_id, last_login) VALUES (?, ?)',
+            (user['id'], datetime.now().isoformat(' '))
+        )
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Écrit les ``last_login`` en attente, par lots ; retourne le nombre de lignes"""
+        if getattr(self._local, 'conn', None) is None and not os.path.exists(self.path):
+            return 0  # aucune connexion enregistrée : ne pas créer le fichier (atexit des scripts)
+        if not self._flush_lock.acquire(blocking=False):
+            return 0  # un autre thread de ce worker s'en charge
+        try:
+            self._last_flush = time.monotonic()
+            store = self._store()
+            total = 0
+            while True:
+                pending = store.execute(
+                    'SELECT user_id, last_login FROM pending_logins LIMIT ?', (FLUSH_BATCH_SIZE,)
+                ).fetchall()
+                if not pending:
+                    return total
+                conn = self.connect()
+                try:
+                    conn.executemany(
+                        'UPDATE users SET last_login = ? WHERE id = ?',
+                        [(last_login, user_id) for user_id, last_login in pending]
+                    )
+                    conn.commit()
+                finally:
+                    conn.close()
+                # Une connexion plus récente (autre worker) reste en attente
+                store.execute('BEGIN')
+                store.executemany(
+                    'DELETE FROM pending_logins WHERE user_id = ? AND last_login = ?', pending
+                )
+                store.execute('COMMIT')
+                total += len(pending)
+        finally:
+            self._flush_lock.release()
@@ -0,0 +1,86 @@
+# Migrations du schéma - Archive Platform
+"""Exécution unique des migrations, même avec plusieurs processus.
+
+La version du schéma est stockée dans ``PRAGMA user_version`` : quand elle
+est à jour, le démarrage ne coûte qu'une lecture. Sinon un verrou
+``fcntl`` sur un fichier voisin de la base garantit qu'un seul processus
+(master gunicorn, worker, script) exécute ``init_db()``, les autres
+attendant puis constatant que la base est à jour. Avec PostgreSQL
+(``DATABASE_URL``), la version est dans la table ``schema_version`` et le
+verrou est un verrou consultatif.
+"""
+
+import sqlite3
+
+try:
+    import fcntl
+except ImportError:  # Windows (développement) : pas de verrou inter-processus
+    fcntl = None
+
+
+def schema_version(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _set_schema_version(db_path, version):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        # PRAGMA n'accepte pas de paramètre lié ; version est un entier
+        conn.execute('PRAGMA user_version = ' + str(int(version)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def run_migrations(db_path, init_fn, version):
+    """Exécute ``init_fn`` si la base n'est pas à ``version`` ; retourne True si exécuté"""
+    if schema_version(db_path) >= version:
+        return False
+
+    with open(db_path + '.migrate.lock', 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            # Un autre processus a pu migrer pendant l'attente du verrou
+            if schema_version(db_path) >= version:
+                return False
+            init_fn()
+            _set_schema_version(db_path, version)
+            return True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _postgres_schema_version(conn):
+    if conn.execute("SELECT to_regclass('schema_version')").fetchone()[0] is None:
+        return 0
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def run_migrations_postgres(connect, init_fn, version, lock_key):
+    """Même principe pour PostgreSQL : version dans la table ``schema_version``,
+    verrou consultatif de session à la place du verrou ``fcntl``"""
+    conn = connect()
+    try:
+        if _postgres_schema_version(conn) >= version:
+            return False
+        conn.execute('SELECT pg_advisory_lock(?)', (lock_key,))
+        try:
+            if _postgres_schema_version(conn) >= version:
+                return False
+            init_fn()
+            conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+            conn.execute('DELETE FROM schema_version')
+            conn.execute('INSERT INTO schema_version (version) VALUES (?)', (version,))
+            conn.commit()
+            return True
+        finally:
+            conn.execute('SELECT pg_advisory_unlock(?)', (lock_key,))
+    finally:
+        conn.close()
@@ -0,0 +1,117 @@
+# Recherche par sous-chaîne dans les noms de fichiers - Archive Platform
+"""Index trigramme des noms de fichiers pour ``/search``.
+
+``/search`` renvoie les fichiers dont ``original_name`` contient la saisie
+(« 2023 » trouve « facture_2023_03.pdf »), avec la sémantique du LIKE de
+SQLite : insensible à la casse pour les lettres ASCII seulement. Les
+caractères ``%`` et ``_`` de la saisie sont des caractères ordinaires
+(échappés, ``ESCAPE '\\'``).
+
+Un ``LIKE '%...%'`` parcourt tous les fichiers de l'utilisateur. Ici la
+table FTS5 ``file_names`` (tokenizer ``trigram``, maintenue par triggers)
+donne les candidats :
+
+- la saisie devient une phrase : les trigrammes consécutifs de la saisie,
+  soit exactement les noms qui la contiennent, à la casse près (le
+  tokenizer ignore la casse de toutes les lettres, LIKE seulement des
+  lettres ASCII : les candidats sont un sur-ensemble) ;
+- la colonne ``owner`` contient ``<u<user_id>>`` ; les délimiteurs
+  empêchent ``<u12>`` de correspondre à ``<u123>`` et FTS5 croise
+  directement les listes de documents du propriétaire et de la saisie ;
+- chaque candidat est revérifié par le même ``LIKE ... ESCAPE`` que le
+  parcours : les résultats sont identiques.
+
+Une saisie de moins de ``MIN_TRIGRAM_LENGTH`` caractères ne forme aucun
+trigramme : parcours des fichiers de l'utilisateur (index
+``idx_files_folder``), comme avant.
+
+Sous PostgreSQL, la recherche utilise ``ILIKE`` (LIKE y est sensible à la
+casse) et un index GIN ``pg_trgm`` sur ``files.original_name`` le sert
+directement, si l'extension est disponible.
+"""
+
+import database
+
+MIN_TRIGRAM_LENGTH = 3
+LIKE_ESCAPE = '\\'
+
+_COLUMNS = 'f.id, f.filename, f.original_name, f.file_size, f.folder_id, f.uploaded_at'
+
+
+def create_name_index(cursor):
+    """Table trigramme, triggers et remplissage initial (appelée par init_db)"""
+    if database.is_postgres(cursor):
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is not None:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_files_original_name_trgm ON files USING GIN (original_name gin_trgm_ops)'
+            )
+        return
+
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS file_names USING fts5(
+            original_name,
+            owner,
+            tokenize = 'trigram'
+        )
+    ''')
+    database.create_trigger(cursor, 'files_names_insert', 'INSERT', 'files', '''
+        INSERT INTO file_names (rowid, original_name, owner)
+        VALUES (NEW.id, NEW.original_name, '<u' || NEW.user_id || '>')
+    ''')
+    database.create_trigger(cursor, 'files_names_update', 'UPDATE OF original_name, user_id', 'files', '''
+        UPDATE file_names SET original_name = NEW.original_name, owner = '<u' || NEW.user_id || '>'
+        WHERE rowid = OLD.id
+    ''')
+    database.create_trigger(cursor, 'files_names_delete', 'DELETE', 'files', '''
+        DELETE FROM file_names WHERE rowid = OLD.id
+    ''')
+    # Fichiers antérieurs à l'index (idempotent), fusionnés en un segment
+    cursor.execute('''
+        INSERT INTO file_names (rowid, original_name, owner)
+        SELECT id, original_name, '<u' || user_id || '>' FROM files
+        WHERE id NOT IN (SELECT rowid FROM file_names)
+    ''')
+    if cursor.rowcount > 0:
+        cursor.execute("INSERT INTO file_names (file_names) VALUES ('optimize')")
+
+
+def escape_like(text):
+    """Échappe les jokers de LIKE (à utiliser avec ``ESCAPE '\\'``)"""
+    return (text.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2)
+            .replace('%', LIKE_ESCAPE + '%')
+            .replace('_', LIKE_ESCAPE + '_'))
+
+
+def _phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def build_match_query(query, user_id):
+    """Requête FTS5 : noms contenant ``query`` parmi les fichiers de ``user_id``"""
+    return 'owner : ' + _phrase('<u' + str(int(user_id)) + '>') + ' AND original_name : ' + _phrase(query)
+
+
+def search(cursor, user_id, query):
+    """Exécute la recherche sur ``cursor`` (colonnes id, filename,
+    original_name, file_size, folder_id, uploaded_at)"""
+    pattern = '%' + escape_like(query) + '%'
+    if database.is_postgres(cursor):
+        cursor.execute(
+            'SELECT ' + _COLUMNS + ' FROM files f WHERE f.user_id = ? AND f.original_name ILIKE ? ESCAPE ?',
+            (user_id, pattern, LIKE_ESCAPE)
+        )
+    elif len(query) < MIN_TRIGRAM_LENGTH:
+        cursor.execute(
+            'SELECT ' + _COLUMNS + ' FROM files f WHERE f.user_id = ? AND f.original_name LIKE ? ESCAPE ?',
+            (user_id, pattern, LIKE_ESCAPE)
+        )
+    else:
+        # CROSS JOIN : partir des candidats FTS5, pas des fichiers de l'utilisateur
+        cursor.execute(
+            'SELECT ' + _COLUMNS + ' FROM file_names CROSS JOIN files f ON f.id = file_names.rowid '
+            'WHERE file_names MATCH ? AND f.user_id = ? AND f.original_name LIKE ? ESCAPE ?',
+            (build_match_query(query, user_id), user_id, pattern, LIKE_ESCAPE)
+        )
+    return cursor
@@ -0,0 +1,252 @@
+# Historique des notes - Archive Platform
+"""Révisions des notes stockées sous forme de deltas compressés.
+
+Chaque enregistrement d'une note ajoute une révision dans
+``note_revisions`` :
+- ``snapshot`` : contenu complet compressé (zlib) ;
+- ``delta`` : différences (difflib, au niveau des mots) par rapport à la
+  révision précédente, sérialisées en JSON puis compressées.
+
+Un instantané complet est écrit au plus toutes les ``SNAPSHOT_INTERVAL``
+révisions, ou plus tôt si le delta n'est pas nettement plus petit (note
+réécrite). Reconstruire une révision applique donc au plus
+``SNAPSHOT_INTERVAL - 1`` deltas à partir de l'instantané précédent, quel
+que soit le nombre total de révisions.
+
+La rétention supprime les révisions les plus anciennes : la première
+révision conservée est réécrite en instantané si nécessaire, pour que la
+chaîne reste reconstructible.
+"""
+
+import difflib
+import json
+import re
+import zlib
+from datetime import datetime, timedelta
+
+SNAPSHOT_INTERVAL = 16  # au plus 15 deltas à appliquer pour reconstruire une révision
+DELTA_MAX_RATIO = 0.5  # au-delà de cette taille (vs. instantané), écrire un instantané
+COMPRESSION_LEVEL = 6
+
+# Mots avec leurs espaces suivants ; la concaténation redonne le texte exact
+_TOKEN_RE = re.compile(r'\S+\s*|\s+')
+
+
+def create_revisions_table(cursor):
+    """Crée la table des révisions (appelée par init_db)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS note_revisions (
+            note_id INTEGER NOT NULL,
+            revision INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL CHECK(kind IN ('snapshot', 'delta')),
+            title TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (note_id, revision),
+            FOREIGN KEY (note_id) REFERENCES notes (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_note_revisions_created ON note_revisions (created_at)')
+
+
+def _tokenize(text):
+    return _TOKEN_RE.findall(text)
+
+
+def make_delta(base, target):
+    """Opérations transformant ``base`` en ``target`` : [début, fin] copie des mots de base, chaîne insérée"""
+    base_tokens = _tokenize(base)
+    target_tokens = _tokenize(target)
+
+    # Une modification est le plus souvent locale : préfixe et suffixe
+    # communs sont copiés directement, SequenceMatcher (quadratique dans le
+    # pire cas) ne compare que la zone modifiée
+    limit = min(len(base_tokens), len(target_tokens))
+    prefix = 0
+    while prefix < limit and base_tokens[prefix] == target_tokens[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and base_tokens[-1 - suffix] == target_tokens[-1 - suffix]:
+        suffix += 1
+
+    ops = [[0, prefix]] if prefix else []
+    middle_base = base_tokens[prefix:len(base_tokens) - suffix]
+    middle_target = target_tokens[prefix:len(target_tokens) - suffix]
+    matcher = difflib.SequenceMatcher(None, middle_base, middle_target, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([prefix + i1, prefix + i2])
+        elif j2 > j1:  # replace / insert ; delete n'a rien à écrire
+            ops.append(''.join(middle_target[j1:j2]))
+    if suffix:
+        ops.append([len(base_tokens) - suffix, len(base_tokens)])
+    return ops
+
+
+def apply_delta(base, ops):
+    tokens = _tokenize(base)
+    return ''.join(''.join(tokens[op[0]:op[1]]) if isinstance(op, list) else op for op in ops)
+
+
+def _encode_snapshot(content):
+    return zlib.compress(content.encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def _encode_delta(ops):
+    return zlib.compress(json.dumps(ops, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def _load_chain(conn, note_id, revision=None):
+    """Révisions depuis le dernier instantané jusqu'à ``revision`` (dernière si None)"""
+    cursor = conn.cursor()
+    if revision is None:
+        cursor.execute('SELECT MAX(revision) FROM note_revisions WHERE note_id = ?', (note_id,))
+        revision = cursor.fetchone()[0]
+        if revision is None:
+            return []
+    cursor.execute('''
+        SELECT revision, kind, title, payload, created_at FROM note_revisions
+        WHERE note_id = ? AND revision <= ? AND revision >= (
+            SELECT MAX(revision) FROM note_revisions
+            WHERE note_id = ? AND revision <= ? AND kind = 'snapshot'
+        )
+        ORDER BY revision
+    ''', (note_id, revision, note_id, revision))
+    chain = cursor.fetchall()
+    if not chain or chain[-1][0] != revision:
+        return []
+    return chain
+
+
+def _rebuild(chain):
+    content = None
+    for _, kind, _, payload, _ in chain:
+        data = zlib.decompress(payload).decode('utf-8')
+        content = data if kind == 'snapshot' else apply_delta(content, json.loads(data))
+    return content
+
+
+def get_revision(conn, note_id, revision):
+    """Titre et contenu d'une révision, ou None si elle n'existe pas"""
+    chain = _load_chain(conn, note_id, revision)
+    if not chain:
+        return None
+    last = chain[-1]
+    return {
+        'revision': last[0],
+        'title': last[2],
+        'content': _rebuild(chain),
+        'created_at': last[4],
+    }
+
+
+def list_revisions(conn, note_id):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT revision, kind, title, length(payload), created_at FROM note_revisions
+        WHERE note_id = ? ORDER BY revision DESC
+    ''', (note_id,))
+    return [
+        {'revision': row[0], 'kind': row[1], 'title': row[2], 'stored_bytes': row[3], 'created_at': row[4]}
+        for row in cursor.fetchall()
+    ]
+
+
+def _insert(conn, note_id, revision, user_id, kind, title, payload, created_at):
+    conn.execute(
+        'INSERT INTO note_revisions (note_id, revision, user_id, kind, title, payload, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (note_id, revision, user_id, kind, title, payload, created_at)
+    )
+
+
+def record_revision(conn, note_id, user_id, title, content, previous=None, keep=None):
+    """Enregistre l'état courant d'une note ; retourne le numéro de révision (None si inchangée).
+
+    ``previous`` (titre, contenu) est l'état avant modification : il devient
+    la révision 1 des notes créées avant l'historique. ``keep`` déclenche
+    la rétention par nombre de révisions.
+    """
+    content = content or ''
+    chain = _load_chain(conn, note_id)
+    now = datetime.now()
+    if not chain and previous is not None:
+        _insert(conn, note_id, 1, user_id, 'snapshot', previous[0], _encode_snapshot(previous[1] or ''), now)
+        chain = _load_chain(conn, note_id, 1)
+
+    if chain:
+        last_revision, _, last_title, _, _ = chain[-1]
+        base = _rebuild(chain)
+        if base == content and last_title == title:
+            return None
+        revision = last_revision + 1
+    else:
+        base = None
+        revision = 1
+
+    snapshot = _encode_snapshot(content)
+    if base is None or len(chain) >= SNAPSHOT_INTERVAL:
+        kind, payload = 'snapshot', snapshot
+    else:
+        delta = _encode_delta(make_delta(base, content))
+        if len(delta) > len(snapshot) * DELTA_MAX_RATIO:
+            kind, payload = 'snapshot', snapshot
+        else:
+            kind, payload = 'delta', delta
+    _insert(conn, note_id, revision, user_id, kind, title, payload, now)
+
+    if keep:
+        prune_revisions(conn, note_id, keep)
+    return revision
+
+
+def prune_revisions(conn, note_id, keep, older_than=None):
+    """Ne garde que les ``keep`` dernières révisions (et celles postérieures à ``older_than``).
+
+    La dernière révision est toujours conservée. Retourne le nombre de
+    révisions supprimées.
+    """
+    cursor = conn.cursor()
+    cursor.execute('SELECT revision FROM note_revisions WHERE note_id = ? ORDER BY revision', (note_id,))
+    revisions = [row[0] for row in cursor.fetchall()]
+    if not revisions:
+        return 0
+    first_kept = revisions[-keep] if len(revisions) > keep else revisions[0]
+    if older_than is not None:
+        cursor.execute(
+            'SELECT MIN(revision) FROM note_revisions WHERE note_id = ? AND created_at >= ?',
+            (note_id, older_than)
+        )
+        recent = cursor.fetchone()[0]
+        first_kept = max(first_kept, recent if recent is not None else revisions[-1])
+    if first_kept == revisions[0]:
+        return 0
+
+    # La première révision conservée doit pouvoir être reconstruite seule
+    cursor.execute('SELECT kind FROM note_revisions WHERE note_id = ? AND revision = ?', (note_id, first_kept))
+    if cursor.fetchone()[0] == 'delta':
+        content = _rebuild(_load_chain(conn, note_id, first_kept))
+        cursor.execute(
+            "UPDATE note_revisions SET kind = 'snapshot', payload = ? WHERE note_id = ? AND revision = ?",
+            (_encode_snapshot(content), note_id, first_kept)
+        )
+    cursor.execute('DELETE FROM note_revisions WHERE note_id = ? AND revision < ?', (note_id, first_kept))
+    return cursor.rowcount
+
+
+def delete_revisions(conn, note_id):
+    conn.execute('DELETE FROM note_revisions WHERE note_id = ?', (note_id,))
+
+
+def purge_old_revisions(conn, keep, max_age_days):
+    """Rétention périodique (worker) : âge maximal et révisions de notes supprimées"""
+    cutoff = datetime.now() - timedelta(days=max_age_days)
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM note_revisions WHERE note_id NOT IN (SELECT id FROM notes)')
+    removed = cursor.rowcount
+    cursor.execute('SELECT DISTINCT note_id FROM note_revisions WHERE created_at < ?', (cutoff,))
+    for (note_id,) in cursor.fetchall():
+        removed += prune_revisions(conn, note_id, keep, older_than=cutoff)
+    conn.commit()
+    return removed
@@ -0,0 +1,634 @@
+#!/usr/bin/env python3
+"""Petits fichiers regroupés dans des segments en ajout seul (``STORAGE_BACKEND=packed``)
+
+La plupart des fichiers archivés (.txt, .png) font quelques Ko : stockés un
+par fichier, listes de répertoire, sauvegardes et vérifications passent leur
+temps en métadonnées (une entrée de répertoire, un inode, un open par
+fichier). ``PackStorage`` range les fichiers d'au plus ``PACK_MAX_BLOB_SIZE``
+octets dans des segments de ``PACK_SEGMENT_SIZE`` octets sous
+``UPLOAD_FOLDER/.packs`` ; les plus gros restent un par fichier
+(``LocalStorage``), dans le même répertoire qu'avant.
+
+- Écriture : l'enregistrement (en-tête, clé, octets) est ajouté à la fin du
+  segment actif, puis indexé (``pack_index`` : segment, position, taille)
+  dans ``.packs/index.db`` (SQLite, WAL), le tout dans une transaction
+  ``BEGIN IMMEDIATE`` : le verrou d'écriture de SQLite ordonne les ajouts de
+  tous les processus. La taille enregistrée du segment fait foi : un ajout
+  interrompu avant le commit est recouvert par le suivant.
+- Lecture : une recherche dans l'index puis un ``os.pread`` sur le segment
+  (descripteurs gardés ouverts par processus), sans déplacer de position de
+  fichier partagée entre threads. ``open()`` retourne un fichier borné au
+  blob dont le descripteur est placé sur ses octets : sous gunicorn, le
+  téléchargement part du segment par ``sendfile`` sans passer par Python.
+- Suppression : l'entrée d'index disparaît, ses octets deviennent inutiles
+  (``pack_segments.live`` diminue). ``compact`` recopie les blobs encore
+  indexés des segments scellés trop creux dans le segment actif (mise à jour
+  conditionnelle : une suppression concurrente gagne), puis supprime le
+  segment. Une lecture en cours garde l'ancien segment ouvert ; une lecture
+  qui le trouve supprimé relit l'index.
+
+Chaque enregistrement porte sa clé : un segment reste lisible sans l'index.
+Comme pour ``LocalStorage``, rien n'est synchronisé sur disque à chaque
+écriture ; le vérificateur (``scrubber.py``) détecte et répare les blobs
+altérés. Seules exceptions, les recopies qui font disparaître l'original
+(compactage, regroupement des fichiers existants) : le segment est
+synchronisé (``fsync``) avant le commit de l'index, commit lui-même durable
+(``synchronous = FULL``), et l'original n'est supprimé qu'ensuite.
+
+Usage :
+    python packstore.py stats                        # segments, octets utiles
+    python packstore.py pack [--limit N]             # regroupe les petits fichiers existants
+    python packstore.py compact [--min-garbage 0.5]  # récupère la place des blobs supprimés
+    python packstore.py unpack                       # un fichier par blob (avant STORAGE_BACKEND=local)
+"""
+
+import argparse
+import heapq
+import io
+import itertools
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows (développement) : pas de verrou inter-processus
+    fcntl = None
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from storage import CHUNK_SIZE, BlobStat, LocalStorage, StorageError, validate_key
+
+PACK_DIR = '.packs'  # caché : ignoré par LocalStorage.list et le vérificateur
+DEFAULT_MAX_BLOB_SIZE = 256 * 1024
+DEFAULT_SEGMENT_SIZE = 256 * 1024 * 1024
+DEFAULT_MIN_GARBAGE = 0.5  # part d'octets supprimés d'un segment avant compactage
+MAX_OPEN_SEGMENTS = 128  # descripteurs de segment gardés ouverts par processus
+BATCH_SIZE = 500  # blobs par transaction (regroupement, liste, compactage)
+COMPACT_BATCH_BYTES = 4 * 1024 * 1024
+
+# En-tête d'enregistrement : marque, longueur de la clé, taille des octets
+_HEADER = struct.Struct('<4sHI')
+MAGIC = b'APK1'
+
+
+def _record_size(key, size):
+    return _HEADER.size + len(key.encode()) + size
+
+
+def _pread(segment, size, position):
+    data = os.pread(segment.fileno(), size, position)
+    if len(data) != size:
+        raise StorageError(f'Segment tronqué : {segment.name}')
+    return data
+
+
+def _read_up_to(fileobj, size):
+    """Lit ``size`` octets au plus (les flux compressés rendent des blocs plus courts)"""
+    parts, remaining = [], size
+    while remaining > 0:
+        data = fileobj.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return b''.join(parts)
+
+
+class BlobFile(io.RawIOBase):
+    """Fichier en lecture limité aux octets d'un blob dans son segment.
+
+    Le descripteur est propre au fichier et placé au début du blob :
+    ``fileno()`` permet à gunicorn d'envoyer ``size`` octets par sendfile.
+    """
+
+    def __init__(self, path, position, size):
+        super().__init__()
+        self._fd = os.open(path, os.O_RDONLY)
+        os.lseek(self._fd, position, os.SEEK_SET)
+        self.name = path
+        self.size = size
+        self._remaining = size
+
+    def readable(self):
+        return True
+
+    def fileno(self):
+        return self._fd
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self._remaining)
+        if count == 0:
+            return 0
+        read = os.readv(self._fd, [memoryview(buffer)[:count]])
+        if read == 0:
+            raise StorageError(f'Segment tronqué : {self.name}')
+        self._remaining -= read
+        return read
+
+    def close(self):
+        if not self.closed:
+            os.close(self._fd)
+        super().close()
+
+
+class PackStore:
+    """Segments d'un répertoire et leur index"""
+
+    def __init__(self, directory, segment_size=DEFAULT_SEGMENT_SIZE):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.segment_size = segment_size
+        self.index_path = os.path.join(self.directory, 'index.db')
+        self._local = threading.local()
+        self._segments = {}  # id -> io.FileIO, par ordre d'ouverture
+        self._segments_lock = threading.Lock()
+        conn = self._connect()
+        try:
+            create_tables(conn)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def _index(self):
+        """Connexion à l'index du thread (recréée après un fork)"""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = self._connect()
+            local.pid = os.getpid()
+        return local.conn
+
+    def segment_path(self, segment_id):
+        return os.path.join(self.directory, f'segment-{segment_id:08d}.pack')
+
+    def _segment(self, segment_id):
+        """Segment ouvert (lecture et écriture par position uniquement)"""
+        with self._segments_lock:
+            segment = self._segments.get(segment_id)
+            if segment is None:
+                segment = io.FileIO(self.segment_path(segment_id), 'r+')
+                if len(self._segments) >= MAX_OPEN_SEGMENTS:
+                    # Retiré du cache sans être fermé : une lecture en cours
+                    # le garde, il est fermé avec sa dernière référence
+                    del self._segments[next(iter(self._segments))]
+                self._segments[segment_id] = segment
+            return segment
+
+    def _forget_segment(self, segment_id):
+        with self._segments_lock:
+            self._segments.pop(segment_id, None)
+
+    # -- Écriture -----------------------------------------------------------
+
+    def _active_segment(self, conn, needed):
+        """Segment où ajouter ``needed`` octets : ``(id, taille)`` (dans la transaction)"""
+        row = conn.execute('SELECT id, size FROM pack_segments WHERE sealed = 0 ORDER BY id DESC LIMIT 1').fetchone()
+        if row is not None and (row[1] == 0 or row[1] + needed <= self.segment_size):
+            return row
+        if row is not None:
+            conn.execute('UPDATE pack_segments SET sealed = 1 WHERE id = ?', (row[0],))
+        segment_id = conn.execute('INSERT INTO pack_segments (created_at) VALUES (?)', (time.time(),)).lastrowid
+        # Un fichier laissé par une transaction annulée est réutilisé tel quel
+        os.close(os.open(self.segment_path(segment_id), os.O_RDWR | os.O_CREAT, 0o644))
+        return segment_id, 0
+
+    def _write_records(self, conn, records, durable=False):
+        """Ajoute ``(clé, octets)`` au segment actif ; retourne le segment et la
+        position des octets de chaque enregistrement. ``durable`` : octets
+        synchronisés sur disque avant le commit de l'index"""
+        buffer = bytearray()
+        positions = []
+        for key, data in records:
+            encoded = key.encode()
+            buffer += _HEADER.pack(MAGIC, len(encoded), len(data))
+            buffer += encoded
+            positions.append(len(buffer))
+            buffer += data
+        segment_id, size = self._active_segment(conn, len(buffer))
+        fd = self._segment(segment_id).fileno()
+        view = memoryview(buffer)
+        written = 0
+        while written < len(buffer):
+            written += os.pwrite(fd, view[written:], size + written)
+        if durable:
+            os.fsync(fd)
+            if size == 0:  # segment créé dans cette transaction : son entrée de répertoire aussi
+                _fsync_directory(self.directory)
+        conn.execute('UPDATE pack_segments SET size = size + ? WHERE id = ?', (len(buffer), segment_id))
+        return segment_id, [size + position for position in positions]
+
+    def _transaction(self, work, durable=False):
+        """Exécute ``work(conn)`` dans une transaction ; ``durable`` : commit
+        synchronisé sur disque (``synchronous = FULL``, à régler hors transaction)"""
+        conn = self._index()
+        if durable:
+            conn.execute('PRAGMA synchronous = FULL')
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work(conn)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            if durable:
+                conn.execute('PRAGMA synchronous = NORMAL')
+        return result
+
+    def put_many(self, blobs, durable=False):
+        """Ajoute ``(clé, octets, date de modification ou None)`` en une
+        transaction ; ``durable`` avant de supprimer la seule autre copie"""
+        for key, _, _ in blobs:
+            validate_key(key)
+
+        def work(conn):
+            segment_id, positions = self._write_records(conn, [(key, data) for key, data, _ in blobs], durable)
+            now = time.time()
+            for (key, data, modified), position in zip(blobs, positions):
+                self._unlink(conn, key)
+                conn.execute(
+                    'INSERT INTO pack_index (key, segment, position, size, modified) VALUES (?, ?, ?, ?, ?)',
+                    (key, segment_id, position, len(data), modified or now)
+                )
+            conn.execute('UPDATE pack_segments SET live = live + ? WHERE id = ?',
+                         (sum(_record_size(key, len(data)) for key, data, _ in blobs), segment_id))
+
+        self._transaction(work, durable)
+
+    def put(self, key, data, modified=None, durable=False):
+        self.put_many([(key, data, modified)], durable)
+        return len(data)
+
+    def _unlink(self, conn, key):
+        row = conn.execute('SELECT segment, size FROM pack_index WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return False
+        conn.execute('DELETE FROM pack_index WHERE key = ?', (key,))
+        conn.execute('UPDATE pack_segments SET live = live - ? WHERE id = ?', (_record_size(key, row[1]), row[0]))
+        return True
+
+    def delete(self, key):
+        return self._transaction(lambda conn: self._unlink(conn, key))
+
+    # -- Lecture ------------------------------------------------------------
+
+    def _locate(self, key):
+        return self._index().execute(
+            'SELECT segment, position, size, modified FROM pack_index WHERE key = ?', (key,)
+        ).fetchone()
+
+    def _read(self, key, reader):
+        """Applique ``reader(segment, position, taille)`` au blob, ou retourne None"""
+        row = self._locate(key)
+        if row is None:
+            return None
+        try:
+            return reader(*row[:3])
+        except FileNotFoundError:
+            # Segment compacté entre la recherche et l'ouverture : le blob a
+            # été déplacé (ou supprimé), l'index dit où
+            row = self._locate(key)
+            return reader(*row[:3]) if row is not None else None
+
+    def get(self, key):
+        return self._read(key, lambda segment_id, position, size: _pread(self._segment(segment_id), size, position))
+
+    def open(self, key):
+        return self._read(key, lambda segment_id, position, size: BlobFile(self.segment_path(segment_id), position, size))
+
+    def stat(self, key):
+        row = self._locate(key)
+        return BlobStat(key, row[2], row[3]) if row is not None else None
+
+    def list(self, start='', end=None):
+        """Blobs de clé ``start <= clé < end``, triés par clé, lus par lots"""
+        lower, operator = start, ' >= ?'
+        while True:
+            sql = 'SELECT key, size, modified FROM pack_index WHERE key' + operator
+            params = [lower]
+            if end is not None:
+                sql += ' AND key < ?'
+                params.append(end)
+            rows = self._index().execute(sql + ' ORDER BY key LIMIT ' + str(BATCH_SIZE), params).fetchall()
+            for row in rows:
+                yield BlobStat(*row)
+            if len(rows) < BATCH_SIZE:
+                return
+            lower, operator = rows[-1][0], ' > ?'
+
+    def stats(self):
+        segments, size, live = self._index().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(live), 0) FROM pack_segments'
+        ).fetchone()
+        blobs, blob_bytes = self._index().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pack_index').fetchone()
+        return {'segments': segments, 'bytes': size, 'live_bytes': live, 'blobs': blobs, 'blob_bytes': blob_bytes}
+
+    # -- Compactage ---------------------------------------------------------
+
+    def compact(self, min_garbage=DEFAULT_MIN_GARBAGE):
+        """Recopie les blobs des segments scellés dont au moins ``min_garbage``
+        des octets sont supprimés, puis supprime ces segments"""
+        lock_file = open(os.path.join(self.directory, 'compact.lock'), 'w')
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise StorageError('Compactage déjà en cours')
+            candidates = self._index().execute(
+                'SELECT id, size FROM pack_segments WHERE sealed = 1 AND size - live >= size * ? ORDER BY id',
+                (min_garbage,)
+            ).fetchall()
+            stats = {'segments': 0, 'moved': 0, 'reclaimed': 0}
+            for segment_id, size in candidates:
+                # Recopies durables : le segment n'est supprimé qu'une fois
+                # les blobs synchronisés et l'index qui les désigne commité
+                stats['moved'] += self._evacuate(segment_id)
+                if self._transaction(lambda conn: self._drop_segment(conn, segment_id), durable=True):
+                    os.remove(self.segment_path(segment_id))
+                    self._forget_segment(segment_id)
+                    stats['segments'] += 1
+                    stats['reclaimed'] += size
+            return stats
+        finally:
+            lock_file.close()
+
+    def _evacuate(self, segment_id):
+        """Recopie les blobs encore indexés d'un segment ; retourne leur nombre"""
+        segment = self._segment(segment_id)
+        moved, after = 0, -1
+        while True:
+            rows = self._index().execute(
+                'SELECT key, position, size FROM pack_index WHERE segment = ? AND position > ? '
+                'ORDER BY position LIMIT ' + str(BATCH_SIZE), (segment_id, after)
+            ).fetchall()
+            if not rows:
+                return moved
+            batch, batch_bytes = [], 0
+            for key, position, size in rows:
+                batch.append((key, _pread(segment, size, position), position))
+                batch_bytes += size
+                if batch_bytes >= COMPACT_BATCH_BYTES:
+                    moved += self._move(segment_id, batch)
+                    batch, batch_bytes = [], 0
+            if batch:
+                moved += self._move(segment_id, batch)
+            after = rows[-1][1]
+
+    def _move(self, old_segment, batch):
+        def work(conn):
+            segment_id, positions = self._write_records(conn, [(key, data) for key, data, _ in batch], durable=True)
+            moved, moved_bytes = 0, 0
+            for (key, data, old_position), position in zip(batch, positions):
+                # Supprimé ou remplacé depuis la lecture : la copie reste inutile
+                if conn.execute(
+                    'UPDATE pack_index SET segment = ?, position = ? WHERE key = ? AND segment = ? AND position = ?',
+                    (segment_id, position, key, old_segment, old_position)
+                ).rowcount:
+                    moved += 1
+                    moved_bytes += _record_size(key, len(data))
+            conn.execute('UPDATE pack_segments SET live = live + ? WHERE id = ?', (moved_bytes, segment_id))
+            conn.execute('UPDATE pack_segments SET live = live - ? WHERE id = ?', (moved_bytes, old_segment))
+            return moved
+
+        return self._transaction(work, durable=True)
+
+    def _drop_segment(self, conn, segment_id):
+        if conn.execute('SELECT 1 FROM pack_index WHERE segment = ? LIMIT 1', (segment_id,)).fetchone():
+            return False
+        conn.execute('DELETE FROM pack_segments WHERE id = ?', (segment_id,))
+        return True
+
+
+def _fsync_directory(path):
+    """Synchronise les entrées d'un répertoire (fichier créé ou supprimé)"""
+    if not hasattr(os, 'O_DIRECTORY'):  # Windows (développement)
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pack_segments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            size INTEGER NOT NULL DEFAULT 0,
+            live INTEGER NOT NULL DEFAULT 0,
+            sealed INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pack_index (
+            key TEXT PRIMARY KEY,
+            segment INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            modified REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pack_index_segment ON pack_index (segment, position)')
+
+
+class _PrefixedReader:
+    """Relit les octets déjà lus de ``fileobj`` avant la suite du flux"""
+
+    def __init__(self, prefix, fileobj):
+        self.prefix = memoryview(prefix)
+        self.fileobj = fileobj
+
+    def read(self, size=-1):
+        if self.prefix:
+            if size is None or size < 0:
+                data = bytes(self.prefix) + self.fileobj.read()
+                self.prefix = self.prefix[:0]
+                return data
+            data = bytes(self.prefix[:size])
+            self.prefix = self.prefix[len(data):]
+            return data
+        return self.fileobj.read(size)
+
+
+class PackStorage:
+    """Fichiers d'au plus ``max_blob_size`` octets dans les segments de
+    ``root/.packs``, les autres un par fichier dans ``root``"""
+
+    def __init__(self, root, max_blob_size=DEFAULT_MAX_BLOB_SIZE, segment_size=DEFAULT_SEGMENT_SIZE):
+        self.files = LocalStorage(root)
+        self.root = self.files.root
+        self.packs = PackStore(os.path.join(self.root, PACK_DIR), segment_size)
+        self.max_blob_size = max_blob_size
+
+    def put(self, key, fileobj):
+        """Écrit le contenu de ``fileobj`` sous ``key`` et retourne sa taille"""
+        head = _read_up_to(fileobj, self.max_blob_size + 1)
+        if len(head) <= self.max_blob_size:
+            size = self.packs.put(key, head)
+            self.files.delete(key)  # version précédente hors des segments
+            return size
+        size = self.files.put(key, _PrefixedReader(head, fileobj))
+        self.packs.delete(key)
+        return size
+
+    def put_file(self, key, src_path):
+        """Range un fichier local déjà complet sous ``key`` (le fichier source disparaît)"""
+        if os.path.getsize(src_path) > self.max_blob_size:
+            size = self.files.put_file(key, src_path)
+            self.packs.delete(key)
+            return size
+        with open(src_path, 'rb') as f:
+            size = self.packs.put(key, f.read(), durable=True)
+        self.files.delete(key)
+        os.remove(src_path)
+        return size
+
+    def get(self, key):
+        data = self.packs.get(key)
+        return data if data is not None else self.files.get(key)
+
+    def open(self, key):
+        blob_file = self.packs.open(key)
+        return blob_file if blob_file is not None else self.files.open(key)
+
+    def stream(self, key, chunk_size=CHUNK_SIZE):
+        with self.open(key) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def delete(self, key):
+        packed = self.packs.delete(key)
+        return self.files.delete(key) or packed
+
+    def stat(self, key):
+        return self.packs.stat(key) or self.files.stat(key)
+
+    def list(self, start='', end=None):
+        """Blobs des deux tiers triés par clé (un blob en cours de
+        regroupement n'apparaît qu'une fois)"""
+        previous = None
+        for blob in heapq.merge(self.packs.list(start, end), self.files.list(start, end)):
+            if blob.key != previous:
+                yield blob
+            previous = blob.key
+
+    def presigned_url(self, key, filename, expires_in=300, content_encoding=None):
+        """Pas d'URL présignée en local : le fichier est servi par l'application"""
+        return None
+
+    def pack_files(self, limit=None):
+        """Range dans les segments les petits fichiers stockés un par fichier ;
+        retourne ``(fichiers, octets)``"""
+        count, total = 0, 0
+        batch = []
+
+        def flush():
+            nonlocal count, total
+            # Originaux supprimés seulement après le commit durable de la copie
+            self.packs.put_many(batch, durable=True)
+            for key, data, _ in batch:
+                try:
+                    os.remove(self.files.path(key))
+                except FileNotFoundError:
+                    # Supprimé pendant la copie : la copie ne lui survit pas
+                    self.packs.delete(key)
+                    continue
+                count += 1
+                total += len(data)
+            batch.clear()
+
+        for blob in self.files.list():
+            if blob.size > self.max_blob_size:
+                continue
+            try:
+                with open(self.files.path(blob.key), 'rb') as f:
+                    data = f.read(self.max_blob_size + 1)
+            except FileNotFoundError:
+                continue
+            if len(data) > self.max_blob_size:
+                continue
+            # Date d'origine conservée (délai de grâce des orphelins du vérificateur)
+            batch.append((blob.key, data, blob.modified))
+            if len(batch) >= BATCH_SIZE:
+                flush()
+            if limit is not None and count + len(batch) >= limit:
+                break
+        if batch:
+            flush()
+        return count, total
+
+    def unpack_files(self):
+        """Ressort chaque blob des segments en un fichier ; retourne leur nombre"""
+        count = 0
+        while True:
+            blobs = list(itertools.islice(self.packs.list(), BATCH_SIZE))
+            if not blobs:
+                return count
+            for blob in blobs:
+                data = self.packs.get(blob.key)
+                if data is None:
+                    continue
+                self.files.put(blob.key, io.BytesIO(data))
+                os.utime(self.files.path(blob.key), (blob.modified, blob.modified))
+                self.packs.delete(blob.key)
+                count += 1
+
+
+def _print_stats(stats):
+    garbage = stats['bytes'] - stats['live_bytes']
+    share = garbage / stats['bytes'] if stats['bytes'] else 0
+    print(f"{stats['blobs']} blob(s), {stats['blob_bytes'] / 1e6:.1f} Mo dans {stats['segments']} segment(s) "
+          f"de {stats['bytes'] / 1e6:.1f} Mo ; {garbage / 1e6:.1f} Mo à récupérer ({share:.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Petits fichiers regroupés en segments')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help='Segments, blobs et place à récupérer')
+    pack = commands.add_parser('pack', help='Regrouper les petits fichiers existants')
+    pack.add_argument('--limit', type=int, help='Nombre maximal de fichiers')
+    compact = commands.add_parser('compact', help='Récupérer la place des blobs supprimés')
+    compact.add_argument('--min-garbage', type=float, default=DEFAULT_MIN_GARBAGE,
+                         help='Part supprimée minimale d\'un segment (0 à 1)')
+    commands.add_parser('unpack', help='Un fichier par blob (avant de revenir à STORAGE_BACKEND=local)')
+    args = parser.parse_args()
+
+    from app import get_storage
+
+    storage = get_storage()
+    # Pas d'isinstance : l'application a importé ``packstore``, ce script est ``__main__``
+    if not hasattr(storage, 'packs'):
+        print('STORAGE_BACKEND=packed requis')
+        return 1
+
+    if args.command == 'pack':
+        count, total = storage.pack_files(args.limit)
+        print(f'{count} fichier(s) regroupé(s), {total / 1e6:.1f} Mo')
+    elif args.command == 'compact':
+        started = time.monotonic()
+        stats = storage.packs.compact(args.min_garbage)
+        print(f"{stats['segments']} segment(s) compacté(s) en {time.monotonic() - started:.1f}s : "
+              f"{stats['moved']} blob(s) recopié(s), {stats['reclaimed'] / 1e6:.1f} Mo libérés")
+    elif args.command == 'unpack':
+        print(f'{storage.unpack_files()} blob(s) ressorti(s)')
+    _print_stats(storage.packs.stats())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,546 @@
+# Profilage à la demande - Archive Platform
+"""Profilage CPU et mémoire d'une route en production, sans redéploiement.
+
+Un administrateur (``ADMIN_USERS``) ouvre une session de profilage pour un
+endpoint Flask (``POST /admin/profiling``) ; chaque worker relit les
+sessions actives au plus toutes les ``REFRESH_INTERVAL`` secondes dans une
+petite base SQLite partagée (``PROFILING_DB``, WAL), comme les statistiques
+SQL. Une fraction ``sample_rate`` des requêtes vers cet endpoint est alors
+profilée, de ``before_request`` jusqu'à la fermeture de la réponse (le
+contenu produit en flux est donc compris) :
+
+- ``cprofile`` : profil déterministe (toutes les fonctions appelées), exporté
+  au format pstats (``python -m pstats``, snakeviz) ;
+- ``sampling`` : un thread relève la pile du thread de la requête toutes
+  les ``SAMPLE_INTERVAL`` secondes ; exporté en piles repliées (« folded »,
+  entrée de flamegraph.pl, speedscope, inferno) ;
+- ``allocations`` (en plus) : tracemalloc pendant la requête, blocs encore
+  alloués à la fin regroupés par ligne. tracemalloc voit tout le processus :
+  les autres threads gthread y contribuent aussi.
+
+Limites strictes, vérifiées à chaque requête :
+
+- une seule requête profilée à la fois par processus ;
+- au plus ``max_share`` (``PROFILE_MAX_SHARE``) du temps de chaque processus
+  passé dans des requêtes profilées, sur une fenêtre glissante de
+  ``BUDGET_WINDOW`` secondes ;
+- ``max_requests`` requêtes profilées au total (réservation atomique dans la
+  base partagée), puis la session se termine (``completed``) ;
+- durée de vie limitée (``expired``) ;
+- arrêt automatique (``aborted``) si les requêtes profilées sont plus de
+  ``max_slowdown`` fois plus lentes que les requêtes non profilées du même
+  endpoint, ou si le profilage lui-même échoue.
+
+Les résultats (un fichier par requête profilée) sont dans
+``PROFILE_DIR/<session>/`` et fusionnés au téléchargement.
+"""
+
+import cProfile
+import json
+import marshal
+import os
+import pstats
+import random
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+
+CPROFILE = 'cprofile'
+SAMPLING = 'sampling'
+MODES = (CPROFILE, SAMPLING)
+
+ACTIVE = 'active'
+COMPLETED = 'completed'
+EXPIRED = 'expired'
+STOPPED = 'stopped'
+ABORTED = 'aborted'
+
+DEFAULT_SAMPLE_RATE = 0.1
+DEFAULT_MAX_REQUESTS = 20
+MAX_REQUESTS_LIMIT = 200
+DEFAULT_DURATION = 600  # secondes
+MAX_DURATION = 3600
+DEFAULT_MAX_SLOWDOWN = 3.0
+MIN_OVERHEAD_SAMPLES = 3  # requêtes de chaque sorte avant de comparer les durées
+DEFAULT_MAX_SHARE = 0.05
+BUDGET_WINDOW = 60.0  # secondes
+REFRESH_INTERVAL = 2.0  # secondes entre deux lectures des sessions actives
+SAMPLE_INTERVAL = 0.005  # secondes entre deux relevés de pile
+ALLOCATION_TOP = 50  # lignes conservées par requête
+RETENTION_DAYS = 7  # sessions terminées (et leurs fichiers) conservées
+
+
+class ProfilingError(Exception):
+    """Session refusée (paramètres invalides ou endpoint déjà profilé)"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class _StackSampler(threading.Thread):
+    """Relève périodiquement la pile d'un thread (profil statistique)"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profiling-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(code.co_name + ' (' + os.path.basename(code.co_filename) + ':'
+                             + str(code.co_firstlineno) + ')')
+                frame = frame.f_back
+            self.counts[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.counts
+
+
+class _Capture:
+    """Requête en cours : profilée (``seq``) ou seulement chronométrée"""
+    __slots__ = ('session', 'seq', 'started', 'profile', 'sampler', 'allocations', 'busy')
+
+    def __init__(self, session):
+        self.session = session
+        self.seq = None
+        self.started = time.perf_counter()
+        self.profile = None
+        self.sampler = None
+        self.allocations = False
+        self.busy = False  # détient le verrou « une requête profilée à la fois »
+
+
+class Profiler:
+    """Sessions de profilage (stockage partagé ``path``) et captures du processus"""
+
+    def __init__(self, path, output_dir, logger=None, max_share=DEFAULT_MAX_SHARE,
+                 refresh_interval=REFRESH_INTERVAL, sample_interval=SAMPLE_INTERVAL):
+        self.path = path
+        self.output_dir = output_dir
+        self.logger = logger
+        self.max_share = max_share
+        self.refresh_interval = refresh_interval
+        self.sample_interval = sample_interval
+        self._lock = threading.Lock()
+        self._reset_process()
+
+    def _reset_process(self):
+        # Après un fork (workers gunicorn), chaque processus a ses mesures
+        self._pid = os.getpid()
+        self._sessions = {}  # endpoint -> session active
+        self._refreshed = float('-inf')
+        self._busy = threading.Lock()  # une requête profilée à la fois
+        self._spent = deque()  # (instant, secondes) des requêtes profilées
+        self._durations = {}  # session -> ([profilées], [non profilées])
+
+    def _store(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = OFF')
+        create_tables(conn)
+        return conn
+
+    def _log_error(self, message):
+        if self.logger is not None:
+            self.logger.error(message)
+
+    def session_dir(self, session_id):
+        return os.path.join(self.output_dir, str(int(session_id)))
+
+    # -- Administration -----------------------------------------------------
+
+    def start(self, endpoint, mode=CPROFILE, allocations=False, sample_rate=DEFAULT_SAMPLE_RATE,
+              max_requests=DEFAULT_MAX_REQUESTS, duration=DEFAULT_DURATION,
+              max_slowdown=DEFAULT_MAX_SLOWDOWN, created_by=None):
+        """Ouvre une session ; ProfilingError si les paramètres sont invalides
+        ou si l'endpoint a déjà une session active (statut 409)"""
+        if mode not in MODES:
+            raise ProfilingError('Mode inconnu : ' + str(mode))
+        if not 0 < sample_rate <= 1:
+            raise ProfilingError('sample_rate doit être dans ]0, 1]')
+        if not 1 <= max_requests <= MAX_REQUESTS_LIMIT:
+            raise ProfilingError('max_requests doit être entre 1 et ' + str(MAX_REQUESTS_LIMIT))
+        if not 1 <= duration <= MAX_DURATION:
+            raise ProfilingError('duration doit être entre 1 et ' + str(MAX_DURATION) + ' secondes')
+        if max_slowdown < 1:
+            raise ProfilingError('max_slowdown doit être supérieur ou égal à 1')
+        now = time.time()
+        conn = self._store()
+        try:
+            self._purge(conn, now)
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                "UPDATE profiling_sessions SET status = ?, reason = 'durée écoulée', ended_at = ? "
+                "WHERE status = 'active' AND expires_at <= ?", (EXPIRED, now, now)
+            )
+            if conn.execute("SELECT 1 FROM profiling_sessions WHERE endpoint = ? AND status = 'active'",
+                            (endpoint,)).fetchone():
+                conn.execute('ROLLBACK')
+                raise ProfilingError('Une session est déjà active pour ' + endpoint, 409)
+            session_id = conn.execute(
+                'INSERT INTO profiling_sessions (endpoint, mode, allocations, sample_rate, max_requests, '
+                'max_slowdown, created_by, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (endpoint, mode, int(bool(allocations)), sample_rate, max_requests, max_slowdown,
+                 created_by, now, now + duration)
+            ).lastrowid
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        self._refreshed = float('-inf')
+        return session_id
+
+    def stop(self, session_id, status=STOPPED, reason=None):
+        """Termine une session active ; retourne False si elle ne l'était plus"""
+        conn = self._store()
+        try:
+            stopped = conn.execute(
+                "UPDATE profiling_sessions SET status = ?, reason = ?, ended_at = ? WHERE id = ? AND status = 'active'",
+                (status, reason, time.time(), session_id)
+            ).rowcount
+        finally:
+            conn.close()
+        self._refreshed = float('-inf')
+        return bool(stopped)
+
+    def sessions(self, limit=50):
+        conn = self._store()
+        try:
+            rows = conn.execute('SELECT * FROM profiling_sessions ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+    def get(self, session_id):
+        conn = self._store()
+        try:
+            row = conn.execute('SELECT * FROM profiling_sessions WHERE id = ?', (session_id,)).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+    def requests(self, session_id):
+        conn = self._store()
+        try:
+            rows = conn.execute(
+                'SELECT seq, pid, method, path, status, duration_ms, peak_kb, created_at '
+                'FROM profiled_requests WHERE session_id = ? ORDER BY seq', (session_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+    def _purge(self, conn, now):
+        """Supprime les sessions terminées depuis plus de RETENTION_DAYS"""
+        cutoff = now - RETENTION_DAYS * 86400
+        old = [row[0] for row in conn.execute(
+            "SELECT id FROM profiling_sessions WHERE status != 'active' AND ended_at < ?", (cutoff,)
+        )]
+        for session_id in old:
+            shutil.rmtree(self.session_dir(session_id), ignore_errors=True)
+            conn.execute('DELETE FROM profiled_requests WHERE session_id = ?', (session_id,))
+            conn.execute('DELETE FROM profiling_sessions WHERE id = ?', (session_id,))
+
+    # -- Requêtes -----------------------------------------------------------
+
+    def active_session(self, endpoint):
+        """Session active pour ``endpoint`` (cache du processus)"""
+        if self._pid != os.getpid():
+            self._reset_process()
+        now = time.monotonic()
+        if now - self._refreshed >= self.refresh_interval:
+            self._refresh(now)
+        session = self._sessions.get(endpoint)
+        if session is not None and session['expires_at'] <= time.time():
+            self.stop(session['id'], EXPIRED, 'durée écoulée')
+            return None
+        return session
+
+    def _refresh(self, now):
+        with self._lock:
+            if now - self._refreshed < self.refresh_interval:
+                return
+            self._refreshed = now
+        try:
+            conn = self._store()
+            try:
+                rows = conn.execute("SELECT * FROM profiling_sessions WHERE status = 'active'").fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            self._log_error(f'Error reading profiling sessions: {e}')
+            return
+        self._sessions = {row['endpoint']: dict(row) for row in rows}
+
+    def _within_budget(self, now):
+        while self._spent and self._spent[0][0] < now - BUDGET_WINDOW:
+            self._spent.popleft()
+        return sum(seconds for _, seconds in self._spent) < self.max_share * BUDGET_WINDOW
+
+    def _claim(self, session):
+        """Réserve une des ``max_requests`` places ; retourne son numéro ou None"""
+        conn = self._store()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            claimed = conn.execute(
+                "UPDATE profiling_sessions SET profiled = profiled + 1 "
+                "WHERE id = ? AND status = 'active' AND profiled < max_requests AND expires_at > ?",
+                (session['id'], time.time())
+            ).rowcount
+            seq = None
+            if claimed:
+                seq = conn.execute('SELECT profiled FROM profiling_sessions WHERE id = ?',
+                                   (session['id'],)).fetchone()[0]
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        if seq is None:
+            self._refreshed = float('-inf')  # session terminée ailleurs
+        return seq
+
+    def begin(self, session):
+        """Début d'une requête vers un endpoint en cours de profilage"""
+        capture = _Capture(session)
+        if random.random() >= session['sample_rate'] or not self._within_budget(time.monotonic()):
+            return capture
+        if not self._busy.acquire(blocking=False):
+            return capture
+        capture.busy = True
+        try:
+            capture.seq = self._claim(session)
+            if capture.seq is None:
+                self._release(capture)
+                return capture
+            if session['allocations'] and not tracemalloc.is_tracing():
+                tracemalloc.start(1)
+                capture.allocations = True
+            if session['mode'] == SAMPLING:
+                capture.sampler = _StackSampler(threading.get_ident(), self.sample_interval)
+                capture.sampler.start()
+            else:
+                capture.profile = cProfile.Profile()
+                capture.profile.enable()
+        except Exception as e:
+            self._abandon(capture, e)
+            return _Capture(session)
+        capture.started = time.perf_counter()
+        return capture
+
+    def finish(self, capture, method, path, status):
+        """Fin de la réponse : arrête la capture et écrit ses résultats"""
+        elapsed = time.perf_counter() - capture.started
+        session = capture.session
+        profiled, plain = self._durations.setdefault(session['id'], ([], []))
+        if capture.seq is None:
+            plain.append(elapsed)
+            del plain[:-100]
+            return
+        self._spent.append((time.monotonic(), elapsed))
+        try:
+            self._write(capture, method, path, status, elapsed)
+        except Exception as e:
+            self._abandon(capture, e)
+            return
+        finally:
+            self._release(capture)
+        profiled.append(elapsed)
+
+        if capture.seq >= session['max_requests']:
+            self.stop(session['id'], COMPLETED)
+        elif len(profiled) >= MIN_OVERHEAD_SAMPLES and len(plain) >= MIN_OVERHEAD_SAMPLES:
+            slowdown = (sum(profiled) / len(profiled)) / max(sum(plain) / len(plain), 1e-6)
+            if slowdown > session['max_slowdown']:
+                self.stop(session['id'], ABORTED, f'surcoût x{slowdown:.1f}')
+                if self.logger is not None:
+                    self.logger.warning(
+                        f'Profiling session {session["id"]} ({session["endpoint"]}) aborted: x{slowdown:.1f} slowdown'
+                    )
+
+    def _release(self, capture):
+        if capture.busy:
+            capture.busy = False
+            self._busy.release()
+
+    def _stop_capture(self, capture):
+        counts, allocations = None, None
+        if capture.profile is not None:
+            capture.profile.disable()
+        if capture.sampler is not None:
+            counts = capture.sampler.stop()
+        if capture.allocations:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            capture.allocations = False
+            allocations = {'peak_kb': round(peak / 1024, 1), 'lines': [
+                [str(stat.traceback[0]), stat.size, stat.count]
+                for stat in snapshot.statistics('lineno')[:ALLOCATION_TOP]
+            ]}
+        return counts, allocations
+
+    def _write(self, capture, method, path, status, elapsed):
+        counts, allocations = self._stop_capture(capture)
+        directory = self.session_dir(capture.session['id'])
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, str(capture.seq))
+        if capture.profile is not None:
+            capture.profile.dump_stats(prefix + '.pstats')
+        if counts is not None:
+            with open(prefix + '.folded', 'w') as f:
+                for stack, count in counts.items():
+                    f.write(stack + ' ' + str(count) + '\n')
+        if allocations is not None:
+            with open(prefix + '.alloc.json', 'w') as f:
+                json.dump(allocations, f)
+        conn = self._store()
+        try:
+            conn.execute(
+                'INSERT INTO profiled_requests (session_id, seq, pid, method, path, status, duration_ms, peak_kb, '
+                'created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (capture.session['id'], capture.seq, os.getpid(), method, path, status,
+                 round(elapsed * 1000, 3), allocations and allocations['peak_kb'], time.time())
+            )
+        finally:
+            conn.close()
+
+    def _abandon(self, capture, error):
+        """Le profilage a échoué : capture arrêtée, session interrompue"""
+        try:
+            self._stop_capture(capture)
+        except Exception:
+            pass
+        self._release(capture)
+        self._log_error(f'Profiling session {capture.session["id"]} failed: {error}')
+        try:
+            self.stop(capture.session['id'], ABORTED, 'erreur : ' + str(error)[:200])
+        except sqlite3.Error:
+            pass
+
+    # -- Exports ------------------------------------------------------------
+
+    def _files(self, session_id, suffix):
+        directory = self.session_dir(session_id)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(suffix))
+
+    def export_pstats(self, session_id):
+        """Profils cProfile fusionnés (format marshal de pstats), ou None"""
+        files = self._files(session_id, '.pstats')
+        if not files:
+            return None
+        stats = pstats.Stats(files[0])
+        for path in files[1:]:
+            stats.add(path)
+        return marshal.dumps(stats.stats)
+
+    def export_folded(self, session_id):
+        """Piles repliées de toutes les requêtes (« pile nombre » par ligne), ou None"""
+        files = self._files(session_id, '.folded')
+        if not files:
+            return None
+        counts = Counter()
+        for path in files:
+            with open(path) as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    counts[stack] += int(count)
+        return ''.join(stack + ' ' + str(count) + '\n' for stack, count in counts.most_common())
+
+    def export_allocations(self, session_id, limit=ALLOCATION_TOP):
+        """Allocations par ligne, cumulées sur les requêtes profilées, ou None"""
+        files = self._files(session_id, '.alloc.json')
+        if not files:
+            return None
+        sizes, counts, peaks = Counter(), Counter(), []
+        for path in files:
+            with open(path) as f:
+                data = json.load(f)
+            peaks.append(data['peak_kb'])
+            for where, size, count in data['lines']:
+                sizes[where] += size
+                counts[where] += count
+        lines = [
+            f'{len(files)} requête(s), pic moyen {sum(peaks) / len(peaks):.1f} Kio, max {max(peaks):.1f} Kio',
+            f'{"Kio":>10} {"blocs":>8}  ligne',
+        ]
+        for where, size in sizes.most_common(limit):
+            lines.append(f'{size / 1024:>10.1f} {counts[where]:>8}  {where}')
+        return '\n'.join(lines) + '\n'
+
+
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS profiling_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            endpoint TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            allocations INTEGER NOT NULL DEFAULT 0,
+            sample_rate REAL NOT NULL,
+            max_requests INTEGER NOT NULL,
+            max_slowdown REAL NOT NULL,
+            profiled INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'active',
+            reason TEXT,
+            created_by TEXT,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            ended_at REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS profiled_requests (
+            session_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            pid INTEGER,
+            method TEXT,
+            path TEXT,
+            status INTEGER,
+            duration_ms REAL,
+            peak_kb REAL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (session_id, seq)
+        )
+    ''')
+
+
+def init_profiling(app, profiler):
+    """Installe les hooks de profilage (``profiler`` None : rien n'est installé)"""
+    if profiler is None:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def _begin_profile():
+        if request.endpoint is None:
+            return
+        session = profiler.active_session(request.endpoint)
+        if session is not None:
+            g._profile_capture = profiler.begin(session)
+
+    @app.after_request
+    def _finish_profile(response):
+        capture = g.pop('_profile_capture', None)
+        if capture is not None:
+            # À la fermeture de la réponse : le contenu produit en flux est compris
+            method, path, status = request.method, request.path, response.status_code
+            response.call_on_close(lambda: profiler.finish(capture, method, path, status))
+        return response
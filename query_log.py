@@ -0,0 +1,460 @@
+# Journal des requêtes lentes - Archive Platform
+"""Mesure des requêtes SQL : histogrammes de latence et requêtes lentes.
+
+Les connexions de l'application (base principale, fichiers de données
+répartis, PostgreSQL) chronomètrent chaque ``execute`` / ``executemany``.
+Les mesures sont regroupées par requête normalisée : littéraux remplacés
+par ``?``, listes ``IN (?, ?, ...)`` réduites à ``IN (?...)``, espaces
+compactés. Une requête construite avec un nombre variable de paramètres
+reste ainsi une seule entrée.
+
+- Chaque processus accumule en mémoire, par requête, le nombre d'appels,
+  le temps total, le maximum et un histogramme à seuils fixes
+  (``BUCKETS_MS``) ; les compteurs sont ajoutés toutes les
+  ``FLUSH_INTERVAL`` secondes à une petite base SQLite partagée par les
+  workers (``QUERY_STATS_DB``, WAL, ``synchronous=OFF``), comme le suivi
+  des connexions.
+- Une requête plus lente que ``SLOW_QUERY_MS`` est journalisée
+  (avertissement) et conservée avec la forme de ses paramètres (types et
+  tailles, jamais les valeurs : mots de passe, contenu des notes) et son
+  plan d'exécution (``EXPLAIN QUERY PLAN``, ``EXPLAIN`` sous PostgreSQL),
+  capturé au plus une fois par ``PLAN_TTL`` secondes et par requête. Les
+  parcours complets de table (``SCAN table`` sans index, ``Seq Scan``) sont
+  signalés.
+
+Pour un SELECT, ``execute`` couvre le calcul de la première ligne (tri,
+agrégat, parcours jusqu'à la première correspondance) mais pas la lecture
+des lignes suivantes.
+
+Usage :
+    python query_log.py report [--limit 20] [--full] [--jsonl]   # classement par temps total
+    python query_log.py slow [--limit 20] [--jsonl]              # dernières requêtes lentes et leur plan
+    python query_log.py reset
+"""
+
+import argparse
+import atexit
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+# Bornes supérieures des intervalles de l'histogramme (ms) ; un dernier
+# intervalle reçoit les durées au-delà
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+FLUSH_INTERVAL = 30.0  # secondes
+PLAN_TTL = 600.0  # secondes entre deux captures du plan d'une même requête
+MAX_SLOW_ENTRIES = 1000  # requêtes lentes conservées
+MAX_STATEMENT_LENGTH = 2000
+
+_QUOTED_RE = re.compile(r"'(?:[^']|'')*'")
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.I)
+_SPACE_RE = re.compile(r'\s+')
+_EXPLAINABLE_RE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.I)
+# SQLite : « SCAN notes » ou « SCAN notes AS n » (sans index ni table virtuelle)
+_SQLITE_SCAN_RE = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+_POSTGRES_SCAN_RE = re.compile(r'\bSeq Scan on (\w+)')
+
+
+@lru_cache(maxsize=2048)
+def normalize(sql):
+    """Clé de regroupement d'une requête"""
+    statement = _LITERAL_RE.sub('?', sql)
+    statement = _IN_LIST_RE.sub('IN (?...)', statement)
+    statement = _SPACE_RE.sub(' ', statement).strip()
+    return statement[:MAX_STATEMENT_LENGTH]
+
+
+def parameter_shape(value):
+    if value is None:
+        return 'null'
+    if isinstance(value, (str, bytes, bytearray, memoryview)):
+        return type(value).__name__ + '[' + str(len(value)) + ']'
+    return type(value).__name__
+
+
+def parameters_shape(parameters):
+    """Types (et tailles) des paramètres liés, sans leurs valeurs"""
+    if isinstance(parameters, dict):
+        return {name: parameter_shape(value) for name, value in parameters.items()}
+    return [parameter_shape(value) for value in parameters or ()]
+
+
+def bucket_index(milliseconds):
+    """Premier intervalle dont la borne supérieure est >= ``milliseconds``"""
+    return bisect_left(BUCKETS_MS, milliseconds)
+
+
+def percentile(buckets, fraction, maximum):
+    """Borne supérieure de l'intervalle contenant le centile demandé"""
+    total = sum(buckets)
+    if not total:
+        return 0.0
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if seen >= total * fraction:
+            return min(BUCKETS_MS[index], maximum) if index < len(BUCKETS_MS) else maximum
+    return maximum
+
+
+def sqlite_plan(conn, sql, parameters):
+    """(lignes du plan, tables parcourues en entier) d'une requête SQLite"""
+    # Curseur sqlite3 ordinaire : l'EXPLAIN lui-même n'est pas mesuré
+    rows = sqlite3.Cursor(conn).execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+    lines = [row[3] for row in rows]
+    scans = [match.group(1) for match in map(_SQLITE_SCAN_RE.match, lines) if match]
+    return lines, scans
+
+
+def postgres_plan(lines):
+    """Même chose d'après la sortie d'``EXPLAIN`` sous PostgreSQL.
+
+    Les valeurs des paramètres apparaissent dans les filtres du plan : les
+    chaînes sont masquées, comme dans la forme des paramètres.
+    """
+    lines = [_QUOTED_RE.sub("'?'", line) for line in lines]
+    return lines, [match.group(1) for line in lines for match in _POSTGRES_SCAN_RE.finditer(line)]
+
+
+class _Stat:
+    __slots__ = ('calls', 'total_ms', 'max_ms', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+
+class QueryLog:
+    """Mesures du processus courant et stockage partagé ``path``"""
+
+    def __init__(self, path, slow_ms=100.0, logger=None, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.slow_ms = slow_ms
+        self.logger = logger
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._reset_process()
+        self.connection_class = type('Connection', (InstrumentedConnection,), {'query_log': self})
+        atexit.register(self.flush)
+
+    def _reset_process(self):
+        # Après un fork (workers gunicorn), les mesures du parent ne sont
+        # pas recomptées par chaque enfant
+        self._pid = os.getpid()
+        self._stats = {}
+        self._slow = []
+        self._plans = {}  # requête -> (instant, lignes, tables parcourues)
+        self._last_flush = time.monotonic()
+
+    def connect(self, path, **kwargs):
+        """sqlite3.connect mesuré"""
+        conn = sqlite3.connect(path, factory=self.connection_class, **kwargs)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def record(self, sql, parameters, seconds, plan=None, plan_target=None):
+        """Compte une exécution ; ``plan(plan_target, sql, parameters)``
+        retourne le plan si la requête est lente"""
+        milliseconds = seconds * 1000
+        statement = normalize(sql)
+        now = time.monotonic()
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset_process()
+            stat = self._stats.get(statement)
+            if stat is None:
+                stat = self._stats[statement] = _Stat()
+            stat.calls += 1
+            stat.total_ms += milliseconds
+            if milliseconds > stat.max_ms:
+                stat.max_ms = milliseconds
+            stat.buckets[bucket_index(milliseconds)] += 1
+            flush_due = now - self._last_flush >= self.flush_interval
+        if milliseconds >= self.slow_ms:
+            self._record_slow(statement, sql, parameters, milliseconds, plan, plan_target, now)
+        if flush_due:
+            self.flush()
+
+    def _record_slow(self, statement, sql, parameters, milliseconds, plan, plan_target, now):
+        cached = self._plans.get(statement)
+        if cached is not None and now - cached[0] < PLAN_TTL:
+            lines, scans = cached[1], cached[2]
+        else:
+            lines, scans = [], []
+            if plan is not None and _EXPLAINABLE_RE.match(sql):
+                try:
+                    lines, scans = plan(plan_target, sql, parameters)
+                except Exception as e:
+                    lines = ['(plan indisponible : ' + str(e) + ')']
+            self._plans[statement] = (now, lines, scans)
+        entry = {
+            'created_at': time.time(),
+            'statement': statement,
+            'duration_ms': round(milliseconds, 3),
+            'params': parameters_shape(parameters),
+            'plan': lines,
+            'full_scans': scans,
+            'pid': os.getpid(),
+        }
+        with self._lock:
+            self._slow.append(entry)
+            del self._slow[:-MAX_SLOW_ENTRIES]
+        if self.logger is not None:
+            scan_note = ' [full scan: ' + ', '.join(scans) + ']' if scans else ''
+            self.logger.warning(f'Slow query ({milliseconds:.0f} ms){scan_note}: {statement[:300]}')
+
+    def _store(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = OFF')
+        create_tables(conn)
+        return conn
+
+    def flush(self):
+        """Ajoute les mesures accumulées au stockage partagé ; retourne le
+        nombre de requêtes distinctes écrites"""
+        if not self._flush_lock.acquire(blocking=False):
+            return 0  # un autre thread écrit déjà
+        try:
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset_process()
+                stats, slow = self._stats, self._slow
+                self._stats, self._slow = {}, []
+                self._last_flush = time.monotonic()
+            if not stats and not slow:
+                return 0
+            try:
+                conn = self._store()
+            except sqlite3.Error as e:
+                if self.logger is not None:
+                    self.logger.error(f'Error writing query statistics: {e}')
+                return 0
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                now = time.time()
+                for statement, stat in stats.items():
+                    row = conn.execute(
+                        'SELECT buckets FROM query_stats WHERE statement = ?', (statement,)
+                    ).fetchone()
+                    buckets = stat.buckets
+                    if row is not None:
+                        buckets = [a + b for a, b in zip(json.loads(row[0]), buckets)]
+                    conn.execute('''
+                        INSERT INTO query_stats (statement, calls, total_ms, max_ms, buckets, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (statement) DO UPDATE SET
+                            calls = calls + excluded.calls,
+                            total_ms = total_ms + excluded.total_ms,
+                            max_ms = MAX(max_ms, excluded.max_ms),
+                            buckets = excluded.buckets,
+                            updated_at = excluded.updated_at
+                    ''', (statement, stat.calls, stat.total_ms, stat.max_ms, json.dumps(buckets), now))
+                conn.executemany(
+                    'INSERT INTO slow_queries (created_at, statement, duration_ms, params, plan, full_scans, pid) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [(e['created_at'], e['statement'], e['duration_ms'], json.dumps(e['params']),
+                      json.dumps(e['plan']), ','.join(e['full_scans']), e['pid']) for e in slow]
+                )
+                if slow:
+                    conn.execute(
+                        'DELETE FROM slow_queries WHERE id <= (SELECT MAX(id) FROM slow_queries) - ?',
+                        (MAX_SLOW_ENTRIES,)
+                    )
+                conn.execute('COMMIT')
+            except sqlite3.Error as e:
+                if self.logger is not None:
+                    self.logger.error(f'Error writing query statistics: {e}')
+                return 0
+            finally:
+                conn.close()
+            return len(stats)
+        finally:
+            self._flush_lock.release()
+
+
+class _Cursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self.connection.query_log.record(sql, parameters, time.perf_counter() - start, sqlite_plan, self.connection)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        # Une entrée par appel ; plan et forme d'après le premier jeu de paramètres
+        self.connection.query_log.record(
+            sql, seq_of_parameters[0] if seq_of_parameters else (),
+            time.perf_counter() - start, sqlite_plan, self.connection
+        )
+        return self
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connexion sqlite3 dont les curseurs sont mesurés (``query_log`` est
+    fixé par ``QueryLog.connection_class``)"""
+    query_log = None
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or _Cursor)
+
+    # Connection.execute n'appelle pas cursor() : à redéfinir aussi
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS query_stats (
+            statement TEXT PRIMARY KEY,
+            calls INTEGER NOT NULL,
+            total_ms REAL NOT NULL,
+            max_ms REAL NOT NULL,
+            buckets TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS slow_queries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            statement TEXT NOT NULL,
+            duration_ms REAL NOT NULL,
+            params TEXT,
+            plan TEXT,
+            full_scans TEXT,
+            pid INTEGER
+        )
+    ''')
+
+
+def report(conn, limit=20):
+    """Requêtes classées par temps total (la plus coûteuse d'abord)"""
+    rows = conn.execute('''
+        SELECT s.statement, s.calls, s.total_ms, s.max_ms, s.buckets,
+               (SELECT full_scans FROM slow_queries q WHERE q.statement = s.statement AND q.full_scans != ''
+                ORDER BY q.id DESC LIMIT 1)
+        FROM query_stats s ORDER BY s.total_ms DESC LIMIT ?
+    ''', (limit,)).fetchall()
+    result = []
+    for statement, calls, total_ms, max_ms, buckets, scans in rows:
+        buckets = json.loads(buckets)
+        result.append({
+            'statement': statement,
+            'calls': calls,
+            'total_ms': round(total_ms, 3),
+            'mean_ms': round(total_ms / calls, 3),
+            'p50_ms': round(percentile(buckets, 0.50, max_ms), 3),
+            'p95_ms': round(percentile(buckets, 0.95, max_ms), 3),
+            'p99_ms': round(percentile(buckets, 0.99, max_ms), 3),
+            'max_ms': round(max_ms, 3),
+            'full_scans': scans.split(',') if scans else [],
+        })
+    return result
+
+
+def slow_queries(conn, limit=20):
+    rows = conn.execute('''
+        SELECT created_at, statement, duration_ms, params, plan, full_scans, pid
+        FROM slow_queries ORDER BY id DESC LIMIT ?
+    ''', (limit,)).fetchall()
+    return [
+        {
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created_at)),
+            'statement': statement,
+            'duration_ms': duration_ms,
+            'params': json.loads(params),
+            'plan': json.loads(plan),
+            'full_scans': full_scans.split(',') if full_scans else [],
+            'pid': pid,
+        }
+        for created_at, statement, duration_ms, params, plan, full_scans, pid in rows
+    ]
+
+
+def _print_report(entries, full):
+    width = None if full else 90
+    print(f'{"total ms":>10} {"appels":>8} {"moy. ms":>8} {"p95 ms":>8} {"max ms":>8}  requête')
+    for entry in entries:
+        statement = entry['statement'] if width is None else entry['statement'][:width]
+        print(f'{entry["total_ms"]:>10.0f} {entry["calls"]:>8} {entry["mean_ms"]:>8.2f} '
+              f'{entry["p95_ms"]:>8.1f} {entry["max_ms"]:>8.1f}  {statement}')
+        if entry['full_scans']:
+            print(f'{"":>47}⚠ parcours complet : {", ".join(entry["full_scans"])}')
+
+
+def _print_slow(entries):
+    for entry in entries:
+        print(f'{entry["created_at"]}  {entry["duration_ms"]:.0f} ms  (pid {entry["pid"]})')
+        print(f'  {entry["statement"]}')
+        print(f'  paramètres : {entry["params"]}')
+        for line in entry['plan']:
+            print(f'    {line}')
+        if entry['full_scans']:
+            print(f'  ⚠ parcours complet : {", ".join(entry["full_scans"])}')
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Statistiques des requêtes SQL')
+    parser.add_argument('--db', default=os.environ.get('QUERY_STATS_DB', 'query_stats.db'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    report_cmd = commands.add_parser('report', help='Requêtes classées par temps total')
+    report_cmd.add_argument('--limit', type=int, default=20)
+    report_cmd.add_argument('--full', action='store_true', help='Requêtes non tronquées')
+    report_cmd.add_argument('--jsonl', action='store_true', help='Une ligne JSON par requête')
+    slow_cmd = commands.add_parser('slow', help='Dernières requêtes lentes et leur plan')
+    slow_cmd.add_argument('--limit', type=int, default=20)
+    slow_cmd.add_argument('--jsonl', action='store_true', help='Une ligne JSON par requête')
+    commands.add_parser('reset', help='Efface les statistiques')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f'✗ {args.db} introuvable (QUERY_STATS_DB)')
+        return 1
+    conn = sqlite3.connect(args.db, timeout=10)
+    create_tables(conn)
+    try:
+        if args.command == 'reset':
+            conn.execute('DELETE FROM query_stats')
+            conn.execute('DELETE FROM slow_queries')
+            conn.commit()
+            print('✓ Statistiques effacées')
+            return 0
+        if args.command == 'report':
+            entries = report(conn, args.limit)
+        else:
+            entries = slow_queries(conn, args.limit)
+    finally:
+        conn.close()
+
+    if args.jsonl:
+        for entry in entries:
+            print(json.dumps(entry, ensure_ascii=False))
+    elif args.command == 'report':
+        _print_report(entries, args.full)
+    else:
+        _print_slow(entries)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+# Compression des réponses HTTP - Archive Platform
+"""Compression dynamique des réponses HTML et JSON.
+
+nginx transmet les réponses de l'application telles quelles (pas de
+``gzip`` sur le contenu proxifié) : ``/dashboard``, ``/search`` ou
+``/get_labels`` partaient non compressés. ``init_response_compression(app)``
+ajoute un ``after_request`` qui :
+
+- négocie l'encodage avec ``Accept-Encoding`` (valeurs q du client, puis
+  ordre de ``ENCODINGS`` à égalité) parmi ceux disponibles : brotli
+  (paquet ``Brotli``), zstd (paquet ``zstandard``), gzip (toujours) ;
+- ne compresse que les types textuels de ``COMPRESSIBLE_TYPES`` d'au moins
+  ``RESPONSE_COMPRESSION_MIN_SIZE`` octets ;
+- compresse les réponses produites par un générateur (listes JSON en flux)
+  au fil de l'eau : chaque morceau est compressé puis vidé (flush) pour
+  que le client le reçoive aussitôt ; seuls les premiers morceaux sont lus
+  d'avance, pour appliquer le seuil ;
+- ajoute ``Vary: Accept-Encoding`` à toute réponse dont le contenu dépend
+  de l'en-tête, et affaiblit l'``ETag`` d'une réponse compressée.
+
+Ne sont jamais compressés : les flux Server-Sent Events (chaque événement
+doit partir immédiatement), les fichiers (``send_file``, téléchargements,
+réponses déjà encodées) et les réponses ``Cache-Control: no-transform``.
+Niveaux choisis avec ``python benchmarks/bench_response_compression.py``.
+"""
+
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # dépendance optionnelle : gzip / zstd seulement
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # dépendance optionnelle : gzip / brotli seulement
+    zstandard = None
+
+BROTLI = 'br'
+ZSTD = 'zstd'
+GZIP = 'gzip'
+# Préférence du serveur quand le client accepte plusieurs encodages à égalité
+ENCODINGS = (BROTLI, ZSTD, GZIP)
+# brotli 5 : listes JSON deux fois plus petites qu'au niveau 4 pour ~40 % de CPU
+# en plus ; zstd 1 égale ou bat zstd 3 sur le HTML et le JSON de l'application
+LEVELS = {BROTLI: 5, ZSTD: 1, GZIP: 6}
+DEFAULT_MIN_SIZE = 1024  # en dessous, l'en-tête et le temps CPU ne valent pas le gain
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/xml', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+
+
+class _GzipEncoder:
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+_ENCODERS = {GZIP: _GzipEncoder, BROTLI: _BrotliEncoder, ZSTD: _ZstdEncoder}
+
+
+def available_encodings():
+    """Encodages utilisables dans ce processus, par ordre de préférence"""
+    missing = {BROTLI: brotli is None, ZSTD: zstandard is None, GZIP: False}
+    return [encoding for encoding in ENCODINGS if not missing[encoding]]
+
+
+def encoder(encoding, level=None):
+    """Compresseur incrémental (``compress`` / ``flush`` / ``finish``)"""
+    return _ENCODERS[encoding](LEVELS[encoding] if level is None else level)
+
+
+def compress(data, encoding, level=None):
+    enc = encoder(encoding, level)
+    return enc.compress(data) + enc.finish()
+
+
+def _to_bytes(chunk):
+    return chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+def _compress_stream(head, rest, iterable, enc):
+    """Compresse les morceaux déjà lus puis le reste du flux, un flush par
+    morceau ; ferme le flux d'origine (connexion de stream_json_list)"""
+    try:
+        yield enc.compress(b''.join(head)) + enc.flush()
+        for chunk in rest:
+            data = enc.compress(_to_bytes(chunk)) + enc.flush()
+            if data:
+                yield data
+        yield enc.finish()
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+
+
+def _is_eligible(response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False  # fichiers (send_file) ou octets déjà compressés
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return False  # dont text/event-stream
+    if 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    if response.headers.get('Content-Disposition', '').startswith('attachment'):
+        return False
+    return True
+
+
+def compress_response(response, accept_encodings, encodings, min_size):
+    """Compresse ``response`` si c'est utile ; retourne la réponse"""
+    if not _is_eligible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = accept_encodings.best_match(encodings)
+    if encoding is None:
+        return response
+
+    if response.is_sequence:
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(compress(data, encoding))
+    else:
+        # Flux : lecture des premiers morceaux jusqu'au seuil
+        iterable = response.response
+        rest = iter(iterable)
+        head, size = [], 0
+        for chunk in rest:
+            head.append(_to_bytes(chunk))
+            size += len(head[-1])
+            if size >= min_size:
+                break
+        else:
+            # Flux terminé sous le seuil : envoyé tel quel
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+            response.set_data(b''.join(head))
+            return response
+        response.response = _compress_stream(head, rest, iterable, encoder(encoding))
+        response.headers.pop('Content-Length', None)
+
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_response_compression(app):
+    """Installe la compression si ``RESPONSE_COMPRESSION`` est actif"""
+    if not app.config.get('RESPONSE_COMPRESSION', True):
+        return
+    encodings = available_encodings()
+    min_size = app.config.get('RESPONSE_COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE)
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, request.accept_encodings, encodings, min_size)
@@ -0,0 +1,86 @@
+# Représentation compacte des lignes SQL - Archive Platform
+"""Fabrique de lignes légère et sérialisation JSON en flux.
+
+``sqlite3.Row`` puis ``dict(row)`` allouent un objet et un dictionnaire par
+ligne. Ici chaque ligne est un namedtuple (``__slots__`` vide, accès par
+attribut, compatible avec ``row['col']`` dans les templates Jinja) et les
+listes JSON sont produites par lots avec ``fetchmany``.
+"""
+
+import json
+import threading
+from collections import namedtuple
+
+FETCH_BATCH_SIZE = 500
+
+_row_classes = {}
+_row_classes_lock = threading.Lock()
+
+
+def _row_class(description):
+    fields = tuple(column[0] for column in description)
+    cls = _row_classes.get(fields)
+    if cls is None:
+        with _row_classes_lock:
+            cls = _row_classes.setdefault(fields, namedtuple('Row', fields))
+    return cls
+
+
+def namedtuple_factory(cursor, row):
+    """row_factory sqlite3 produisant des namedtuples (classe partagée par projection)"""
+    return _row_class(cursor.description)._make(row)
+
+
+def use_namedtuples(cursor):
+    """Active la fabrique de namedtuples sur un curseur et le retourne"""
+    cursor.row_factory = namedtuple_factory
+    return cursor
+
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+class JSONListStream:
+    """Itérable WSGI produisant ``{"key":[...]}`` ligne par ligne à partir
+    d'un curseur exécuté.
+
+    Seul un lot de ``batch_size`` lignes est en mémoire à la fois.
+    ``close()`` (appelé par le serveur, y compris pour une requête HEAD ou
+    une déconnexion avant la première ligne) appelle ``on_close`` une seule
+    fois (ex. fermeture de la connexion) ; un flux lu jusqu'au bout l'appelle
+    dès sa fin.
+    """
+
+    def __init__(self, cursor, key, batch_size=FETCH_BATCH_SIZE, on_close=None):
+        self.cursor = cursor
+        self.key = key
+        self.batch_size = batch_size
+        self.on_close = on_close
+        self._closed = False
+
+    def __iter__(self):
+        fields = [column[0] for column in self.cursor.description]
+        yield '{' + _encoder.encode(self.key) + ':['
+        first = True
+        while True:
+            batch = self.cursor.fetchmany(self.batch_size)
+            if not batch:
+                break
+            parts = []
+            for row in batch:
+                parts.append(_encoder.encode(dict(zip(fields, row))))
+            yield ('' if first else ',') + ','.join(parts)
+            first = False
+        yield ']}'
+        self.close()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            if self.on_close is not None:
+                self.on_close()
+
+
+def stream_json_list(cursor, key, batch_size=FETCH_BATCH_SIZE, on_close=None):
+    """Liste JSON en flux d'un curseur exécuté (voir ``JSONListStream``)"""
+    return JSONListStream(cursor, key, batch_size, on_close)
@@ -2,13 +2,11 @@
 """Script de démarrage de l'application"""
 
 import os
-from app import app, init_db
+from app import app, migrate
 
 if __name__ == '__main__':
-    # Initialiser la base de données si elle n'existe pas
-    if not os.path.exists('database.db'):
-        print("Initialisation de la base de données...")
-        init_db()
+    # Mettre le schéma à jour si nécessaire (une seule fois par version)
+    if migrate():
         print("✓ Base de données initialisée!")
     
     # Démarrer l'application
@@ -23,6 +21,6 @@ if __name__ == '__main__':
     else:
         print("\n" + "="*50)
         print("  MODE PRODUCTION")
-        print("  Utilisez Gunicorn: gunicorn -w 4 -b 0.0.0.0:5000 app:app")
+        print("  Utilisez Gunicorn: gunicorn -c gunicorn.conf.py")
         print("="*50 + "\n")
         app.run(debug=False, host='127.0.0.1', port=5000)
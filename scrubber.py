@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""Vérification du stockage et réconciliation avec la table ``files``
+
+Le stockage (``UPLOAD_FOLDER`` ou S3) et la table ``files`` (base
+principale et fichiers de données répartis) doivent désigner les mêmes
+fichiers. Le vérificateur les parcourt par intervalles de clés (un par
+premier caractère de l'UUID qui commence chaque clé) ; dans un intervalle,
+la liste triée du stockage et les lignes triées par clé (lues par lots de
+``ROW_BATCH``) sont fusionnées comme dans une jointure de fusion : rien
+n'est chargé en entier et aucune transaction de lecture ne reste ouverte.
+
+Pour chaque clé :
+
+- ligne et fichier : l'empreinte SHA-256 des octets stockés est recalculée
+  et comparée à ``files.checksum`` (enregistrée si elle manquait) ;
+- ligne sans fichier (``missing``) ou empreinte différente (``corrupt``) :
+  le fichier est restauré depuis les sauvegardes (``backup.py``) si leur
+  copie a l'empreinte attendue ;
+- fichier illisible (``unreadable``) : même réparation ;
+- fichier sans ligne (``orphan``) plus ancien que ``--grace-hours`` (un
+  upload écrit le fichier avant sa ligne) : déplacé dans ``QUARANTINE_DIR``
+  plutôt que supprimé.
+
+Chaque anomalie est revérifiée juste avant d'agir (suppression ou upload
+terminé entre-temps). Les empreintes sont calculées par un pool de threads
+dont les lectures passent par un seau à jetons (``--rate-mb``) : la
+vérification ne sature pas le disque de l'application. L'avancement est
+enregistré dans ``SCRUB_STATE_DB`` toutes les ``CHECKPOINT_KEYS`` clés : une
+vérification interrompue reprend à la dernière clé enregistrée.
+
+Usage :
+    python scrubber.py run [--threads 4] [--rate-mb 20] [--grace-hours 24] [--dry-run] [--restart]
+    python scrubber.py status                  # avancement de la dernière vérification
+    python scrubber.py findings [--run N]      # anomalies détectées
+"""
+
+import argparse
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows (développement) : pas de verrou inter-processus
+    fcntl = None
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database
+from backup import BACKUP_DIR, BlobCatalog
+from storage import LocalStorage, validate_key
+
+SCRUB_STATE_DB = os.environ.get('SCRUB_STATE_DB', 'scrub_state.db')
+QUARANTINE_DIR = os.environ.get('QUARANTINE_DIR', 'quarantine')
+DEFAULT_THREADS = 4
+DEFAULT_RATE_MB = 20.0  # Mo/s lus au plus (0 : pas de limite)
+DEFAULT_GRACE_HOURS = 24.0
+READ_SIZE = 1024 * 1024
+ROW_BATCH = 1000  # lignes de files lues par requête
+CHECKPOINT_KEYS = 500
+CHECKPOINT_SECONDS = 10
+HEX_DIGITS = '0123456789abcdef'
+
+MISSING, CORRUPT, ORPHAN, UNREADABLE = 'missing', 'corrupt', 'orphan', 'unreadable'
+
+
+class TokenBucket:
+    """Débit partagé par les threads : ``rate`` octets/s en moyenne, au plus
+    ``burst`` octets d'avance (``rate`` nul : pas de limite)"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Découvert autorisé : l'appelant attend qu'il soit comblé, les
+            # suivants attendent d'autant plus
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def key_ranges(prefix_length=1):
+    """Intervalles ``[début, fin)`` couvrant toutes les clés, un par préfixe
+    hexadécimal (le premier et le dernier couvrent aussi les clés qui ne
+    commencent pas par un UUID)"""
+    prefixes = [''.join(p) for p in itertools.product(HEX_DIGITS, repeat=prefix_length)]
+    bounds = [''] + prefixes[1:] + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _file_rows(connect, db_path, start, end, after=None):
+    """Lignes de ``files`` d'un intervalle triées par clé, par lots (chaque lot
+    est une requête courte : les écritures de l'application ne sont pas bloquées)"""
+    conn = connect(db_path)
+    try:
+        # Ordre des octets UTF-8, celui du stockage (BINARY pour SQLite)
+        collate = ' COLLATE "C"' if database.is_postgres(conn) else ''
+        column = 'filename' + collate
+        sql = 'SELECT id, filename, file_size, codec, checksum FROM files WHERE ' + column + ' > ?'
+        if end is not None:
+            sql += ' AND ' + column + ' < ?'
+        sql += ' ORDER BY ' + column + ' LIMIT ' + str(ROW_BATCH)
+        lower = after
+        if lower is None:
+            # Première ligne de l'intervalle : filename >= start
+            cursor = conn.execute(
+                'SELECT id, filename, file_size, codec, checksum FROM files WHERE filename = ?', (start,)
+            )
+            for row in cursor.fetchall():
+                yield db_path, row
+            lower = start
+        while True:
+            rows = conn.execute(sql, (lower,) if end is None else (lower, end)).fetchall()
+            for row in rows:
+                yield db_path, row
+            if len(rows) < ROW_BATCH:
+                return
+            lower = rows[-1]['filename']
+    finally:
+        conn.close()
+
+
+def merge_join(blobs, rows):
+    """Fusionne deux flux triés par clé : ``(clé, fichier ou None, lignes)``"""
+    groups = itertools.groupby(rows, key=lambda item: item[1]['filename'])
+    blob = next(blobs, None)
+    group = next(groups, None)
+    while blob is not None or group is not None:
+        if group is None or (blob is not None and blob.key < group[0]):
+            yield blob.key, blob, []
+            blob = next(blobs, None)
+        elif blob is None or group[0] < blob.key:
+            yield group[0], None, list(group[1])
+            group = next(groups, None)
+        else:
+            yield blob.key, blob, list(group[1])
+            blob = next(blobs, None)
+            group = next(groups, None)
+
+
+def _sha256_path(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ScrubState:
+    """Vérifications, avancement par intervalle et anomalies (``SCRUB_STATE_DB``)"""
+
+    def __init__(self, path=SCRUB_STATE_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS scrub_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP,
+                options TEXT NOT NULL,
+                stats TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE TABLE IF NOT EXISTS scrub_progress (
+                run_id INTEGER NOT NULL,
+                range_start TEXT NOT NULL,
+                position TEXT,
+                done INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (run_id, range_start)
+            );
+            CREATE TABLE IF NOT EXISTS scrub_findings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                action TEXT NOT NULL,
+                detail TEXT,
+                found_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        ''')
+
+    def lock(self):
+        """Une seule vérification à la fois ; retourne False si une autre est en cours"""
+        self.lock_file = open(self.path + '.lock', 'w')
+        if fcntl is None:
+            return True
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def latest_run(self):
+        return self.conn.execute('SELECT * FROM scrub_runs ORDER BY id DESC LIMIT 1').fetchone()
+
+    def start_run(self, options):
+        run_id = self.conn.execute('INSERT INTO scrub_runs (options) VALUES (?)', (json.dumps(options),)).lastrowid
+        self.conn.commit()
+        return run_id
+
+    def progress(self, run_id):
+        """``{début d'intervalle: (dernière clé traitée, terminé)}``"""
+        return {row['range_start']: (row['position'], bool(row['done'])) for row in self.conn.execute(
+            'SELECT range_start, position, done FROM scrub_progress WHERE run_id = ?', (run_id,)
+        )}
+
+    def checkpoint(self, run_id, range_start, position, done, stats, findings):
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO scrub_findings (run_id, key, kind, action, detail) VALUES (?, ?, ?, ?, ?)',
+                [(run_id,) + finding for finding in findings]
+            )
+            self.conn.execute(
+                'INSERT INTO scrub_progress (run_id, range_start, position, done) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (run_id, range_start) DO UPDATE SET position = excluded.position, done = excluded.done',
+                (run_id, range_start, position, int(done))
+            )
+            self.conn.execute('UPDATE scrub_runs SET stats = ? WHERE id = ?', (json.dumps(stats), run_id))
+
+    def finish(self, run_id):
+        with self.conn:
+            self.conn.execute('UPDATE scrub_runs SET finished_at = CURRENT_TIMESTAMP WHERE id = ?', (run_id,))
+
+    def findings(self, run_id):
+        return self.conn.execute(
+            'SELECT key, kind, action, detail, found_at FROM scrub_findings WHERE run_id = ? ORDER BY id', (run_id,)
+        ).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+class Scrubber:
+    """Parcours du stockage et des bases ``databases`` (ouvertes par ``connect``)"""
+
+    def __init__(self, storage, databases, connect, state, threads=DEFAULT_THREADS, rate_mb=DEFAULT_RATE_MB,
+                 grace_hours=DEFAULT_GRACE_HOURS, dry_run=False, quarantine_dir=QUARANTINE_DIR,
+                 backup_dir=BACKUP_DIR, prefix_length=1):
+        self.storage = storage
+        self.databases = databases
+        self.connect = connect
+        self.state = state
+        self.threads = threads
+        self.bucket = TokenBucket(rate_mb * 1024 * 1024, burst=4 * READ_SIZE)
+        self.grace = grace_hours * 3600
+        self.dry_run = dry_run
+        self.quarantine_dir = quarantine_dir
+        self.prefix_length = prefix_length
+        # Sauvegardes : source des réparations (le catalogue n'est pas créé ici)
+        catalog_exists = os.path.exists(os.path.join(backup_dir, 'catalog.db'))
+        self.catalog = BlobCatalog(backup_dir) if catalog_exists else None
+
+    def run(self, restart=False):
+        """Reprend la dernière vérification inachevée (ou en commence une) ;
+        retourne ``(run_id, stats)``"""
+        latest = self.state.latest_run()
+        if latest is not None and latest['finished_at'] is None and not restart:
+            run_id = latest['id']
+            stats = Counter(json.loads(latest['stats']))
+        else:
+            run_id = self.state.start_run({'dry_run': self.dry_run, 'grace_hours': self.grace / 3600})
+            stats = Counter()
+        progress = self.state.progress(run_id)
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            for start, end in key_ranges(self.prefix_length):
+                position, done = progress.get(start, (None, False))
+                if not done:
+                    self._scrub_range(pool, run_id, start, end, position, stats)
+        self.state.finish(run_id)
+        if self.catalog is not None:
+            self.catalog.close()
+        return run_id, dict(stats)
+
+    def _scrub_range(self, pool, run_id, start, end, position, stats):
+        blobs = self.storage.list(position or start, end)
+        if position is not None:
+            blobs = (blob for blob in blobs if blob.key > position)
+        rows = heapq.merge(
+            *[_file_rows(self.connect, db_path, start, end, position) for db_path in self.databases],
+            key=lambda item: item[1]['filename']
+        )
+        # Empreintes calculées en avance par le pool, résultats traités dans
+        # l'ordre des clés : la position enregistrée n'a rien d'inachevé derrière elle
+        pending = deque()
+        findings, updates = [], []
+        last_key, handled, last_checkpoint = position, 0, time.monotonic()
+        for key, blob, key_rows in merge_join(blobs, rows):
+            future = pool.submit(self._checksum, key) if blob is not None and key_rows else None
+            pending.append((key, blob, key_rows, future))
+            while len(pending) > self.threads * 4:
+                last_key = self._handle(run_id, *pending.popleft(), stats, findings, updates)
+                handled += 1
+            if handled >= CHECKPOINT_KEYS or time.monotonic() - last_checkpoint > CHECKPOINT_SECONDS:
+                self._checkpoint(run_id, start, last_key, False, stats, findings, updates)
+                handled, last_checkpoint = 0, time.monotonic()
+        while pending:
+            last_key = self._handle(run_id, *pending.popleft(), stats, findings, updates)
+        self._checkpoint(run_id, start, last_key, True, stats, findings, updates)
+
+    def _checkpoint(self, run_id, start, position, done, stats, findings, updates):
+        # Empreintes d'abord : une reprise refait au pire quelques vérifications
+        for db_path, group in itertools.groupby(sorted(updates, key=lambda u: u[0]), key=lambda u: u[0]):
+            conn = self.connect(db_path)
+            try:
+                conn.executemany(
+                    'UPDATE files SET checksum = ? WHERE id = ? AND checksum IS NULL',
+                    [(checksum, file_id) for _, file_id, checksum in group]
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        self.state.checkpoint(run_id, start, position, done, dict(stats), findings)
+        findings.clear()
+        updates.clear()
+
+    def _checksum(self, key):
+        """``(taille, sha256)`` des octets stockés, ou None si le fichier a disparu"""
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with self.storage.open(key) as f:
+                for block in iter(lambda: f.read(READ_SIZE), b''):
+                    self.bucket.consume(len(block))
+                    digest.update(block)
+                    size += len(block)
+        except Exception:
+            if self.storage.stat(key) is None:
+                return None  # supprimé pendant la vérification
+            raise
+        return size, digest.hexdigest()
+
+    def _handle(self, run_id, key, blob, rows, future, stats, findings, updates):
+        """Classe une clé, agit si besoin ; retourne la clé (position à enregistrer)"""
+        if blob is None:
+            # Ligne supprimée ou fichier écrit depuis la lecture ?
+            if self.storage.stat(key) is None and self._referenced(key):
+                stats[MISSING] += 1
+                findings.append((key, MISSING, self._repair(key, rows), None))
+            return key
+
+        if not rows:
+            if time.time() - blob.modified < self.grace:
+                stats['recent_orphans'] += 1  # upload peut-être en cours
+            elif not self._referenced(key):
+                stats[ORPHAN] += 1
+                action = 'reported' if self.dry_run else self._quarantine(run_id, key)
+                findings.append((key, ORPHAN, action, f'{blob.size} octets'))
+            return key
+
+        try:
+            result = future.result()
+        except OSError as e:
+            # Secteur illisible : la copie de sauvegarde réécrit le fichier
+            stats[UNREADABLE] += 1
+            findings.append((key, UNREADABLE, self._repair(key, rows), str(e)))
+            return key
+        if result is None:
+            return key
+        size, checksum = result
+        stats['checked'] += 1
+        stats['bytes'] += size
+        expected = next((row['checksum'] for _, row in rows if row['checksum']), None)
+        if expected is not None and checksum != expected:
+            stats[CORRUPT] += 1
+            findings.append((key, CORRUPT, self._repair(key, rows), f'sha256 {checksum}'))
+        elif expected is None and self._size_mismatch(rows, size):
+            stats[CORRUPT] += 1
+            findings.append((key, CORRUPT, self._repair(key, rows), f'{size} octets'))
+        elif expected is None:
+            stats['recorded'] += 1
+            updates.extend((db_path, row['id'], checksum) for db_path, row in rows)
+        return key
+
+    def _size_mismatch(self, rows, size):
+        """Fichier non compressé dont la taille diffère de celle de l'upload (tronqué)"""
+        return any(row['codec'] is None and row['file_size'] is not None and row['file_size'] != size
+                   for _, row in rows)
+
+    def _referenced(self, key):
+        for db_path in self.databases:
+            conn = self.connect(db_path)
+            try:
+                if conn.execute('SELECT 1 FROM files WHERE filename = ? LIMIT 1', (key,)).fetchone():
+                    return True
+            finally:
+                conn.close()
+        return False
+
+    def _repair(self, key, rows):
+        """Restaure ``key`` depuis la sauvegarde si sa copie est la bonne ; retourne l'action"""
+        entry = self.catalog.get(key) if self.catalog is not None else None
+        if entry is None:
+            return 'unrepaired'
+        backup_size, backup_checksum = entry
+        expected = next((row['checksum'] for _, row in rows if row['checksum']), None)
+        if expected is not None and backup_checksum != expected:
+            return 'unrepaired'
+        if expected is None and self._size_mismatch(rows, backup_size):
+            return 'unrepaired'
+        if self.dry_run:
+            return 'repairable'
+        path = self.catalog.path(key)
+        if _sha256_path(path) != backup_checksum:
+            return 'unrepaired'  # copie de sauvegarde elle-même altérée
+        with open(path, 'rb') as f:
+            self.storage.put(key, f)
+        return 'repaired'
+
+    def _quarantine(self, run_id, key):
+        """Retire un fichier orphelin du stockage sans le détruire"""
+        directory = os.path.join(self.quarantine_dir, str(run_id))
+        os.makedirs(directory, exist_ok=True)
+        dest = os.path.join(directory, validate_key(key))
+        if isinstance(self.storage, LocalStorage):
+            try:
+                os.replace(self.storage.path(key), dest)
+                return 'quarantined'
+            except OSError:
+                pass  # autre système de fichiers : copie puis suppression
+        with self.storage.open(key) as src, open(dest + '.part', 'wb') as out:
+            shutil.copyfileobj(src, out, READ_SIZE)
+        os.replace(dest + '.part', dest)
+        self.storage.delete(key)
+        return 'quarantined'
+
+
+def _print_stats(stats):
+    print(f"{stats.get('checked', 0)} fichier(s) vérifié(s), {stats.get('bytes', 0) / 1024 / 1024:.1f} Mo lus, "
+          f"{stats.get('recorded', 0)} empreinte(s) enregistrée(s)")
+    print(f"{stats.get(MISSING, 0)} manquant(s), {stats.get(CORRUPT, 0)} altéré(s), "
+          f"{stats.get(UNREADABLE, 0)} illisible(s), {stats.get(ORPHAN, 0)} orphelin(s), "
+          f"{stats.get('recent_orphans', 0)} orphelin(s) récent(s) ignoré(s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vérification du stockage des fichiers')
+    parser.add_argument('--state-db', default=SCRUB_STATE_DB)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Vérifier (reprend la dernière vérification inachevée)')
+    run.add_argument('--threads', type=int, default=DEFAULT_THREADS)
+    run.add_argument('--rate-mb', type=float, default=DEFAULT_RATE_MB, help='Débit de lecture maximal (Mo/s, 0 : illimité)')
+    run.add_argument('--grace-hours', type=float, default=DEFAULT_GRACE_HOURS, help='Âge minimal d\'un orphelin')
+    run.add_argument('--dry-run', action='store_true', help='Signaler sans réparer ni déplacer')
+    run.add_argument('--restart', action='store_true', help='Recommencer depuis le début')
+    run.add_argument('--quarantine-dir', default=QUARANTINE_DIR)
+    run.add_argument('--backup-dir', default=BACKUP_DIR)
+
+    commands.add_parser('status', help='Avancement de la dernière vérification')
+
+    findings = commands.add_parser('findings', help='Anomalies détectées')
+    findings.add_argument('--run', type=int, help='Vérification (par défaut la dernière)')
+
+    args = parser.parse_args()
+    state = ScrubState(args.state_db)
+
+    if args.command == 'status':
+        latest = state.latest_run()
+        if latest is None:
+            print('Aucune vérification')
+            return 0
+        done = sum(1 for _, finished in state.progress(latest['id']).values() if finished)
+        ended = f"terminée le {latest['finished_at']}" if latest['finished_at'] else 'inachevée'
+        print(f"Vérification {latest['id']} du {latest['started_at']}, {ended} : {done}/{len(key_ranges())} intervalles")
+        _print_stats(json.loads(latest['stats']))
+        return 0
+
+    if args.command == 'findings':
+        latest = state.latest_run()
+        run_id = args.run or (latest['id'] if latest else None)
+        for row in state.findings(run_id):
+            print(f"{row['found_at']}  {row['kind']:<8} {row['action']:<11} {row['key']}  {row['detail'] or ''}")
+        return 0
+
+    if not state.lock():
+        print('Une vérification est déjà en cours')
+        return 1
+
+    from app import connect_database, data_databases, get_storage, migrate
+
+    migrate()
+    scrubber = Scrubber(
+        get_storage(), data_databases(), connect_database, state, threads=args.threads, rate_mb=args.rate_mb,
+        grace_hours=args.grace_hours, dry_run=args.dry_run, quarantine_dir=args.quarantine_dir,
+        backup_dir=args.backup_dir
+    )
+    started = time.monotonic()
+    run_id, stats = scrubber.run(restart=args.restart)
+    print(f'Vérification {run_id} terminée en {time.monotonic() - started:.1f}s')
+    _print_stats(stats)
+    unresolved = [row for row in state.findings(run_id) if row['action'] in ('unrepaired', 'repairable')]
+    for row in unresolved:
+        print(f"✗ {row['kind']} {row['key']} ({row['action']})")
+    return 1 if unresolved else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,327 @@
+# Sessions côté serveur - Archive Platform
+"""Stockage des sessions côté serveur (optionnel).
+
+Par défaut Flask signe la session entière dans le cookie : chaque requête
+vérifie un HMAC et désérialise le cookie, et une déconnexion ne peut pas
+révoquer un cookie volé. Avec ``SESSION_BACKEND = 'sqlite'`` (ou
+``'memory'`` pour un seul processus) le cookie ne contient plus qu'un
+identifiant aléatoire de 192 bits ; les données sont dans la table
+``sessions``, derrière un petit cache LRU en mémoire.
+"""
+
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+SID_BYTES = 24  # 192 bits -> 32 caractères en base64 URL
+SID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{32}$')
+CACHE_SIZE = 4096  # sessions gardées en mémoire par worker
+CACHE_TTL = 5  # secondes : délai maximal de propagation d'une révocation
+TOUCH_INTERVAL = 60  # secondes entre deux prolongations en base d'une session
+
+serializer = TaggedJSONSerializer()
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session dont les données restent côté serveur"""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.modified = False
+        # clear() marque la session pour un nouvel identifiant (connexion,
+        # déconnexion) : protection contre la fixation de session
+        self.rotate = False
+
+    def clear(self):
+        super().clear()
+        self.rotate = True
+
+
+class SQLiteSessionStore:
+    """Sessions persistées dans la table ``sessions`` (partagée entre workers)"""
+
+    def __init__(self, connect):
+        self.connect = connect
+
+    def load(self, sid):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT data, expires_at FROM sessions WHERE sid = ?', (sid,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return serializer.loads(row['data']), datetime.fromisoformat(row['expires_at'])
+
+    def save(self, sid, user_id, data, expires_at):
+        conn = self.connect()
+        try:
+            conn.execute(
+                'INSERT INTO sessions (sid, user_id, data, expires_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (sid) DO UPDATE SET user_id = excluded.user_id, data = excluded.data, '
+                'expires_at = excluded.expires_at',
+                (sid, user_id, serializer.dumps(data), expires_at.isoformat())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def touch(self, sid, expires_at):
+        conn = self.connect()
+        try:
+            conn.execute('UPDATE sessions SET expires_at = ? WHERE sid = ?', (expires_at.isoformat(), sid))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete(self, sid):
+        conn = self.connect()
+        try:
+            conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete_user(self, user_id):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def purge_expired(self):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM sessions WHERE expires_at < ?', (datetime.now().isoformat(),))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+
+class MemorySessionStore:
+    """Sessions en mémoire (LRU borné), pour un serveur à processus unique"""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return None
+            self._data.move_to_end(sid)
+            _, data, expires_at = entry
+            return dict(data), expires_at
+
+    def save(self, sid, user_id, data, expires_at):
+        with self._lock:
+            self._data[sid] = (user_id, dict(data), expires_at)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            if sid in self._data:
+                user_id, data, _ = self._data[sid]
+                self._data[sid] = (user_id, data, expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            sids = [sid for sid, entry in self._data.items() if entry[0] == user_id]
+            for sid in sids:
+                del self._data[sid]
+            return len(sids)
+
+    def purge_expired(self):
+        now = datetime.now()
+        with self._lock:
+            sids = [sid for sid, entry in self._data.items() if entry[2] < now]
+            for sid in sids:
+                del self._data[sid]
+            return len(sids)
+
+
+class SessionCache:
+    """Cache LRU à courte durée de vie devant le stockage des sessions"""
+
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._data[sid]
+                return None
+            self._data.move_to_end(sid)
+            return entry[1]
+
+    def set(self, sid, value):
+        with self._lock:
+            self._data[sid] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            sids = [sid for sid, (_, value) in self._data.items() if value[0].get('user_id') == user_id]
+            for sid in sids:
+                del self._data[sid]
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Interface de session Flask : cookie = identifiant, données = stockage"""
+
+    def __init__(self, store, cache=None):
+        self.store = store
+        self.cache = cache or SessionCache()
+
+    def _lifetime(self, app):
+        lifetime = app.permanent_session_lifetime
+        return lifetime if isinstance(lifetime, timedelta) else timedelta(seconds=lifetime)
+
+    def _load(self, sid):
+        entry = self.cache.get(sid)
+        if entry is None:
+            entry = self.store.load(sid)
+            if entry is not None:
+                self.cache.set(sid, entry)
+        return entry
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        # Validation peu coûteuse : format de l'identifiant, puis existence
+        if not sid or not SID_PATTERN.match(sid):
+            return ServerSession()
+
+        entry = self._load(sid)
+        if entry is None:
+            return ServerSession()
+        data, expires_at = entry
+        if expires_at < datetime.now():
+            self.cache.discard(sid)
+            self.store.delete(sid)
+            return ServerSession()
+        return ServerSession(data, sid=sid, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        # Session vidée (déconnexion) ou régénérée (connexion) : l'ancien
+        # identifiant est révoqué côté serveur
+        if session.sid and (session.rotate or not session):
+            self.cache.discard(session.sid)
+            self.store.delete(session.sid)
+            if not session:
+                response.delete_cookie(name, domain=domain, path=path)
+                return
+            session.sid = None
+
+        if not session:
+            return
+
+        now = datetime.now()
+        lifetime = self._lifetime(app)
+        expires_at = now + lifetime
+
+        if session.sid is None or session.modified:
+            sid = session.sid or secrets.token_urlsafe(SID_BYTES)
+            data = dict(session)
+            self.store.save(sid, data.get('user_id'), data, expires_at)
+            self.cache.set(sid, (data, expires_at))
+            session.sid = sid
+        elif session.expires_at - now < lifetime - timedelta(seconds=TOUCH_INTERVAL):
+            # Expiration glissante : prolongée au plus une fois par minute
+            self.store.touch(session.sid, expires_at)
+            self.cache.set(session.sid, (dict(session), expires_at))
+        else:
+            return
+
+        response.set_cookie(
+            name,
+            session.sid,
+            max_age=int(lifetime.total_seconds()) if session.permanent else None,
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+        response.vary.add('Cookie')
+
+    def revoke_user(self, user_id):
+        """Révoque toutes les sessions d'un utilisateur (tous appareils)"""
+        self.cache.discard_user(user_id)
+        return self.store.delete_user(user_id)
+
+
+def create_sessions_table(cursor):
+    """Crée la table des sessions côté serveur"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            sid TEXT PRIMARY KEY,
+            user_id INTEGER,
+            data TEXT NOT NULL,
+            expires_at TIMESTAMP NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)')
+
+
+def init_sessions(app, connect):
+    """Installe le backend de session choisi par ``SESSION_BACKEND``"""
+    backend = app.config.get('SESSION_BACKEND', 'cookie')
+    if backend == 'sqlite':
+        app.session_interface = ServerSideSessionInterface(SQLiteSessionStore(connect))
+    elif backend == 'memory':
+        app.session_interface = ServerSideSessionInterface(MemorySessionStore())
+    elif backend != 'cookie':
+        raise ValueError(f'SESSION_BACKEND inconnu : {backend}')
+
+
+def revoke_user_sessions(app, user_id):
+    """Révoque les sessions d'un utilisateur ; retourne None avec les cookies signés"""
+    interface = app.session_interface
+    if isinstance(interface, ServerSideSessionInterface):
+        return interface.revoke_user(user_id)
+    return None
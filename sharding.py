@@ -0,0 +1,328 @@
+# Répartition des données par utilisateur - Archive Platform
+"""Répartition optionnelle des données sur plusieurs fichiers SQLite.
+
+SQLite n'admet qu'un écrivain à la fois par fichier : avec une base unique,
+les écritures de tous les utilisateurs se sérialisent. Avec
+``DB_SHARD_MODE`` :
+
+- ``'bucket'`` : un fichier par groupe d'utilisateurs
+  (``user_id % DB_SHARD_BUCKETS``) ;
+- ``'user'`` : un fichier par utilisateur.
+
+La base principale (``database.db``) devient le catalogue : utilisateurs,
+connexion, sessions et table ``shard_placement`` (répertoire de chaque
+fichier de données). Chaque fichier de données a le schéma complet et
+contient les dossiers, fichiers, notes, étiquettes, tâches et journaux de
+ses utilisateurs ; les identifiants ne sont uniques qu'au sein d'un fichier,
+ce qui suffit puisque toute requête est restreinte à un utilisateur.
+
+Un fichier est placé à sa première utilisation dans le répertoire
+(``DB_SHARD_DIRS``, un par volume) qui en contient le moins, puis peut être
+déplacé à chaud (``python sharding.py rebalance``) : les lectures continuent
+pendant la copie, les écritures de ce fichier attendent (``BEGIN
+IMMEDIATE``) puis, une fois le catalogue mis à jour, l'ancien fichier
+refuse toute écriture (triggers ``RAISE``) avant d'être supprimé : une
+connexion ouverte sur l'ancien emplacement ne peut pas perdre d'écriture.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from urllib.request import pathname2url
+
+MODES = ('bucket', 'user')
+DEFAULT_BUCKETS = 64
+CACHE_TTL = 5  # secondes : délai maximal de prise en compte d'un déplacement
+MOVED_MESSAGE = 'shard moved'
+
+
+def create_placement_table(cursor):
+    """Emplacement des fichiers de données (appelée par init_db)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shard_placement (
+            bucket INTEGER PRIMARY KEY,
+            directory TEXT NOT NULL,
+            moved_at TIMESTAMP
+        )
+    ''')
+
+
+def is_moved_error(error):
+    """True si une écriture a visé un fichier déplacé entre-temps"""
+    return isinstance(error, sqlite3.IntegrityError) and str(error) == MOVED_MESSAGE
+
+
+def _connect(path, must_exist=False, factory=sqlite3.Connection):
+    if must_exist:
+        # mode=rw : un fichier supprimé par un déplacement n'est pas recréé vide
+        conn = sqlite3.connect('file:' + pathname2url(os.path.abspath(path)) + '?mode=rw', uri=True, factory=factory)
+    else:
+        conn = sqlite3.connect(path, factory=factory)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class ShardRouter:
+    """Fichier de données de chaque utilisateur.
+
+    ``initialize(path)`` met un fichier de données au schéma courant ; il
+    est appelé à la création d'un fichier (voir ``migrate()`` pour les
+    fichiers existants). ``factory`` : classe des connexions aux fichiers
+    de données (mesure des requêtes, voir query_log.py).
+    """
+
+    def __init__(self, catalog_path, mode='', buckets=DEFAULT_BUCKETS, directories=('shards',), initialize=None,
+                 factory=sqlite3.Connection):
+        if mode and mode not in MODES:
+            raise ValueError('DB_SHARD_MODE inconnu : ' + mode)
+        self.catalog_path = catalog_path
+        self.mode = mode
+        self.buckets = buckets
+        self.directories = list(directories)
+        self.initialize = initialize
+        self.factory = factory
+        self._cache = {}  # bucket -> (chemin, instant de lecture)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.mode)
+
+    def bucket_for(self, user_id):
+        return user_id if self.mode == 'user' else user_id % self.buckets
+
+    def filename(self, bucket):
+        if self.mode == 'user':
+            return 'user-' + str(bucket) + '.db'
+        return 'bucket-' + str(bucket).zfill(4) + '.db'
+
+    def connect_catalog(self):
+        return _connect(self.catalog_path)
+
+    def connect(self, user_id):
+        """Connexion au fichier de données de l'utilisateur"""
+        bucket = self.bucket_for(user_id)
+        try:
+            return _connect(self.path_for(bucket), must_exist=True, factory=self.factory)
+        except sqlite3.OperationalError:
+            # Emplacement en cache périmé (fichier déplacé puis supprimé)
+            self.invalidate()
+            return _connect(self.path_for(bucket), must_exist=True, factory=self.factory)
+
+    def path_for(self, bucket):
+        cached = self._cache.get(bucket)
+        if cached is not None and time.monotonic() - cached[1] < CACHE_TTL:
+            return cached[0]
+        directory = self._lookup(bucket)
+        if directory is None:
+            directory = self._place(bucket)
+        path = os.path.join(directory, self.filename(bucket))
+        self._cache[bucket] = (path, time.monotonic())
+        return path
+
+    def invalidate(self):
+        self._cache.clear()
+
+    def _lookup(self, bucket):
+        conn = self.connect_catalog()
+        try:
+            row = conn.execute('SELECT directory FROM shard_placement WHERE bucket = ?', (bucket,)).fetchone()
+        finally:
+            conn.close()
+        return row['directory'] if row else None
+
+    def placements(self):
+        """Liste des (bucket, répertoire) placés"""
+        conn = self.connect_catalog()
+        try:
+            return [tuple(row) for row in conn.execute('SELECT bucket, directory FROM shard_placement ORDER BY bucket')]
+        finally:
+            conn.close()
+
+    def shard_paths(self):
+        """Chemins de tous les fichiers de données existants"""
+        if not self.enabled:
+            return []
+        return [os.path.join(directory, self.filename(bucket)) for bucket, directory in self.placements()]
+
+    def _place(self, bucket):
+        """Premier usage d'un bucket : répertoire le moins chargé, puis schéma"""
+        with self._lock:
+            conn = self.connect_catalog()
+            try:
+                counts = dict(conn.execute('SELECT directory, COUNT(*) FROM shard_placement GROUP BY directory'))
+                directory = min(self.directories, key=lambda d: counts.get(d, 0))
+                # Un autre processus a pu placer ce bucket entre-temps : sa
+                # décision l'emporte
+                conn.execute(
+                    'INSERT OR IGNORE INTO shard_placement (bucket, directory) VALUES (?, ?)',
+                    (bucket, directory)
+                )
+                conn.commit()
+                directory = conn.execute(
+                    'SELECT directory FROM shard_placement WHERE bucket = ?', (bucket,)
+                ).fetchone()['directory']
+            finally:
+                conn.close()
+        os.makedirs(directory, exist_ok=True)
+        if self.initialize is not None:
+            self.initialize(os.path.join(directory, self.filename(bucket)))
+        return directory
+
+    # -- Déplacements ---------------------------------------------------
+
+    def move(self, bucket, directory, busy_timeout=60):
+        """Déplace à chaud le fichier d'un bucket ; retourne False s'il y est déjà"""
+        source_dir = self._lookup(bucket)
+        if source_dir is None:
+            raise ValueError('bucket ' + str(bucket) + ' non placé')
+        if os.path.abspath(source_dir) == os.path.abspath(directory):
+            return False
+        source = os.path.join(source_dir, self.filename(bucket))
+        target = os.path.join(directory, self.filename(bucket))
+        os.makedirs(directory, exist_ok=True)
+
+        # Verrou d'écriture sur la source : les écrivains attendent, les
+        # lecteurs continuent (journal rollback) ; la copie se fait par une
+        # autre connexion, la sauvegarde SQLite ne pouvant pas lire depuis
+        # la connexion qui détient le verrou
+        lock = sqlite3.connect(source, timeout=busy_timeout, isolation_level=None)
+        try:
+            lock.execute('BEGIN IMMEDIATE')
+            try:
+                reader = sqlite3.connect(source)
+                copy = sqlite3.connect(target + '.tmp')
+                try:
+                    reader.backup(copy)
+                finally:
+                    copy.close()
+                    reader.close()
+                os.replace(target + '.tmp', target)
+                _refuse_writes(lock)
+
+                catalog = self.connect_catalog()
+                try:
+                    catalog.execute(
+                        'UPDATE shard_placement SET directory = ?, moved_at = CURRENT_TIMESTAMP WHERE bucket = ?',
+                        (directory, bucket)
+                    )
+                    catalog.commit()
+                finally:
+                    catalog.close()
+            except Exception:
+                lock.execute('ROLLBACK')
+                for path in (target + '.tmp', target):
+                    if os.path.exists(path):
+                        os.remove(path)
+                raise
+            lock.execute('COMMIT')
+        finally:
+            lock.close()
+
+        self.invalidate()
+        for path in (source, source + '-journal', source + '.migrate.lock'):
+            if os.path.exists(path):
+                os.remove(path)
+        return True
+
+    def directory_usage(self):
+        """Taille totale (octets) et buckets de chaque répertoire configuré"""
+        usage = {directory: [0, []] for directory in self.directories}
+        for bucket, directory in self.placements():
+            entry = usage.setdefault(directory, [0, []])
+            path = os.path.join(directory, self.filename(bucket))
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            entry[0] += size
+            entry[1].append((size, bucket))
+        return usage
+
+    def plan_rebalance(self):
+        """Déplacements (bucket, depuis, vers) qui égalisent la taille des répertoires.
+
+        Les répertoires retirés de ``DB_SHARD_DIRS`` sont vidés ; sinon le
+        plus gros bucket qui réduit l'écart entre le répertoire le plus
+        chargé et le moins chargé est déplacé, jusqu'à ce qu'aucun ne le
+        réduise.
+        """
+        usage = self.directory_usage()
+        moves = []
+        for directory in [d for d in usage if d not in self.directories]:
+            for size, bucket in usage.pop(directory)[1]:
+                target = min(self.directories, key=lambda d: usage[d][0])
+                moves.append((bucket, directory, target))
+                usage[target][0] += size
+                usage[target][1].append((size, bucket))
+
+        while len(usage) > 1:
+            fullest = max(usage, key=lambda d: usage[d][0])
+            emptiest = min(usage, key=lambda d: usage[d][0])
+            gap = usage[fullest][0] - usage[emptiest][0]
+            candidates = [item for item in usage[fullest][1] if 0 < item[0] < gap]
+            if not candidates:
+                break
+            size, bucket = max(candidates)
+            usage[fullest][1].remove((size, bucket))
+            usage[fullest][0] -= size
+            usage[emptiest][1].append((size, bucket))
+            usage[emptiest][0] += size
+            moves.append((bucket, fullest, emptiest))
+        return moves
+
+
+def _refuse_writes(conn):
+    """Ancien emplacement : toute écriture échoue (connexions ouvertes avant le déplacement)"""
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+        "AND sql NOT LIKE 'CREATE VIRTUAL%'"
+    ).fetchall()]
+    # Les tables virtuelles (FTS5) sont couvertes par leurs tables internes
+    for table in tables:
+        for operation in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(
+                'CREATE TRIGGER "moved_' + table + '_' + operation.lower() + '" BEFORE ' + operation
+                + ' ON "' + table + "\" BEGIN SELECT RAISE(ABORT, '" + MOVED_MESSAGE + "'); END"
+            )
+
+
+def _print_status(router):
+    for directory, (size, buckets) in router.directory_usage().items():
+        marker = '' if directory in router.directories else '  (retiré)'
+        print(f'{directory:30} {len(buckets):6} fichier(s) {size / 1024 / 1024:10.1f} Mo{marker}')
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description='Fichiers de données répartis (DB_SHARD_MODE)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help='Fichiers et taille par répertoire')
+    move_parser = commands.add_parser('move', help='Déplacer un bucket')
+    move_parser.add_argument('bucket', type=int)
+    move_parser.add_argument('directory')
+    rebalance_parser = commands.add_parser('rebalance', help='Égaliser les répertoires de DB_SHARD_DIRS')
+    rebalance_parser.add_argument('--dry-run', action='store_true', help='Afficher le plan sans rien déplacer')
+    args = parser.parse_args()
+
+    from app import migrate, shard_router
+
+    if not shard_router.enabled:
+        sys.exit('DB_SHARD_MODE n\'est pas défini : base unique')
+    migrate()
+
+    if args.command == 'status':
+        _print_status(shard_router)
+    elif args.command == 'move':
+        started = time.monotonic()
+        moved = shard_router.move(args.bucket, args.directory)
+        print(f'bucket {args.bucket} : ' + (f'déplacé en {time.monotonic() - started:.2f}s' if moved else 'déjà en place'))
+    else:
+        for bucket, source, target in shard_router.plan_rebalance():
+            if args.dry_run:
+                print(f'bucket {bucket} : {source} -> {target}')
+                continue
+            started = time.monotonic()
+            shard_router.move(bucket, target)
+            print(f'bucket {bucket} : {source} -> {target} ({time.monotonic() - started:.2f}s)')
+        _print_status(shard_router)
@@ -71,6 +71,12 @@ function deleteFile(fileId) {
 
 // Note Functions
 function editNote(noteId, title, content) {
+    // Valeurs lues sur la carte (tenue à jour par les événements /events)
+    if (title === undefined) {
+        const card = findCard('note', noteId);
+        title = card.querySelector('[data-field="title"]').textContent;
+        content = card.querySelector('[data-field="content"]').textContent;
+    }
     // Open modal with existing values
     openCreateNoteModal();
     document.getElementById('note_title').value = title;
@@ -159,3 +165,269 @@ document.querySelectorAll('.modal, .fixed').forEach(modal => {
         }
     });
 });
+
+// Chunked Upload (fichiers > 8MB) : reprenable après une coupure réseau
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+const CHUNK_PARALLELISM = 3;
+const CHUNK_RETRIES = 5;
+
+async function sha256Hex(blob) {
+    const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function startOrResumeUpload(file, folderId) {
+    const resumeKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+    const previousId = localStorage.getItem(resumeKey);
+    if (previousId) {
+        const response = await fetch(`/uploads/${previousId}`);
+        if (response.ok) {
+            return { resumeKey, ...(await response.json()) };
+        }
+        localStorage.removeItem(resumeKey);
+    }
+    const response = await fetch('/uploads', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size, folder_id: folderId })
+    });
+    const upload = await response.json();
+    if (!response.ok) {
+        throw new Error(upload.error || 'Upload refusé');
+    }
+    localStorage.setItem(resumeKey, upload.upload_id);
+    return { resumeKey, received: [], ...upload };
+}
+
+async function sendChunk(file, upload, index) {
+    const chunk = file.slice(index * upload.chunk_size, (index + 1) * upload.chunk_size);
+    const checksum = await sha256Hex(chunk);
+    for (let attempt = 0; attempt < CHUNK_RETRIES; attempt++) {
+        try {
+            const response = await fetch(`/uploads/${upload.upload_id}/chunks/${index}`, {
+                method: 'PUT',
+                headers: { 'X-Chunk-SHA256': checksum },
+                body: chunk
+            });
+            if (response.ok) {
+                return;
+            }
+            if (response.status < 500 && response.status !== 422 && response.status !== 429) {
+                break;
+            }
+        } catch (e) {
+            // Erreur réseau : nouvelle tentative
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+    }
+    throw new Error(`Échec de l'envoi du morceau ${index}`);
+}
+
+async function chunkedUpload(file, folderId) {
+    const upload = await startOrResumeUpload(file, folderId);
+    const received = new Set(upload.received);
+    const pending = [];
+    for (let i = 0; i < upload.chunk_count; i++) {
+        if (!received.has(i)) {
+            pending.push(i);
+        }
+    }
+    // Plusieurs morceaux en vol simultanément
+    const senders = Array.from({ length: CHUNK_PARALLELISM }, async () => {
+        while (pending.length) {
+            await sendChunk(file, upload, pending.shift());
+        }
+    });
+    await Promise.all(senders);
+
+    const response = await fetch(`/uploads/${upload.upload_id}/complete`, { method: 'POST' });
+    if (!response.ok) {
+        throw new Error((await response.json()).error || 'Finalisation impossible');
+    }
+    localStorage.removeItem(upload.resumeKey);
+}
+
+const uploadForm = document.querySelector('#uploadModal form');
+if (uploadForm) {
+    uploadForm.addEventListener('submit', async function(e) {
+        const file = this.querySelector('input[type="file"]').files[0];
+        if (!file || file.size <= CHUNKED_UPLOAD_THRESHOLD || !window.crypto || !crypto.subtle) {
+            return;  // Upload classique du formulaire
+        }
+        e.preventDefault();
+        const folderValue = this.querySelector('input[name="folder_id"]').value;
+        const submitButton = this.querySelector('button[type="submit"]');
+        submitButton.disabled = true;
+        try {
+            await chunkedUpload(file, folderValue ? parseInt(folderValue, 10) : null);
+            window.location.reload();
+        } catch (err) {
+            alert(err.message);
+            submitButton.disabled = false;
+        }
+    });
+}
+
+// Mises à jour en direct : flux Server-Sent Events (/events) appliqué au DOM
+const CARD_GRIDS = { folder: 'foldersGrid', note: 'notesGrid', file: 'filesGrid' };
+const CARD_TEMPLATES = { folder: 'folderCardTemplate', note: 'noteCardTemplate', file: 'fileCardTemplate' };
+const LIVE_RETRY_DELAY = 30000;
+
+function findCard(kind, id) {
+    return document.querySelector(`[data-kind="${kind}"][data-id="${Number(id)}"]`);
+}
+
+// Les jetons des modèles ne sont remplacés que par des identifiants
+// numériques ou des noms de stockage validés ; les textes passent par textContent
+function cloneTemplate(templateId, replacements) {
+    let html = document.getElementById(templateId).innerHTML;
+    for (const [token, value] of Object.entries(replacements)) {
+        html = html.split(token).join(value);
+    }
+    const wrapper = document.createElement('div');
+    wrapper.innerHTML = html.trim();
+    return wrapper.firstElementChild;
+}
+
+function storedFilename(name) {
+    return /^[A-Za-z0-9_.-]+$/.test(name || '') ? name : '';
+}
+
+function setField(card, field, value) {
+    const element = card.querySelector(`[data-field="${field}"]`);
+    if (element) {
+        element.textContent = value;
+    }
+    return element;
+}
+
+function fillCard(card, kind, data) {
+    if (kind === 'folder') {
+        setField(card, 'name', data.name);
+    } else if (kind === 'note') {
+        setField(card, 'title', data.title);
+        setField(card, 'content', data.content || '');
+    } else if (kind === 'file') {
+        setField(card, 'original_name', data.original_name).title = data.original_name;
+        setField(card, 'size', `${((data.file_size || 0) / 1024).toFixed(2)} KB`);
+    }
+}
+
+function applyLabelChange(change) {
+    const data = change.data || {};
+    const select = document.getElementById('label_id_select');
+    if (change.action === 'created' && select) {
+        const option = document.createElement('option');
+        option.value = String(Number(change.id));
+        option.textContent = data.name;
+        select.appendChild(option);
+    } else if (change.action === 'deleted') {
+        document.querySelectorAll(`[data-label-id="${Number(change.id)}"]`).forEach(chip => chip.remove());
+        if (select) {
+            select.querySelectorAll(`option[value="${Number(change.id)}"]`).forEach(option => option.remove());
+        }
+    }
+}
+
+function applyFolderLabelChange(change) {
+    const data = change.data || {};
+    const card = findCard('folder', data.folder_id);
+    if (!card) {
+        return;
+    }
+    const existing = card.querySelector(`[data-label-id="${Number(data.label_id)}"]`);
+    if (change.action === 'unlabeled') {
+        if (existing) {
+            existing.remove();
+        }
+    } else if (!existing) {
+        const chip = cloneTemplate('labelChipTemplate', {
+            '__FOLDER_ID__': String(Number(data.folder_id)),
+            '__LABEL_ID__': String(Number(data.label_id)),
+        });
+        chip.style.backgroundColor = data.color;
+        chip.querySelector('span').textContent = data.name;
+        card.querySelector('[data-field="labels"]').appendChild(chip);
+    }
+}
+
+// Retourne false si la page doit être rechargée (section absente du DOM)
+function applyChange(change, currentFolder) {
+    if (change.kind === 'label') {
+        applyLabelChange(change);
+        return true;
+    }
+    if (change.action === 'labeled' || change.action === 'unlabeled') {
+        applyFolderLabelChange(change);
+        return true;
+    }
+    if (!(change.kind in CARD_GRIDS)) {
+        return true;  // tâches d'arrière-plan : seulement l'événement archive:change
+    }
+
+    let card = findCard(change.kind, change.id);
+    if (change.action === 'deleted') {
+        if (card) {
+            card.remove();
+        }
+        return true;
+    }
+
+    const inView = (change.folder_id === null ? '' : String(change.folder_id)) === currentFolder;
+    if (!inView) {
+        if (card) {
+            card.remove();  // déplacé vers un autre dossier
+        }
+        return true;
+    }
+    if (!card) {
+        const grid = document.getElementById(CARD_GRIDS[change.kind]);
+        if (!grid) {
+            return false;
+        }
+        card = cloneTemplate(CARD_TEMPLATES[change.kind], {
+            '__ID__': String(Number(change.id)),
+            '__FILENAME__': storedFilename((change.data || {}).filename),
+        });
+        grid.appendChild(card);
+    }
+    fillCard(card, change.kind, change.data || {});
+    return true;
+}
+
+function startLiveUpdates(since) {
+    const root = document.getElementById('dashboardRoot');
+    if (!root || !window.EventSource) {
+        return;
+    }
+    let lastId = since;
+    const source = new EventSource(`${root.dataset.eventsUrl}?since=${encodeURIComponent(lastId)}`);
+
+    source.addEventListener('change', function(e) {
+        lastId = e.lastEventId || lastId;
+        const change = JSON.parse(e.data);
+        if (!applyChange(change, root.dataset.currentFolder)) {
+            source.close();
+            window.location.reload();
+            return;
+        }
+        document.dispatchEvent(new CustomEvent('archive:change', { detail: change }));
+    });
+    // Modifications manquées (journal purgé) : rendu complet
+    source.addEventListener('reset', function() {
+        source.close();
+        window.location.reload();
+    });
+    // Refus du serveur (503 : trop de flux) : EventSource ne réessaie pas seul
+    source.addEventListener('error', function() {
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(() => startLiveUpdates(lastId), LIVE_RETRY_DELAY);
+        }
+    });
+    window.addEventListener('beforeunload', () => source.close());
+}
+
+const dashboardRoot = document.getElementById('dashboardRoot');
+if (dashboardRoot) {
+    startLiveUpdates(dashboardRoot.dataset.changeCursor);
+}
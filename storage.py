@@ -0,0 +1,326 @@
+# Stockage des fichiers uploadés - Archive Platform
+"""Abstraction du stockage des fichiers (put / get / stream / delete / stat / list).
+
+- ``LocalStorage`` : un fichier par upload dans ``UPLOAD_FOLDER`` ;
+- ``S3Storage`` : tout service compatible S3 (AWS, MinIO...), avec pool de
+  connexions, uploads multipart en parallèle et téléchargements par URL
+  présignée (les octets ne passent plus par les workers de l'application) ;
+- ``PackStorage`` (``packstore.py``) : ``LocalStorage`` dont les petits
+  fichiers sont regroupés dans des segments en ajout seul.
+
+Les clés sont les noms uniques générés à l'upload (``<uuid>_<nom>``).
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from contextlib import contextmanager
+
+CHUNK_SIZE = 64 * 1024
+
+BlobStat = namedtuple('BlobStat', ['key', 'size', 'modified'])
+
+
+class StorageError(Exception):
+    """Erreur du stockage (clé invalide, service indisponible...)"""
+
+
+def validate_key(key):
+    """Refuse les clés qui pourraient sortir du stockage (path traversal)"""
+    if not key or '/' in key or '\\' in key or key.startswith('.') or '\x00' in key:
+        raise StorageError(f'Clé de stockage invalide : {key!r}')
+    return key
+
+
+class LocalStorage:
+    """Stockage sur le système de fichiers local"""
+
+    def __init__(self, root):
+        # Chemin absolu : Flask résoudrait un chemin relatif depuis app.root_path
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, validate_key(key))
+
+    def put(self, key, fileobj):
+        """Écrit le contenu de ``fileobj`` sous ``key`` et retourne sa taille"""
+        path = self.path(key)
+        # Écriture dans un fichier temporaire puis renommage atomique : un
+        # upload interrompu ne laisse jamais de fichier partiel sous la clé
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(fileobj, f, CHUNK_SIZE)
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return size
+
+    def put_file(self, key, src_path):
+        """Déplace un fichier local déjà complet sous ``key`` (sans recopie)"""
+        path = self.path(key)
+        try:
+            os.replace(src_path, path)
+        except OSError:
+            # Autre système de fichiers : copie puis suppression
+            shutil.move(src_path, path)
+        return os.path.getsize(path)
+
+    def get(self, key):
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def stream(self, key, chunk_size=CHUNK_SIZE):
+        with open(self.path(key), 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def stat(self, key):
+        try:
+            st = os.stat(self.path(key))
+        except FileNotFoundError:
+            return None
+        return BlobStat(key, st.st_size, st.st_mtime)
+
+    def list(self, start='', end=None):
+        """Fichiers de clé ``start <= clé < end``, triés par clé.
+
+        Les fichiers cachés (temporaires ``.tmp-``, morceaux ``.chunks``) ne
+        sont pas des clés. Le répertoire est parcouru en entier mais seules
+        les clés de l'intervalle sont gardées en mémoire.
+        """
+        blobs = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith('.') or name < start or (end is not None and name >= end):
+                    continue
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue  # supprimé pendant le parcours
+                blobs.append(BlobStat(name, st.st_size, st.st_mtime))
+        blobs.sort()
+        return iter(blobs)
+
+    def presigned_url(self, key, filename, expires_in=300, content_encoding=None):
+        """Pas d'URL présignée en local : le fichier est servi par l'application"""
+        return None
+
+
+class S3Storage:
+    """Stockage objet compatible S3 (boto3 requis)"""
+
+    def __init__(self, bucket, endpoint_url=None, region=None, access_key_id=None,
+                 secret_access_key=None, max_pool_connections=32,
+                 multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024,
+                 max_concurrency=8):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config as BotoConfig
+        except ImportError:
+            raise StorageError('STORAGE_BACKEND=s3 nécessite le paquet boto3')
+
+        self.bucket = bucket
+        # Un seul client (thread-safe) par processus : le pool de connexions
+        # HTTP est partagé entre toutes les requêtes du worker
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            config=BotoConfig(
+                max_pool_connections=max_pool_connections,
+                retries={'max_attempts': 5, 'mode': 'adaptive'},
+                signature_version='s3v4',
+            ),
+        )
+        # Multipart au-delà du seuil, parties envoyées en parallèle
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True,
+        )
+
+    def _is_missing(self, error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    @contextmanager
+    def _errors(self, key):
+        """Erreurs boto3 traduites dans celles des autres drivers : objet
+        absent -> ``FileNotFoundError``, autre échec -> ``StorageError``"""
+        from boto3.exceptions import Boto3Error
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        try:
+            yield
+        except ClientError as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(f'Objet S3 absent : {key}') from e
+            raise StorageError(f'Erreur S3 ({key}) : {e}') from e
+        except (BotoCoreError, Boto3Error) as e:
+            raise StorageError(f'Erreur S3 ({key}) : {e}') from e
+
+    def put(self, key, fileobj):
+        validate_key(key)
+        counter = _CountingReader(fileobj)
+        with self._errors(key):
+            self.client.upload_fileobj(counter, self.bucket, key, Config=self.transfer_config)
+        return counter.size
+
+    def put_file(self, key, src_path):
+        validate_key(key)
+        size = os.path.getsize(src_path)
+        with self._errors(key):
+            self.client.upload_file(src_path, self.bucket, key, Config=self.transfer_config)
+        os.remove(src_path)
+        return size
+
+    def get(self, key):
+        with self._errors(key):
+            response = self.client.get_object(Bucket=self.bucket, Key=validate_key(key))
+            return response['Body'].read()
+
+    def open(self, key):
+        with self._errors(key):
+            response = self.client.get_object(Bucket=self.bucket, Key=validate_key(key))
+        return response['Body']
+
+    def stream(self, key, chunk_size=CHUNK_SIZE):
+        body = self.open(key)
+        try:
+            with self._errors(key):
+                for chunk in body.iter_chunks(chunk_size):
+                    yield chunk
+        finally:
+            body.close()
+
+    def delete(self, key):
+        # DELETE est idempotent côté S3 (succès même si la clé est absente) ;
+        # une clé absente signalée par un service compatible retourne False
+        try:
+            with self._errors(key):
+                self.client.delete_object(Bucket=self.bucket, Key=validate_key(key))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def stat(self, key):
+        try:
+            with self._errors(key):
+                head = self.client.head_object(Bucket=self.bucket, Key=validate_key(key))
+        except FileNotFoundError:
+            return None
+        return BlobStat(key, head['ContentLength'], head['LastModified'].timestamp())
+
+    def list(self, start='', end=None):
+        """Objets de clé ``start <= clé < end``, triés par clé (ordre de S3)"""
+        if start:
+            # StartAfter exclut la borne elle-même
+            first = self.stat(start)
+            if first is not None:
+                yield first
+        paginator = self.client.get_paginator('list_objects_v2')
+        params = {'Bucket': self.bucket}
+        if start:
+            params['StartAfter'] = start
+        with self._errors(self.bucket):
+            for page in paginator.paginate(**params):
+                for obj in page.get('Contents', []):
+                    key = obj['Key']
+                    if end is not None and key >= end:
+                        return
+                    if not key.startswith('.') and '/' not in key:
+                        yield BlobStat(key, obj['Size'], obj['LastModified'].timestamp())
+
+    def presigned_url(self, key, filename, expires_in=300, content_encoding=None):
+        """URL de téléchargement direct, valable ``expires_in`` secondes"""
+        params = {
+            'Bucket': self.bucket,
+            'Key': validate_key(key),
+            'ResponseContentDisposition': f'attachment; filename="{filename}"',
+        }
+        if content_encoding:
+            # Objet compressé au repos, décompressé par le client
+            params['ResponseContentEncoding'] = content_encoding
+        with self._errors(key):
+            return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+
+
+class _CountingReader:
+    """Enveloppe un flux en lecture pour compter les octets envoyés"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.size += len(data)
+        return data
+
+
+class ChecksumReader(_CountingReader):
+    """Compte et hache (SHA-256) les octets lus : empreinte du fichier stocké"""
+
+    def __init__(self, fileobj):
+        super().__init__(fileobj)
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.digest.update(data)
+        return data
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+def create_storage(config):
+    """Instancie le driver de stockage décrit par la configuration de l'application"""
+    backend = config.get('STORAGE_BACKEND', 'local')
+    if backend == 'local':
+        return LocalStorage(config['UPLOAD_FOLDER'])
+    if backend == 's3':
+        return S3Storage(
+            bucket=config['S3_BUCKET'],
+            endpoint_url=config.get('S3_ENDPOINT_URL'),
+            region=config.get('S3_REGION'),
+            access_key_id=config.get('S3_ACCESS_KEY_ID'),
+            secret_access_key=config.get('S3_SECRET_ACCESS_KEY'),
+            max_pool_connections=config.get('S3_MAX_POOL_CONNECTIONS', 32),
+            max_concurrency=config.get('S3_MAX_CONCURRENCY', 8),
+        )
+    if backend == 'packed':
+        from packstore import DEFAULT_MAX_BLOB_SIZE, DEFAULT_SEGMENT_SIZE, PackStorage
+
+        return PackStorage(
+            config['UPLOAD_FOLDER'],
+            max_blob_size=config.get('PACK_MAX_BLOB_SIZE', DEFAULT_MAX_BLOB_SIZE),
+            segment_size=config.get('PACK_SEGMENT_SIZE', DEFAULT_SEGMENT_SIZE),
+        )
+    raise StorageError(f'STORAGE_BACKEND inconnu : {backend}')
@@ -0,0 +1,127 @@
+# Handlers des tâches d'arrière-plan - Archive Platform
+"""Handlers exécutés par ``worker.py``.
+
+Les imports de ``app`` sont faits dans les fonctions : ce module est importé
+par ``app.py`` pour que les types de tâches soient connus des deux côtés.
+"""
+
+import io
+import os
+import tempfile
+
+from jobs import job_handler
+
+
+@job_handler('delete_blobs', concurrency=2, visibility_timeout=600)
+def delete_blobs(payload, job):
+    """Supprime du stockage les fichiers d'un dossier supprimé"""
+    from app import app, get_storage
+    from storage import StorageError
+
+    storage = get_storage()
+    # 'paths' : tâches déposées avant l'introduction des drivers de stockage
+    keys = payload.get('keys') or [os.path.basename(path) for path in payload.get('paths', [])]
+    deleted = 0
+    for key in keys:
+        try:
+            if storage.delete(key):
+                deleted += 1
+        except StorageError as e:
+            app.logger.warning(f'Skipping invalid storage key {key!r}: {e}')
+    return {'deleted': deleted}
+
+
+@job_handler('index_file', concurrency=2, visibility_timeout=600, max_attempts=3)
+def index_file(payload, job):
+    """Extrait le texte d'un fichier et l'ajoute à l'index plein texte"""
+    from app import get_db_connection, get_storage
+    import compression
+    import content_index
+    from storage import LocalStorage
+
+    file_id = payload['file_id']
+    conn = get_db_connection(job['user_id'])
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT user_id, filename, original_name, file_size, codec FROM files WHERE id = ?', (file_id,))
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return {'skipped': 'deleted'}
+
+    extension = row['original_name'].rsplit('.', 1)[-1].lower()
+    text = ''
+    if extension in content_index.INDEXABLE_EXTENSIONS and (row['file_size'] or 0) <= content_index.MAX_SOURCE_BYTES:
+        storage = get_storage()
+        if isinstance(storage, LocalStorage) and not row['codec']:
+            text = content_index.extract_in_pool(storage.path(row['filename']), extension)
+        else:
+            # Copie locale (décompressée) pour le processus d'extraction
+            chunks = storage.stream(row['filename'])
+            if row['codec']:
+                chunks = compression.decompress_stream(chunks, row['codec'])
+            with tempfile.NamedTemporaryFile(suffix='.' + extension) as tmp:
+                for chunk in chunks:
+                    tmp.write(chunk)
+                tmp.flush()
+                text = content_index.extract_in_pool(tmp.name, extension)
+
+    # Un texte vide est aussi enregistré : le fichier n'est plus à indexer
+    conn = get_db_connection(job['user_id'])
+    try:
+        content_index.index_document(conn, file_id, row['user_id'], text)
+        conn.commit()
+    finally:
+        conn.close()
+    return {'indexed_chars': len(text)}
+
+
+@job_handler('hash_images', concurrency=2, visibility_timeout=600, max_attempts=3)
+def hash_images(payload, job):
+    """Calcule les empreintes perceptuelles d'images (upload ou lot de remplissage)"""
+    from app import app, get_db_connection, get_storage
+    import compression
+    import image_hash
+    from storage import LocalStorage, StorageError
+
+    placeholders = ', '.join('?' * len(payload['file_ids']))
+    conn = get_db_connection(job['user_id'])
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT id, filename, original_name, file_size, codec FROM files WHERE id IN (' + placeholders + ')',
+            payload['file_ids']
+        )
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    storage = get_storage()
+    computed = {}
+    for row in rows:
+        if not image_hash.is_hashable(row['original_name']) or (row['file_size'] or 0) > image_hash.MAX_SOURCE_BYTES:
+            continue
+        try:
+            if isinstance(storage, LocalStorage) and not row['codec']:
+                hashes = image_hash.compute_hashes(storage.path(row['filename']))
+            else:
+                chunks = storage.stream(row['filename'])
+                if row['codec']:
+                    chunks = compression.decompress_stream(chunks, row['codec'])
+                hashes = image_hash.compute_hashes(io.BytesIO(b''.join(chunks)))
+        except (OSError, StorageError) as e:
+            # Fichier supprimé ou illisible : le reste du lot est traité
+            app.logger.warning(f'Skipping perceptual hash of file {row["id"]}: {e}')
+            continue
+        if hashes is not None:
+            computed[row['id']] = hashes
+
+    conn = get_db_connection(job['user_id'])
+    try:
+        for file_id, hashes in computed.items():
+            image_hash.store_hashes(conn, file_id, hashes)
+        conn.commit()
+    finally:
+        conn.close()
+    return {'hashed': len(computed), 'skipped': len(payload['file_ids']) - len(computed)}
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Performances du rendu des templates
+
+- cache de bytecode Jinja sur disque, partagé entre les workers Gunicorn ;
+- balise ``{% cache clé, ... %}...{% endcache %}`` pour mettre en cache des
+  fragments (navigation, palette d'étiquettes) par utilisateur ;
+- mesure du temps de rendu de chaque template (en-tête ``Server-Timing``).
+
+Usage en ligne de commande (précompilation lors du build de l'image) :
+    python templating.py
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, before_render_template, template_rendered
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+DEFAULT_CACHE_DIR = 'cache/jinja'
+FRAGMENT_CACHE_SIZE = 2048  # nombre maximal de fragments en mémoire par worker
+FRAGMENT_CACHE_TIMEOUT = 300  # secondes
+SLOW_RENDER_THRESHOLD = 0.2  # secondes
+
+
+class FragmentCache:
+    """Cache LRU borné avec expiration, propre à chaque processus"""
+
+    def __init__(self, max_entries=FRAGMENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+fragment_cache = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    """Balise ``{% cache 'nom', clé1, clé2 %}...{% endcache %}``.
+
+    Tous les arguments forment la clé du fragment : ils doivent inclure
+    l'utilisateur et une version des données affichées pour que le cache
+    ne serve jamais un contenu périmé.
+    """
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_cache_support', [nodes.List(args)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache_support(self, key_parts, caller):
+        key = tuple(key_parts)
+        value = fragment_cache.get(key)
+        if value is None:
+            # caller() retourne un Markup : il est conservé tel quel pour ne
+            # pas être échappé une seconde fois lors des rendus suivants
+            value = caller()
+            fragment_cache.set(key, value, FRAGMENT_CACHE_TIMEOUT)
+        return value
+
+
+# Statistiques de rendu par template : nom -> [nombre, durée totale, durée max]
+render_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record_render_start(sender, template, context, **extra):
+    g.setdefault('_render_starts', []).append(time.perf_counter())
+
+
+def _record_render_end(sender, template, context, **extra):
+    starts = g.get('_render_starts')
+    if not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    name = template.name or 'string'
+    g.setdefault('render_timings', []).append((name, duration))
+
+    with _stats_lock:
+        stats = render_stats.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] = max(stats[2], duration)
+
+    if duration > SLOW_RENDER_THRESHOLD:
+        sender.logger.warning(f'Slow template render: {name} took {duration * 1000:.1f}ms')
+
+
+def _add_server_timing(response):
+    timings = g.get('render_timings')
+    if timings:
+        value = ', '.join(
+            f'tpl;desc="{name}";dur={duration * 1000:.2f}' for name, duration in timings
+        )
+        response.headers.add('Server-Timing', value)
+    return response
+
+
+class LazyBytecodeCache(FileSystemBytecodeCache):
+    """Cache de bytecode dont le répertoire est créé à la première écriture :
+    importer l'application (master gunicorn, scripts) ne touche pas au disque"""
+
+    _directory_ready = False
+
+    def dump_bytecode(self, bucket):
+        if not self._directory_ready:
+            os.makedirs(self.directory, exist_ok=True)
+            self._directory_ready = True
+        super().dump_bytecode(bucket)
+
+
+def init_templating(app):
+    """Configure le cache de bytecode, le cache de fragments et la mesure du rendu"""
+    cache_dir = app.config.get('JINJA_CACHE_DIR') or DEFAULT_CACHE_DIR
+
+    # Doit être appelé avant le premier accès à app.jinja_env
+    app.jinja_options = dict(
+        app.jinja_options,
+        bytecode_cache=LazyBytecodeCache(cache_dir),
+        extensions=list(app.jinja_options.get('extensions', ())) + [FragmentCacheExtension],
+    )
+
+    before_render_template.connect(_record_render_start, app)
+    template_rendered.connect(_record_render_end, app)
+    app.after_request(_add_server_timing)
+
+
+def precompile_templates(app):
+    """Compile tous les templates pour remplir le cache de bytecode"""
+    env = app.jinja_env
+    count = 0
+    for name in env.list_templates(extensions=['html']):
+        env.get_template(name)
+        count += 1
+    return count
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app
+
+    print("Précompilation des templates...")
+    count = precompile_templates(app)
+    print(f"✓ {count} templates compilés dans {app.config['JINJA_CACHE_DIR']}")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests du pipeline des fichiers statiques (assets.py) : déduplication par
+empreinte, variantes .gz/.br, noms empreintés émis par url_for.
+
+Usage :
+    python test_assets.py
+"""
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask, url_for
+
+import assets
+
+SCRIPT = ''.join(f'// étape {i}\nfunction step{i}() {{\n    return {i};\n}}\n' for i in range(60))
+
+
+class BuildTest(unittest.TestCase):
+    def setUp(self):
+        self.static_dir = tempfile.mkdtemp(prefix='test_assets_')
+        self.write('js/app.js', SCRIPT)
+        self.write('js/app-enhanced.js', SCRIPT)  # copie identique
+        self.write('js/app-tailwind.js', SCRIPT)
+        self.write('js/dashboard.js', 'loadDashboard();\n')
+        self.write('css/style.css', 'body {\n    color: red;\n}\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.static_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.static_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def published(self):
+        dist_dir = os.path.join(self.static_dir, assets.DIST_DIRNAME)
+        return sorted(os.path.relpath(os.path.join(root, name), self.static_dir)
+                      for root, _, names in os.walk(dist_dir) for name in names)
+
+    def read(self, name):
+        with open(os.path.join(self.static_dir, name), 'rb') as f:
+            return f.read()
+
+    def test_identical_contents_are_published_once(self):
+        manifest = assets.build(self.static_dir)
+        self.assertEqual(manifest['js/app.js'], manifest['js/app-enhanced.js'])
+        self.assertEqual(manifest['js/app.js'], manifest['js/app-tailwind.js'])
+        self.assertRegex(manifest['js/dashboard.bundle.js'], r'^dist/js/dashboard\.bundle\.[0-9a-f]{8}\.js$')
+        self.assertEqual(len(set(manifest.values())), 4)
+
+        with open(os.path.join(self.static_dir, assets.DIST_DIRNAME, assets.MANIFEST_NAME)) as f:
+            self.assertEqual(json.load(f), manifest)
+        with open(os.path.join(self.static_dir, manifest['js/dashboard.bundle.js']), encoding='utf-8') as f:
+            bundle = f.read()
+        self.assertNotIn('// étape', bundle)
+        self.assertTrue(bundle.endswith('\n;\nloadDashboard();\n'))
+
+        # Build reproductible : mêmes noms, mêmes octets
+        before = {name: self.read(name) for name in self.published()}
+        self.assertEqual(assets.build(self.static_dir), manifest)
+        self.assertEqual({name: self.read(name) for name in self.published()}, before)
+
+    def test_precompressed_variants(self):
+        manifest = assets.build(self.static_dir)
+        script = manifest['js/app.js']
+        published = self.published()
+        self.assertIn(script + '.gz', published)
+        self.assertEqual(gzip.decompress(self.read(script + '.gz')), self.read(script))
+        if assets.brotli is not None:
+            self.assertEqual(assets.brotli.decompress(self.read(script + '.br')), self.read(script))
+        # Fichiers sous MIN_PRECOMPRESS_SIZE : pas de variante
+        for small in (manifest['js/dashboard.js'], manifest['css/style.css']):
+            self.assertIn(small, published)
+            self.assertNotIn(small + '.gz', published)
+            self.assertNotIn(small + '.br', published)
+
+    def create_app(self):
+        app = Flask(__name__, static_folder=self.static_dir, static_url_path='/static')
+        assets.init_assets(app)
+        return app
+
+    def test_url_for_emits_fingerprinted_names(self):
+        manifest = assets.build(self.static_dir)
+        app = self.create_app()
+        bundle_urls = app.jinja_env.globals['bundle_urls']
+        with app.test_request_context():
+            self.assertEqual(url_for('static', filename='js/dashboard.bundle.js'),
+                             '/static/' + manifest['js/dashboard.bundle.js'])
+            self.assertEqual(url_for('static', filename='js/app-enhanced.js'), '/static/' + manifest['js/app.js'])
+            self.assertEqual(url_for('static', filename='img/logo.svg'), '/static/img/logo.svg')
+            self.assertEqual(bundle_urls('js/dashboard.bundle.js'), ['/static/' + manifest['js/dashboard.bundle.js']])
+        self.assertEqual(app.get_send_file_max_age(manifest['js/app.js']), 365 * 24 * 3600)
+
+        response = app.test_client().get('/static/' + manifest['js/dashboard.bundle.js'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cache_control.max_age, 365 * 24 * 3600)
+        response.close()
+
+    def test_sources_served_without_manifest(self):
+        app = self.create_app()
+        bundle_urls = app.jinja_env.globals['bundle_urls']
+        with app.test_request_context():
+            self.assertEqual(url_for('static', filename='js/app.js'), '/static/js/app.js')
+            self.assertEqual(bundle_urls('js/dashboard.bundle.js'),
+                             ['/static/js/app-tailwind.js', '/static/js/dashboard.js'])
+        self.assertFalse(os.path.exists(os.path.join(self.static_dir, assets.DIST_DIRNAME)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Tests des sauvegardes (backup.py) : instantané pendant des écritures,
+vérification et restauration complètes, fichier supprimé pendant la
+sauvegarde, base par défaut de la ligne de commande.
+
+Usage :
+    python test_backup.py
+"""
+
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import backup
+import fixtures
+from storage import LocalStorage
+
+
+def _rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT id, filename, original_name, file_size FROM files ORDER BY id').fetchall()
+    finally:
+        conn.close()
+
+
+class _DeletingStorage(LocalStorage):
+    """Stockage dont le fichier ``victim`` est supprimé (ligne et blob) après
+    l'instantané, juste avant sa copie"""
+
+    def __init__(self, root, db_path, victim):
+        super().__init__(root)
+        self.db_path = db_path
+        self.victim = victim
+
+    def stat(self, key):
+        if key == self.victim:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute('DELETE FROM files WHERE filename = ?', (key,))
+            conn.commit()
+            conn.close()
+            self.delete(key)
+        return super().stat(key)
+
+
+class BackupTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='test_backup_')
+        self.db_path = os.path.join(self.tmpdir, 'database.db')
+        self.backup_dir = os.path.join(self.tmpdir, 'backups')
+        self.storage = LocalStorage(os.path.join(self.tmpdir, 'uploads'))
+        conn = fixtures.create_database(self.db_path)
+        self.user_id = fixtures.add_user(conn, 'alice')
+        for i in range(300):
+            self.add_file(conn, i)
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def add_file(self, conn, i):
+        """Blob écrit avant sa ligne, comme à l'upload"""
+        key = f'{i:05d}_note.txt'
+        data = (key * 40).encode()
+        self.storage.put(key, io.BytesIO(data))
+        fixtures.add_file(conn, self.user_id, 'note ' + str(i) + '.txt', filename=key, file_size=len(data))
+
+    def restore_elsewhere(self, name):
+        restored_db = os.path.join(self.tmpdir, 'restored.db')
+        restored = LocalStorage(os.path.join(self.tmpdir, 'restored_uploads'))
+        return backup.restore(name, restored_db, restored, self.backup_dir), restored_db, restored
+
+    def test_roundtrip_while_writing(self):
+        before = _rows(self.db_path)
+        started, stop = threading.Event(), threading.Event()
+
+        def write():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            i = 1000
+            while not stop.is_set():
+                self.add_file(conn, i)
+                conn.commit()
+                started.set()
+                i += 1
+            conn.close()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            started.wait()
+            name, stats = backup.run_backup(self.db_path, self.storage, self.backup_dir, pages=1, sleep=0.001)
+        finally:
+            stop.set()
+            writer.join()
+        self.assertEqual(stats['missing'], [])
+        self.assertEqual(backup.verify_snapshot(name, self.backup_dir, deep=True), [])
+
+        result, restored_db, restored = self.restore_elsewhere(name)
+        rows = _rows(restored_db)
+        # Instantané cohérent : tout ce qui précédait, puis un préfixe des écritures concurrentes
+        self.assertEqual(rows[:len(before)], before)
+        self.assertEqual(rows, _rows(self.db_path)[:len(rows)])
+        self.assertEqual(result['blobs_restored'], len(rows))
+        for _, key, _, size in rows:
+            self.assertEqual(restored.get(key), self.storage.get(key))
+            self.assertEqual(len(restored.get(key)), size)
+
+    def test_blob_deleted_during_backup(self):
+        victim = '00007_note.txt'
+        storage = _DeletingStorage(self.storage.root, self.db_path, victim)
+        name, stats = backup.run_backup(self.db_path, storage, self.backup_dir)
+        self.assertEqual(stats['missing'], [victim])
+        self.assertEqual(backup.verify_snapshot(name, self.backup_dir, deep=True), [])
+
+        result, restored_db, restored = self.restore_elsewhere(name)
+        self.assertEqual(result['blobs_unavailable'], 1)
+        self.assertEqual(result['blobs_restored'], 299)
+        self.assertIsNone(restored.stat(victim))
+        self.assertEqual(restored.get('00008_note.txt'), self.storage.get('00008_note.txt'))
+
+    def test_command_line_defaults_to_application_database(self):
+        fixtures.create_database(':memory:').close()  # variables d'environnement des tests
+        import app
+
+        fixtures.create_database(app.DATABASE).close()
+        self.addCleanup(os.remove, app.DATABASE)
+        app.app.config['UPLOAD_FOLDER'] = self.storage.root
+        app._storage = None
+        self.addCleanup(setattr, app, '_storage', None)
+        with mock.patch('sys.argv', ['backup.py', '--backup-dir', self.backup_dir, 'snapshot']):
+            self.assertEqual(backup.main(), 0)
+        [name] = backup.list_snapshots(self.backup_dir)
+        self.assertEqual(backup.verify_snapshot(name, self.backup_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
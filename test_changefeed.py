@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Tests du journal des modifications et du flux SSE (changefeed.py) : triggers,
+historique purgé, lots, maintien de connexion, places du sémaphore.
+
+Usage :
+    python test_changefeed.py
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import changefeed
+import database
+import fixtures
+import jobs
+
+
+def _events(chunk):
+    """Événements ``change`` d'un morceau du flux : [(id, charge utile)]"""
+    events = []
+    for block in chunk.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if fields.get('event') == 'change':
+            events.append((int(fields['id']), json.loads(fields['data'])))
+    return events
+
+
+class ChangeFeedTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='test_changefeed_')
+        self.path = os.path.join(self.tmpdir, 'database.db')
+        self.conn = fixtures.create_database(self.path)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmpdir)
+
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def stream(self, last_id=0, slots=None, **kwargs):
+        kwargs.setdefault('poll_interval', 0)
+        return changefeed.EventStream(self.connect, 1, last_id, slots or changefeed.StreamSlots(1), **kwargs)
+
+    def changes(self, user_id=1):
+        return [(row['kind'], row['action'], row['object_id'])
+                for row in changefeed.changes_since(self.conn, user_id, 0, limit=1000)]
+
+    def test_triggers_cover_tracked_tables(self):
+        folder = self.conn.execute("INSERT INTO folders (user_id, name) VALUES (1, 'Factures')").lastrowid
+        file_id = fixtures.add_file(self.conn, 1, 'mars.pdf', folder_id=folder)
+        note = self.conn.execute("INSERT INTO notes (user_id, title, content) VALUES (1, 'Todo', '')").lastrowid
+        label = self.conn.execute("INSERT INTO labels (user_id, name, color) VALUES (1, 'urgent', '#ff0000')").lastrowid
+        self.conn.execute('INSERT INTO folder_labels (folder_id, label_id) VALUES (?, ?)', (folder, label))
+        self.conn.execute("UPDATE files SET original_name = 'avril.pdf' WHERE id = ?", (file_id,))
+        self.conn.execute('UPDATE files SET file_size = 10 WHERE id = ?', (file_id,))  # colonne non suivie
+        self.conn.execute('DELETE FROM folder_labels')
+        self.conn.execute('DELETE FROM notes WHERE id = ?', (note,))
+        fixtures.add_file(self.conn, 2, 'autre.pdf')
+        self.assertEqual(self.changes(), [
+            ('folder', 'created', folder), ('file', 'created', file_id), ('note', 'created', note),
+            ('label', 'created', label), ('folder', 'labeled', folder), ('file', 'updated', file_id),
+            ('folder', 'unlabeled', folder), ('note', 'deleted', note),
+        ])
+        self.assertEqual(len(self.changes(user_id=2)), 1)
+
+        data = json.loads(self.conn.execute(
+            "SELECT data FROM change_log WHERE kind = 'file' AND action = 'updated'"
+        ).fetchone()[0])
+        self.assertEqual((data['original_name'], data['folder_id']), ('avril.pdf', folder))
+
+    def test_finished_jobs_are_logged(self):
+        job_id = jobs.enqueue(self.conn, 'export', user_id=1)
+        self.conn.execute("UPDATE jobs SET status = 'running' WHERE id = ?", (job_id,))
+        self.conn.execute("UPDATE jobs SET status = 'done' WHERE id = ?", (job_id,))
+        jobs.enqueue(self.conn, 'maintenance')  # sans utilisateur
+        self.conn.execute("UPDATE jobs SET status = 'failed' WHERE user_id IS NULL")
+        self.assertEqual(self.changes(), [('job', 'done', job_id)])
+
+    def test_history_truncated(self):
+        # Identifiants communs : 1, 2, 4, 5 pour l'utilisateur 1, 3 pour l'utilisateur 2
+        for user_id in (1, 1, 2, 1, 1):
+            self.conn.execute('INSERT INTO folders (user_id, name) VALUES (?, ?)', (user_id, 'd'))
+        self.assertFalse(changefeed.history_truncated(self.conn, 1, 0))
+        self.assertFalse(changefeed.history_truncated(self.conn, 1, 2))
+
+        # Plus ancienne ligne purgée, pour un seul utilisateur
+        self.conn.execute('DELETE FROM change_log WHERE id <= 1')
+        self.assertTrue(changefeed.history_truncated(self.conn, 1, 1))
+        self.assertFalse(changefeed.history_truncated(self.conn, 1, 2))
+        self.assertFalse(changefeed.history_truncated(self.conn, 2, 3))
+        self.conn.execute('DELETE FROM change_log WHERE id <= 3')
+        self.assertTrue(changefeed.history_truncated(self.conn, 2, 3))
+        self.assertFalse(changefeed.history_truncated(self.conn, 1, 4))
+
+    def test_postgres_triggers_take_write_lock_first(self):
+        statements = []
+        cursor = mock.Mock(execute=lambda sql, *args: statements.append(sql))
+        with mock.patch('database.is_postgres', return_value=True):
+            changefeed.create_change_feed(cursor)
+        functions = [sql for sql in statements if sql.startswith('CREATE OR REPLACE FUNCTION')]
+        self.assertEqual(len(functions), 3 * len(changefeed._TRACKED) + 3)
+        # Verrou pris avant l'identifiant (séquence) de la ligne du journal
+        lock = 'PERFORM pg_advisory_xact_lock(' + str(database.WRITE_LOCK_KEY) + ');'
+        for sql in functions:
+            self.assertLess(sql.index(lock), sql.index('INSERT INTO change_log'), sql)
+
+    def test_full_batch_is_followed_immediately(self):
+        for i in range(changefeed.BATCH_SIZE + 5):
+            self.conn.execute('INSERT INTO folders (user_id, name) VALUES (1, ?)', ('d' + str(i),))
+        self.conn.commit()
+        # Une pause entre deux lots rendrait le test très lent
+        stream = iter(self.stream(poll_interval=60))
+        self.assertTrue(next(stream).startswith('retry: '))
+        first, second = _events(next(stream)), _events(next(stream))
+        self.assertEqual(len(first), changefeed.BATCH_SIZE)
+        self.assertEqual(len(second), 5)
+        self.assertEqual([event_id for event_id, _ in first + second],
+                         list(range(1, changefeed.BATCH_SIZE + 6)))
+        self.assertEqual(second[-1][1], {'kind': 'folder', 'action': 'created', 'id': changefeed.BATCH_SIZE + 5,
+                                         'folder_id': None, 'data': second[-1][1]['data']})
+
+    def test_heartbeat_and_reconnect_cursor(self):
+        self.conn.execute("INSERT INTO folders (user_id, name) VALUES (1, 'ancien')")
+        self.conn.commit()
+        stream = iter(self.stream(last_id=1, heartbeat=0))
+        next(stream)
+        self.assertEqual(next(stream), ': keep-alive\n\n')
+        self.conn.execute("INSERT INTO folders (user_id, name) VALUES (1, 'nouveau')")
+        self.conn.commit()
+        self.assertEqual([event_id for event_id, _ in _events(next(stream))], [2])
+
+    def test_reset_when_history_was_pruned(self):
+        for i in range(3):
+            self.conn.execute('INSERT INTO folders (user_id, name) VALUES (1, ?)', ('d' + str(i),))
+        self.conn.execute('DELETE FROM change_log WHERE id <= 2')
+        self.conn.commit()
+        self.assertEqual(list(self.stream(last_id=1))[1:], ['event: reset\ndata: {}\n\n'])
+
+    def test_close_releases_slot_once(self):
+        slots = changefeed.StreamSlots(1)
+        self.assertTrue(slots.acquire())
+        self.assertFalse(slots.acquire())
+        stream = self.stream(slots=slots, max_duration=0)
+        self.assertEqual(len(list(stream)), 1)  # durée maximale atteinte : retry seul
+        stream.close()
+        stream.close()  # appelé deux fois (déconnexion puis fin de réponse)
+        self.assertTrue(slots.acquire())
+        self.assertFalse(slots.acquire())
+
+        slots.release()
+        closing = self.stream(slots=slots, heartbeat=0)
+        self.assertTrue(slots.acquire())
+        iterator = iter(closing)
+        next(iterator)
+        closing.close()  # client déconnecté : le flux s'arrête
+        self.assertEqual(list(iterator), [])
+        self.assertTrue(slots.acquire())
+
+
+if __name__ == '__main__':
+    unittest.main()
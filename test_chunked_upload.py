@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Tests des uploads par morceaux (chunked_upload.py et routes /uploads) :
+morceaux dans le désordre, fichier assemblé, reprise, morceaux
+refusés, finalisations simultanées.
+
+Usage :
+    python test_chunked_upload.py
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import chunked_upload
+import fixtures
+
+CHUNK = chunked_upload.MIN_CHUNK_SIZE
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ChunkedUploadTest(unittest.TestCase):
+    def setUp(self):
+        self.upload_folder = tempfile.mkdtemp(prefix='test_chunked_upload_')
+        self.conn = fixtures.create_database()
+        self.user_id = fixtures.add_user(self.conn, 'alice')
+        self.data = os.urandom(2 * CHUNK + 1000)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.upload_folder)
+
+    def init(self):
+        return chunked_upload.init_upload(
+            self.conn, self.upload_folder, self.user_id, 'video.mp4', 'uuid_video.mp4',
+            len(self.data), chunk_size=CHUNK
+        )
+
+    def put(self, upload, index):
+        chunk = self.data[index * CHUNK:(index + 1) * CHUNK]
+        chunked_upload.write_chunk(
+            self.conn, self.upload_folder, upload, index, io.BytesIO(chunk), _sha256(chunk)
+        )
+
+    def test_complete_returns_assembled_file(self):
+        upload = self.init()
+        self.assertEqual(upload['chunk_count'], 3)
+        for index in (2, 0, 1):  # ordre d'arrivée quelconque
+            self.put(upload, index)
+        path = chunked_upload.complete_upload(self.conn, self.upload_folder, upload)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_bad_resend_keeps_accepted_chunk(self):
+        upload = self.init()
+        for index in range(3):
+            self.put(upload, index)
+        chunk = self.data[:CHUNK]
+        # Renvoi après une réponse perdue : copie tronquée, puis corrompue
+        with self.assertRaises(chunked_upload.UploadError):
+            chunked_upload.write_chunk(
+                self.conn, self.upload_folder, upload, 0, io.BytesIO(b'\0' * (CHUNK // 2)), _sha256(chunk)
+            )
+        with self.assertRaises(chunked_upload.UploadError) as raised:
+            chunked_upload.write_chunk(
+                self.conn, self.upload_folder, upload, 0, io.BytesIO(b'\0' * CHUNK), _sha256(chunk)
+            )
+        self.assertEqual(raised.exception.status, 422)
+
+        path = chunked_upload.complete_upload(self.conn, self.upload_folder, upload)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+
+class ChunkedUploadRoutesTest(unittest.TestCase):
+    def setUp(self):
+        self.upload_folder = tempfile.mkdtemp(prefix='test_chunked_upload_')
+        self.client, self.user_id = fixtures.create_app_client(self.upload_folder)
+        self.data = os.urandom(2 * CHUNK + 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.upload_folder)
+
+    def init(self):
+        response = self.client.post('/uploads', json={'filename': 'notes.txt', 'size': len(self.data), 'chunk_size': CHUNK})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['chunk_count'], 3)
+        return response.json['upload_id']
+
+    def put(self, upload_id, index, sha256=None, client=None):
+        chunk = self.data[index * CHUNK:(index + 1) * CHUNK]
+        return (client or self.client).put(
+            '/uploads/' + upload_id + '/chunks/' + str(index), data=chunk,
+            headers={'X-Chunk-SHA256': sha256 or _sha256(chunk)}
+        )
+
+    def complete(self, upload_id, client=None):
+        return (client or self.client).post('/uploads/' + upload_id + '/complete')
+
+    def connect(self):
+        from app import DATABASE
+
+        conn = sqlite3.connect(DATABASE)
+        conn.row_factory = sqlite3.Row
+        self.addCleanup(conn.close)
+        return conn
+
+    def files(self):
+        return [tuple(row) for row in self.connect().execute('SELECT filename, file_size, checksum FROM files')]
+
+    def test_resume_sends_only_missing_chunks(self):
+        upload_id = self.init()
+        for index in (0, 2):
+            self.assertEqual(self.put(upload_id, index).status_code, 204)
+
+        status = self.client.get('/uploads/' + upload_id).json
+        self.assertEqual((status['received'], status['completing']), ([0, 2], False))
+        self.assertEqual(self.put(upload_id, 1).status_code, 204)
+
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, 201)
+        [(filename, size, checksum)] = self.files()
+        # Empreinte laissée au scrubber : le fichier n'est pas relu pendant la requête
+        self.assertEqual((filename, size, checksum), (response.json['filename'], len(self.data), None))
+        with open(os.path.join(self.upload_folder, filename), 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(self.client.get('/uploads/' + upload_id).status_code, 404)
+
+    def test_rejected_chunks_are_not_recorded(self):
+        upload_id = self.init()
+        self.assertEqual(self.put(upload_id, 0, sha256='0' * 64).status_code, 422)
+        self.assertEqual(self.put(upload_id, 3).status_code, 400)  # index = chunk_count
+        self.assertEqual(self.client.put(
+            '/uploads/' + upload_id + '/chunks/0', data=b'x', headers={'X-Chunk-SHA256': 'abc'}
+        ).status_code, 400)
+        self.assertEqual(self.client.get('/uploads/' + upload_id).json['received'], [])
+
+    def test_complete_with_missing_chunks_can_be_retried(self):
+        upload_id = self.init()
+        self.put(upload_id, 0)
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('2 morceau', response.json['error'])
+        self.assertEqual(self.files(), [])
+
+        # Réservation levée : l'upload continue puis se termine
+        self.assertEqual(self.put(upload_id, 1).status_code, 204)
+        self.assertEqual(self.put(upload_id, 2).status_code, 204)
+        self.assertEqual(self.complete(upload_id).status_code, 201)
+
+    def test_completion_in_progress_blocks_other_requests(self):
+        upload_id = self.init()
+        for index in range(3):
+            self.put(upload_id, index)
+        # Finalisation en cours dans une autre requête
+        self.assertIsNotNone(chunked_upload.claim_upload(self.connect(), upload_id, self.user_id))
+
+        self.assertEqual(self.complete(upload_id).status_code, 409)
+        self.assertEqual(self.put(upload_id, 0).status_code, 409)
+        self.assertTrue(self.client.get('/uploads/' + upload_id).json['completing'])
+        self.assertEqual(self.files(), [])
+
+    def test_concurrent_completes_create_one_file(self):
+        upload_id = self.init()
+        for index in range(3):
+            self.put(upload_id, index)
+        # Deuxième client de la même session (double clic, reprise du navigateur)
+        clients = [self.client, self.client.application.test_client()]
+        with clients[0].session_transaction() as source, clients[1].session_transaction() as target:
+            target.update(source)
+
+        barrier = threading.Barrier(2)
+        statuses = []
+
+        def complete(client):
+            barrier.wait()
+            statuses.append(self.complete(upload_id, client).status_code)
+
+        threads = [threading.Thread(target=complete, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIn(sorted(statuses), ([201, 404], [201, 409]))
+        self.assertEqual(len(self.files()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
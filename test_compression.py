@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Tests de la compression au repos (compression.py et send_compressed_file) :
+choix du codec, repli sur gzip sans zstandard, téléchargement compressé ou
+décompressé selon le client.
+
+Usage :
+    python test_compression.py
+"""
+
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import compression
+import fixtures
+
+TEXT = ''.join(f'Ligne {i} : facture réglée le 0{i % 9 + 1}/03.\n' for i in range(4000)).encode('utf-8')
+
+
+def _compress(data, codec):
+    return compression.compressing_reader(io.BytesIO(data), codec).read()
+
+
+def _decompress(data, codec):
+    return b''.join(compression.decompress_stream([data[i:i + 1000] for i in range(0, len(data), 1000)], codec))
+
+
+class ChooseCodecTest(unittest.TestCase):
+    def test_compressible_input(self):
+        stream = io.BytesIO(b'entete' + TEXT)
+        stream.read(6)
+        self.assertEqual(compression.choose_codec(stream, 'txt'), compression.preferred_codec())
+        self.assertEqual(stream.tell(), 6)  # flux rembobiné à sa position de départ
+
+    def test_incompressible_input(self):
+        self.assertIsNone(compression.choose_codec(io.BytesIO(os.urandom(64 * 1024)), 'bin'))
+        # Déjà compressé d'après l'extension : pas d'échantillon
+        stream = mock.Mock(wraps=io.BytesIO(TEXT))
+        self.assertIsNone(compression.choose_codec(stream, 'JPG'))
+        stream.read.assert_not_called()
+        self.assertIsNone(compression.choose_codec(io.BytesIO(TEXT[:compression.MIN_SIZE - 1]), 'txt'))
+
+    def test_gzip_fallback_without_zstandard(self):
+        with mock.patch('compression.zstandard', None):
+            self.assertEqual(compression.choose_codec(io.BytesIO(TEXT), 'txt'), compression.GZIP)
+            compressed = _compress(TEXT, compression.GZIP)
+            self.assertLess(len(compressed), len(TEXT) * compression.MAX_RATIO)
+            self.assertEqual(_decompress(compressed, compression.GZIP), TEXT)
+            # Fichiers zstd déjà stockés : erreur explicite plutôt que des octets corrompus
+            with self.assertRaises(RuntimeError):
+                compression.decompressor(compression.ZSTD)
+
+    @unittest.skipIf(compression.zstandard is None, 'zstandard requis')
+    def test_zstd_round_trip(self):
+        self.assertEqual(compression.preferred_codec(), compression.ZSTD)
+        self.assertEqual(_decompress(_compress(TEXT, compression.ZSTD), compression.ZSTD), TEXT)
+
+
+class CompressedDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.upload_folder = tempfile.mkdtemp(prefix='test_compression_')
+        self.client, self.user_id = fixtures.create_app_client(self.upload_folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.upload_folder)
+
+    def upload(self, data, name='releve.txt'):
+        response = self.client.post('/upload', data={'file': (io.BytesIO(data), name)})
+        self.assertEqual(response.status_code, 302)
+        from app import DATABASE
+
+        conn = sqlite3.connect(DATABASE)
+        try:
+            return conn.execute('SELECT filename, file_size, codec FROM files WHERE original_name = ?',
+                                (name,)).fetchone()
+        finally:
+            conn.close()
+
+    def download(self, filename, accept_encoding=None):
+        headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+        response = self.client.get('/download/' + filename, headers=headers)
+        self.addCleanup(response.close)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_download_round_trip(self):
+        filename, size, codec = self.upload(TEXT)
+        self.assertEqual((size, codec), (len(TEXT), compression.preferred_codec()))
+        with open(os.path.join(self.upload_folder, filename), 'rb') as f:
+            stored = f.read()
+        self.assertLess(len(stored), len(TEXT) * compression.MAX_RATIO)
+
+        # Le client accepte l'encodage : octets stockés transmis tels quels
+        response = self.download(filename, codec + ', identity')
+        self.assertEqual(response.headers['Content-Encoding'], codec)
+        self.assertIn('Accept-Encoding', response.vary)
+        self.assertIn('releve.txt', response.headers['Content-Disposition'])
+        self.assertEqual(response.content_length, len(stored))
+        self.assertEqual(response.get_data(), stored)
+        self.assertEqual(_decompress(response.get_data(), codec), TEXT)
+
+        # Sinon : décompressé au fil de l'eau, taille d'origine annoncée
+        response = self.download(filename, 'identity')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.vary)
+        self.assertEqual(response.content_length, len(TEXT))
+        self.assertEqual(response.get_data(), TEXT)
+
+    def test_gzip_fallback_download(self):
+        with mock.patch('compression.zstandard', None):
+            filename, _, codec = self.upload(TEXT)
+        self.assertEqual(codec, compression.GZIP)
+        response = self.download(filename, 'gzip')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(_decompress(response.get_data(), codec), TEXT)
+        self.assertEqual(self.download(filename).get_data(), TEXT)
+
+    def test_incompressible_file_stored_as_is(self):
+        data = os.urandom(64 * 1024)
+        filename, _, codec = self.upload(data)
+        self.assertIsNone(codec)
+        with open(os.path.join(self.upload_folder, filename), 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(self.download(filename, 'gzip, zstd').get_data(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
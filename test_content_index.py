@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Tests de l'extraction de texte pour l'index plein texte (content_index.py).
+
+Usage :
+    python test_content_index.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import content_index
+
+
+class ExtractTxtTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='test_content_index_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, data):
+        path = os.path.join(self.tmpdir, 'doc.txt')
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_multibyte_tail_cut_by_read_limit(self):
+        # 'x' décale la lecture : le dernier 'é' lu est coupé en deux
+        path = self._write(('x' + 'é' * 500000).encode('utf-8'))
+        text = content_index.extract_text(path, 'txt')
+        self.assertEqual(len(text), content_index.MAX_INDEXED_CHARS)
+        self.assertEqual(text, 'x' + 'é' * (content_index.MAX_INDEXED_CHARS - 1))
+
+    def test_latin1_fallback(self):
+        path = self._write('café crème'.encode('latin-1'))
+        self.assertEqual(content_index.extract_text(path, 'txt'), 'café crème')
+
+    def test_control_characters_replaced(self):
+        path = self._write(b'ligne\x00un\nligne deux')
+        self.assertEqual(content_index.extract_text(path, 'txt'), 'ligne un\nligne deux')
+
+
+if __name__ == '__main__':
+    unittest.main()
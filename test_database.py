@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests de la traduction du SQL de l'application pour PostgreSQL
+(``database.translate``) : paramètres, littéraux, LIKE, dates, DDL.
+
+Usage :
+    python test_database.py
+"""
+
+import unittest
+
+import database
+from database import translate
+
+
+class TranslateTest(unittest.TestCase):
+    def test_placeholders_and_literals(self):
+        statement = translate("SELECT id FROM files WHERE user_id = ? AND original_name = '?%' AND note = \"a?\"")
+        self.assertEqual(statement.sql, "SELECT id FROM files WHERE user_id = %s AND original_name = '?%%' AND note = \"a?\"")
+        self.assertEqual(statement.kind, 'other')
+        # Sans paramètres, psycopg n'interprète pas les % : rien n'est doublé
+        self.assertEqual(translate("SELECT '50%' WHERE 1 % 2 = 1", with_params=False).sql,
+                         "SELECT '50%' WHERE 1 % 2 = 1")
+
+    def test_like_is_kept(self):
+        # ILIKE est choisi explicitement par les requêtes qui ignorent la casse (name_index)
+        self.assertEqual(translate("SELECT 1 FROM users WHERE email LIKE '%_@_%'").sql,
+                         "SELECT 1 FROM users WHERE email LIKE '%%_@_%%'")
+        self.assertEqual(translate('SELECT 1 FROM files WHERE original_name ILIKE ? ESCAPE ?').sql,
+                         'SELECT 1 FROM files WHERE original_name ILIKE %s ESCAPE %s')
+
+    def test_current_timestamp_is_truncated(self):
+        self.assertEqual(
+            translate('UPDATE jobs SET updated_at = CURRENT_TIMESTAMP WHERE id = ?').sql,
+            'UPDATE jobs SET updated_at = ' + database.CURRENT_TIMESTAMP_SQL + ' WHERE id = %s'
+        )
+        ddl = translate('CREATE TABLE t (created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, until TIMESTAMP)').sql
+        # Pas de TIMESTAMP(0) : PostgreSQL arrondirait les dates passées en paramètre
+        self.assertEqual(ddl, 'CREATE TABLE t (created_at TIMESTAMP DEFAULT ' + database.CURRENT_TIMESTAMP_SQL
+                         + ', until TIMESTAMP)')
+        self.assertEqual(translate("SELECT 'CURRENT_TIMESTAMP'").sql, "SELECT 'CURRENT_TIMESTAMP'")
+
+    def test_create_table(self):
+        statement = translate('''CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            body BLOB,
+            code TEXT CHECK (code GLOB '[A-Z]*'),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )''')
+        self.assertEqual(statement.identity, ('notes', 'id'))
+        self.assertIn('id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY', statement.sql)
+        self.assertIn('user_id BIGINT NOT NULL', statement.sql)
+        self.assertIn('body BYTEA', statement.sql)
+        self.assertIn("code SIMILAR TO '[A-Z]*'", statement.sql)
+        self.assertNotIn('FOREIGN KEY', statement.sql)
+        # Hors DDL, les types ne sont pas réécrits
+        self.assertEqual(translate('SELECT CAST(x AS INTEGER) FROM t').sql, 'SELECT CAST(x AS INTEGER) FROM t')
+
+    def test_statement_kinds(self):
+        self.assertEqual(translate('  begin immediate').kind, 'begin_immediate')
+        self.assertIn('pg_advisory_xact_lock', translate('BEGIN IMMEDIATE').sql)
+        insert = translate('INSERT INTO Files (user_id) VALUES (?)')
+        self.assertEqual((insert.kind, insert.insert_table), ('write', 'files'))
+        self.assertEqual(translate('DELETE FROM files WHERE id = ?').kind, 'write')
+        self.assertEqual(translate('SELECT 1').insert_table, None)
+
+    def test_temp_and_join_hints(self):
+        self.assertEqual(
+            translate('SELECT * FROM temp.ids CROSS JOIN files f ON f.id = ids.id').sql,
+            'SELECT * FROM pg_temp.ids JOIN files f ON f.id = ids.id'
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tests du filtrage par étiquettes (facets.py) : ET / OU, facettes du
+résultat, compteurs maintenus par triggers, étiquettes d'un autre
+utilisateur refusées.
+
+Usage :
+    python test_facets.py
+"""
+
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import facets
+import fixtures
+
+
+class FacetsTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = fixtures.create_database()
+        self.alice = fixtures.add_user(self.conn, 'alice')
+        self.bob = fixtures.add_user(self.conn, 'bob')
+        self.urgent = self.add_label(self.alice, 'urgent')
+        self.client = self.add_label(self.alice, 'client')
+        self.archive = self.add_label(self.alice, 'archive')
+        self.foreign = self.add_label(self.bob, 'urgent')
+
+        # A : urgent + client, B : urgent, C : client + archive, D : sans étiquette
+        self.a = self.add_folder(self.alice, 'A', self.urgent, self.client)
+        self.b = self.add_folder(self.alice, 'B', self.urgent)
+        self.c = self.add_folder(self.alice, 'C', self.client, self.archive)
+        self.d = self.add_folder(self.alice, 'D')
+        self.bob_folder = self.add_folder(self.bob, 'X', self.foreign)
+        fixtures.add_file(self.conn, self.alice, 'devis.pdf', folder_id=self.a)
+        fixtures.add_file(self.conn, self.alice, 'plan.png', folder_id=self.c)
+        self.conn.execute('INSERT INTO notes (title, content, user_id, folder_id) VALUES (?, ?, ?, ?)',
+                          ('Relance', '', self.alice, self.b))
+
+    def tearDown(self):
+        self.conn.close()
+
+    def add_label(self, user_id, name):
+        return self.conn.execute(
+            'INSERT INTO labels (name, color, user_id) VALUES (?, ?, ?)', (name, '#336699', user_id)
+        ).lastrowid
+
+    def add_folder(self, user_id, name, *label_ids):
+        folder_id = self.conn.execute(
+            'INSERT INTO folders (user_id, name) VALUES (?, ?)', (user_id, name)
+        ).lastrowid
+        for label_id in label_ids:
+            self.label(folder_id, label_id)
+        return folder_id
+
+    def label(self, folder_id, label_id):
+        self.conn.execute('INSERT INTO folder_labels (folder_id, label_id) VALUES (?, ?)', (folder_id, label_id))
+
+    def counts(self):
+        return dict(self.conn.execute('SELECT label_id, folder_count FROM label_counts').fetchall())
+
+    def filter(self, label_ids, mode):
+        owned = facets.owned_labels(self.conn, self.alice, label_ids)
+        return facets.filter_by_labels(self.conn, self.alice, owned, mode)
+
+    def test_and_requires_every_label(self):
+        result = self.filter([self.urgent, self.client], 'and')
+        self.assertEqual([folder['name'] for folder in result['folders']], ['A'])
+        self.assertEqual((result['folder_count'], result['file_count'], result['note_count']), (1, 1, 0))
+        self.assertEqual([file['original_name'] for file in result['files']], ['devis.pdf'])
+        facet_counts = {facet['id']: facet['count'] for facet in result['facets']}
+        self.assertEqual(facet_counts, {self.urgent: 1, self.client: 1, self.archive: 0})
+        self.assertEqual(self.filter([self.urgent, self.archive], 'and')['folder_count'], 0)
+
+    def test_or_accepts_any_label(self):
+        result = self.filter([self.urgent, self.archive], 'or')
+        self.assertEqual([folder['name'] for folder in result['folders']], ['A', 'B', 'C'])
+        self.assertEqual((result['file_count'], result['note_count']), (2, 1))
+        facet_counts = {facet['id']: facet['count'] for facet in result['facets']}
+        self.assertEqual(facet_counts, {self.urgent: 2, self.client: 2, self.archive: 1})
+        # Le dossier de bob porte une étiquette homonyme : jamais dans le résultat
+        self.assertNotIn(self.bob_folder, [folder['id'] for folder in result['folders']])
+
+    def test_counts_follow_label_changes(self):
+        self.assertEqual(self.counts(), {self.urgent: 2, self.client: 2, self.archive: 1, self.foreign: 1})
+
+        self.label(self.d, self.archive)
+        self.assertEqual(self.counts()[self.archive], 2)
+        self.conn.execute('DELETE FROM folder_labels WHERE folder_id = ? AND label_id = ?', (self.a, self.urgent))
+        self.assertEqual(self.counts()[self.urgent], 1)
+
+        # Dossier supprimé : ses associations et compteurs suivent
+        self.conn.execute('DELETE FROM folders WHERE id = ?', (self.c,))
+        self.assertEqual(self.counts(), {self.urgent: 1, self.client: 1, self.archive: 1, self.foreign: 1})
+        self.assertEqual(self.conn.execute(
+            'SELECT COUNT(*) FROM folder_labels WHERE folder_id = ?', (self.c,)
+        ).fetchone()[0], 0)
+
+        # Étiquette supprimée : compteur et associations disparaissent
+        self.conn.execute('DELETE FROM labels WHERE id = ?', (self.client,))
+        self.assertNotIn(self.client, self.counts())
+        self.assertEqual(self.conn.execute(
+            'SELECT COUNT(*) FROM folder_labels WHERE label_id = ?', (self.client,)
+        ).fetchone()[0], 0)
+
+        facet_counts = {facet['id']: facet['count'] for facet in facets.label_facets(self.conn, self.alice)}
+        self.assertEqual(facet_counts, {self.urgent: 1, self.archive: 1})
+
+    def test_owned_labels_rejects_other_users_labels(self):
+        # Triées de la plus rare à la plus fréquente (ordre du ET)
+        self.assertEqual(facets.owned_labels(self.conn, self.alice, [self.urgent, self.archive]),
+                         [self.archive, self.urgent])
+        self.assertEqual(facets.owned_labels(self.conn, self.alice, [self.urgent, self.foreign]), [self.urgent])
+        self.assertEqual(facets.owned_labels(self.conn, self.bob, [self.urgent, self.client]), [])
+
+
+class FilterRouteTest(unittest.TestCase):
+    def setUp(self):
+        self.upload_folder = tempfile.mkdtemp(prefix='test_facets_')
+        self.client, self.user_id = fixtures.create_app_client(self.upload_folder)
+        from app import DATABASE
+
+        conn = sqlite3.connect(DATABASE)
+        try:
+            other = fixtures.add_user(conn, 'bob')
+            self.own = conn.execute('INSERT INTO labels (name, color, user_id) VALUES (?, ?, ?)',
+                                    ('urgent', '#336699', self.user_id)).lastrowid
+            self.foreign = conn.execute('INSERT INTO labels (name, color, user_id) VALUES (?, ?, ?)',
+                                        ('urgent', '#336699', other)).lastrowid
+            conn.commit()
+        finally:
+            conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.upload_folder)
+
+    def test_foreign_label_is_not_found(self):
+        self.assertEqual(self.client.get('/filter?label=' + str(self.own)).status_code, 200)
+        response = self.client.get('/filter?label=' + str(self.own) + '&label=' + str(self.foreign))
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Tests des empreintes perceptuelles (image_hash.py) : robustesse aux
+ré-exports, recherche multi-index identique au parcours complet, remplissage.
+
+Usage :
+    python test_image_hash.py
+"""
+
+import io
+import json
+import random
+import unittest
+
+import fixtures
+import image_hash
+
+try:
+    from PIL import Image, ImageDraw, ImageEnhance
+except ImportError:  # Pillow absent : seuls les tests de recherche sont exécutés
+    Image = None
+
+
+def _add(conn, user_id, name, phash=None):
+    file_id = fixtures.add_file(conn, user_id, name)
+    if phash is not None:
+        image_hash.store_hashes(conn, file_id, {'ahash': 0, 'dhash': 0, 'phash': phash})
+    return file_id
+
+
+def _flip(value, rng, count):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def _picture(seed, size=(800, 600)):
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        box = [x, y, x + rng.randrange(40, 400), y + rng.randrange(40, 300)]
+        shape = draw.ellipse if rng.random() < 0.5 else draw.rectangle
+        shape(box, fill=tuple(rng.randrange(256) for _ in range(3)))
+    return image
+
+
+def _hashes(image, format='PNG', **options):
+    data = io.BytesIO()
+    image.save(data, format, **options)
+    data.seek(0)
+    return image_hash.compute_hashes(data)
+
+
+@unittest.skipIf(Image is None, 'Pillow non installé')
+class PerceptualHashTest(unittest.TestCase):
+    def test_re_exports_stay_close(self):
+        for seed in range(5):
+            image = _picture(seed)
+            original = _hashes(image)['phash']
+            exif = Image.Exif()
+            exif[0x0112] = 6  # pivoter de 90° pour l'affichage
+            variants = {
+                'réduite': _hashes(image.resize((400, 300))),
+                'jpeg': _hashes(image, 'JPEG', quality=40),
+                'éclaircie': _hashes(ImageEnhance.Brightness(image).enhance(1.2)),
+                'niveaux de gris': _hashes(image.convert('L')),
+                'orientation exif': _hashes(image.rotate(90, expand=True), 'JPEG', quality=90, exif=exif),
+            }
+            for name, hashes in variants.items():
+                self.assertLessEqual(image_hash.hamming(original, hashes['phash']), image_hash.DEFAULT_DISTANCE, name)
+
+    def test_different_pictures_are_far_apart(self):
+        hashes = [_hashes(_picture(seed))['phash'] for seed in range(10, 20)]
+        for i, a in enumerate(hashes):
+            for b in hashes[:i]:
+                self.assertGreater(image_hash.hamming(a, b), image_hash.DEFAULT_DISTANCE)
+
+    def test_unreadable_image(self):
+        self.assertIsNone(image_hash.compute_hashes(io.BytesIO(b'pas une image')))
+
+
+class SimilarSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = fixtures.create_database()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_multi_index_matches_linear_scan(self):
+        rng = random.Random(48)
+        bases = [rng.getrandbits(64) for _ in range(40)]
+        for i in range(3000):
+            base = rng.choice(bases)
+            _add(self.conn, rng.randint(1, 2), f'{i}.jpg', _flip(base, rng, rng.randint(0, 16)))
+        rows = self.conn.execute('SELECT id, user_id, phash FROM files').fetchall()
+        for _ in range(30):
+            query = _flip(rng.choice(bases), rng, rng.randint(0, 4))
+            for distance in (0, 3, 4, 7, 10, 11):
+                expected = sorted(
+                    (image_hash.hamming(query, phash), file_id) for file_id, user_id, phash in rows
+                    if user_id == 1 and image_hash.hamming(query, phash) <= distance
+                )
+                found = image_hash.find_similar(self.conn, 1, query, distance, limit=len(rows))
+                self.assertEqual([(r['distance'], r['id']) for r in found], expected)
+
+    def test_signed_storage_of_high_bit(self):
+        high = (1 << 63) | 0b1011
+        file_id = _add(self.conn, 1, 'haut.png', high)
+        self.assertLess(self.conn.execute('SELECT phash FROM files WHERE id = ?', (file_id,)).fetchone()[0], 0)
+        self.assertEqual([r['id'] for r in image_hash.find_similar(self.conn, 1, high, 0)], [file_id])
+        self.assertEqual([r['distance'] for r in image_hash.find_similar(self.conn, 1, high ^ 1, 1)], [1])
+
+    def test_uses_partial_indexes(self):
+        plan = self.conn.execute(
+            'EXPLAIN QUERY PLAN SELECT id FROM files WHERE user_id = ? AND phash IS NOT NULL AND '
+            + image_hash._CHUNK_SQL[2] + ' IN (?, ?)', (1, 2, 3)
+        ).fetchall()
+        self.assertIn('idx_files_phash_2', ' '.join(row[-1] for row in plan))
+
+    def test_excludes_reference_and_caps_distance(self):
+        first = _add(self.conn, 1, 'a.png', 0)
+        second = _add(self.conn, 1, 'b.png', 0xFFF)  # 12 bits
+        self.assertEqual(image_hash.find_similar(self.conn, 1, 0, exclude_id=first), [])
+        self.assertEqual(image_hash.find_similar(self.conn, 1, 0, 64, exclude_id=first), [])
+        self.assertEqual([r['id'] for r in image_hash.find_similar(self.conn, 1, 0xFFF, 0)], [second])
+
+    def test_backfill_batches_per_user(self):
+        for i in range(5):
+            _add(self.conn, 1, f'photo_{i}.JPG')
+        _add(self.conn, 1, 'deja.png', 42)
+        _add(self.conn, 1, 'notes.txt')
+        _add(self.conn, 2, 'scan.png')
+        self.assertEqual(image_hash.backfill(self.conn, batch_size=3), 6)
+        batches = [
+            (row[0], json.loads(row[1])['file_ids'])
+            for row in self.conn.execute("SELECT user_id, payload FROM jobs WHERE job_type = 'hash_images' ORDER BY id")
+        ]
+        self.assertEqual([(user_id, len(ids)) for user_id, ids in batches], [(1, 3), (1, 2), (2, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
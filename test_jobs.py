@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests de la file de tâches (jobs.py) : scrutation sans verrou d'écriture,
+limites de concurrence globales avec des données réparties.
+
+Usage :
+    python test_jobs.py
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import jobs
+
+
+class JobQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='test_jobs_')
+        self.handlers = dict(jobs.HANDLERS)
+        jobs.HANDLERS.clear()
+        jobs.job_handler('export', concurrency=1)(lambda payload, job: None)
+
+    def tearDown(self):
+        jobs.HANDLERS.clear()
+        jobs.HANDLERS.update(self.handlers)
+        shutil.rmtree(self.tmpdir)
+
+    def _connect(self, name):
+        conn = sqlite3.connect(os.path.join(self.tmpdir, name), timeout=0.1)
+        conn.row_factory = sqlite3.Row
+        jobs.create_jobs_table(conn.cursor())
+        jobs.create_job_leases_table(conn.cursor())
+        conn.commit()
+        self.addCleanup(conn.close)
+        return conn
+
+    def test_idle_poll_takes_no_write_lock(self):
+        conn = self._connect('bucket-0000.db')
+        writer = self._connect('bucket-0000.db')
+        writer.execute('BEGIN IMMEDIATE')  # écriture d'une requête en cours
+        self.assertIsNone(jobs.claim(conn, 'w1'))
+        writer.rollback()
+
+        jobs.enqueue(conn, 'export', delay=60)
+        conn.commit()
+        self.assertFalse(jobs.has_ready(conn))
+        jobs.enqueue(conn, 'export')
+        conn.commit()
+        self.assertTrue(jobs.has_ready(conn))
+        self.assertEqual(jobs.claim(conn, 'w1')['attempts'], 1)
+
+    def test_concurrency_limit_is_global_across_shards(self):
+        catalog = self._connect('database.db')
+        shards = [self._connect('bucket-0000.db'), self._connect('bucket-0001.db')]
+        for conn in shards:
+            jobs.enqueue(conn, 'export')
+            conn.commit()
+
+        first = jobs.claim_leased(catalog, shards[0], 'bucket-0000.db', 'w1')
+        self.assertIsNotNone(first)
+        self.assertIsNone(jobs.claim_leased(catalog, shards[1], 'bucket-0001.db', 'w2'))
+
+        jobs.release_lease(catalog, 'bucket-0000.db', first['id'])
+        self.assertIsNotNone(jobs.claim_leased(catalog, shards[1], 'bucket-0001.db', 'w2'))
+        self.assertEqual(catalog.execute('SELECT COUNT(*) FROM job_leases').fetchone()[0], 1)
+
+    def test_expired_lease_frees_slot(self):
+        catalog = self._connect('database.db')
+        shard = self._connect('bucket-0000.db')
+        catalog.execute(
+            "INSERT INTO job_leases (source, job_id, job_type, locked_until) VALUES ('bucket-0009.db', 1, 'export', ?)",
+            (jobs._now(),)
+        )
+        catalog.commit()
+        jobs.enqueue(shard, 'export')
+        shard.commit()
+        self.assertIsNotNone(jobs.claim_leased(catalog, shard, 'bucket-0000.db', 'w1'))
+        self.assertEqual(jobs.purge_expired_leases(catalog), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
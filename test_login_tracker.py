@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Tests du suivi des connexions (login_tracker.py), y compris avec plusieurs
+processus partageant le même stockage, comme les workers Gunicorn.
+
+Usage :
+    python test_login_tracker.py
+"""
+
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import fixtures
+from login_tracker import LoginTracker
+
+PROCESSES = 4
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _tracker(directory, max_attempts=5, flush_interval=3600):
+    db_path = os.path.join(directory, 'database.db')
+    return LoginTracker(
+        os.path.join(directory, 'login_state.db'), lambda: _connect(db_path),
+        max_attempts=max_attempts, flush_interval=flush_interval
+    )
+
+
+def _user(directory, user_id):
+    conn = _connect(os.path.join(directory, 'database.db'))
+    try:
+        return conn.execute(
+            'SELECT id, failed_login_attempts, account_locked_until, last_login FROM users WHERE id = ?',
+            (user_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+
+def _fail_many(directory, user_id, count, max_attempts, barrier):
+    tracker = _tracker(directory, max_attempts)
+    barrier.wait()
+    for _ in range(count):
+        tracker.record_failure(_user(directory, user_id))
+
+
+def _login_many(directory, user_ids, rounds, barrier):
+    tracker = _tracker(directory)
+    barrier.wait()
+    conn = _connect(os.path.join(directory, 'database.db'))
+    for _ in range(rounds):
+        for user_id in user_ids:
+            tracker.record_success(conn, _user(directory, user_id))
+    conn.close()
+
+
+class LoginTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='login_tracker_')
+        conn = fixtures.create_database(os.path.join(self.directory, 'database.db'))
+        for i in range(1, 51):
+            fixtures.add_user(conn, 'user' + str(i))
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _run(self, target, args_list):
+        barrier = multiprocessing.Barrier(len(args_list))
+        processes = [multiprocessing.Process(target=target, args=args + (barrier,)) for args in args_list]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+            self.assertEqual(process.exitcode, 0)
+
+    def test_success_without_failures_does_not_write_users(self):
+        tracker = _tracker(self.directory)
+        conn = _connect(os.path.join(self.directory, 'database.db'))
+        statements = []
+        conn.set_trace_callback(statements.append)
+        tracker.record_success(conn, _user(self.directory, 1))
+        conn.close()
+        self.assertEqual([s for s in statements if 'UPDATE' in s.upper()], [])
+        self.assertIsNone(_user(self.directory, 1)['last_login'])
+        self.assertEqual(tracker.flush(), 1)
+        self.assertIsNotNone(_user(self.directory, 1)['last_login'])
+
+    def test_failures_below_threshold_stay_out_of_main_database(self):
+        tracker = _tracker(self.directory)
+        for expected in range(1, 5):
+            attempts, locked_until = tracker.record_failure(_user(self.directory, 1))
+            self.assertEqual((attempts, locked_until), (expected, None))
+        self.assertEqual(_user(self.directory, 1)['failed_login_attempts'], 0)
+
+        attempts, locked_until = tracker.record_failure(_user(self.directory, 1))
+        self.assertEqual(attempts, 5)
+        self.assertIsNotNone(locked_until)
+        user = _user(self.directory, 1)
+        self.assertEqual(user['failed_login_attempts'], 5)
+        self.assertIsNotNone(user['account_locked_until'])
+
+    def test_success_resets_persisted_lock_and_counter(self):
+        tracker = _tracker(self.directory)
+        for _ in range(5):
+            tracker.record_failure(_user(self.directory, 1))
+        conn = _connect(os.path.join(self.directory, 'database.db'))
+        tracker.record_success(conn, _user(self.directory, 1))
+        conn.close()
+        user = _user(self.directory, 1)
+        self.assertEqual(user['failed_login_attempts'], 0)
+        self.assertIsNone(user['account_locked_until'])
+        self.assertEqual(tracker.record_failure(_user(self.directory, 1)), (1, None))
+
+    def test_concurrent_failures_are_all_counted(self):
+        self._run(_fail_many, [(self.directory, 1, 25, 1000)] * PROCESSES)
+        attempts, _ = _tracker(self.directory, 1000).record_failure(_user(self.directory, 1))
+        self.assertEqual(attempts, PROCESSES * 25 + 1)
+        self.assertEqual(_user(self.directory, 1)['failed_login_attempts'], 0)
+
+    def test_concurrent_failures_lock_the_account(self):
+        self._run(_fail_many, [(self.directory, 1, 2, 5)] * PROCESSES)
+        user = _user(self.directory, 1)
+        self.assertGreaterEqual(user['failed_login_attempts'], 5)
+        self.assertIsNotNone(user['account_locked_until'])
+
+    def test_concurrent_logins_are_coalesced(self):
+        user_ids = list(range(1, 51))
+        self._run(_login_many, [(self.directory, user_ids, 5)] * PROCESSES)
+        store = sqlite3.connect(os.path.join(self.directory, 'login_state.db'))
+        pending = dict(store.execute('SELECT user_id, last_login FROM pending_logins'))
+        store.close()
+        self.assertEqual(sorted(pending), user_ids)
+
+        self.assertEqual(_tracker(self.directory).flush(), len(user_ids))
+        for user_id in user_ids:
+            self.assertEqual(_user(self.directory, user_id)['last_login'], pending[user_id])
+
+    def test_newer_login_survives_flush(self):
+        tracker = _tracker(self.directory)
+        conn = _connect(os.path.join(self.directory, 'database.db'))
+        tracker.record_success(conn, _user(self.directory, 1))
+        store = sqlite3.connect(os.path.join(self.directory, 'login_state.db'))
+        flushed = store.execute('SELECT user_id, last_login FROM pending_logins').fetchall()
+        # Connexion plus récente arrivée entre la lecture et la suppression
+        store.execute("UPDATE pending_logins SET last_login = '2999-01-01 00:00:00' WHERE user_id = 1")
+        store.commit()
+        store.execute('DELETE FROM pending_logins WHERE user_id = ? AND last_login = ?', flushed[0])
+        self.assertEqual(store.execute('SELECT COUNT(*) FROM pending_logins').fetchone()[0], 1)
+        store.close()
+        tracker.flush()
+        self.assertEqual(_user(self.directory, 1)['last_login'], '2999-01-01 00:00:00')
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
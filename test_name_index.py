@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Tests de la recherche par sous-chaîne (name_index.py) : mêmes résultats que
+le parcours ``LIKE '%...%' ESCAPE`` et qu'une recherche Python de référence.
+
+Usage :
+    python test_name_index.py
+"""
+
+import random
+import unittest
+
+import fixtures
+import name_index
+
+ALPHABET = 'abcAB01_%\\ .-éÉ"\''
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+def _add(conn, user_id, name):
+    return fixtures.add_file(conn, user_id, name)
+
+
+def _search(conn, user_id, query):
+    return sorted(row[0] for row in name_index.search(conn.cursor(), user_id, query).fetchall())
+
+
+def _scan(conn, user_id, query):
+    """Parcours complet avec le LIKE échappé (chemin de référence SQL)"""
+    return sorted(row[0] for row in conn.execute(
+        "SELECT id FROM files WHERE user_id = ? AND original_name LIKE ? ESCAPE '\\'",
+        (user_id, '%' + name_index.escape_like(query) + '%')
+    ))
+
+
+def _reference(conn, user_id, query):
+    """Sémantique attendue : sous-chaîne, casse ignorée pour l'ASCII seulement"""
+    needle = query.translate(_ASCII_LOWER)
+    return sorted(
+        file_id for file_id, name in conn.execute('SELECT id, original_name FROM files WHERE user_id = ?', (user_id,))
+        if needle in name.translate(_ASCII_LOWER)
+    )
+
+
+class NameIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = fixtures.create_database()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def assertSameResults(self, user_id, query):
+        expected = _reference(self.conn, user_id, query)
+        self.assertEqual(_scan(self.conn, user_id, query), expected, query)
+        self.assertEqual(_search(self.conn, user_id, query), expected, query)
+
+    def test_random_names_match_like_semantics(self):
+        rng = random.Random(45)
+        names = []
+        for _ in range(2000):
+            name = ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 12))) + rng.choice(['.pdf', '.txt', ''])
+            names.append(name)
+            _add(self.conn, rng.randint(1, 3), name)
+        queries = set()
+        for name in rng.sample(names, 300):
+            start = rng.randint(0, len(name) - 1)
+            query = name[start:start + rng.randint(1, 6)]
+            queries.add(query)
+            queries.add(query.swapcase())
+        queries.update(''.join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 4))) for _ in range(300))
+        for query in queries:
+            if query.strip():
+                for user_id in (1, 2, 3):
+                    self.assertSameResults(user_id, query)
+
+    def test_wildcards_are_literal(self):
+        ids = {name: _add(self.conn, 1, name) for name in ('a%b.txt', 'a_b.txt', 'axb.txt', 'a\\b.txt', 'ab.txt')}
+        self.assertEqual(_search(self.conn, 1, 'a%b'), [ids['a%b.txt']])
+        self.assertEqual(_search(self.conn, 1, 'a_b'), [ids['a_b.txt']])
+        self.assertEqual(_search(self.conn, 1, 'a\\b'), [ids['a\\b.txt']])
+        self.assertEqual(_search(self.conn, 1, '%'), [ids['a%b.txt']])
+        self.assertEqual(_search(self.conn, 1, '_'), [ids['a_b.txt']])
+
+    def test_substring_inside_word(self):
+        file_id = _add(self.conn, 1, 'facture_2023_03.pdf')
+        _add(self.conn, 1, 'facture_2024_03.pdf')
+        self.assertEqual(_search(self.conn, 1, '2023'), [file_id])
+        self.assertEqual(_search(self.conn, 1, 'FACTURE_2023'), [file_id])
+
+    def test_case_folding_is_ascii_only(self):
+        upper = _add(self.conn, 1, 'ÉTÉ 2023.txt')
+        lower = _add(self.conn, 1, 'été 2023.txt')
+        self.assertEqual(_search(self.conn, 1, 'été'), [lower])
+        self.assertEqual(_search(self.conn, 1, 'ÉTÉ'), [upper])
+        self.assertEqual(_search(self.conn, 1, 'tÉ 2'), [upper])
+
+    def test_owner_token_is_exact(self):
+        _add(self.conn, 123, 'budget.xlsx')
+        _add(self.conn, 1, 'budget.xlsx')
+        mine = _add(self.conn, 12, 'budget.xlsx')
+        self.assertEqual(_search(self.conn, 12, 'budget'), [mine])
+
+    def test_short_queries_use_scan(self):
+        file_id = _add(self.conn, 1, 'q1.txt')
+        self.assertEqual(_search(self.conn, 1, 'q1'), [file_id])
+        self.assertEqual(_search(self.conn, 1, 'Q'), [file_id])
+
+    def test_triggers_follow_renames_and_deletes(self):
+        file_id = _add(self.conn, 1, 'rapport.pdf')
+        self.conn.execute("UPDATE files SET original_name = 'compte-rendu.pdf' WHERE id = ?", (file_id,))
+        self.assertEqual(_search(self.conn, 1, 'rapport'), [])
+        self.assertEqual(_search(self.conn, 1, 'rendu'), [file_id])
+        self.conn.execute('UPDATE files SET user_id = 2 WHERE id = ?', (file_id,))
+        self.assertEqual(_search(self.conn, 1, 'rendu'), [])
+        self.assertEqual(_search(self.conn, 2, 'rendu'), [file_id])
+        self.conn.execute('DELETE FROM files WHERE id = ?', (file_id,))
+        self.assertEqual(_search(self.conn, 2, 'rendu'), [])
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM file_names').fetchone()[0], 0)
+
+    def test_existing_files_are_backfilled(self):
+        conn = fixtures.create_database()
+        file_id = _add(conn, 1, 'ancien_fichier.doc')
+        conn.execute('DELETE FROM file_names')  # fichier antérieur à l'index
+        name_index.create_name_index(conn.cursor())
+        name_index.create_name_index(conn.cursor())  # idempotent
+        self.assertEqual(_search(conn, 1, 'fichier'), [file_id])
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM file_names').fetchone()[0], 1)
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests de l'historique des notes (note_revisions.py) : deltas, instantané
+toutes les SNAPSHOT_INTERVAL révisions, reconstruction exacte de chaque
+révision, rétention.
+
+Usage :
+    python test_note_revisions.py
+"""
+
+import unittest
+from datetime import datetime, timedelta
+
+import fixtures
+import note_revisions
+from note_revisions import SNAPSHOT_INTERVAL
+
+WORDS = ['archive', 'dossier', 'note', 'rapport', 'facture', 'contrat', 'projet', 'réunion']
+
+
+def _versions(count):
+    """Contenus successifs : un mot modifié par enregistrement (deltas courts)"""
+    words = [WORDS[i % len(WORDS)] + str(i) for i in range(200)]
+    versions = []
+    for i in range(count):
+        words[(i * 37) % len(words)] = 'édition' + str(i)
+        versions.append(' '.join(words[:100]) + '\n\n' + ' '.join(words[100:]))
+    return versions
+
+
+class NoteRevisionsTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = fixtures.create_database()
+        self.user_id = fixtures.add_user(self.conn, 'alice')
+        self.note_id = self.conn.execute(
+            'INSERT INTO notes (title, content, user_id) VALUES (?, ?, ?)', ('Note', '', self.user_id)
+        ).lastrowid
+
+    def tearDown(self):
+        self.conn.close()
+
+    def record(self, versions, keep=None):
+        return [
+            note_revisions.record_revision(self.conn, self.note_id, self.user_id, 'Note', content, keep=keep)
+            for content in versions
+        ]
+
+    def kinds(self):
+        return {entry['revision']: entry['kind'] for entry in note_revisions.list_revisions(self.conn, self.note_id)}
+
+    def assert_rebuilds(self, versions, revisions):
+        for revision in revisions:
+            found = note_revisions.get_revision(self.conn, self.note_id, revision)
+            self.assertEqual(found['content'], versions[revision - 1], f'révision {revision}')
+
+    def test_every_revision_rebuilds_across_snapshots(self):
+        count = 2 * SNAPSHOT_INTERVAL + 5
+        versions = _versions(count)
+        self.assertEqual(self.record(versions), list(range(1, count + 1)))
+
+        kinds = self.kinds()
+        # Instantané au plus toutes les SNAPSHOT_INTERVAL révisions, deltas entre les deux
+        snapshots = sorted(revision for revision, kind in kinds.items() if kind == 'snapshot')
+        self.assertEqual(snapshots, [1, SNAPSHOT_INTERVAL + 1, 2 * SNAPSHOT_INTERVAL + 1])
+        self.assert_rebuilds(versions, range(1, count + 1))
+        self.assertIsNone(note_revisions.record_revision(self.conn, self.note_id, self.user_id, 'Note', versions[-1]))
+
+    def test_rewrite_stores_snapshot(self):
+        self.record(['un texte court', 'x' * 500])
+        self.assertEqual(self.kinds(), {1: 'snapshot', 2: 'snapshot'})
+
+    def test_prune_keeps_revisions_rebuildable(self):
+        count = 2 * SNAPSHOT_INTERVAL + 5
+        versions = _versions(count)
+        self.record(versions)
+        keep = 10
+        first_kept = count - keep + 1
+        self.assertEqual(self.kinds()[first_kept], 'delta')
+
+        self.assertEqual(note_revisions.prune_revisions(self.conn, self.note_id, keep), count - keep)
+        kinds = self.kinds()
+        self.assertEqual(sorted(kinds), list(range(first_kept, count + 1)))
+        self.assertEqual(kinds[first_kept], 'snapshot')  # premier delta conservé réécrit
+        self.assert_rebuilds(versions, range(first_kept, count + 1))
+        self.assertIsNone(note_revisions.get_revision(self.conn, self.note_id, first_kept - 1))
+
+        # Les enregistrements suivants continuent la chaîne
+        more = _versions(count + 3)[count:]
+        self.record(more, keep=keep)
+        self.assert_rebuilds(versions + more, range(count + 3 - keep + 1, count + 4))
+
+    def test_purge_by_age_keeps_recent_revisions_rebuildable(self):
+        versions = _versions(SNAPSHOT_INTERVAL + 8)
+        self.record(versions)
+        old = datetime.now() - timedelta(days=100)
+        self.conn.execute('UPDATE note_revisions SET created_at = ? WHERE revision <= ?', (old, 20))
+
+        # keep élevé : seul l'âge décide, la révision 21 (delta) devient la première
+        self.assertEqual(note_revisions.purge_old_revisions(self.conn, keep=100, max_age_days=30), 20)
+        self.assertEqual(min(self.kinds()), 21)
+        self.assertEqual(self.kinds()[21], 'snapshot')
+        self.assert_rebuilds(versions, range(21, len(versions) + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
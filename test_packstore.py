@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Tests du stockage en segments (packstore.py) : tiers petits / gros fichiers,
+liste fusionnée, compactage, regroupement des fichiers existants, écritures
+concurrentes de plusieurs processus.
+
+Usage :
+    python test_packstore.py
+"""
+
+import io
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import backup
+from packstore import PackStorage
+from storage import LocalStorage, StorageError
+
+OLD = time.time() - 7 * 24 * 3600
+
+
+class _ShortReads(io.RawIOBase):
+    """Flux qui rend au plus 1000 octets par lecture (comme un flux compressé)"""
+
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self.data.read(min(size, 1000) if size and size > 0 else 1000)
+
+
+def _write_blobs(root, worker, count):
+    storage = PackStorage(root, max_blob_size=4096, segment_size=64 * 1024)
+    for i in range(count):
+        storage.put(f'{worker}-{i:04d}.txt', io.BytesIO(f'{worker}:{i}'.encode() * 50))
+
+
+class PackStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='test_packstore_')
+        self.root = os.path.join(self.tmpdir, 'uploads')
+        self.storage = PackStorage(self.root, max_blob_size=4096, segment_size=64 * 1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_small_blobs_packed_large_ones_in_files(self):
+        small, large = b'note ' * 100, os.urandom(10000)
+        self.assertEqual(self.storage.put('a_note.txt', io.BytesIO(small)), len(small))
+        self.assertEqual(self.storage.put('b_scan.png', _ShortReads(large)), len(large))
+        self.assertEqual(sorted(os.listdir(self.root)), ['.packs', 'b_scan.png'])
+
+        self.assertEqual(self.storage.get('a_note.txt'), small)
+        self.assertEqual(b''.join(self.storage.stream('a_note.txt', chunk_size=64)), small)
+        with self.storage.open('a_note.txt') as f:
+            # Descripteur placé sur les octets du blob (sendfile)
+            self.assertEqual(os.lseek(f.fileno(), 0, os.SEEK_CUR), self.storage.packs._locate('a_note.txt')[1])
+            self.assertEqual(f.read(), small)
+        self.assertEqual(self.storage.get('b_scan.png'), large)
+        self.assertEqual(self.storage.stat('a_note.txt').size, len(small))
+        self.assertIsNone(self.storage.stat('c_absent.txt'))
+        with self.assertRaises(FileNotFoundError):
+            self.storage.get('c_absent.txt')
+        with self.assertRaises(StorageError):
+            self.storage.put('../evasion.txt', io.BytesIO(b'x'))
+
+    def test_list_merges_tiers_by_key(self):
+        keys = ['3c_a.txt', '7d_b.png', '9e_c.txt', 'a0_d.txt', 'f1_e.txt']
+        for i, key in enumerate(keys):
+            size = 10000 if i % 2 else 100
+            self.storage.put(key, io.BytesIO(b'x' * size))
+        self.assertEqual([b.key for b in self.storage.list()], keys)
+        self.assertEqual([b.key for b in self.storage.list('7d', 'a0')], ['7d_b.png', '9e_c.txt'])
+        self.assertEqual([b.size for b in self.storage.list('a')], [10000, 100])
+
+    def test_overwrite_moves_between_tiers_and_delete(self):
+        self.storage.put('k_doc.txt', io.BytesIO(b'x' * 10000))
+        self.storage.put('k_doc.txt', io.BytesIO(b'petit'))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'k_doc.txt')))
+        self.assertEqual(self.storage.get('k_doc.txt'), b'petit')
+        self.storage.put('k_doc.txt', io.BytesIO(b'y' * 10000))
+        self.assertIsNone(self.storage.packs.stat('k_doc.txt'))
+        self.assertEqual(len(self.storage.get('k_doc.txt')), 10000)
+        self.assertTrue(self.storage.delete('k_doc.txt'))
+        self.assertFalse(self.storage.delete('k_doc.txt'))
+        self.assertEqual(list(self.storage.list()), [])
+
+    def test_compaction_reclaims_deleted_blobs(self):
+        contents = {f'{i:04d}_note.txt': os.urandom(3000) for i in range(100)}
+        for key, data in contents.items():
+            self.storage.put(key, io.BytesIO(data))
+        packs = self.storage.packs
+        self.assertGreater(packs.stats()['segments'], 3)
+        for key in list(contents)[::3]:
+            self.storage.delete(key)
+            del contents[key]
+        with self.storage.open(sorted(contents)[0]) as opened:  # lecture en cours pendant le compactage
+            before = packs.stats()
+            stats = packs.compact(min_garbage=0.2)
+            self.assertEqual(opened.read(), contents[sorted(contents)[0]])
+        after = packs.stats()
+        self.assertGreater(stats['segments'], 0)
+        self.assertEqual(after['live_bytes'], before['live_bytes'])
+        self.assertLess(after['bytes'], before['bytes'])
+        segment_files = [name for name in os.listdir(packs.directory) if name.endswith('.pack')]
+        self.assertEqual(len(segment_files), after['segments'])
+        # Nouvelle instance (aucun segment ouvert) : toutes les positions sont à jour
+        fresh = PackStorage(self.root, max_blob_size=4096)
+        for key, data in contents.items():
+            self.assertEqual(fresh.get(key), data)
+
+    def test_compaction_keeps_concurrent_delete(self):
+        for i in range(40):
+            self.storage.put(f'{i:04d}_note.txt', io.BytesIO(os.urandom(3000)))
+        packs = self.storage.packs
+        first = packs._locate('0000_note.txt')[0]
+        batch = [(key, packs.get(key), position) for key, position in packs._index().execute(
+            'SELECT key, position FROM pack_index WHERE segment = ? ORDER BY position', (first,)
+        )]
+        self.storage.delete(batch[0][0])  # supprimé entre la lecture et la recopie
+        self.assertEqual(packs._move(first, batch), len(batch) - 1)
+        self.assertIsNone(self.storage.stat(batch[0][0]))
+        live = packs._index().execute('SELECT live FROM pack_segments WHERE id = ?', (first,)).fetchone()[0]
+        self.assertEqual(live, 0)
+
+    def record_sync_order(self, committed):
+        """Journal des fsync et suppressions, avec ``committed()`` (état de
+        l'index vu par une autre connexion) au moment de chaque appel"""
+        events = []
+        fsync, remove = os.fsync, os.remove
+        index = self.storage.packs._index()
+
+        def recording_fsync(fd):
+            synchronous = index.execute('PRAGMA synchronous').fetchone()[0]
+            events.append(('fsync', committed(), synchronous))
+            fsync(fd)
+
+        def recording_remove(path):
+            events.append(('remove', path, committed()))
+            remove(path)
+
+        patches = [mock.patch('os.fsync', recording_fsync), mock.patch('os.remove', recording_remove)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        return events
+
+    def committed_rows(self, sql, params):
+        conn = sqlite3.connect(self.storage.packs.index_path)
+        try:
+            return conn.execute(sql, params).fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_compaction_syncs_copies_before_removing_segment(self):
+        for i in range(40):
+            self.storage.put(f'{i:04d}_note.txt', io.BytesIO(os.urandom(3000)))
+        packs = self.storage.packs
+        first = packs._locate('0000_note.txt')[0]
+        for i in range(0, 40, 2):
+            self.storage.delete(f'{i:04d}_note.txt')
+        events = self.record_sync_order(lambda: self.committed_rows(
+            'SELECT COUNT(*) FROM pack_index WHERE segment = ?', (first,)
+        ))
+
+        packs.compact(min_garbage=0.2)
+        removal = events.index(('remove', packs.segment_path(first), 0))  # index commité avant
+        syncs = [event for event in events[:removal] if event[0] == 'fsync']
+        # Copie synchronisée alors que l'index désigne encore l'ancien segment,
+        # commit en synchronous = FULL (2)
+        self.assertTrue(syncs)
+        self.assertGreater(syncs[0][1], 0)
+        self.assertTrue(all(synchronous == 2 for _, _, synchronous in syncs))
+        self.assertEqual(packs._index().execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL rétabli
+
+    def test_pack_files_removes_originals_after_durable_commit(self):
+        files = LocalStorage(self.root)
+        for i in range(5):
+            with open(files.path(f'{i}_existant.txt'), 'wb') as f:
+                f.write(b'petit fichier')
+        events = self.record_sync_order(lambda: self.committed_rows('SELECT COUNT(*) FROM pack_index', ()))
+
+        self.assertEqual(self.storage.pack_files()[0], 5)
+        self.assertEqual([event[0] for event in events], ['fsync'] * 2 + ['remove'] * 5)
+        self.assertEqual([event[1:] for event in events[:2]], [(0, 2), (0, 2)])  # segment et répertoire
+        self.assertTrue(all(event[2] == 5 for event in events[2:]))
+
+    def test_pack_and_unpack_existing_files(self):
+        files = LocalStorage(self.root)
+        for i in range(30):
+            key = f'{i:02d}_existant.txt'
+            with open(files.path(key), 'wb') as f:
+                f.write(key.encode() * (10 if i % 10 else 500))
+            os.utime(files.path(key), (OLD, OLD))
+        self.assertEqual(self.storage.pack_files()[0], 27)
+        self.assertEqual(len(os.listdir(self.root)), 4)  # .packs et trois gros fichiers
+        blobs = list(self.storage.list())
+        self.assertEqual(len(blobs), 30)
+        self.assertTrue(all(abs(blob.modified - OLD) < 1 for blob in blobs))
+
+        self.assertEqual(self.storage.unpack_files(), 27)
+        self.assertEqual(self.storage.packs.stats()['blobs'], 0)
+        self.assertEqual(files.get('01_existant.txt'), b'01_existant.txt' * 10)
+        self.assertLess(abs(files.stat('01_existant.txt').modified - OLD), 1)
+
+    def test_concurrent_writers(self):
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_write_blobs, args=(self.root, w, 200)) for w in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+        for w in range(4):
+            for i in range(200):
+                self.assertEqual(self.storage.get(f'{w}-{i:04d}.txt'), f'{w}:{i}'.encode() * 50)
+        stats = self.storage.packs.stats()
+        self.assertEqual((stats['blobs'], stats['live_bytes']), (800, stats['bytes']))
+
+    def test_backup_copies_packed_blobs(self):
+        self.storage.put('aa_note.txt', io.BytesIO(b'contenu'))
+        catalog = backup.BlobCatalog(os.path.join(self.tmpdir, 'backups'))
+        try:
+            self.assertEqual(catalog.copy_from(self.storage, 'aa_note.txt'), 7)
+            with open(catalog.path('aa_note.txt'), 'rb') as f:
+                self.assertEqual(f.read(), b'contenu')
+        finally:
+            catalog.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Tests du profilage à la demande (profiling.py) : échantillonnage, plafonds,
+arrêt automatique, fichiers exportés.
+
+Usage :
+    python test_profiling.py
+"""
+
+import marshal
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from flask import Flask, Response
+
+import profiling
+
+
+def _work(n):
+    return sum(i * i for i in range(n))
+
+
+def _make_app(profiler):
+    app = Flask(__name__)
+
+    @app.route('/slow')
+    def slow():
+        return str(_work(20000))
+
+    @app.route('/stream')
+    def stream():
+        def generate():
+            for _ in range(3):
+                yield str(_work(200000))
+        return Response(generate())
+
+    @app.route('/other')
+    def other():
+        return 'ok'
+
+    profiling.init_profiling(app, profiler)
+    return app
+
+
+class ProfilingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='test_profiling_')
+        self.profiler = profiling.Profiler(
+            os.path.join(self.tmpdir, 'profiling.db'), os.path.join(self.tmpdir, 'profiles'),
+            max_share=1.0, refresh_interval=0, sample_interval=0.001
+        )
+        self.client = _make_app(self.profiler).test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _get(self, path, count=1):
+        for _ in range(count):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            response.get_data()  # contenu produit en flux compris
+            response.close()
+
+    def test_cprofile_session_completes(self):
+        session_id = self.profiler.start('slow', sample_rate=1, max_requests=3)
+        self._get('/slow', 5)
+        self._get('/other')
+        session = self.profiler.get(session_id)
+        self.assertEqual((session['status'], session['profiled']), (profiling.COMPLETED, 3))
+        self.assertEqual([r['seq'] for r in self.profiler.requests(session_id)], [1, 2, 3])
+
+        stats = marshal.loads(self.profiler.export_pstats(session_id))
+        calls = {key[2]: value[1] for key, value in stats.items()}
+        self.assertEqual(calls['_work'], 3)
+        self.assertIsNone(self.profiler.export_folded(session_id))
+
+    def test_sampling_covers_streamed_response(self):
+        session_id = self.profiler.start('stream', mode=profiling.SAMPLING, sample_rate=1, max_requests=2)
+        self._get('/stream', 2)
+        folded = self.profiler.export_folded(session_id)
+        self.assertIn('generate', folded)
+        for line in folded.splitlines():
+            stack, _, count = line.rpartition(' ')
+            self.assertTrue(stack and int(count) > 0)
+
+    def test_allocations(self):
+        session_id = self.profiler.start('slow', allocations=True, sample_rate=1, max_requests=1)
+        self._get('/slow')
+        report = self.profiler.export_allocations(session_id)
+        self.assertTrue(report.startswith('1 requête(s)'))
+        self.assertIsNotNone(self.profiler.requests(session_id)[0]['peak_kb'])
+
+    def test_one_active_session_per_endpoint(self):
+        self.profiler.start('slow')
+        with self.assertRaises(profiling.ProfilingError) as raised:
+            self.profiler.start('slow')
+        self.assertEqual(raised.exception.status, 409)
+        with self.assertRaises(profiling.ProfilingError):
+            self.profiler.start('other', sample_rate=2)
+        with self.assertRaises(profiling.ProfilingError):
+            self.profiler.start('other', max_requests=profiling.MAX_REQUESTS_LIMIT + 1)
+
+    def test_expired_and_stopped_sessions_profile_nothing(self):
+        expired = self.profiler.start('slow', sample_rate=1, duration=1)
+        stopped = self.profiler.start('other', sample_rate=1)
+        self.assertTrue(self.profiler.stop(stopped))
+        self.assertFalse(self.profiler.stop(stopped))
+        time.sleep(1.1)
+        self._get('/slow')
+        self._get('/other')
+        self.assertEqual(self.profiler.get(expired)['status'], profiling.EXPIRED)
+        self.assertEqual(self.profiler.get(stopped)['status'], profiling.STOPPED)
+        self.assertEqual(self.profiler.requests(expired) + self.profiler.requests(stopped), [])
+
+    def test_time_budget(self):
+        self.profiler.max_share = 0.0
+        session_id = self.profiler.start('slow', sample_rate=1)
+        self._get('/slow', 3)
+        self.assertEqual(self.profiler.get(session_id)['profiled'], 0)
+
+    def test_aborts_on_overhead(self):
+        session_id = self.profiler.start('slow', sample_rate=0.5, max_requests=50, max_slowdown=1.0)
+        timings = self.profiler._durations.setdefault(session_id, ([], []))
+        timings[1].extend([1e-9] * profiling.MIN_OVERHEAD_SAMPLES)  # requêtes non profilées instantanées
+        for _ in range(200):
+            if self.profiler.get(session_id)['status'] != profiling.ACTIVE:
+                break
+            self._get('/slow')
+        session = self.profiler.get(session_id)
+        self.assertEqual(session['status'], profiling.ABORTED)
+        self.assertIn('surcoût', session['reason'])
+
+    def test_profiling_failure_aborts_session_not_request(self):
+        session_id = self.profiler.start('slow', sample_rate=1)
+        self.profiler.output_dir = os.path.join(self.tmpdir, 'fichier')
+        open(self.profiler.output_dir, 'w').close()  # répertoire impossible à créer
+        self._get('/slow', 2)
+        self.assertEqual(self.profiler.get(session_id)['status'], profiling.ABORTED)
+        self.assertFalse(self.profiler._busy.locked())
+
+
+if __name__ == '__main__':
+    unittest.main()
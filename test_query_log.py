@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Tests des mesures de requêtes SQL (query_log.py) : normalisation,
+histogrammes, fusion dans le stockage partagé, plusieurs processus, plan des
+requêtes lentes.
+
+Usage :
+    python test_query_log.py
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import query_log
+from query_log import BUCKETS_MS, QueryLog, bucket_index, normalize, percentile
+
+
+class NormalizeTest(unittest.TestCase):
+    def test_literals_lists_and_spaces(self):
+        self.assertEqual(
+            normalize("SELECT *  FROM files\n WHERE id IN (?, ?,?) AND name = 'l''été' AND size > 10.5 AND t2.x = 3"),
+            'SELECT * FROM files WHERE id IN (?...) AND name = ? AND size > ? AND t2.x = ?'
+        )
+        # Nombre variable de paramètres : une seule entrée
+        self.assertEqual(normalize('DELETE FROM jobs WHERE id IN (?)'), normalize('DELETE FROM jobs WHERE id IN (?, ?)'))
+        self.assertEqual(len(normalize('SELECT ' + 'x, ' * 2000 + 'y')), query_log.MAX_STATEMENT_LENGTH)
+
+    def test_parameters_shape_hides_values(self):
+        self.assertEqual(query_log.parameters_shape(('hunter2', b'\x00\x01', 3, None)),
+                         ['str[7]', 'bytes[2]', 'int', 'null'])
+        self.assertEqual(query_log.parameters_shape({'password': 'secret'}), {'password': 'str[6]'})
+
+
+class HistogramTest(unittest.TestCase):
+    def test_bucket_index(self):
+        self.assertEqual(bucket_index(0), 0)
+        self.assertEqual(bucket_index(BUCKETS_MS[0]), 0)  # borne supérieure incluse
+        self.assertEqual(bucket_index(0.11), 1)
+        self.assertEqual(bucket_index(BUCKETS_MS[-1] + 1), len(BUCKETS_MS))
+
+    def test_percentile(self):
+        buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.assertEqual(percentile(buckets, 0.5, 0), 0.0)
+        buckets[bucket_index(0.2)] = 90
+        buckets[bucket_index(40)] = 10
+        self.assertEqual(percentile(buckets, 0.5, 42.0), 0.25)
+        self.assertEqual(percentile(buckets, 0.95, 42.0), 42.0)  # borne 50 ms, plafonnée au maximum observé
+        buckets[-1] = 100
+        self.assertEqual(percentile(buckets, 0.99, 9000.0), 9000.0)
+
+
+class QueryLogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='test_query_log_')
+        self.path = os.path.join(self.tmpdir, 'stats', 'query_stats.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def stored(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            return query_log.report(conn), query_log.slow_queries(conn)
+        finally:
+            conn.close()
+
+    def test_flush_merges_counters(self):
+        log = QueryLog(self.path, slow_ms=1000)
+        self.assertEqual(log.flush(), 0)
+        self.assertFalse(os.path.exists(self.path))  # rien à écrire : pas de fichier
+
+        log.record('SELECT * FROM files WHERE id = 1', (), 0.0002)
+        log.record('SELECT * FROM files WHERE id = 2', (), 0.003)
+        self.assertEqual(log.flush(), 1)
+        log.record('SELECT * FROM files WHERE id = 3', (), 0.040)
+        self.assertEqual(log.flush(), 1)
+
+        [entry], slow = self.stored()
+        self.assertEqual(slow, [])
+        self.assertEqual(entry['statement'], 'SELECT * FROM files WHERE id = ?')
+        self.assertEqual(entry['calls'], 3)
+        self.assertAlmostEqual(entry['total_ms'], 43.2)
+        self.assertAlmostEqual(entry['max_ms'], 40.0)
+        self.assertEqual(entry['p50_ms'], 5)
+        conn = sqlite3.connect(self.path)
+        buckets = json.loads(conn.execute('SELECT buckets FROM query_stats').fetchone()[0])
+        conn.close()
+        self.assertEqual(sum(buckets), 3)
+        self.assertEqual(buckets[bucket_index(40)], 1)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'fork requis')
+    def test_processes_accumulate_without_double_counting(self):
+        log = QueryLog(self.path, slow_ms=1000)
+        log.record('SELECT 1', (), 0.001)  # pas encore écrit au moment du fork
+        pid = os.fork()
+        if pid == 0:  # worker : ses propres mesures seulement
+            try:
+                log.record('SELECT 1', (), 0.001)
+                log.record('SELECT 1', (), 0.001)
+                log.flush()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        log.flush()
+        [entry], _ = self.stored()
+        self.assertEqual(entry['calls'], 3)
+
+    def test_instrumented_connection_flags_full_scans(self):
+        log = QueryLog(self.path, slow_ms=0)  # toutes les requêtes sont « lentes »
+        conn = log.connect(':memory:')
+        conn.execute('CREATE TABLE notes (id INTEGER PRIMARY KEY, user_id INTEGER, title TEXT)')
+        conn.execute('CREATE TABLE files (id INTEGER PRIMARY KEY, user_id INTEGER)')
+        conn.execute('CREATE INDEX idx_files_user ON files (user_id)')
+        conn.executemany('INSERT INTO notes (user_id, title) VALUES (?, ?)', [(1, 'secret'), (2, 'b')])
+        conn.execute('SELECT title FROM notes WHERE user_id = ?', (1,)).fetchall()
+        conn.cursor().execute('SELECT id FROM files WHERE user_id = ?', (1,)).fetchall()
+        conn.close()
+        log.flush()
+
+        report, slow = self.stored()
+        statements = {entry['statement'] for entry in report}
+        self.assertIn('INSERT INTO notes (user_id, title) VALUES (?, ?)', statements)
+        self.assertFalse(any(statement.startswith('EXPLAIN') for statement in statements))
+
+        by_statement = {entry['statement']: entry for entry in slow}
+        scan = by_statement['SELECT title FROM notes WHERE user_id = ?']
+        self.assertEqual(scan['full_scans'], ['notes'])
+        self.assertIn('SCAN notes', scan['plan'])
+        self.assertEqual(scan['params'], ['int'])
+        indexed = by_statement['SELECT id FROM files WHERE user_id = ?']
+        self.assertEqual(indexed['full_scans'], [])
+        self.assertTrue(any('idx_files_user' in line for line in indexed['plan']))
+        # executemany : une entrée, forme du premier jeu de paramètres, jamais les valeurs
+        insert = by_statement['INSERT INTO notes (user_id, title) VALUES (?, ?)']
+        self.assertEqual(insert['params'], ['int', 'str[6]'])
+        self.assertNotIn('secret', json.dumps(slow))
+        # Le classement rappelle le parcours complet de la requête
+        scans = {entry['statement']: entry['full_scans'] for entry in report}
+        self.assertEqual(scans['SELECT title FROM notes WHERE user_id = ?'], ['notes'])
+        self.assertEqual(scans['SELECT id FROM files WHERE user_id = ?'], [])
+
+    def test_postgres_plan_masks_strings(self):
+        lines, scans = query_log.postgres_plan([
+            'Seq Scan on users  (cost=0.00..1.05 rows=1 width=4)',
+            "  Filter: (email = 'alice@example.com'::text)",
+        ])
+        self.assertEqual(scans, ['users'])
+        self.assertEqual(lines[1], "  Filter: (email = '?'::text)")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Tests de la compression des réponses (response_compression.py) :
+négociation, seuil, flux compressés au fil de l'eau, réponses exclues.
+
+Usage :
+    python test_response_compression.py
+"""
+
+import gzip
+import io
+import json
+import unittest
+import zlib
+
+from flask import Flask, Response, jsonify, send_file
+
+import response_compression
+
+BIG = {'files': [{'id': i, 'original_name': f'facture_{i}.pdf'} for i in range(200)]}
+
+
+def _decode(data, encoding):
+    if encoding == response_compression.GZIP:
+        return gzip.decompress(data)
+    if encoding == response_compression.BROTLI:
+        return response_compression.brotli.decompress(data)
+    if encoding == response_compression.ZSTD:
+        return response_compression.zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def _make_app():
+    app = Flask(__name__)
+    app.config['RESPONSE_COMPRESSION_MIN_SIZE'] = 1024
+    closed = []
+
+    @app.route('/big')
+    def big():
+        response = jsonify(BIG)
+        response.set_etag('v1')
+        return response
+
+    @app.route('/small')
+    def small():
+        return jsonify({'files': []})
+
+    @app.route('/stream')
+    def stream():
+        def generate():
+            try:
+                yield '{"files":['
+                for i in range(200):
+                    yield ('' if i == 0 else ',') + json.dumps({'id': i})
+                yield ']}'
+            finally:
+                closed.append(True)
+        return Response(generate(), mimetype='application/json')
+
+    @app.route('/events')
+    def events():
+        return Response(iter(['data: x\n\n' * 200]), mimetype='text/event-stream')
+
+    @app.route('/download')
+    def download():
+        return send_file(io.BytesIO(b'a' * 5000), mimetype='text/plain', as_attachment=True,
+                         download_name='notes.txt')
+
+    response_compression.init_response_compression(app)
+    return app, closed
+
+
+class ResponseCompressionTest(unittest.TestCase):
+    def setUp(self):
+        self.app, self.closed = _make_app()
+        self.client = self.app.test_client()
+
+    def get(self, path, accept):
+        return self.client.get(path, headers={'Accept-Encoding': accept})
+
+    def test_negotiates_available_encodings(self):
+        for encoding in response_compression.available_encodings():
+            response = self.get('/big', encoding)
+            self.assertEqual(response.headers['Content-Encoding'], encoding)
+            self.assertEqual(json.loads(_decode(response.data, encoding)), BIG)
+            self.assertIn('Accept-Encoding', response.headers['Vary'])
+            self.assertEqual(int(response.headers['Content-Length']), len(response.data))
+
+    def test_client_quality_values_win(self):
+        response = self.get('/big', 'br;q=0.5, gzip')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        response = self.get('/big', 'gzip;q=0, identity')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+    def test_small_response_is_not_compressed(self):
+        response = self.get('/small', 'gzip')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+    def test_strong_etag_is_weakened(self):
+        response = self.get('/big', 'gzip')
+        self.assertEqual(response.headers['ETag'], 'W/"v1"')
+        self.assertEqual(self.get('/big', 'identity').headers['ETag'], '"v1"')
+
+    def test_stream_is_compressed_chunk_by_chunk(self):
+        response = self.get('/stream', 'gzip')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(json.loads(gzip.decompress(response.data)), {'files': [{'id': i} for i in range(200)]})
+        self.assertEqual(self.closed, [True])
+
+    def test_flushed_chunks_decode_incrementally(self):
+        encoder = response_compression.encoder('gzip')
+        decoder = zlib.decompressobj(31)
+        for part in (b'{"files":[', b'{"id":1}', b']}'):
+            self.assertEqual(decoder.decompress(encoder.compress(part) + encoder.flush()), part)
+
+    def test_excluded_responses(self):
+        response = self.get('/events', 'gzip')
+        self.assertNotIn('Content-Encoding', response.headers)
+        response = self.get('/download', 'gzip')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, b'a' * 5000)
+        response.close()
+
+    def test_disabled_by_config(self):
+        app = Flask(__name__)
+        app.config['RESPONSE_COMPRESSION'] = False
+        app.add_url_rule('/big', 'big', lambda: jsonify(BIG))
+        response_compression.init_response_compression(app)
+        response = app.test_client().get('/big', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests des listes JSON en flux (rows.py) : contenu par lots, fermeture de
+la connexion pour un flux lu, interrompu ou jamais commencé (HEAD).
+
+Usage :
+    python test_rows.py
+"""
+
+import json
+import sqlite3
+import unittest
+
+from werkzeug.test import create_environ
+from werkzeug.wrappers import Response
+
+import rows
+
+
+class StreamJSONListTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute('CREATE TABLE labels (id INTEGER PRIMARY KEY, name TEXT)')
+        self.conn.executemany('INSERT INTO labels (name) VALUES (?)', [('étiquette ' + str(i),) for i in range(7)])
+        self.closed = 0
+
+    def tearDown(self):
+        self.conn.close()
+
+    def on_close(self):
+        self.closed += 1
+
+    def stream(self):
+        cursor = self.conn.execute('SELECT id, name FROM labels ORDER BY id')
+        return rows.stream_json_list(cursor, 'labels', batch_size=3, on_close=self.on_close)
+
+    def test_full_read_closes_once(self):
+        stream = self.stream()
+        data = json.loads(''.join(stream))
+        self.assertEqual(len(data['labels']), 7)
+        self.assertEqual(data['labels'][0], {'id': 1, 'name': 'étiquette 0'})
+        self.assertEqual(self.closed, 1)
+        stream.close()  # appelé ensuite par le serveur
+        self.assertEqual(self.closed, 1)
+
+    def test_empty_result(self):
+        self.conn.execute('DELETE FROM labels')
+        self.assertEqual(''.join(self.stream()), '{"labels":[]}')
+
+    def test_disconnect_mid_stream_closes(self):
+        stream = self.stream()
+        next(iter(stream))
+        stream.close()
+        self.assertEqual(self.closed, 1)
+
+    def test_head_request_closes_without_iterating(self):
+        response = Response(self.stream(), mimetype='application/json')
+        app_iter = response.get_app_iter(create_environ(method='HEAD'))
+        self.assertEqual(list(app_iter), [])
+        self.assertEqual(self.closed, 0)
+        app_iter.close()  # serveur WSGI, fin de la requête
+        self.assertEqual(self.closed, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Tests du vérificateur de stockage (scrubber.py) : empreintes, fichiers
+manquants, altérés ou orphelins, réparation depuis les sauvegardes, reprise.
+
+Usage :
+    python test_scrubber.py
+"""
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import fixtures
+import scrubber
+from backup import BlobCatalog
+from storage import LocalStorage
+
+OLD = time.time() - 7 * 24 * 3600
+
+
+def _connect(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class ScrubberTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='test_scrubber_')
+        self.storage = LocalStorage(os.path.join(self.tmpdir, 'uploads'))
+        self.databases = [os.path.join(self.tmpdir, name) for name in ('a.db', 'b.db')]
+        for path in self.databases:
+            fixtures.create_database(path).close()
+        self.backup_dir = os.path.join(self.tmpdir, 'backups')
+        self.state = scrubber.ScrubState(os.path.join(self.tmpdir, 'scrub_state.db'))
+
+    def tearDown(self):
+        self.state.close()
+        shutil.rmtree(self.tmpdir)
+
+    def add(self, key, data=None, db=0, row=True, blob=True, mtime=OLD):
+        data = data if data is not None else key.encode() * 10
+        if blob:
+            path = self.storage.path(key)
+            with open(path, 'wb') as f:
+                f.write(data)
+            os.utime(path, (mtime, mtime))
+        if row:
+            conn = _connect(self.databases[db])
+            fixtures.add_file(conn, 1, key, filename=key, file_size=len(data))
+            conn.commit()
+            conn.close()
+        return data
+
+    def scrub(self, **kwargs):
+        kwargs.setdefault('threads', 2)
+        kwargs.setdefault('rate_mb', 0)
+        instance = scrubber.Scrubber(
+            self.storage, self.databases, _connect, self.state,
+            quarantine_dir=os.path.join(self.tmpdir, 'quarantine'), backup_dir=self.backup_dir, **kwargs
+        )
+        return instance.run(restart=True)
+
+    def findings(self, run_id):
+        return {(row['key'], row['kind'], row['action']) for row in self.state.findings(run_id)}
+
+    def checksum(self, key, db=0):
+        conn = _connect(self.databases[db])
+        try:
+            return conn.execute('SELECT checksum FROM files WHERE filename = ?', (key,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_records_then_verifies_checksums(self):
+        data = self.add('0a_doc.txt')
+        self.add('f1_photo.jpg', db=1)
+        run_id, stats = self.scrub()
+        self.assertEqual(stats['recorded'], 2)
+        self.assertEqual(self.findings(run_id), set())
+        self.assertEqual(self.checksum('0a_doc.txt'), hashlib.sha256(data).hexdigest())
+
+        run_id, stats = self.scrub()
+        self.assertEqual((stats['checked'], stats.get('recorded', 0)), (2, 0))
+
+    def test_corrupt_blob_is_repaired_from_backup(self):
+        data = self.add('3c_rapport.pdf')
+        self.scrub()
+        catalog = BlobCatalog(self.backup_dir)
+        catalog.copy_from(self.storage, '3c_rapport.pdf')
+        catalog.close()
+        with open(self.storage.path('3c_rapport.pdf'), 'r+b') as f:
+            f.write(b'X')  # bit rot
+
+        run_id, stats = self.scrub(dry_run=True)
+        self.assertEqual(self.findings(run_id), {('3c_rapport.pdf', 'corrupt', 'repairable')})
+        run_id, stats = self.scrub()
+        self.assertEqual(self.findings(run_id), {('3c_rapport.pdf', 'corrupt', 'repaired')})
+        self.assertEqual(self.storage.get('3c_rapport.pdf'), data)
+
+    def test_truncated_blob_without_checksum(self):
+        self.add('7d_notes.txt', data=b'abc')
+        with open(self.storage.path('7d_notes.txt'), 'wb') as f:
+            f.write(b'ab')
+        run_id, _ = self.scrub()
+        self.assertEqual(self.findings(run_id), {('7d_notes.txt', 'corrupt', 'unrepaired')})
+        self.assertIsNone(self.checksum('7d_notes.txt'))
+
+    def test_missing_blob(self):
+        self.add('b2_cv.pdf', blob=False)
+        run_id, stats = self.scrub()
+        self.assertEqual(stats['missing'], 1)
+        self.assertEqual(self.findings(run_id), {('b2_cv.pdf', 'missing', 'unrepaired')})
+
+    def test_orphans_are_quarantined_after_grace_period(self):
+        self.add('5e_old.txt', row=False)
+        self.add('5f_upload_en_cours.txt', row=False, mtime=time.time())
+        self.add('Zz_hors_uuid.txt', row=False)  # clé hors des préfixes hexadécimaux
+        os.makedirs(os.path.join(self.storage.root, '.chunks'))
+        with open(os.path.join(self.storage.root, '.tmp-123'), 'wb') as f:
+            f.write(b'partiel')
+
+        run_id, stats = self.scrub()
+        self.assertEqual(self.findings(run_id), {
+            ('5e_old.txt', 'orphan', 'quarantined'), ('Zz_hors_uuid.txt', 'orphan', 'quarantined'),
+        })
+        self.assertEqual(stats['recent_orphans'], 1)
+        self.assertIsNone(self.storage.stat('5e_old.txt'))
+        self.assertIsNotNone(self.storage.stat('5f_upload_en_cours.txt'))
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, 'quarantine', str(run_id), '5e_old.txt')))
+        self.assertTrue(os.path.exists(os.path.join(self.storage.root, '.tmp-123')))
+
+    def test_orphan_check_sees_rows_inserted_meanwhile(self):
+        self.add('9a_late.txt', row=False)
+        instance = scrubber.Scrubber(self.storage, self.databases, _connect, self.state, rate_mb=0,
+                                     quarantine_dir=os.path.join(self.tmpdir, 'quarantine'), backup_dir=self.backup_dir)
+        original = instance._referenced
+
+        def referenced(key):
+            self.add(key, blob=False, db=1)  # ligne écrite après la lecture de l'intervalle
+            return original(key)
+
+        instance._referenced = referenced
+        run_id, stats = instance.run(restart=True)
+        self.assertEqual(self.findings(run_id), set())
+        self.assertIsNotNone(self.storage.stat('9a_late.txt'))
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        keys = [f'{i:03x}_{i}.txt' for i in range(60)]
+        for i, key in enumerate(keys):
+            self.add(key, db=i % 2)
+        instance = scrubber.Scrubber(self.storage, self.databases, _connect, self.state, threads=2, rate_mb=0,
+                                     backup_dir=self.backup_dir)
+        original = instance._checksum
+        calls = []
+
+        def failing(key):
+            calls.append(key)
+            if len(calls) == 25:
+                raise KeyboardInterrupt
+            return original(key)
+
+        with mock.patch.object(scrubber, 'CHECKPOINT_KEYS', 5):
+            instance._checksum = failing
+            with self.assertRaises(KeyboardInterrupt):
+                instance.run()
+            progress = self.state.progress(self.state.latest_run()['id'])
+            self.assertTrue(progress)
+
+            instance._checksum = original
+            run_id, stats = instance.run()
+        self.assertEqual(stats['checked'], len(keys))
+        self.assertEqual(stats['recorded'], len(keys))
+        self.assertTrue(all(self.checksum(key, db=i % 2) for i, key in enumerate(keys)))
+
+    def test_token_bucket_limits_rate(self):
+        bucket = scrubber.TokenBucket(rate=1000, burst=100)
+        started = time.monotonic()
+        for _ in range(3):
+            bucket.consume(100)
+        self.assertGreaterEqual(time.monotonic() - started, 0.19)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Tests des sessions côté serveur (sessions.py) : nouvel identifiant à la
+connexion, révocation de tous les appareils, expiration après inactivité,
+prolongation glissante, cache en mémoire des workers.
+
+Usage :
+    python test_sessions.py
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import types
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from flask import Flask, session
+
+import sessions
+from sessions import MemorySessionStore, ServerSideSessionInterface, SQLiteSessionStore
+
+LIFETIME = timedelta(minutes=30)
+
+
+def _create_app(store):
+    """Application minimale : la même logique de connexion que app.login"""
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.permanent_session_lifetime = LIFETIME
+    app.session_interface = ServerSideSessionInterface(store)
+
+    @app.route('/visit')
+    def visit():
+        session['theme'] = 'sombre'  # session anonyme avant la connexion
+        return ''
+
+    @app.route('/login/<int:user_id>')
+    def login(user_id):
+        session.clear()
+        session['user_id'] = user_id
+        session.permanent = True
+        return ''
+
+    @app.route('/whoami')
+    def whoami():
+        return str(session.get('user_id'))
+
+    @app.route('/logout')
+    def logout():
+        session.clear()
+        return ''
+
+    return app
+
+
+class SQLiteSessionsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='test_sessions_')
+        self.store = self.create_store()
+        self.app = _create_app(self.store)
+
+        # Horloge des sessions avancée à la main (dates et TTL du cache)
+        self.elapsed = 0.0
+        test = self
+
+        class ShiftedDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.now(tz) + timedelta(seconds=test.elapsed)
+
+        clock = types.SimpleNamespace(monotonic=lambda: time.monotonic() + self.elapsed)
+        for patch in (mock.patch('sessions.datetime', ShiftedDatetime), mock.patch('sessions.time', clock)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def create_store(self):
+        path = os.path.join(self.tmpdir, 'sessions.db')
+
+        def connect():
+            conn = sqlite3.connect(path)
+            conn.row_factory = sqlite3.Row
+            return conn
+
+        conn = connect()
+        sessions.create_sessions_table(conn.cursor())
+        conn.commit()
+        conn.close()
+        return SQLiteSessionStore(connect)
+
+    def login(self, user_id, app=None):
+        client = (app or self.app).test_client()
+        client.get('/login/' + str(user_id))
+        return client
+
+    def sid(self, client):
+        cookie = client.get_cookie('session')
+        return cookie.value if cookie else None
+
+    def whoami(self, client):
+        return client.get('/whoami').get_data(as_text=True)
+
+    def test_login_rotates_session_id(self):
+        client = self.app.test_client()
+        client.get('/visit')
+        anonymous = self.sid(client)
+        self.assertIsNotNone(anonymous)
+
+        client.get('/login/1')
+        authenticated = self.sid(client)
+        self.assertNotEqual(authenticated, anonymous)
+        # L'identifiant d'avant la connexion (fixation) ne mène plus à rien
+        self.assertIsNone(self.store.load(anonymous))
+        stolen = self.app.test_client()
+        stolen.set_cookie('session', anonymous)
+        self.assertEqual(self.whoami(stolen), 'None')
+        self.assertEqual(self.whoami(client), '1')
+
+        client.get('/logout')
+        self.assertIsNone(self.sid(client))
+        self.assertIsNone(self.store.load(authenticated))
+
+    def test_revoke_user_invalidates_other_sessions(self):
+        laptop, phone, other = self.login(1), self.login(1), self.login(2)
+        self.assertEqual(self.whoami(phone), '1')  # en cache
+
+        self.assertEqual(self.app.session_interface.revoke_user(1), 2)
+        self.assertEqual(self.whoami(laptop), 'None')
+        self.assertEqual(self.whoami(phone), 'None')
+        self.assertEqual(self.whoami(other), '2')
+
+    def test_idle_session_expires(self):
+        client = self.login(1)
+        sid = self.sid(client)
+        self.elapsed = LIFETIME.total_seconds() + 1
+        self.assertEqual(self.whoami(client), 'None')
+        self.assertIsNone(self.store.load(sid))  # supprimée à la lecture
+
+    def test_activity_slides_expiration(self):
+        client = self.login(1)
+        sid = self.sid(client)
+        _, expires_at = self.store.load(sid)
+
+        # Moins d'une minute après : pas d'écriture, pas de cookie renvoyé
+        self.elapsed = sessions.TOUCH_INTERVAL / 2
+        response = client.get('/whoami')
+        self.assertNotIn('Set-Cookie', response.headers)
+        self.assertEqual(self.store.load(sid)[1], expires_at)
+
+        # Au-delà : expiration repoussée d'une durée de vie complète
+        self.elapsed = sessions.TOUCH_INTERVAL * 2
+        response = client.get('/whoami')
+        self.assertIn('Set-Cookie', response.headers)
+        touched = self.store.load(sid)[1]
+        self.assertAlmostEqual(touched - expires_at, timedelta(seconds=self.elapsed), delta=timedelta(seconds=1))
+
+        # Active après l'expiration d'origine, puis expirée après une inactivité complète
+        self.elapsed += LIFETIME.total_seconds() - 1
+        self.assertEqual(self.whoami(client), '1')
+        self.elapsed += LIFETIME.total_seconds() + 1
+        self.assertEqual(self.whoami(client), 'None')
+
+    def test_worker_cache_stops_serving_revoked_session(self):
+        # Deux workers : même stockage, chacun son cache
+        worker = _create_app(self.store)
+        client = self.login(1)
+        sid = self.sid(client)
+        other = worker.test_client()
+        other.set_cookie('session', sid)
+        self.assertEqual(self.whoami(other), '1')  # mise en cache par l'autre worker
+
+        self.app.session_interface.revoke_user(1)
+        self.assertEqual(self.whoami(client), 'None')
+        # Révocation propagée en au plus CACHE_TTL secondes
+        self.elapsed = sessions.CACHE_TTL / 2
+        self.assertEqual(self.whoami(other), '1')
+        self.elapsed = sessions.CACHE_TTL + 0.1
+        self.assertEqual(self.whoami(other), 'None')
+
+
+class MemorySessionsTest(SQLiteSessionsTest):
+    def create_store(self):
+        return MemorySessionStore()
+
+
+if __name__ == '__main__':
+    unittest.main()
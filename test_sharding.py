@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Tests de la répartition des données (sharding.py) : routage par groupe ou
+par utilisateur, placement au premier usage, déplacement pendant une
+écriture, migration des fichiers existants.
+
+Usage :
+    python test_sharding.py
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import fixtures
+import sharding
+from sharding import ShardRouter
+
+
+class ShardRouterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='test_sharding_')
+        self.catalog = os.path.join(self.tmpdir, 'database.db')
+        conn = sqlite3.connect(self.catalog)
+        sharding.create_placement_table(conn.cursor())
+        conn.commit()
+        conn.close()
+        self.directories = [os.path.join(self.tmpdir, 'vol1'), os.path.join(self.tmpdir, 'vol2')]
+        self.initialized = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def initialize(self, path):
+        self.initialized.append(path)
+        conn = sqlite3.connect(path)
+        conn.execute('CREATE TABLE IF NOT EXISTS notes (id INTEGER PRIMARY KEY, user_id INTEGER, title TEXT)')
+        conn.commit()
+        conn.close()
+
+    def router(self, mode='bucket', directories=None):
+        return ShardRouter(self.catalog, mode, buckets=4, directories=directories or self.directories,
+                           initialize=self.initialize)
+
+    def add_note(self, conn, user_id, title):
+        conn.execute('INSERT INTO notes (user_id, title) VALUES (?, ?)', (user_id, title))
+
+    def titles(self, router, user_id):
+        conn = router.connect(user_id)
+        try:
+            return [row['title'] for row in conn.execute('SELECT title FROM notes WHERE user_id = ? ORDER BY id',
+                                                         (user_id,))]
+        finally:
+            conn.close()
+
+    def test_bucket_mode_groups_users(self):
+        router = self.router()
+        self.assertEqual([router.bucket_for(user_id) for user_id in (1, 5, 2)], [1, 1, 2])
+        for user_id in (1, 5, 2):
+            conn = router.connect(user_id)
+            self.add_note(conn, user_id, 'note ' + str(user_id))
+            conn.commit()
+            conn.close()
+
+        # Un fichier par bucket, placé au premier usage dans le répertoire le moins chargé
+        self.assertEqual(router.placements(), [(1, self.directories[0]), (2, self.directories[1])])
+        self.assertEqual(self.initialized, [os.path.join(self.directories[0], 'bucket-0001.db'),
+                                            os.path.join(self.directories[1], 'bucket-0002.db')])
+        self.assertEqual(self.titles(router, 5), ['note 5'])
+        # Un autre processus (autre ordre des répertoires) lit le même placement
+        other = self.router(directories=list(reversed(self.directories)))
+        self.assertEqual(other.path_for(1), os.path.join(self.directories[0], 'bucket-0001.db'))
+        self.assertEqual(self.titles(other, 1), ['note 1'])
+
+    def test_user_mode_one_file_per_user(self):
+        router = self.router('user')
+        self.assertEqual(router.bucket_for(7), 7)
+        router.connect(7).close()
+        router.connect(11).close()
+        self.assertEqual(sorted(os.path.basename(path) for path in router.shard_paths()), ['user-11.db', 'user-7.db'])
+        self.assertFalse(self.router('').enabled)
+        with self.assertRaises(ValueError):
+            self.router('table')
+
+    def test_move_during_write(self):
+        router = self.router()
+        writer = router.connect(1)
+        self.add_note(writer, 1, 'avant')
+        writer.commit()
+
+        # Écriture en cours : le déplacement attend son commit
+        self.add_note(writer, 1, 'pendant')
+        mover = threading.Thread(target=router.move, args=(1, self.directories[1]))
+        mover.start()
+        time.sleep(0.2)
+        self.assertTrue(mover.is_alive())
+        writer.commit()
+        mover.join()
+
+        self.assertEqual(router.placements(), [(1, self.directories[1])])
+        self.assertFalse(os.path.exists(os.path.join(self.directories[0], 'bucket-0001.db')))
+        # Connexion ouverte sur l'ancien fichier : écriture refusée, rien de perdu
+        with self.assertRaises(sqlite3.IntegrityError) as raised:
+            self.add_note(writer, 1, 'après')
+        writer.close()
+        self.assertTrue(sharding.is_moved_error(raised.exception))
+        self.assertEqual(self.titles(router, 1), ['avant', 'pendant'])
+
+    def test_plan_rebalance_empties_removed_directory(self):
+        router = self.router()
+        for user_id in (1, 2, 3):
+            router.connect(user_id).close()
+        router = self.router(directories=self.directories[1:])
+        moves = router.plan_rebalance()
+        self.assertEqual(sorted(bucket for bucket, source, _ in moves if source == self.directories[0]), [1, 3])
+        for bucket, _, target in moves:
+            router.move(bucket, target)
+        self.assertEqual({directory for _, directory in router.placements()}, {self.directories[1]})
+
+
+class AppShardingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='test_sharding_')
+        fixtures.create_database(':memory:').close()  # variables d'environnement des tests
+        import app
+
+        self.app = app
+        fixtures.create_database(app.DATABASE).close()
+        self.router = ShardRouter(app.DATABASE, 'bucket', buckets=4, directories=[self.tmpdir],
+                                  initialize=app.migrate_database)
+        patch = mock.patch.object(app, 'shard_router', self.router)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_moved_error_asks_client_to_retry(self):
+        self.router.path_for(1)
+        self.assertTrue(self.router._cache)
+        error = sqlite3.IntegrityError(sharding.MOVED_MESSAGE)
+        with self.app.app.test_request_context():
+            response = self.app.integrity_error(error)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(self.router._cache, {})  # emplacement relu à la nouvelle tentative
+
+    def test_migrate_updates_existing_shard_files(self):
+        for user_id in (1, 2):
+            conn = self.router.connect(user_id)
+            fixtures.add_file(conn, user_id, 'rapport.pdf')
+            # Fichier d'une version précédente du schéma
+            conn.execute('DROP TABLE note_revisions')
+            conn.execute('PRAGMA user_version = ' + str(self.app.SCHEMA_VERSION - 1))
+            conn.commit()
+            conn.close()
+
+        self.assertTrue(self.app.migrate())
+        for path in self.router.shard_paths():
+            conn = sqlite3.connect(path)
+            try:
+                self.assertEqual(conn.execute('PRAGMA user_version').fetchone()[0], self.app.SCHEMA_VERSION)
+                self.assertIsNotNone(conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'note_revisions'"
+                ).fetchone())
+                self.assertEqual(conn.execute('SELECT original_name FROM files').fetchall(), [('rapport.pdf',)])
+            finally:
+                conn.close()
+        self.assertFalse(self.app.migrate())
+
+
+if __name__ == '__main__':
+    unittest.main()
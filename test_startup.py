@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Tests du démarrage : importer l'application (master gunicorn, scripts) ne
+crée aucun fichier et ne charge pas les dépendances optionnelles lourdes ;
+réglages gunicorn de chaque profil, variables obligatoires en production.
+
+Usage :
+    python test_startup.py
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import config
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Chargées à la première utilisation : stockage S3, PostgreSQL, images, PDF
+LAZY_MODULES = ('boto3', 'botocore', 'psycopg', 'psycopg_pool', 'PIL', 'pypdf')
+
+_SCRIPT = '''
+import json, sys
+import app
+print(json.dumps(sorted({name.split('.')[0] for name in sys.modules})))
+'''
+
+# Réglages lus par gunicorn dans gunicorn.conf.py (gevent absent si demandé)
+_GUNICORN_SCRIPT = '''
+import json, os, runpy, sys
+if os.environ.get('GUNICORN_WORKER_CLASS') == 'gevent':
+    sys.modules['gevent'] = None
+settings = runpy.run_path(sys.argv[1])
+names = ('bind', 'worker_class', 'workers', 'threads', 'preload_app', 'reload', 'timeout',
+         'max_requests', 'max_requests_jitter', 'cores')
+result = {name: settings.get(name) for name in names}
+result['sse_max_streams'] = os.environ['SSE_MAX_STREAMS']
+print(json.dumps(result))
+'''
+
+_GUNICORN_VARIABLES = ('FLASK_ENV', 'SECRET_KEY', 'GUNICORN_BIND', 'GUNICORN_WORKER_CLASS',
+                       'GUNICORN_WORKERS', 'GUNICORN_THREADS', 'SSE_MAX_STREAMS')
+
+
+class StartupTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp(prefix='test_startup_')
+
+    def tearDown(self):
+        shutil.rmtree(self.cwd)
+
+    def test_import_has_no_side_effects(self):
+        env = {name: value for name, value in os.environ.items()
+               if name not in ('JINJA_CACHE_DIR', 'LOGIN_STATE_DB', 'QUERY_STATS_DB', 'PROFILING_DB')}
+        env['PYTHONPATH'] = ROOT
+        result = subprocess.run([sys.executable, '-c', _SCRIPT], cwd=self.cwd, env=env,
+                                capture_output=True, text=True, check=True)
+        modules = set(json.loads(result.stdout))
+        self.assertEqual(sorted(modules.intersection(LAZY_MODULES)), [])
+        # Après la sortie : les flush atexit (connexions, statistiques SQL) compris
+        self.assertEqual(os.listdir(self.cwd), [])
+
+
+class GunicornProfilesTest(unittest.TestCase):
+    def load(self, **variables):
+        env = {name: value for name, value in os.environ.items() if name not in _GUNICORN_VARIABLES}
+        env.update(variables, PYTHONPATH=ROOT)
+        return subprocess.run([sys.executable, '-c', _GUNICORN_SCRIPT, os.path.join(ROOT, 'gunicorn.conf.py')],
+                              cwd=ROOT, env=env, capture_output=True, text=True)
+
+    def settings(self, **variables):
+        result = self.load(**variables)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return json.loads(result.stdout)
+
+    def test_development_profile(self):
+        settings = self.settings(FLASK_ENV='development')
+        self.assertEqual(settings['bind'], '127.0.0.1:5000')
+        self.assertEqual((settings['worker_class'], settings['workers'], settings['threads']), ('gthread', 1, 4))
+        self.assertEqual((settings['reload'], settings['preload_app']), (True, False))
+        self.assertEqual((settings['timeout'], settings['max_requests']), (300, 0))
+        self.assertEqual(settings['sse_max_streams'], '2')
+
+    def test_production_profile(self):
+        settings = self.settings(FLASK_ENV='production', SECRET_KEY='secret')
+        self.assertEqual(settings['bind'], '0.0.0.0:5000')
+        # Un worker par cœur, 4 threads chacun, recyclés avec une gigue
+        self.assertEqual(settings['workers'], settings['cores'])
+        self.assertEqual((settings['worker_class'], settings['threads']), ('gthread', 4))
+        self.assertEqual((settings['reload'], settings['preload_app']), (False, True))
+        self.assertEqual((settings['timeout'], settings['max_requests'], settings['max_requests_jitter']),
+                         (60, 2000, 200))
+
+        settings = self.settings(FLASK_ENV='production', SECRET_KEY='secret', GUNICORN_WORKERS='3',
+                                 GUNICORN_THREADS='8', GUNICORN_BIND='unix:/run/archive.sock')
+        self.assertEqual((settings['bind'], settings['workers'], settings['threads']), ('unix:/run/archive.sock', 3, 8))
+        self.assertEqual(settings['sse_max_streams'], '4')
+
+    def test_gevent_falls_back_to_gthread(self):
+        settings = self.settings(FLASK_ENV='production', SECRET_KEY='secret', GUNICORN_WORKER_CLASS='gevent')
+        self.assertEqual((settings['worker_class'], settings['threads']), ('gthread', 4))
+
+    def test_production_requires_secret_key(self):
+        with mock.patch.dict(os.environ, {'SECRET_KEY': ''}):
+            with self.assertRaises(ValueError) as raised:
+                config.get_config('production')
+            self.assertIn('SECRET_KEY', str(raised.exception))
+            # Les autres profils n'exigent rien
+            self.assertIs(config.get_config('development'), config.DevelopmentConfig)
+            self.assertIs(config.get_config('testing'), config.TestingConfig)
+        with mock.patch.dict(os.environ, {'SECRET_KEY': 'secret'}):
+            self.assertIs(config.get_config('production'), config.ProductionConfig)
+
+        # gunicorn refuse de démarrer en production sans la variable
+        result = self.load(FLASK_ENV='production')
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('SECRET_KEY doit être défini en production', result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests du driver S3 (storage.py) contre un S3 simulé (moto) : objet absent et
+erreurs du service traduits comme pour le stockage local.
+
+Usage :
+    python test_storage.py
+"""
+
+import io
+import os
+import unittest
+
+from storage import S3Storage, StorageError
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:  # dépendances optionnelles (STORAGE_BACKEND=s3, tests)
+    boto3 = mock_aws = None
+
+BUCKET = 'archive-test'
+
+
+@unittest.skipIf(mock_aws is None, 'boto3 et moto requis')
+class S3StorageTest(unittest.TestCase):
+    def setUp(self):
+        for variable in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+            os.environ.setdefault(variable, 'testing')
+        self.mock = mock_aws()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+        self.storage = S3Storage(BUCKET, region='us-east-1')
+
+    def test_roundtrip(self):
+        self.assertEqual(self.storage.put('a_rapport.txt', io.BytesIO(b'contenu')), 7)
+        self.assertEqual(self.storage.get('a_rapport.txt'), b'contenu')
+        self.assertEqual(b''.join(self.storage.stream('a_rapport.txt', chunk_size=3)), b'contenu')
+        with self.storage.open('a_rapport.txt') as f:
+            self.assertEqual(f.read(), b'contenu')
+        self.assertEqual(self.storage.stat('a_rapport.txt').size, 7)
+        self.assertEqual([blob.key for blob in self.storage.list()], ['a_rapport.txt'])
+        self.assertTrue(self.storage.delete('a_rapport.txt'))
+        self.assertIsNone(self.storage.stat('a_rapport.txt'))
+
+    def test_missing_key_is_reported_like_local_storage(self):
+        self.assertIsNone(self.storage.stat('absent.txt'))
+        with self.assertRaises(FileNotFoundError):
+            self.storage.get('absent.txt')
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open('absent.txt')
+        with self.assertRaises(FileNotFoundError):
+            list(self.storage.stream('absent.txt'))
+        # DELETE idempotent : pas d'erreur pour une clé absente
+        self.storage.delete('absent.txt')
+
+    def test_service_errors_become_storage_errors(self):
+        storage = S3Storage('bucket-inexistant', region='us-east-1')
+        for call in (
+            lambda: storage.get('a.txt'),
+            lambda: storage.open('a.txt'),
+            lambda: storage.delete('a.txt'),
+            lambda: storage.put('a.txt', io.BytesIO(b'x')),
+            lambda: list(storage.list()),
+        ):
+            with self.assertRaises(StorageError):
+                call()
+
+    def test_invalid_key(self):
+        with self.assertRaises(StorageError):
+            self.storage.get('../database.db')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests du rendu des templates (templating.py) : fragments mis en cache par
+utilisateur, invalidation par la version des étiquettes, cache de bytecode
+créé à la première écriture.
+
+Usage :
+    python test_templating.py
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from jinja2 import DictLoader, Environment
+from markupsafe import Markup
+
+import fixtures
+import templating
+from templating import FragmentCacheExtension, LazyBytecodeCache
+
+
+class FragmentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.upload_folder = tempfile.mkdtemp(prefix='test_templating_')
+        self.client, self.user_id = fixtures.create_app_client(self.upload_folder)
+        from app import DATABASE, app
+
+        self.database = DATABASE
+        conn = sqlite3.connect(DATABASE)
+        self.other_id = fixtures.add_user(conn, 'bobby')
+        conn.execute('INSERT INTO labels (name, color, user_id) VALUES (?, ?, ?)',
+                     ('Urgent', '#FF0000', self.user_id))
+        conn.commit()
+        conn.close()
+        self.other = app.test_client()
+        with self.other.session_transaction() as session:
+            session['user_id'] = self.other_id
+            session['username'] = 'bobby'
+        templating.fragment_cache.clear()
+
+    def tearDown(self):
+        templating.fragment_cache.clear()
+        shutil.rmtree(self.upload_folder)
+
+    def dashboard(self, client=None):
+        response = (client or self.client).get('/dashboard')
+        self.assertEqual(response.status_code, 200)
+        return response.get_data(as_text=True)
+
+    def fragment_keys(self, name):
+        return [key for key in templating.fragment_cache._data if key[0] == name]
+
+    def test_nav_is_cached_per_user(self):
+        alice = self.dashboard()
+        bobby = self.dashboard(self.other)
+        self.assertIn('alice', alice)
+        self.assertNotIn('bobby', alice)
+        # La navigation d'alice, déjà en cache, n'est pas servie à l'autre session
+        self.assertIn('bobby', bobby)
+        self.assertNotIn('alice', bobby)
+        self.assertEqual(sorted(self.fragment_keys('nav')), [('nav', 'alice'), ('nav', 'bobby')])
+        self.assertIn('Connexion', self.client.application.test_client().get('/login').get_data(as_text=True))
+
+    def test_label_palette_follows_labels_version(self):
+        self.assertIn('Urgent', self.dashboard())
+        [key] = self.fragment_keys('label_palette')
+        self.assertEqual(key[1], self.user_id)
+
+        # Étiquettes inchangées : fragment servi depuis le cache
+        templating.fragment_cache.set(key, Markup('<p>palette en cache</p>'), templating.FRAGMENT_CACHE_TIMEOUT)
+        self.assertIn('palette en cache', self.dashboard())
+
+        # Étiquette renommée : nouvelle version, fragment reconstruit
+        conn = sqlite3.connect(self.database)
+        conn.execute('UPDATE labels SET name = ? WHERE user_id = ?', ('Archivé', self.user_id))
+        conn.commit()
+        conn.close()
+        page = self.dashboard()
+        self.assertNotIn('palette en cache', page)
+        self.assertIn('Archivé', page)
+        self.assertEqual(len(self.fragment_keys('label_palette')), 2)
+        # Pas d'étiquettes pour l'autre utilisateur
+        self.assertNotIn('Archivé', self.dashboard(self.other))
+
+
+class LazyBytecodeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='test_templating_')
+        self.directory = os.path.join(self.tmpdir, 'cache', 'jinja')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def environment(self):
+        return Environment(loader=DictLoader({'page.html': '{% cache "p", user %}<b>{{ user }}</b>{% endcache %}'}),
+                           bytecode_cache=LazyBytecodeCache(self.directory),
+                           extensions=[FragmentCacheExtension], autoescape=True)
+
+    def test_directory_created_on_first_dump(self):
+        env = self.environment()
+        self.assertFalse(os.path.exists(self.directory))  # rien sur le disque à la création
+
+        templating.fragment_cache.clear()
+        self.addCleanup(templating.fragment_cache.clear)
+        self.assertEqual(env.get_template('page.html').render(user='<x>'), '<b>&lt;x&gt;</b>')
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+        # Un autre worker charge le bytecode sans recompiler
+        other = self.environment()
+        other.compile = None
+        self.assertEqual(other.get_template('page.html').render(user='<x>'), '<b>&lt;x&gt;</b>')
+
+
+if __name__ == '__main__':
+    unittest.main()
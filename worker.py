@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""Worker d'exécution des tâches d'arrière-plan
+
+Usage :
+    python worker.py                       # tous les types de tâches
+    python worker.py --types delete_blobs  # seulement certains types
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import (
+    DATABASE, app, connect_database, data_databases, get_catalog_connection, init_logging, login_tracker, migrate,
+    shard_router
+)
+import jobs
+import chunked_upload
+import note_revisions
+import changefeed
+from sessions import SQLiteSessionStore
+
+POLL_INTERVAL = float(os.environ.get('WORKER_POLL_INTERVAL', '1.0'))
+MAX_THREADS = int(os.environ.get('WORKER_THREADS', '4'))
+PURGE_INTERVAL = 3600  # secondes entre deux purges (tâches terminées, sessions et uploads expirés)
+
+
+class Worker:
+    """Boucle de réclamation / exécution des tâches"""
+
+    def __init__(self, job_types=None, threads=MAX_THREADS, poll_interval=POLL_INTERVAL):
+        self.job_types = job_types
+        self.poll_interval = poll_interval
+        self.worker_id = jobs.default_worker_id()
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.slots = threading.Semaphore(threads)
+        self.stopping = threading.Event()
+        self.last_purge = 0
+        self.next_database = 0
+
+    def stop(self, *args):
+        app.logger.info(f'Worker {self.worker_id} stopping')
+        self.stopping.set()
+
+    def run(self):
+        app.logger.info(f'Worker {self.worker_id} started')
+        idle_rounds = 0
+        while not self.stopping.is_set():
+            self.housekeeping()
+            # Attendre un thread libre avant de réclamer une tâche
+            if not self.slots.acquire(timeout=self.poll_interval):
+                continue
+            job = self.claim()
+
+            if job is None:
+                self.slots.release()
+                idle_rounds += 1
+                # Scrutation ralentie tant que la file reste vide
+                self.stopping.wait(min(self.poll_interval * idle_rounds, self.poll_interval * 10))
+                continue
+
+            idle_rounds = 0
+            self.executor.submit(self.execute, job)
+
+        self.executor.shutdown(wait=True)
+
+    def claim(self):
+        """Prochaine tâche, en parcourant les fichiers de données à tour de rôle"""
+        databases = data_databases()
+        if not databases:
+            return None  # données réparties, aucun fichier encore créé
+        start = self.next_database % len(databases)
+        for offset in range(len(databases)):
+            db_path = databases[(start + offset) % len(databases)]
+            conn = connect_database(db_path)
+            try:
+                if not shard_router.enabled:
+                    job = jobs.claim(conn, self.worker_id, self.job_types)
+                elif jobs.has_ready(conn, self.job_types):
+                    # Limites de concurrence globales : comptées dans le catalogue
+                    catalog = get_catalog_connection()
+                    try:
+                        job = jobs.claim_leased(catalog, conn, os.path.basename(db_path), self.worker_id, self.job_types)
+                    finally:
+                        catalog.close()
+                else:
+                    job = None
+            except Exception as e:
+                job = None
+                app.logger.error(f'Error claiming job in {db_path}: {e}')
+            finally:
+                conn.close()
+            if job is not None:
+                # Le fichier suivant sera interrogé en premier : un fichier
+                # chargé ne monopolise pas le worker
+                self.next_database = start + offset + 1
+                job['database'] = db_path
+                return job
+        return None
+
+    def execute(self, job):
+        handler = jobs.HANDLERS[job['job_type']]
+        started = time.monotonic()
+        try:
+            with app.app_context():
+                result = handler.func(job['payload'], job)
+        except Exception as e:
+            app.logger.error(f'Job {job["id"]} ({job["job_type"]}) failed: {e}')
+            self._record(job['database'], jobs.fail, job, self.worker_id, e)
+        else:
+            app.logger.info(
+                f'Job {job["id"]} ({job["job_type"]}) done in {time.monotonic() - started:.2f}s'
+            )
+            self._record(job['database'], jobs.complete, job['id'], self.worker_id, result)
+        finally:
+            if shard_router.enabled:
+                self._release_lease(job)
+            self.slots.release()
+
+    def _release_lease(self, job):
+        catalog = get_catalog_connection()
+        try:
+            jobs.release_lease(catalog, os.path.basename(job['database']), job['id'])
+        except Exception as e:
+            app.logger.error(f'Error releasing job lease: {e}')
+        finally:
+            catalog.close()
+
+    def housekeeping(self):
+        if time.monotonic() - self.last_purge < PURGE_INTERVAL:
+            return
+        self.last_purge = time.monotonic()
+        for db_path in data_databases():
+            self._record(db_path, jobs.purge_finished)
+            self._record(db_path, chunked_upload.purge_expired_uploads, app.config['UPLOAD_FOLDER'])
+            self._record(
+                db_path, note_revisions.purge_old_revisions,
+                app.config['NOTE_REVISIONS_KEEP'], app.config['NOTE_REVISIONS_MAX_AGE_DAYS']
+            )
+            self._record(db_path, changefeed.prune_changes)
+        if shard_router.enabled:
+            self._record(DATABASE, jobs.purge_expired_leases)
+        try:
+            SQLiteSessionStore(get_catalog_connection).purge_expired()
+        except Exception as e:
+            app.logger.error(f'Error purging sessions: {e}')
+        try:
+            login_tracker.flush()
+        except Exception as e:
+            app.logger.error(f'Error flushing login bookkeeping: {e}')
+
+    def _record(self, db_path, func, *args):
+        conn = connect_database(db_path)
+        try:
+            func(conn, *args)
+        except Exception as e:
+            app.logger.error(f'Error updating job state: {e}')
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Worker des tâches d\'arrière-plan')
+    parser.add_argument('--types', nargs='*', help='Types de tâches à traiter (tous par défaut)')
+    parser.add_argument('--threads', type=int, default=MAX_THREADS, help='Nombre de tâches simultanées')
+    args = parser.parse_args()
+
+    init_logging()
+    migrate()
+    worker = Worker(job_types=args.types, threads=args.threads)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
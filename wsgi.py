@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""Point d'entrée WSGI pour Gunicorn
+
+Chargé une seule fois dans le master avec ``--preload`` : les imports,
+les templates compilés et le manifeste des fichiers statiques sont
+partagés par les workers (copy-on-write) au lieu d'être reconstruits
+dans chacun d'eux. Les ressources propres à un processus (connexions,
+fichiers de log, client S3, pool d'extraction) restent créées au
+premier usage, après le fork.
+
+Usage :
+    gunicorn --preload -w 4 -b 0.0.0.0:5000 wsgi:app
+"""
+
+import gc
+import os
+import sys
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, migrate
+from templating import precompile_templates
+
+# Migrations exécutées une seule fois, avant le fork des workers
+migrate()
+
+# Templates compilés dans le master : partagés par tous les workers
+precompile_templates(app)
+
+# Objets créés pendant le chargement exclus du ramasse-miettes : ses passages
+# ne réécrivent plus leurs en-têtes, les pages restent partagées après le fork
+gc.freeze()